@@ -23,6 +23,7 @@ def create_app(config_class=Config):
     os.makedirs(os.path.join(app.config.get('UPLOAD_FOLDER', 'uploads'), 'videos'), exist_ok=True)
     os.makedirs(os.path.join(app.config.get('UPLOAD_FOLDER', 'uploads'), 'submissions'), exist_ok=True)
     os.makedirs(os.path.join(app.config.get('UPLOAD_FOLDER', 'uploads'), 'lesson_files'), exist_ok=True)
+    os.makedirs(app.config.get('JOBS_FOLDER') or os.path.join(app.config.get('UPLOAD_FOLDER', 'uploads'), 'jobs'), exist_ok=True)
     
     db.init_app(app)
     migrate.init_app(app, db)
@@ -49,35 +50,32 @@ def create_app(config_class=Config):
         from datetime import timedelta
         return value + timedelta(hours=5)
     
+    # base.html menyusi kabi bo'laklar uchun {% cache %} tegi
+    from app.utils.fragment_cache import init_fragment_cache
+    init_fragment_cache(app)
+    
     # Context processor for translations
     @app.context_processor
     def inject_global_data():
         from flask import session
         from flask_login import current_user
-        from app.utils.translations import get_translation
-        from app.models import Message
+        from app.utils.translations import get_translator, LANGUAGES
+        from app.utils.messaging import get_unread_count
         
         lang = session.get('language', 'uz')
         
         unread_msg_count = 0
         if current_user.is_authenticated:
             try:
-                unread_msg_count = Message.query.filter_by(
-                    receiver_id=current_user.id, 
-                    is_read=False
-                ).count()
+                unread_msg_count = get_unread_count(current_user.id)
             except:
                 pass
                 
         return {
-            't': lambda key: get_translation(key, lang),
+            't': get_translator(lang),
             'current_lang': lang,
             'unread_msg_count': unread_msg_count,
-            'languages': {
-                'uz': {'code': 'uz', 'name': 'O\'zbek', 'flag': '🇺🇿'},
-                'ru': {'code': 'ru', 'name': 'Русский', 'flag': '🇷🇺'},
-                'en': {'code': 'en', 'name': 'English', 'flag': '🇺🇸'}
-            }
+            'languages': LANGUAGES
         }
     
     from app.routes import main, auth, admin, dean, courses, api, accounting
@@ -89,6 +87,12 @@ def create_app(config_class=Config):
     app.register_blueprint(api.bp)
     app.register_blueprint(accounting.bp)
     
+    from app.commands import register_commands
+    register_commands(app)
+    
+    from app.utils.watch_time import init_watch_time
+    init_watch_time(app)
+    
     with app.app_context():
         db.create_all()
         
@@ -132,6 +136,52 @@ def create_app(config_class=Config):
                 if 'permissions' not in api_key_columns:
                     with db.engine.begin() as conn:
                         conn.execute(text("ALTER TABLE api_key ADD COLUMN permissions TEXT DEFAULT '[]'"))
+
+            # schedule jadvaliga sana/vaqt ustunlarini qo'shish va mavjud darslardan to'ldirish
+            if 'schedule' in inspector.get_table_names():
+                schedule_columns = [col['name'] for col in inspector.get_columns('schedule')]
+                # To'ldirish ORM orqali ishlaydi, shuning uchun avval barcha ustunlar qo'shiladi
+                if 'updated_at' not in schedule_columns:
+                    with db.engine.begin() as conn:
+                        conn.execute(text("ALTER TABLE schedule ADD COLUMN updated_at TIMESTAMP"))
+                if 'lesson_date' not in schedule_columns:
+                    with db.engine.begin() as conn:
+                        conn.execute(text("ALTER TABLE schedule ADD COLUMN lesson_date DATE"))
+                        conn.execute(text("ALTER TABLE schedule ADD COLUMN lesson_start TIME"))
+                        conn.execute(text("ALTER TABLE schedule ADD COLUMN lesson_end TIME"))
+                    from app.utils.schedule_calendar import backfill_schedule_calendar
+                    backfill_schedule_calendar()
+
+            # student_semester_progress jadvaliga guruh ustunini qo'shish (bo'sh qatorlar qayta hisoblanadi)
+            if 'student_semester_progress' in inspector.get_table_names():
+                progress_columns = [col['name'] for col in inspector.get_columns('student_semester_progress')]
+                if 'group_id' not in progress_columns:
+                    with db.engine.begin() as conn:
+                        conn.execute(text("ALTER TABLE student_semester_progress ADD COLUMN group_id INTEGER"))
+
+            # Modellarda e'lon qilingan indekslar (create_all mavjud jadvallarga indeks qo'shmaydi).
+            # Alembic bilan boshqariladigan bazalarda ular migrations/versions orqali ham qo'shiladi.
+            for table in db.metadata.sorted_tables:
+                for index in table.indexes:
+                    try:
+                        with db.engine.begin() as conn:
+                            index.create(bind=conn, checkfirst=True)
+                    except Exception as e:
+                        app.logger.warning(f"Indeks yaratilmadi ({index.name}): {e}")
+            
+            if 'message' in inspector.get_table_names():
+                # Suhbatlar indeksini mavjud xabarlardan bir marta to'ldirish
+                from app.models import Conversation, Message
+                if not Conversation.query.first() and Message.query.first():
+                    from app.utils.messaging import rebuild_conversations
+                    rebuild_conversations()
+                # Eski ma'lumotlar: hisoblagichi yo'q foydalanuvchilarning o'qilmagan xabarlari
+                from app.utils.messaging import ensure_unread_counters
+                ensure_unread_counters()
+            
+            # Oldingi ishga tushirishda to'xtab qolgan fon vazifalari
+            from app.utils.jobs import fail_stale_jobs
+            fail_stale_jobs()
         except Exception as e:
             # Migration xatosi bo'lsa, xato log qilish lekin dasturni ishga tushirish
             app.logger.warning(f"Migration xatosi (bu normal bo'lishi mumkin): {e}")
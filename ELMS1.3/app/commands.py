@@ -0,0 +1,67 @@
+"""Flask CLI buyruqlari (flask <buyruq>)"""
+import click
+
+
+def register_commands(app):
+    """Ilovaga CLI buyruqlarini qo'shish"""
+
+    @app.cli.command('rebuild-unread-counters')
+    @click.option('--user-id', type=int, default=None, help="Faqat bitta foydalanuvchi uchun")
+    def rebuild_unread_counters_command(user_id):
+        """O'qilmagan xabarlar hisoblagichlarini Message jadvalidan qayta tiklash"""
+        from app.utils.messaging import rebuild_unread_counters
+        total = rebuild_unread_counters(user_id)
+        click.echo(f"{total} ta hisoblagich yangilandi")
+
+    @app.cli.command('rebuild-conversations')
+    def rebuild_conversations_command():
+        """Suhbatlar indeksini (Conversation) Message jadvalidan qayta qurish"""
+        from app.utils.messaging import rebuild_conversations
+        total = rebuild_conversations()
+        click.echo(f"{total} ta suhbat qayta qurildi")
+
+    @app.cli.command('db-index-audit')
+    @click.option('--role', 'roles', multiple=True, help="Faqat shu rollar (student, teacher, dean, admin)")
+    @click.option('--path', 'paths', multiple=True, help="Qo'shimcha tekshiriladigan sahifa")
+    def db_index_audit_command(roles, paths):
+        """Asosiy sahifalar so'rovlarida indeksiz to'liq jadval o'qishlarini topish"""
+        from app.utils.index_audit import run_index_audit
+        findings, total, warnings = run_index_audit(app, roles=roles, extra_paths=paths)
+        for warning in warnings:
+            click.echo(f"! {warning}", err=True)
+        for finding in findings:
+            repeat = f" (x{finding.count})" if finding.count > 1 else ''
+            click.echo(f"[{finding.role}] {finding.path}: {', '.join(finding.tables)}{repeat}")
+            click.echo(f"    {finding.statement[:300]}")
+        click.echo(f"{total} ta so'rov tekshirildi, {len(findings)} tasida to'liq jadval o'qish bor")
+
+    @app.cli.command('import-uploads')
+    def import_uploads_command():
+        """Eski papkalardagi (videos, lesson_files, submissions) fayllarni fayllar omboriga ko'chirish"""
+        from app.utils.blob_store import import_legacy_uploads
+        total = import_legacy_uploads()
+        click.echo(f"{total} ta fayl omborga ko'chirildi")
+
+    @app.cli.command('backfill-schedule-dates')
+    def backfill_schedule_dates_command():
+        """Dars jadvalidagi lesson_date/lesson_start/lesson_end ustunlarini day_of_week va vaqtdan to'ldirish"""
+        from app.utils.schedule_calendar import backfill_schedule_calendar
+        total = backfill_schedule_calendar()
+        click.echo(f"{total} ta dars yangilandi")
+
+    @app.cli.command('run-jobs')
+    @click.option('--once', is_flag=True, help="Navbatni bir marta bo'shatib chiqish")
+    @click.option('--cleanup', is_flag=True, help="Eski vazifalar, yuklashlar va fayllarini o'chirish")
+    def run_jobs_command(once, cleanup):
+        """Fon vazifalari worker'i (JOBS_RUN_IN_PROCESS=0 bo'lganda ishlatiladi)"""
+        from app.utils.jobs import run_pending_jobs, cleanup_old_jobs
+        from app.utils.chunked_upload import cleanup_stale_uploads
+        from app.utils.blob_store import cleanup_blobs
+        from app.utils.schedule_feed import cleanup_schedule_tombstones
+        if cleanup:
+            click.echo(f"{cleanup_old_jobs()} ta eski vazifa o'chirildi")
+            click.echo(f"{cleanup_stale_uploads()} ta eski yuklash o'chirildi")
+            click.echo(f"{cleanup_blobs()} ta ishlatilmayotgan fayl o'chirildi")
+            click.echo(f"{cleanup_schedule_tombstones()} ta eski dars izi o'chirildi")
+        click.echo("Fon vazifalari kutilmoqda..." if not once else "Navbatdagi vazifalar bajarilmoqda...")
+        run_pending_jobs(once=once)
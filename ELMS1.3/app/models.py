@@ -2,6 +2,10 @@ from app import db, login_manager
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, date, timedelta
+from bisect import bisect_right
+from collections import namedtuple
+import threading
+import time
 
 @login_manager.user_loader
 def load_user(id):
@@ -79,6 +83,27 @@ class Group(db.Model):
     def get_students_count(self):
         return self.students.count()
 
+    @staticmethod
+    def students_count_map(group_ids=None, role=None, by=None):
+        """Talabalar soni bitta GROUP BY so'rovda (har bir guruh uchun alohida count o'rniga).
+
+        by=None - {guruh_id: soni}; by=Group.faculty_id yoki Group.direction_id - shu ustun bo'yicha
+        yig'indi. role='student' - faqat asosiy roli talaba bo'lganlar. Talabasi yo'q kalitlar
+        natijada bo'lmaydi, shuning uchun .get(id, 0) bilan o'qiladi.
+        """
+        key = by if by is not None else User.group_id
+        query = db.session.query(key, db.func.count(User.id)).filter(User.group_id.isnot(None))
+        if by is not None:
+            query = query.join(Group, User.group_id == Group.id)
+        if group_ids is not None:
+            group_ids = list(group_ids)
+            if not group_ids:
+                return {}
+            query = query.filter(User.group_id.in_(group_ids))
+        if role:
+            query = query.filter(User.role == role)
+        return dict(query.group_by(key).all())
+
 
 # ==================== FAN (SUBJECT) ====================
 class Subject(db.Model):
@@ -193,44 +218,65 @@ class Subject(db.Model):
                 TeacherSubject.subject_id == self.id,
                 TeacherSubject.group_id.in_(direction_group_ids)
             ).all()
-            
-            # Dars turlarini normallashtirish
-            teacher_lesson_types = set()
-            for ta in teacher_assignments:
-                if ta.lesson_type:
-                    l_type = ta.lesson_type.lower().strip()
-                    matched = False
-                    
-                    # Laboratoriya (lab, lob, laboratoriya, lobaratoriya)
-                    if 'lab' in l_type or 'lob' in l_type:
-                        teacher_lesson_types.add('laboratoriya')
-                        matched = True
-                    
-                    # Kurs ishi (kurs, course)
-                    if 'kurs' in l_type or 'course' in l_type:
-                        teacher_lesson_types.add('kurs_ishi')
-                        matched = True
-                    
-                    # Amaliyot (amaliyot, amal, practice) - bu Lobaratoriya va Kurs ishini ham o'z ichiga oladi
-                    if 'amal' in l_type or 'prac' in l_type:
-                        teacher_lesson_types.add('amaliyot')
-                        teacher_lesson_types.add('laboratoriya')
-                        teacher_lesson_types.add('kurs_ishi')
-                        matched = True
-                    
-                    # Maruza (maruza, lecture, ma'ruza)
-                    if 'maru' in l_type or 'lect' in l_type:
-                        teacher_lesson_types.add('maruza')
-                        matched = True
-                    
-                    # Seminar
-                    if 'sem' in l_type:
-                        teacher_lesson_types.add('seminar')
-                        matched = True
-                    
-                    if not matched:
-                        teacher_lesson_types.add(l_type)
+            teacher_lesson_types = Subject.normalize_teacher_lesson_types(ta.lesson_type for ta in teacher_assignments)
         
+        # Ushbu yo'nalish uchun mavjud darslarni dars turi bo'yicha sanash
+        lesson_type_counts = {}
+        for (lesson_type,) in db.session.query(Lesson.lesson_type).filter_by(
+            subject_id=self.id,
+            direction_id=direction_id
+        ):
+            lesson_type_counts[lesson_type] = lesson_type_counts.get(lesson_type, 0) + 1
+        
+        return Subject.curriculum_check_result(
+            curriculum, lesson_type_counts, lessons_count, assignments_count, teacher_lesson_types, is_admin
+        )
+
+    @staticmethod
+    def normalize_teacher_lesson_types(lesson_types):
+        """O'qituvchi biriktirishlaridagi dars turlarini o'quv reja kalitlariga keltirish"""
+        teacher_lesson_types = set()
+        for lesson_type in lesson_types:
+            if lesson_type:
+                l_type = lesson_type.lower().strip()
+                matched = False
+                
+                # Laboratoriya (lab, lob, laboratoriya, lobaratoriya)
+                if 'lab' in l_type or 'lob' in l_type:
+                    teacher_lesson_types.add('laboratoriya')
+                    matched = True
+                
+                # Kurs ishi (kurs, course)
+                if 'kurs' in l_type or 'course' in l_type:
+                    teacher_lesson_types.add('kurs_ishi')
+                    matched = True
+                
+                # Amaliyot (amaliyot, amal, practice) - bu Lobaratoriya va Kurs ishini ham o'z ichiga oladi
+                if 'amal' in l_type or 'prac' in l_type:
+                    teacher_lesson_types.add('amaliyot')
+                    teacher_lesson_types.add('laboratoriya')
+                    teacher_lesson_types.add('kurs_ishi')
+                    matched = True
+                
+                # Maruza (maruza, lecture, ma'ruza)
+                if 'maru' in l_type or 'lect' in l_type:
+                    teacher_lesson_types.add('maruza')
+                    matched = True
+                
+                # Seminar
+                if 'sem' in l_type:
+                    teacher_lesson_types.add('seminar')
+                    matched = True
+                
+                if not matched:
+                    teacher_lesson_types.add(l_type)
+        return teacher_lesson_types
+
+    @staticmethod
+    def curriculum_check_result(curriculum, lesson_type_counts, lessons_count, assignments_count,
+                                teacher_lesson_types=None, is_admin=False):
+        """Oldindan yuklangan sonlar bo'yicha o'quv reja to'liqligi natijasi (bazaga so'rovsiz).
+        lesson_type_counts - {dars turi: mavzular soni}"""
         warnings = []
         has_issue = False
         
@@ -240,44 +286,29 @@ class Subject(db.Model):
                 'name': 'Maruza',
                 'hours': curriculum.hours_maruza or 0,
                 'required_topics': (curriculum.hours_maruza or 0) / 2.0,
-                'actual_topics': 0
             },
             'amaliyot': {
                 'name': 'Amaliyot',
                 'hours': curriculum.hours_amaliyot or 0,
                 'required_topics': (curriculum.hours_amaliyot or 0) / 2.0,
-                'actual_topics': 0
             },
             'laboratoriya': {
                 'name': 'Laboratoriya',
                 'hours': curriculum.hours_laboratoriya or 0,
                 'required_topics': (curriculum.hours_laboratoriya or 0) / 2.0,
-                'actual_topics': 0
             },
             'seminar': {
                 'name': 'Seminar',
                 'hours': curriculum.hours_seminar or 0,
                 'required_topics': (curriculum.hours_seminar or 0) / 2.0,
-                'actual_topics': 0
             },
             'kurs_ishi': {
                 'name': 'Kurs ishi',
                 'hours': curriculum.hours_kurs_ishi or 0,
                 'required_topics': (curriculum.hours_kurs_ishi or 0) / 2.0,
-                'actual_topics': 0
             }
         }
         
-        # Ushbu yo'nalish uchun mavjud darslarni sanash
-        lessons = Lesson.query.filter_by(
-            subject_id=self.id,
-            direction_id=direction_id
-        ).all()
-        
-        for lesson in lessons:
-            if lesson.lesson_type in lesson_types_check:
-                lesson_types_check[lesson.lesson_type]['actual_topics'] += 1
-        
         # Har bir dars turi uchun tekshirish
         for lesson_type, data in lesson_types_check.items():
             if data['hours'] > 0:  # Faqat soat belgilangan dars turlarini tekshirish
@@ -286,7 +317,7 @@ class Subject(db.Model):
                     continue  # Bu dars turi o'qituvchiga biriktirilmagan, o'tkazib yuborish
                 
                 required = data['required_topics']
-                actual = data['actual_topics']
+                actual = lesson_type_counts.get(lesson_type, 0)
                 
                 if lesson_type == 'kurs_ishi':
                     # Kurs ishi uchun kamida 1 ta mavzu bo'lishi kerak
@@ -366,6 +397,10 @@ class TeacherSubject(db.Model):
     group = db.relationship('Group', backref='subject_assignments')
     assigner = db.relationship('User', foreign_keys=[assigned_by])
 
+    __table_args__ = (
+        db.Index('ix_teacher_subject_teacher_subject_group_type', 'teacher_id', 'subject_id', 'group_id', 'lesson_type'),
+    )
+
 
 # ==================== FOYDALANUVCHI ROLI ====================
 class UserRole(db.Model):
@@ -422,27 +457,41 @@ class User(UserMixin, db.Model):
         return check_password_hash(self.password_hash, password)
     
     def get_roles(self):
-        """Foydalanuvchining barcha rollarini olish"""
-        if self.roles_list.count() > 0:
-            return [r.role for r in self.roles_list]
-        # Agar roles_list bo'sh bo'lsa, eski role maydonini qaytaramiz
-        return [self.role] if self.role else []
+        """Foydalanuvchining barcha rollarini olish.
+
+        Natija obektda saqlanadi: current_user har so'rovda qayta yuklanadi, shuning uchun
+        rollar bir so'rov davomida bir marta o'qiladi.
+        """
+        roles = self.__dict__.get('_roles_cache')
+        if roles is None:
+            roles = tuple(r.role for r in self.roles_list)
+            if not roles:
+                # Agar roles_list bo'sh bo'lsa, eski role maydonini qaytaramiz
+                roles = (self.role,) if self.role else ()
+            self._roles_cache = roles
+        return list(roles)
     
     def has_role(self, role_name):
         """Foydalanuvchida bunday rol bormi?"""
         return role_name in self.get_roles()
     
+    def invalidate_roles_cache(self):
+        """Rollar o'zgarganda saqlangan ro'yxatni tozalash"""
+        self.__dict__.pop('_roles_cache', None)
+    
     def add_role(self, role_name):
         """Foydalanuvchiga rol qo'shish"""
         if not self.has_role(role_name):
             user_role = UserRole(user_id=self.id, role=role_name)
             db.session.add(user_role)
             db.session.commit()
+            self.invalidate_roles_cache()
     
     def remove_role(self, role_name):
         """Foydalanuvchidan rol olib tashlash"""
         UserRole.query.filter_by(user_id=self.id, role=role_name).delete()
         db.session.commit()
+        self.invalidate_roles_cache()
     
     def set_roles(self, role_list):
         """Foydalanuvchiga bir nechta rol biriktirish (eski rollarni o'chirib, yangilarini qo'shish)"""
@@ -453,6 +502,7 @@ class User(UserMixin, db.Model):
             user_role = UserRole(user_id=self.id, role=role)
             db.session.add(user_role)
         db.session.commit()
+        self.invalidate_roles_cache()
     
     def get_role_display(self):
         """Asosiy rol nomini olish (eski kodlar bilan mosligi uchun)"""
@@ -539,6 +589,10 @@ class Lesson(db.Model):
     # Video ko'rish yozuvlari
     views = db.relationship('LessonView', backref='lesson', lazy='dynamic', cascade='all, delete-orphan')
 
+    __table_args__ = (
+        db.Index('ix_lesson_subject_direction_order', 'subject_id', 'direction_id', 'order'),
+    )
+
 
 # ==================== DARS KO'RISH YOZUVI ====================
 class LessonView(db.Model):
@@ -554,6 +608,10 @@ class LessonView(db.Model):
     
     student = db.relationship('User', backref='lesson_views')
 
+    __table_args__ = (
+        db.Index('ix_lesson_view_lesson_student', 'lesson_id', 'student_id'),
+    )
+
 
 # ==================== TOPSHIRIQ ====================
 class Assignment(db.Model):
@@ -578,6 +636,10 @@ class Assignment(db.Model):
     group = db.relationship('Group', backref='assignments')
     direction = db.relationship('Direction', backref='assignments')
     # subject relationship - Subject modelida allaqachon backref mavjud
+
+    __table_args__ = (
+        db.Index('ix_assignment_subject_group_direction', 'subject_id', 'group_id', 'direction_id'),
+    )
     
     def get_submission_count(self):
         return self.submissions.count()
@@ -611,6 +673,10 @@ class Submission(db.Model):
     is_active = db.Column(db.Boolean, default=True)  # Faol topshiriq (oxirgi yuborilgan)
     
     grader = db.relationship('User', foreign_keys=[graded_by], backref='graded_submissions')
+
+    __table_args__ = (
+        db.Index('ix_submission_student_assignment_active', 'student_id', 'assignment_id', 'is_active'),
+    )
     
     def can_resubmit(self, max_resubmissions=3):
         """Qayta topshirish mumkinligini tekshirish"""
@@ -619,6 +685,33 @@ class Submission(db.Model):
         return self.resubmission_count < max_resubmissions
 
 
+# ==================== SEMESTR NATIJALARI ====================
+class StudentSemesterProgress(db.Model):
+    """Talabaning fan bo'yicha semestr natijasi (dashboard uchun oldindan hisoblangan)"""
+    __tablename__ = 'student_semester_progress'
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), nullable=False)
+    semester = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, default=0)  # Baholangan topshiriqlar bo'yicha jami ball
+    max_score = db.Column(db.Float, default=0)  # Barcha topshiriqlarning maksimal bali
+    graded_count = db.Column(db.Integer, default=0)
+    total_assignments = db.Column(db.Integer, default=0)
+    credits = db.Column(db.Float, default=0)
+    group_id = db.Column(db.Integer)  # Hisoblangandagi guruh; talaba boshqa guruhga o'tsa qator eskirgan
+    is_stale = db.Column(db.Boolean, default=False)  # Topshiriqlar o'zgarganda qayta hisoblash kerak
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'subject_id', 'semester', name='uq_student_subject_semester_progress'),
+        db.Index('ix_student_semester_progress_student', 'student_id', 'semester'),
+    )
+
+    @property
+    def percent(self):
+        return (self.score / self.max_score) * 100 if self.max_score else 0.0
+
+
 # ==================== E'LON ====================
 class Announcement(db.Model):
     """E'lon modeli"""
@@ -647,12 +740,92 @@ class Schedule(db.Model):
     day_of_week = db.Column(db.Integer)
     start_time = db.Column(db.String(5))  # HH:MM
     end_time = db.Column(db.String(5))
+    # Yuqoridagi maydonlarning DATE/TIME ko'rinishi (kalendar so'rovlari uchun). Ular o'zlashtirilganda
+    # avtomatik to'ldiriladi; eski hafta kuni yozuvlarida lesson_date bo'sh qoladi.
+    lesson_date = db.Column(db.Date)
+    lesson_start = db.Column(db.Time)
+    lesson_end = db.Column(db.Time)
     link = db.Column(db.String(500))  # Meeting link (Zoom, Teams, etc.)
     lesson_type = db.Column(db.String(20))  # lecture, practice, lab
+    # .ics tasmasining delta rejimi uchun (eski yozuvlarda bo'sh)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     group = db.relationship('Group', backref='schedules')
     teacher = db.relationship('User', backref='teaching_schedules')
 
+    __table_args__ = (
+        db.Index('ix_schedule_day_group', 'day_of_week', 'group_id'),
+        db.Index('ix_schedule_group_date', 'group_id', 'lesson_date'),
+        db.Index('ix_schedule_teacher_date', 'teacher_id', 'lesson_date'),
+        # Fakultet/barcha guruhlar bo'yicha oylik kalendar (sana oralig'i + guruh JOIN)
+        db.Index('ix_schedule_date_group', 'lesson_date', 'group_id'),
+    )
+
+    @staticmethod
+    def date_from_code(code):
+        """YYYYMMDD butun son -> date (hafta kuni yoki noto'g'ri qiymat bo'lsa None)"""
+        if not code:
+            return None
+        try:
+            return datetime.strptime(str(code), '%Y%m%d').date()
+        except ValueError:
+            return None
+
+    @staticmethod
+    def time_from_text(value):
+        """'HH:MM' -> time (noto'g'ri bo'lsa None)"""
+        if not value:
+            return None
+        try:
+            return datetime.strptime(str(value).strip()[:5], '%H:%M').time()
+        except ValueError:
+            return None
+
+    @classmethod
+    def calendar_columns(cls, day_of_week, start_time, end_time):
+        """bulk_insert_mappings kabi ORM hodisalarisiz yozuvlar uchun lesson_* qiymatlari"""
+        return {
+            'lesson_date': cls.date_from_code(day_of_week),
+            'lesson_start': cls.time_from_text(start_time),
+            'lesson_end': cls.time_from_text(end_time),
+        }
+
+    @db.validates('day_of_week', 'start_time', 'end_time')
+    def _sync_calendar_columns(self, key, value):
+        if key == 'day_of_week':
+            self.lesson_date = self.date_from_code(value)
+        elif key == 'start_time':
+            self.lesson_start = self.time_from_text(value)
+        else:
+            self.lesson_end = self.time_from_text(value)
+        return value
+
+
+class ScheduleTombstone(db.Model):
+    """O'chirilgan yoki boshqa guruh/o'qituvchiga o'tkazilgan dars izi (.ics delta rejimi uchun)"""
+    __tablename__ = 'schedule_tombstone'
+    id = db.Column(db.Integer, primary_key=True)
+    schedule_id = db.Column(db.Integer, nullable=False)
+    group_id = db.Column(db.Integer, index=True)
+    teacher_id = db.Column(db.Integer, index=True)
+    lesson_date = db.Column(db.Date)
+    lesson_start = db.Column(db.Time)
+    removed_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
+# ==================== KALENDAR OBUNASI (.ICS) ====================
+class CalendarFeedToken(db.Model):
+    """Shaxsiy dars jadvali .ics havolasi tokeni (foydalanuvchiga bitta, bekor qilinadi)"""
+    __tablename__ = 'calendar_feed_token'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, unique=True)
+    token_prefix = db.Column(db.String(16), nullable=False, index=True)  # qidirish uchun
+    token_hash = db.Column(db.String(64), nullable=False)  # SHA-256 (xom token saqlanmaydi)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, nullable=True)
+
+    user = db.relationship('User', backref=db.backref('calendar_feed_token', uselist=False))
+
 
 # ==================== XABAR ====================
 class Message(db.Model):
@@ -667,6 +840,54 @@ class Message(db.Model):
     sender = db.relationship('User', foreign_keys=[sender_id], backref='sent_messages')
     receiver = db.relationship('User', foreign_keys=[receiver_id], backref='received_messages')
 
+    __table_args__ = (
+        # Suhbat tarixini sahifalab o'qish uchun (id < cursor)
+        db.Index('ix_message_pair', 'sender_id', 'receiver_id', 'id'),
+        db.Index('ix_message_receiver_read', 'receiver_id', 'is_read'),
+    )
+
+
+class UnreadMessageCounter(db.Model):
+    """Foydalanuvchining o'qilmagan xabarlari soni (har sahifada COUNT(*) qilmaslik uchun)"""
+    __tablename__ = 'unread_message_counter'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    unread_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class Conversation(db.Model):
+    """Ikki foydalanuvchi o'rtasidagi suhbat xulosasi (xabarlar sahifasi uchun indeks).
+
+    Juftlik tartiblangan holda saqlanadi: user_low_id <= user_high_id.
+    """
+    __tablename__ = 'conversation'
+    id = db.Column(db.Integer, primary_key=True)
+    user_low_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    user_high_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    last_message_id = db.Column(db.Integer, db.ForeignKey('message.id', ondelete='SET NULL'))
+    last_message_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    unread_low = db.Column(db.Integer, nullable=False, default=0)  # user_low_id o'qimagan xabarlar
+    unread_high = db.Column(db.Integer, nullable=False, default=0)  # user_high_id o'qimagan xabarlar
+
+    last_message = db.relationship('Message', foreign_keys=[last_message_id])
+
+    __table_args__ = (
+        db.UniqueConstraint('user_low_id', 'user_high_id', name='uq_conversation_pair'),
+        db.Index('ix_conversation_low_last', 'user_low_id', 'last_message_at'),
+        db.Index('ix_conversation_high_last', 'user_high_id', 'last_message_at'),
+    )
+
+    @staticmethod
+    def pair(user_a_id, user_b_id):
+        """Juftlikni (kichik, katta) ko'rinishiga keltirish"""
+        return (user_a_id, user_b_id) if user_a_id <= user_b_id else (user_b_id, user_a_id)
+
+    def other_user_id(self, user_id):
+        return self.user_high_id if self.user_low_id == user_id else self.user_low_id
+
+    def unread_for(self, user_id):
+        return self.unread_low if self.user_low_id == user_id else self.unread_high
+
 
 # ==================== PAROLNI TIKLASH TOKENI ====================
 class PasswordResetToken(db.Model):
@@ -708,6 +929,66 @@ class StudentPayment(db.Model):
 
 
 # ==================== BAHOLASH TIZIMI ====================
+# Keshdagi baho yozuvi (GradeScale ustunlari bilan bir xil nomlar, shablonlar uchun)
+GradeBand = namedtuple('GradeBand', ['id', 'name', 'letter', 'min_score', 'max_score', 'description',
+                                     'gpa_value', 'color', 'order', 'is_passing'])
+
+
+class _GradeScaleCache:
+    """Baholash shkalasining jarayon ichidagi nusxasi (min_score bo'yicha tartiblangan)"""
+    # Boshqa gunicorn worker'larida qilingan o'zgarishlar shu vaqtdan keyin ko'rinadi (soniya)
+    TTL = 300
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = 0
+        self._loaded_version = None
+        self._loaded_at = 0.0
+        self._bands = ()
+        self._mins = ()
+        self._ordered = ()
+
+    def _snapshot(self):
+        now = time.monotonic()
+        if self._loaded_version == self.version and now - self._loaded_at < self.TTL:
+            return self._bands, self._mins, self._ordered
+        with self._lock:
+            version = self.version
+            rows = GradeScale.query.all()
+            bands = sorted(
+                (GradeBand(r.id, r.name, r.letter, r.min_score, r.max_score, r.description,
+                           r.gpa_value, r.color, r.order, r.is_passing) for r in rows),
+                key=lambda b: (b.min_score, b.id)
+            )
+            self._bands = tuple(bands)
+            self._mins = tuple(b.min_score for b in bands)
+            self._ordered = tuple(sorted(bands, key=lambda b: (b.order or 0, b.id)))
+            self._loaded_version = version
+            self._loaded_at = now
+            return self._bands, self._mins, self._ordered
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+
+    def lookup(self, percents):
+        bands, mins, _ = self._snapshot()
+        result = []
+        for percent in percents:
+            grade = None
+            idx = bisect_right(mins, percent) - 1
+            if idx >= 0 and percent <= bands[idx].max_score:
+                grade = bands[idx]
+            result.append(grade)
+        return result
+
+    def ordered(self):
+        return list(self._snapshot()[2])
+
+
+_grade_scale_cache = _GradeScaleCache()
+
+
 class GradeScale(db.Model):
     """Baholash tizimi (ballik tizim)"""
     id = db.Column(db.Integer, primary_key=True)
@@ -724,20 +1005,28 @@ class GradeScale(db.Model):
     
     @staticmethod
     def get_grade(score, max_score=100):
-        """Ball asosida bahoni aniqlash"""
+        """Ball asosida bahoni aniqlash (keshdan, bazaga so'rovsiz)"""
         if max_score == 0:
             return None
         percent = (score / max_score) * 100
-        grade = GradeScale.query.filter(
-            GradeScale.min_score <= percent,
-            GradeScale.max_score >= percent
-        ).first()
-        return grade
+        return _grade_scale_cache.lookup([percent])[0]
+    
+    @staticmethod
+    def get_grades(scores, max_score=100):
+        """Bir nechta ball uchun baholarni bitta chaqiruvda aniqlash (ro'yxat tartibida)"""
+        if max_score == 0:
+            return [None] * len(scores)
+        return _grade_scale_cache.lookup([(score / max_score) * 100 for score in scores])
     
     @staticmethod
     def get_all_ordered():
         """Barcha baholarni tartibda olish"""
-        return GradeScale.query.order_by(GradeScale.order).all()
+        return _grade_scale_cache.ordered()
+    
+    @staticmethod
+    def invalidate_cache():
+        """Baholash shkalasi o'zgarganda keshni yangilash"""
+        _grade_scale_cache.invalidate()
     
     @staticmethod
     def init_default_grades():
@@ -756,6 +1045,7 @@ class GradeScale(db.Model):
             grade = GradeScale(**g)
             db.session.add(grade)
         db.session.commit()
+        GradeScale.invalidate_cache()
 
 
 # ==================== API KALITI (MOBIL ILOVALAR UCHUN) ====================
@@ -780,7 +1070,7 @@ class ApiKey(db.Model):
     __tablename__ = 'api_key'
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)  # Ilova nomi (masalan: Android ilova)
-    key_prefix = db.Column(db.String(16), nullable=False)  # Kalitning oldingi qismi (ko'rsatish uchun)
+    key_prefix = db.Column(db.String(16), nullable=False, index=True)  # Kalitning oldingi qismi (ko'rsatish va qidirish uchun)
     key_hash = db.Column(db.String(256), nullable=False)  # Kalitning xesh (hash) qilingan qismi
     permissions = db.Column(db.Text, default='[]')  # JSON: ["subjects", "grades", ...] - qaysi dostuplar berilgan
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -803,6 +1093,127 @@ class ApiKey(db.Model):
         return f'<ApiKey {self.name} ...{self.key_prefix}>'
 
 
+# ==================== FON VAZIFALARI (IMPORT / EKSPORT) ====================
+class BackgroundJob(db.Model):
+    """Fonda bajariladigan import yoki eksport vazifasi"""
+    __tablename__ = 'background_job'
+    id = db.Column(db.String(32), primary_key=True)  # uuid4().hex
+    kind = db.Column(db.String(50), nullable=False)  # import_students, export_schedule, ...
+    title = db.Column(db.String(200))
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # queued, running, done, failed
+    params = db.Column(db.Text, default='{}')  # JSON
+    progress_done = db.Column(db.Integer, default=0)
+    progress_total = db.Column(db.Integer, default=0)
+    result = db.Column(db.Text)  # JSON: import natijasi (imported, updated, ...)
+    errors = db.Column(db.Text, default='[]')  # JSON: xatolar ro'yxati
+    input_path = db.Column(db.String(500))  # Yuklangan fayl (import)
+    output_path = db.Column(db.String(500))  # Tayyor fayl (eksport)
+    output_name = db.Column(db.String(255))
+    return_url = db.Column(db.String(500))  # Vazifa tugagach qaytiladigan sahifa
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # Oxirgi progress yangilanishi (to'xtab qolganini aniqlash uchun)
+
+    creator = db.relationship('User', foreign_keys=[created_by])
+
+    def _load_json(self, value, default):
+        import json
+        try:
+            return json.loads(value) if value else default
+        except (ValueError, TypeError):
+            return default
+
+    def get_params(self):
+        return self._load_json(self.params, {})
+
+    def get_result(self):
+        return self._load_json(self.result, {})
+
+    def get_errors(self):
+        return self._load_json(self.errors, [])
+
+    @property
+    def is_finished(self):
+        return self.status in ('done', 'failed')
+
+    @property
+    def percent(self):
+        if self.status == 'done':
+            return 100
+        if not self.progress_total:
+            return 0
+        return min(100, int(self.progress_done * 100 / self.progress_total))
+
+    def __repr__(self):
+        return f'<BackgroundJob {self.kind} {self.status}>'
+
+
+# ==================== QISMLAB YUKLASH (VIDEO VA DARS FAYLLARI) ====================
+class ChunkedUpload(db.Model):
+    """Qismlarga bo'lib yuklanayotgan fayl. Qabul qilingan qismlar diskdagi fayllardan aniqlanadi."""
+    __tablename__ = 'chunked_upload'
+    id = db.Column(db.String(32), primary_key=True)  # uuid4().hex
+    kind = db.Column(db.String(20), nullable=False)  # video, lesson_file
+    original_name = db.Column(db.String(255), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    sha256 = db.Column(db.String(64))  # Butun fayl xeshi (ixtiyoriy, yig'ishda tekshiriladi)
+    status = db.Column(db.String(20), nullable=False, default='uploading', index=True)  # uploading, complete, used
+    stored_name = db.Column(db.String(255))  # Yig'ilgan fayl nomi (videos/ yoki lesson_files/ ichida)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+
+    @property
+    def total_chunks(self):
+        return max(1, -(-self.total_size // self.chunk_size))
+
+    def expected_chunk_size(self, index):
+        """index-qism hajmi (oxirgisi qisqaroq bo'lishi mumkin)"""
+        if index < self.total_chunks - 1:
+            return self.chunk_size
+        return self.total_size - self.chunk_size * (self.total_chunks - 1)
+
+    def __repr__(self):
+        return f'<ChunkedUpload {self.kind} {self.status}>'
+
+
+# ==================== FAYLLAR OMBORI (MAZMUN BO'YICHA SAQLASH) ====================
+class Blob(db.Model):
+    """Fayl mazmuni: SHA-256 bo'yicha bir marta saqlanadi (UPLOAD_FOLDER/blobs/ab/cd/<sha256>)"""
+    __tablename__ = 'blob'
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0, index=True)  # Unga ishora qiluvchi Attachment lar soni
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<Blob {self.sha256[:12]} x{self.ref_count}>'
+
+
+class Attachment(db.Model):
+    """Yuklangan fayl nomi (uuid.ext) -> egasi (dars yoki javob) va mazmuni (Blob).
+    Bitta nom bir nechta darsga tegishli bo'lishi mumkin (bir dars bir nechta guruh uchun yaratilganda) -
+    har bir egasi uchun alohida yozuv. Egasi yo'q yozuv - hali formaga biriktirilmagan yuklash."""
+    __tablename__ = 'attachment'
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(255), nullable=False, index=True)
+    kind = db.Column(db.String(20), nullable=False)  # video, lesson_file, submission
+    blob_sha256 = db.Column(db.String(64), db.ForeignKey('blob.sha256'), nullable=False, index=True)
+    original_name = db.Column(db.String(255))
+    lesson_id = db.Column(db.Integer, db.ForeignKey('lesson.id', ondelete='SET NULL'), index=True)
+    submission_id = db.Column(db.Integer, db.ForeignKey('submission.id', ondelete='SET NULL'), index=True)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    blob = db.relationship('Blob')
+
+    def __repr__(self):
+        return f'<Attachment {self.filename} {self.kind}>'
+
+
 # ==================== DEMO MA'LUMOTLAR ====================
 def create_demo_data():
     """Demo ma'lumotlarni yaratish"""
@@ -5,6 +5,7 @@ from app import db
 from functools import wraps
 from datetime import datetime
 from sqlalchemy import func
+from app.utils.jobs import enqueue_job
 
 bp = Blueprint('accounting', __name__, url_prefix='/accounting')
 
@@ -306,31 +307,9 @@ def import_payments():
             flash("Faqat Excel fayllar (.xlsx, .xls) qo'llab-quvvatlanadi", 'error')
             return redirect(url_for('accounting.import_payments'))
         
-        try:
-            from app.utils.excel_import import import_payments_from_excel
-            
-            result = import_payments_from_excel(file)
-            
-            if result['success']:
-                if result['imported'] > 0:
-                    flash(f"{result['imported']} ta yozuv muvaffaqiyatli import qilindi", 'success')
-                else:
-                    flash("Hech qanday yozuv import qilinmadi", 'warning')
-                
-                if result['errors']:
-                    error_msg = f"Xatolar ({len(result['errors'])}): " + "; ".join(result['errors'][:5])
-                    if len(result['errors']) > 5:
-                        error_msg += f" va yana {len(result['errors']) - 5} ta xato"
-                    flash(error_msg, 'warning')
-            else:
-                flash(f"Import xatosi: {result['errors'][0] if result['errors'] else 'Noma`lum xatolik'}", 'error')
-                
-        except ImportError as e:
-            flash(f"Excel import funksiyasi ishlamayapti: {str(e)}", 'error')
-        except Exception as e:
-            flash(f"Import xatosi: {str(e)}", 'error')
-        
-        return redirect(url_for('accounting.index'))
+        job = enqueue_job('import_payments', "To'lovlarni import qilish", upload=file,
+                          return_url=url_for('accounting.index'), user_id=current_user.id)
+        return redirect(url_for('main.job_detail', job_id=job.id))
     
     return render_template('accounting/import_payments.html')
 
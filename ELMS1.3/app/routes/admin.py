@@ -7,15 +7,25 @@ from datetime import datetime
 from sqlalchemy import func, or_
 import secrets
 
+from app.utils.api_key_cache import invalidate_api_key_cache
+from app.utils.course_catalogue import invalidate_course_catalogue
+from app.utils.org_hierarchy import get_org_hierarchy, invalidate_org_hierarchy, group_semester_subjects
+from app.utils.schedule_calendar import month_schedule
+from app.utils.schedule_feed import record_schedule_removal
+from app.utils.schedule_conflicts import (
+    DEFAULT_LESSON_MINUTES, describe_conflicts, find_free_slots, find_schedule_conflicts
+)
 from app.utils.excel_export import create_all_users_excel, create_subjects_excel
 from app.utils.excel_import import (
-    import_students_from_excel, generate_sample_file,
+    generate_sample_file,
     import_directions_from_excel,
-    import_staff_from_excel, generate_staff_sample_file,
+    generate_staff_sample_file,
     import_subjects_from_excel, generate_subjects_sample_file,
-    import_curriculum_from_excel, generate_curriculum_sample_file,
-    import_schedule_from_excel, generate_schedule_sample_file
+    generate_curriculum_sample_file,
+    generate_schedule_sample_file
 )
+from app.utils.jobs import enqueue_job
+from app.utils.job_handlers import schedule_date_codes
 from werkzeug.security import generate_password_hash, check_password_hash
 
 bp = Blueprint('admin', __name__, url_prefix='/admin')
@@ -113,6 +123,7 @@ def api_key_edit(key_id):
         import json
         api_key.permissions = json.dumps(perms)
         db.session.commit()
+        invalidate_api_key_cache()
         flash("Dostuplar yangilandi", 'success')
         return redirect(url_for('admin.api_keys'))
     return render_template('admin/api_key_edit.html', api_key=api_key, permissions_list=API_KEY_PERMISSIONS)
@@ -126,6 +137,7 @@ def api_key_delete(key_id):
     api_key = ApiKey.query.get_or_404(key_id)
     db.session.delete(api_key)
     db.session.commit()
+    invalidate_api_key_cache()
     flash("API kaliti o'chirildi", 'success')
     return redirect(url_for('admin.api_keys'))
 
@@ -138,6 +150,7 @@ def api_key_toggle(key_id):
     api_key = ApiKey.query.get_or_404(key_id)
     api_key.is_active = not api_key.is_active
     db.session.commit()
+    invalidate_api_key_cache()
     flash("API kaliti yangilandi", 'success')
     return redirect(url_for('admin.api_keys'))
 
@@ -928,6 +941,7 @@ def create_faculty():
                 dean.faculty_id = faculty.id
         
         db.session.commit()
+        invalidate_org_hierarchy()
         
         flash("Fakultet muvaffaqiyatli yaratildi", 'success')
         return redirect(url_for('admin.faculties'))
@@ -994,6 +1008,7 @@ def edit_faculty(id):
                 dean.faculty_id = faculty.id
         
         db.session.commit()
+        invalidate_org_hierarchy()
         flash("Fakultet muvaffaqiyatli yangilandi", 'success')
         return redirect(url_for('admin.faculties'))
     
@@ -1030,6 +1045,7 @@ def delete_faculty(id):
     # Fanlar endi fakultetga bog'liq emas, shuning uchun ularni alohida tekshirish shart emas
     db.session.delete(faculty)
     db.session.commit()
+    invalidate_org_hierarchy()
     flash("Fakultet o'chirildi", 'success')
     
     return redirect(url_for('admin.faculties'))
@@ -1099,6 +1115,9 @@ def faculty_detail(id):
     # Barcha talabalarni olish (agregatsiya uchun)
     all_students = query.all()
     
+    # Guruhlar bo'yicha talabalar soni bitta so'rovda
+    students_counts = Group.students_count_map([g.id for g in all_groups], role='student')
+    
     # Qabul yili va ta'lim shakli bo'yicha guruhlash
     courses_dict = {}
     
@@ -1121,7 +1140,7 @@ def faculty_detail(id):
             continue
             
         # Guruhga tegishli talabalar sonini hisoblash
-        students_count = User.query.filter(User.group_id == group.id, User.role == 'student').count()
+        students_count = students_counts.get(group.id, 0)
         
         if students_count == 0:
            continue
@@ -1499,8 +1518,6 @@ def export_curriculum(id, year=None, education_type=None):
 @admin_required
 def import_curriculum(id, year=None, education_type=None):
     """O'quv rejani Excel fayldan import qilish"""
-    from app.utils.excel_import import import_curriculum_from_excel
-    
     direction = Direction.query.get_or_404(id)
     
     if request.method == 'POST':
@@ -1523,29 +1540,15 @@ def import_curriculum(id, year=None, education_type=None):
                 return redirect(url_for('admin.direction_curriculum', id=id, year=year, education_type=education_type))
             return redirect(url_for('admin.direction_curriculum', id=id))
         
-        # Import funksiyasiga yil va ta'lim shaklini ham uzatish
-        result = import_curriculum_from_excel(file, direction.id, enrollment_year=year, education_type=education_type)
-        
-        if result['success']:
-            if result['imported'] > 0 or result['updated'] > 0:
-                message = f"Muvaffaqiyatli! {result['imported']} ta yangi qo'shildi, {result['updated']} ta yangilandi."
-                if result.get('subjects_created', 0) > 0:
-                    message += f" {result['subjects_created']} ta yangi fan yaratildi."
-                if result['errors']:
-                    message += f" {len(result['errors'])} ta xatolik yuz berdi."
-                flash(message, 'success' if not result['errors'] else 'warning')
-            else:
-                flash("Hech qanday o'zgarish kiritilmadi", 'info')
-            
-            if result['errors']:
-                for error in result['errors'][:10]:  # Faqat birinchi 10 ta xatolikni ko'rsatish
-                    flash(error, 'error')
-        else:
-            flash(f"Import qilishda xatolik: {', '.join(result['errors'])}", 'error')
-        
         if year and education_type:
-            return redirect(url_for('admin.direction_curriculum', id=id, year=year, education_type=education_type))
-        return redirect(url_for('admin.direction_curriculum', id=id))
+            return_url = url_for('admin.direction_curriculum', id=id, year=year, education_type=education_type)
+        else:
+            return_url = url_for('admin.direction_curriculum', id=id)
+        # Import funksiyasiga yil va ta'lim shaklini ham uzatish
+        job = enqueue_job('import_curriculum', f"O'quv rejani import qilish: {direction.name}",
+                          params={'direction_id': direction.id, 'enrollment_year': year, 'education_type': education_type},
+                          upload=file, return_url=return_url, user_id=current_user.id)
+        return redirect(url_for('main.job_detail', job_id=job.id))
     
     return render_template('admin/import_curriculum.html', 
                          direction=direction,
@@ -1721,6 +1724,7 @@ def direction_subjects(id, year=None, education_type=None):
                             db.session.delete(teacher_subject)
         
         db.session.commit()
+        invalidate_course_catalogue()
         flash(f"{semester}-semestr o'qituvchilari muvaffaqiyatli saqlandi", 'success')
         return redirect(url_for('admin.direction_subjects', id=id, year=year, education_type=education_type))
     
@@ -1811,6 +1815,7 @@ def delete_curriculum_item(id, item_id, year=None, education_type=None):
     
     db.session.delete(item)
     db.session.commit()
+    invalidate_course_catalogue()
     flash("Fan o'quv rejasidan o'chirildi", 'success')
     if year and education_type:
         return redirect(url_for('admin.direction_curriculum', id=id, year=year, education_type=education_type))
@@ -1862,6 +1867,7 @@ def add_subject_to_curriculum(id, year=None, education_type=None):
             added += 1
     
     db.session.commit()
+    invalidate_course_catalogue()
     flash(f"{added} ta fan o'quv rejaga qo'shildi", 'success')
     if year and education_type:
         return redirect(url_for('admin.direction_curriculum', id=id, year=year, education_type=education_type))
@@ -1913,6 +1919,7 @@ def update_semester_curriculum(id, semester, year=None, education_type=None):
         updated_count += 1
         
     db.session.commit()
+    invalidate_course_catalogue()
     flash(f"{semester}-semestr o'quv rejasi yangilandi", 'success')
     
     if year and education_type:
@@ -1953,6 +1960,7 @@ def replace_curriculum_item(id, item_id, year=None, education_type=None):
             else:
                 item.subject_id = new_subject_id
                 db.session.commit()
+                invalidate_course_catalogue()
                 flash(f"Fan {new_subject.name} ga almashtirildi", 'success')
         else:
             flash("Tanlangan fan topilmadi", 'error')
@@ -2084,26 +2092,12 @@ def import_schedule():
             return redirect(request.url)
             
         if file and file.filename.endswith('.xlsx'):
-            try:
-                result = import_schedule_from_excel(file)
-                
-                if result.get('success'):
-                    count = result.get('imported', 0)
-                    errors = result.get('errors', [])
-                    
-                    if errors:
-                        for error in errors[:10]:
-                            flash(error, 'danger')
-                        if count > 0:
-                            flash(f"{count} ta dars jadvali muvaffaqiyatli import qilindi", 'warning')
-                    else:
-                        flash(f"{count} ta dars jadvali muvaffaqiyatli import qilindi", 'success')
-                    return redirect(url_for('admin.schedule'))
-                else:
-                    for error in result.get('errors', []):
-                        flash(error, 'danger')
-            except Exception as e:
-                flash(f"Xatolik yuz berdi: {str(e)}", 'danger')
+            # Tekshiruv rejimi: to'qnashuv va xatolar hisoboti, bazaga hech narsa yozilmaydi
+            dry_run = bool(request.form.get('dry_run'))
+            title = "Dars jadvalini tekshirish" if dry_run else "Dars jadvalini import qilish"
+            job = enqueue_job('import_schedule', title, params={'dry_run': dry_run}, upload=file,
+                              return_url=url_for('admin.schedule'), user_id=current_user.id)
+            return redirect(url_for('main.job_detail', job_id=job.id))
         else:
             flash("Faqat .xlsx formatidagi fayllarni yuklash mumkin", 'danger')
             
@@ -2300,16 +2294,19 @@ def reports():
         'active_users': User.query.filter_by(is_active=True).count(),
     }
     
-    # Fakultetlar bo'yicha statistika
+    # Fakultetlar bo'yicha statistika (har biri bitta GROUP BY so'rov, fakultet boshiga so'rovsiz)
+    groups_counts = dict(db.session.query(Group.faculty_id, func.count(Group.id)).group_by(Group.faculty_id).all())
+    subjects_counts = dict(db.session.query(
+        Group.faculty_id, func.count(func.distinct(TeacherSubject.subject_id))
+    ).join(TeacherSubject, TeacherSubject.group_id == Group.id).group_by(Group.faculty_id).all())
+    students_counts = Group.students_count_map(by=Group.faculty_id)
     faculty_stats = []
     for faculty in Faculty.query.all():
         faculty_stats.append({
             'faculty': faculty,
-            'groups': faculty.groups.count(),
-            'subjects': Subject.query.join(TeacherSubject).join(Group).filter(
-                Group.faculty_id == faculty.id
-            ).distinct().count(),
-            'students': User.query.join(Group).filter(Group.faculty_id == faculty.id).count()
+            'groups': groups_counts.get(faculty.id, 0),
+            'subjects': subjects_counts.get(faculty.id, 0),
+            'students': students_counts.get(faculty.id, 0)
         })
     
     # Guruhlar bo'yicha talabalar
@@ -2365,6 +2362,7 @@ def create_grade():
         )
         db.session.add(grade)
         db.session.commit()
+        GradeScale.invalidate_cache()
         
         flash("Baho muvaffaqiyatli qo'shildi", 'success')
         return redirect(url_for('admin.grade_scale'))
@@ -2391,6 +2389,7 @@ def edit_grade(id):
         grade.order = request.form.get('order', type=int)
         
         db.session.commit()
+        GradeScale.invalidate_cache()
         flash("Baho yangilandi", 'success')
         return redirect(url_for('admin.grade_scale'))
     
@@ -2405,6 +2404,7 @@ def delete_grade(id):
     grade = GradeScale.query.get_or_404(id)
     db.session.delete(grade)
     db.session.commit()
+    GradeScale.invalidate_cache()
     flash("Baho o'chirildi", 'success')
     return redirect(url_for('admin.grade_scale'))
 
@@ -2417,6 +2417,7 @@ def reset_grade_scale():
     # Barcha baholarni o'chirish
     GradeScale.query.delete()
     db.session.commit()
+    GradeScale.invalidate_cache()
     
     # Standart baholarni qayta yaratish
     GradeScale.init_default_grades()
@@ -2445,31 +2446,9 @@ def import_students():
             flash("Faqat Excel fayllar (.xlsx, .xls) qo'llab-quvvatlanadi", 'error')
             return redirect(url_for('admin.students'))
         
-        try:
-            from app.utils.excel_import import import_students_from_excel
-            
-            result = import_students_from_excel(file, faculty_id=None)
-            
-            if result['success']:
-                if result['imported'] > 0:
-                    flash(f"{result['imported']} ta talaba muvaffaqiyatli import qilindi", 'success')
-                else:
-                    flash("Hech qanday talaba import qilinmadi", 'warning')
-                
-                if result['errors']:
-                    error_msg = f"Xatolar ({len(result['errors'])}): " + "; ".join(result['errors'][:5])
-                    if len(result['errors']) > 5:
-                        error_msg += f" va yana {len(result['errors']) - 5} ta xato"
-                    flash(error_msg, 'warning')
-            else:
-                flash(f"Import xatosi: {result['errors'][0] if result['errors'] else 'Noma`lum xatolik'}", 'error')
-                
-        except ImportError as e:
-            flash(f"Excel import funksiyasi ishlamayapti: {str(e)}", 'error')
-        except Exception as e:
-            flash(f"Import xatosi: {str(e)}", 'error')
-        
-        return redirect(url_for('admin.students'))
+        job = enqueue_job('import_students', "Talabalarni import qilish", upload=file,
+                          return_url=url_for('admin.students'), user_id=current_user.id)
+        return redirect(url_for('main.job_detail', job_id=job.id))
     
     return render_template('admin/import_students.html')
 
@@ -2480,37 +2459,13 @@ def import_students():
 @admin_required
 def export_students():
     """Talabalar ro'yxatini Excel formatida yuklab olish"""
-    try:
-        from app.utils.excel_export import create_students_excel
-    except ImportError:
-        flash("Excel export funksiyasi ishlamayapti. Iltimos, 'pip install openpyxl' buyrug'ini bajaring.", 'error')
-        return redirect(url_for('admin.students'))
-    
     faculty_id = request.args.get('faculty_id', type=int)
-    
     if faculty_id:
-        faculty = Faculty.query.get_or_404(faculty_id)
-        group_ids = [g.id for g in faculty.groups.all()]
-        students = User.query.filter(
-            User.role == 'student',
-            User.group_id.in_(group_ids)
-        ).order_by(User.full_name).all()
-        faculty_name = faculty.name
-    else:
-        students = User.query.filter_by(role='student').order_by(User.full_name).all()
-        faculty_name = None
-    
-    excel_file = create_students_excel(students, faculty_name)
+        Faculty.query.get_or_404(faculty_id)
     
-    filename = f"talabalar_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    if faculty_name:
-        filename = f"talabalar_{faculty_name.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    
-    return Response(
-        excel_file,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        headers={'Content-Disposition': f'attachment; filename={filename}'}
-    )
+    job = enqueue_job('export_students', "Talabalar ro'yxatini eksport qilish", params={'faculty_id': faculty_id},
+                      return_url=url_for('admin.students'), user_id=current_user.id)
+    return redirect(url_for('main.job_detail', job_id=job.id))
 
 
 @bp.route('/export/all_users')
@@ -2518,41 +2473,9 @@ def export_students():
 @admin_required
 def export_all_users():
     """Xodimlarni Excel formatida yuklab olish (admin, dekan, o'qituvchi, buxgalter)"""
-    try:
-        from app.utils.excel_export import create_staff_excel
-    except ImportError:
-        flash("Excel export funksiyasi ishlamayapti. Iltimos, 'pip install openpyxl' buyrug'ini bajaring.", 'error')
-        return redirect(url_for('admin.staff'))
-    
-    # Faqat xodimlar (talabalar emas) - bir nechta rollarni ham qo'shish
-    staff_roles = ['admin', 'dean', 'teacher', 'accounting']
-    
-    # UserRole orqali bir nechta rolli xodimlarni olish
-    staff_user_ids = set()
-    for role in staff_roles:
-        # Asosiy rol bo'yicha
-        users_with_role = User.query.filter_by(role=role).all()
-        staff_user_ids.update([u.id for u in users_with_role])
-        
-        # UserRole orqali bir nechta rolli xodimlar
-        from app.models import UserRole
-        multi_role_users = User.query.join(UserRole).filter(UserRole.role == role).all()
-        staff_user_ids.update([u.id for u in multi_role_users])
-    
-    # Talabalar emas, faqat xodimlar
-    staff_users = User.query.filter(
-        User.id.in_(list(staff_user_ids)),
-        User.role != 'student'
-    ).all()
-    excel_file = create_staff_excel(staff_users)
-    
-    filename = f"xodimlar_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    
-    return Response(
-        excel_file,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        headers={'Content-Disposition': f'attachment; filename={filename}'}
-    )
+    job = enqueue_job('export_staff', "Xodimlar ro'yxatini eksport qilish",
+                      return_url=url_for('admin.staff'), user_id=current_user.id)
+    return redirect(url_for('main.job_detail', job_id=job.id))
 
 
 @bp.route('/import/all_users', methods=['GET', 'POST'])
@@ -2574,31 +2497,9 @@ def import_all_users():
             flash("Faqat Excel fayllar (.xlsx, .xls) qo'llab-quvvatlanadi", 'error')
             return redirect(url_for('admin.staff'))
         
-        try:
-            from app.utils.excel_import import import_staff_from_excel
-            
-            result = import_staff_from_excel(file)
-            
-            if result['success']:
-                if result['imported'] > 0:
-                    flash(f"{result['imported']} ta foydalanuvchi muvaffaqiyatli import qilindi", 'success')
-                else:
-                    flash("Hech qanday foydalanuvchi import qilinmadi", 'warning')
-                
-                if result['errors']:
-                    error_msg = f"Xatolar ({len(result['errors'])}): " + "; ".join(result['errors'][:5])
-                    if len(result['errors']) > 5:
-                        error_msg += f" va yana {len(result['errors']) - 5} ta xato"
-                    flash(error_msg, 'warning')
-            else:
-                flash(f"Import xatosi: {result['errors'][0] if result['errors'] else 'Noma`lum xatolik'}", 'error')
-                
-        except ImportError as e:
-            flash(f"Excel import funksiyasi ishlamayapti: {str(e)}", 'error')
-        except Exception as e:
-            flash(f"Import xatosi: {str(e)}", 'error')
-        
-        return redirect(url_for('admin.staff'))
+        job = enqueue_job('import_staff', "Xodimlarni import qilish", upload=file,
+                          return_url=url_for('admin.staff'), user_id=current_user.id)
+        return redirect(url_for('main.job_detail', job_id=job.id))
     
     return render_template('admin/import_all_users.html')
 
@@ -2629,15 +2530,6 @@ def download_staff_sample_import():
 @admin_required
 def export_schedule():
     """Admin uchun dars jadvalini Excel formatida yuklab olish"""
-    try:
-        from app.utils.excel_export import create_schedule_excel
-    except ImportError:
-        flash("Excel export funksiyasi ishlamayapti. Iltimos, 'pip install openpyxl' buyrug'ini bajaring.", 'error')
-        return redirect(url_for('admin.schedule'))
-    
-    import calendar
-    from app.models import Direction
-    
     # Get all filter parameters
     faculty_id = request.args.get('faculty_id', type=int)
     course_year = request.args.get('course_year', type=int)
@@ -2650,85 +2542,23 @@ def export_schedule():
     
     
     # Determine date range
-    start_code = None
-    end_code = None
-    
-    if start_date or end_date:
-        try:
-            if start_date and end_date:
-                # Both dates provided
-                start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-                end_dt = datetime.strptime(end_date, "%Y-%m-%d")
-                start_code = int(start_dt.strftime("%Y%m%d"))
-                end_code = int(end_dt.strftime("%Y%m%d"))
-            elif start_date:
-                # Only start date: from start_date to far future
-                start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-                start_code = int(start_dt.strftime("%Y%m%d"))
-                end_code = 99991231  # Far future date
-            elif end_date:
-                # Only end date: from far past to end_date
-                end_dt = datetime.strptime(end_date, "%Y-%m-%d")
-                start_code = 19000101  # Far past date
-                end_code = int(end_dt.strftime("%Y%m%d"))
-        except ValueError:
-            flash("Sana formati noto'g'ri", 'error')
-            return redirect(url_for('admin.schedule'))
-    else:
-        # Default to all schedules if no date range specified
-        start_code = 19000101  # Far past
-        end_code = 99991231    # Far future
-    
-    # Build query with all filters (mirror schedule view logic)
-    query = Schedule.query.join(Group).filter(Schedule.day_of_week.between(start_code, end_code))
-    
-    if faculty_id:
-        query = query.filter(Group.faculty_id == faculty_id)
-    if course_year:
-        query = query.filter(Group.course_year == course_year)
-    if direction_id:
-        query = query.filter(Group.direction_id == direction_id)
-    if group_id:
-        query = query.filter(Schedule.group_id == group_id)
-    if teacher_id:
-        query = query.filter(Schedule.teacher_id == teacher_id)
-    if semester:
-        query = query.filter(Group.semester == semester)
-    
-    schedules = query.order_by(Schedule.day_of_week, Schedule.start_time).all()
-    
-    # Generate descriptive filename
-    filename_parts = ["dars_jadvali"]
-    if group_id and schedules:
-        filename_parts.append(schedules[0].group.name if schedules[0].group else "")
-    elif faculty_id:
-        faculty = Faculty.query.get(faculty_id)
-        if faculty:
-            filename_parts.append(faculty.name.replace(' ', '_'))
-    elif teacher_id:
-        teacher = User.query.get(teacher_id)
-        if teacher:
-            filename_parts.append(teacher.full_name.replace(' ', '_'))
-    
-    if start_date and end_date:
-        filename_parts.append(f"{start_date}_{end_date}")
-    
-    filename = "_".join(filter(None, filename_parts)) + ".xlsx"
-    
-    # Create Excel file
-    group_name = schedules[0].group.name if schedules and schedules[0].group else None
-    faculty_name = None
-    if faculty_id:
-        faculty = Faculty.query.get(faculty_id)
-        faculty_name = faculty.name if faculty else None
-    
-    excel_file = create_schedule_excel(schedules, group_name, faculty_name)
+    try:
+        schedule_date_codes(start_date, end_date)
+    except ValueError:
+        flash("Sana formati noto'g'ri", 'error')
+        return redirect(url_for('admin.schedule'))
     
-    return Response(
-        excel_file,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        headers={'Content-Disposition': f'attachment; filename={filename}'}
-    )
+    job = enqueue_job('export_schedule', "Dars jadvalini eksport qilish", params={
+        'faculty_id': faculty_id,
+        'course_year': course_year,
+        'semester': semester,
+        'direction_id': direction_id,
+        'group_id': group_id,
+        'teacher_id': teacher_id,
+        'start_date': start_date,
+        'end_date': end_date,
+    }, return_url=url_for('admin.schedule'), user_id=current_user.id)
+    return redirect(url_for('main.job_detail', job_id=job.id))
 
 
 # ==================== GURUHLAR BOSHQARUVI ====================
@@ -2809,6 +2639,7 @@ def create_group():
         )
         db.session.add(group)
         db.session.commit()
+        invalidate_org_hierarchy()
         
         flash("Guruh muvaffaqiyatli yaratildi", 'success')
         # Fakultet detail sahifasiga qaytish
@@ -2889,6 +2720,7 @@ def edit_group(id):
         group.description = description if description else None
         
         db.session.commit()
+        invalidate_org_hierarchy()
         flash("Guruh yangilandi", 'success')
         
         # Redireksiya
@@ -3004,6 +2836,7 @@ def delete_group(id):
         # Guruhga bog'liq Schedule yozuvlarini o'chirish
         schedules = Schedule.query.filter_by(group_id=group.id).all()
         for schedule in schedules:
+            record_schedule_removal(schedule)
             db.session.delete(schedule)
         
         # Guruhga bog'liq TeacherSubject yozuvlarini o'chirish
@@ -3014,6 +2847,7 @@ def delete_group(id):
         # Guruhni o'chirish
         db.session.delete(group)
         db.session.commit()
+        invalidate_org_hierarchy()
         flash("Guruh o'chirildi", 'success')
     
     # Fakultet detail sahifasiga qaytish
@@ -3068,6 +2902,7 @@ def create_direction():
         )
         db.session.add(direction)
         db.session.commit()
+        invalidate_org_hierarchy()
         
         flash("Yo'nalish muvaffaqiyatli yaratildi", 'success')
         # Fakultet detail sahifasiga qaytish
@@ -3106,6 +2941,7 @@ def edit_direction(id):
                                  faculties=Faculty.query.all())
         
         db.session.commit()
+        invalidate_org_hierarchy()
         flash("Yo'nalish yangilandi", 'success')
         # Fakultet detail sahifasiga qaytish
         if request.args.get('faculty_id'):
@@ -3140,6 +2976,7 @@ def delete_direction(id):
     else:
         db.session.delete(direction)
         db.session.commit()
+        invalidate_org_hierarchy()
         flash("Yo'nalish o'chirildi", 'success')
     
     # Fakultet detail sahifasiga qaytish
@@ -3315,7 +3152,8 @@ def create_student():
                 db.session.commit()
             else:
                 raise
-        
+        invalidate_org_hierarchy()
+
         flash(f"{student.full_name} muvaffaqiyatli yaratildi", 'success')
         return redirect(url_for('admin.students'))
     
@@ -3441,6 +3279,7 @@ def edit_student(id):
             student.group_id = None
             
         db.session.commit()
+        invalidate_org_hierarchy()
         flash(f"{student.full_name} ma'lumotlari yangilandi", 'success')
         return redirect(url_for('admin.students'))
     
@@ -3923,31 +3762,10 @@ def api_schedule_filters():
     teacher_id = request.args.get('teacher_id', type=int)
     
     if group_id and not subject_id:
-        from app.models import Group, DirectionCurriculum, TeacherSubject
-        group = Group.query.get(group_id)
+        group = get_org_hierarchy().group(group_id)
         if not group:
             return jsonify([])
-            
-        current_semester = group.semester if group.semester else 1
-        
-        # Guruhga biriktirilgan fanlar, lekin faqat joriy semestrdagilar
-        assignments = TeacherSubject.query.filter_by(group_id=group_id).all()
-        subjects_data = {}
-        for a in assignments:
-            # Tekshirish: bu fan bu guruhda shu semestrda bormi?
-            curr_item = DirectionCurriculum.query.filter_by(
-                direction_id=group.direction_id,
-                subject_id=a.subject_id,
-                semester=current_semester
-            ).first()
-            
-            if curr_item and a.subject_id not in subjects_data:
-                subjects_data[a.subject_id] = {
-                    'id': a.subject.id,
-                    'name': a.subject.name,
-                    'code': a.subject.code
-                }
-        return jsonify(sorted(list(subjects_data.values()), key=lambda x: x['name']))
+        return jsonify(group_semester_subjects(group))
     
     if group_id and subject_id and not teacher_id:
         # Guruh va fan uchun biriktirilgan o'qituvchilar
@@ -3973,6 +3791,25 @@ def api_schedule_filters():
         
     return jsonify([])
 
+
+@bp.route('/api/schedule/free-slots')
+@login_required
+@admin_required
+def api_schedule_free_slots():
+    """Haftaning o'quv kunlarida guruh va o'qituvchi bir vaqtda bo'sh bo'lgan oraliqlar.
+    week - haftadagi istalgan sana (YYYY-MM-DD), duration - dars davomiyligi (daqiqa)"""
+    group_id = request.args.get('group_id', type=int)
+    teacher_id = request.args.get('teacher_id', type=int)
+    duration = request.args.get('duration', type=int) or DEFAULT_LESSON_MINUTES
+    try:
+        week = datetime.strptime(request.args.get('week', ''), "%Y-%m-%d").date()
+    except ValueError:
+        return jsonify({'error': "week parametri YYYY-MM-DD formatida bo'lishi kerak"}), 400
+    if not group_id and not teacher_id:
+        return jsonify({'error': "group_id yoki teacher_id kerak"}), 400
+    return jsonify(find_free_slots(week, teacher_id=teacher_id, group_id=group_id, duration=max(duration, 1)))
+
+
 @bp.route('/schedule')
 @login_required
 @admin_required
@@ -4006,9 +3843,6 @@ def schedule():
     today_month = today.month
     today_day = today.day
     
-    start_code = int(f"{year}{month:02d}01")
-    end_code = int(f"{year}{month:02d}{days_in_month:02d}")
-    
     # Advanced Filters
     faculty_id = request.args.get('faculty_id', type=int)
     course_year = request.args.get('course_year', type=int)
@@ -4017,81 +3851,19 @@ def schedule():
     group_id = request.args.get('group_id', type=int)
     teacher_id = request.args.get('teacher_id', type=int)
     
-    faculties = Faculty.query.order_by(Faculty.name).all()
+    hierarchy = get_org_hierarchy()
+    faculties = hierarchy.faculties
 
     all_teachers = User.query.outerjoin(UserRole).filter(
         or_(User.role == 'teacher', UserRole.role == 'teacher')
     ).distinct().order_by(User.full_name).all()
     
-    # Mirror the data structure logic from create_schedule
-    from app.models import Direction
-    # Optimized robust mapping
-    faculty_courses = {f.id: set() for f in faculties}
-    faculty_course_semesters = {f.id: {} for f in faculties}
-    faculty_course_semester_education_directions = {f.id: {} for f in faculties}
-    direction_groups = {}
-    
-    all_groups = Group.query.all()
-    for g in all_groups:
-        print(f"DEBUG: Processing g: {g}, type: {type(g)}")
-        fid = g.faculty_id
-        if fid not in faculty_courses: continue
-        
-        c = g.course_year
-        if not c: continue
-        
-        faculty_courses[fid].add(c)
-        
-        if g.direction:
-            d = g.direction
-            s = g.semester
-            
-            if c not in faculty_course_semesters[fid]:
-                faculty_course_semesters[fid][c] = set()
-            faculty_course_semesters[fid][c].add(s)
-            
-            if s not in faculty_course_semester_education_directions[fid]:
-                faculty_course_semester_education_directions[fid][s] = {}
-            if c not in faculty_course_semester_education_directions[fid][s]:
-                faculty_course_semester_education_directions[fid][s][c] = {}
-            
-            etype = g.education_type or 'kunduzgi'
-            if etype not in faculty_course_semester_education_directions[fid][s][c]:
-                faculty_course_semester_education_directions[fid][s][c][etype] = []
-            
-            if not any(item['id'] == d.id for item in faculty_course_semester_education_directions[fid][s][c][etype]):
-                faculty_course_semester_education_directions[fid][s][c][etype].append({
-                    'id': d.id,
-                    'name': d.name,
-                    'code': d.code,
-                    'enrollment_year': g.enrollment_year,
-                    'education_type': etype
-                })
-            
-            if d.id not in direction_groups:
-                direction_groups[d.id] = []
-            if not any(item['id'] == g.id for item in direction_groups[d.id]):
-                direction_groups[d.id].append({
-                    'id': g.id,
-                    'name': g.name
-                })
-
-    # Convert sets to sorted lists
-    for fid in faculty_courses:
-        faculty_courses[fid] = sorted(list(faculty_courses[fid]))
-        for c in faculty_course_semesters[fid]:
-            faculty_course_semesters[fid][c] = sorted(list(faculty_course_semesters[fid][c]))
-
-
-    # Filter groups that have students
-    active_groups_all = [g for g in Group.query.all() if g.get_students_count() > 0]
-    all_courses = sorted(list(set(g.course_year for g in active_groups_all if g.course_year)))
-    all_semesters = sorted(list(set(g.semester for g in active_groups_all if g.semester)))
-    all_directions = sorted(list(set(g.direction for g in active_groups_all if g.direction)), key=lambda x: x.name)
-    all_groups = sorted(active_groups_all, key=lambda x: x.name)
+    # Bog'langan filtrlar (bo'sh guruhlar ham) va talabasi bor guruhlardan ro'yxatlar
+    tree = hierarchy.schedule_tree(active_only=False)
+    filters = hierarchy.filter_options()
 
     # Base query
-    query = Schedule.query.join(Group).filter(Schedule.day_of_week.between(start_code, end_code))
+    query = Schedule.query.join(Group)
     
     # Apply additive filters
     if faculty_id:
@@ -4107,31 +3879,18 @@ def schedule():
     if semester:
         query = query.filter(Group.semester == semester)
         
-    schedules = query.order_by(Schedule.day_of_week, Schedule.start_time).all()
-    
-    schedule_by_day = {i: [] for i in range(1, days_in_month + 1)}
-    for s in schedules:
-        try:
-            code_str = str(s.day_of_week)
-            day = int(code_str[-2:])
-        except (TypeError, ValueError):
-            continue
-        if 1 <= day <= days_in_month:
-            schedule_by_day[day].append(s)
-    
-    for day in schedule_by_day:
-        schedule_by_day[day].sort(key=lambda x: x.start_time or '')
+    schedule_by_day = month_schedule(query, year, month)
     
     return render_template('admin/schedule.html', 
                          faculties=faculties,
-                         faculty_courses=faculty_courses,
-                         faculty_course_semesters=faculty_course_semesters,
-                         faculty_course_semester_education_directions=faculty_course_semester_education_directions,
-                         direction_groups=direction_groups,
-                         all_courses=all_courses,
-                         all_semesters=all_semesters,
-                         all_directions=all_directions,
-                         all_groups=all_groups,
+                         faculty_courses=tree['faculty_courses'],
+                         faculty_course_semesters=tree['faculty_course_semesters'],
+                         faculty_course_semester_education_directions=tree['faculty_course_semester_education_directions'],
+                         direction_groups=tree['direction_groups'],
+                         all_courses=filters['courses'],
+                         all_semesters=filters['semesters'],
+                         all_directions=filters['directions'],
+                         all_groups=filters['groups'],
                          all_teachers=all_teachers,
                          current_faculty_id=faculty_id,
                          current_course_year=course_year,
@@ -4158,67 +3917,10 @@ def schedule():
 @admin_required
 def create_schedule():
     """Admin uchun dars jadvaliga qo'shish"""
-    from app.models import Direction
-    
-    faculties = Faculty.query.order_by(Faculty.name).all()
-    # Optimized robust mapping
-    faculty_courses = {f.id: set() for f in faculties}
-    faculty_course_semesters = {f.id: {} for f in faculties}
-    faculty_course_semester_education_directions = {f.id: {} for f in faculties}
-    direction_groups = {}
-    
-    all_groups = Group.query.all()
-    for g in all_groups:
-        if g.get_students_count() == 0: continue # Skip empty groups
-        
-        fid = g.faculty_id
-        if fid not in faculty_courses: continue
-        
-        c = g.course_year
-        if not c: continue
-        
-        faculty_courses[fid].add(c)
-        
-        if g.direction:
-            d = g.direction
-            s = g.semester
-            
-            if c not in faculty_course_semesters[fid]:
-                faculty_course_semesters[fid][c] = set()
-            faculty_course_semesters[fid][c].add(s)
-            
-            if s not in faculty_course_semester_education_directions[fid]:
-                faculty_course_semester_education_directions[fid][s] = {}
-            if c not in faculty_course_semester_education_directions[fid][s]:
-                faculty_course_semester_education_directions[fid][s][c] = {}
-            
-            etype = g.education_type or 'kunduzgi'
-            if etype not in faculty_course_semester_education_directions[fid][s][c]:
-                faculty_course_semester_education_directions[fid][s][c][etype] = []
-            
-            if not any(item['id'] == d.id for item in faculty_course_semester_education_directions[fid][s][c][etype]):
-                faculty_course_semester_education_directions[fid][s][c][etype].append({
-                    'id': d.id,
-                    'name': d.name,
-                    'code': d.code,
-                    'enrollment_year': g.enrollment_year,
-                    'education_type': etype
-                })
-            
-            if d.id not in direction_groups:
-                direction_groups[d.id] = []
-            if not any(item['id'] == g.id for item in direction_groups[d.id]):
-                direction_groups[d.id].append({
-                    'id': g.id,
-                    'name': g.name
-                })
-
-    # Convert sets to sorted lists
-    for fid in faculty_courses:
-        faculty_courses[fid] = sorted(list(faculty_courses[fid]))
-        for c in faculty_course_semesters[fid]:
-            faculty_course_semesters[fid][c] = sorted(list(faculty_course_semesters[fid][c]))
-
+    hierarchy = get_org_hierarchy()
+    faculties = hierarchy.faculties
+    # Bog'langan tanlovlar (faqat talabasi bor guruhlar)
+    tree = hierarchy.schedule_tree()
 
     # GET parametrlar orqali kelgan default sana
     default_date = request.args.get('date')
@@ -4267,42 +3969,40 @@ def create_schedule():
         found_types = sorted(list(set([types_map.get(a.lesson_type, a.lesson_type.capitalize()) for a in assignments if a.lesson_type])))
         lesson_type_display = "/".join(found_types) if found_types else 'Ma\'ruza'
         
-        # Takrorlanishni tekshirish
-        existing = Schedule.query.filter_by(
-            group_id=group_id,
-            day_of_week=date_code,
-            start_time=start_time
-        ).first()
-        
-        if existing:
-            flash(f"Bu vaqtda ({start_time}) guruhda dars allaqachon mavjud: {existing.subject.name}", 'warning')
-            return redirect(url_for('admin.schedule', year=parsed_date.year, month=parsed_date.month, group=group_id))
-
-        schedule_entry = Schedule(
-            subject_id=subject_id,
-            group_id=group_id,
-            teacher_id=teacher_id,
-            day_of_week=date_code,
-            start_time=start_time,
-            end_time=None,
-            link=link,
-            lesson_type=lesson_type_display[:20] # Model limitiga moslash
-        )
+        # O'qituvchi yoki guruh shu vaqtda band emasligini tekshirish (birlashgan ma'ruza bundan mustasno)
+        clash = describe_conflicts(find_schedule_conflicts(
+            parsed_date.date(), start_time, teacher_id=teacher_id, group_id=group_id, subject_id=subject_id
+        ))
+        if clash:
+            # Forma kiritilgan qiymatlar bilan qayta ko'rsatiladi
+            flash(f"Bu vaqtda ({start_time}) dars qo'yib bo'lmaydi - {clash}", 'warning')
+        else:
+            schedule_entry = Schedule(
+                subject_id=subject_id,
+                group_id=group_id,
+                teacher_id=teacher_id,
+                day_of_week=date_code,
+                start_time=start_time,
+                end_time=None,
+                link=link,
+                lesson_type=lesson_type_display[:20] # Model limitiga moslash
+            )
 
-        db.session.add(schedule_entry)
-        db.session.commit()
+            db.session.add(schedule_entry)
+            db.session.commit()
         
-        flash("Dars jadvaliga qo'shildi", 'success')
+            flash("Dars jadvaliga qo'shildi", 'success')
             
-        return redirect(url_for('admin.schedule', year=parsed_date.year, month=parsed_date.month, group=group_id))
+            return redirect(url_for('admin.schedule', year=parsed_date.year, month=parsed_date.month, group=group_id))
     
     return render_template('admin/create_schedule.html',
                          faculties=faculties,
-                         faculty_courses=faculty_courses,
-                         faculty_course_semesters=faculty_course_semesters,
-                         faculty_course_semester_education_directions=faculty_course_semester_education_directions,
-                         direction_groups=direction_groups,
-                         default_date=default_date)
+                         faculty_courses=tree['faculty_courses'],
+                         faculty_course_semesters=tree['faculty_course_semesters'],
+                         faculty_course_semester_education_directions=tree['faculty_course_semester_education_directions'],
+                         direction_groups=tree['direction_groups'],
+                         default_date=default_date,
+                         form=request.form)
 
 
 @bp.route('/schedule/<int:id>/edit', methods=['GET', 'POST'])
@@ -4312,78 +4012,15 @@ def edit_schedule(id):
     """Admin uchun dars jadvalini tahrirlash"""
     schedule = Schedule.query.get_or_404(id)
     
-    faculties = Faculty.query.order_by(Faculty.name).all()
-    
-    # Mirror the data structure logic from create_schedule
-    from app.models import Direction
-    faculty_courses = {}
-    faculty_course_semesters = {}
-    faculty_course_semester_education_directions = {}
-    direction_groups = {}
-    
-    # Optimized robust mapping
-    faculty_courses = {f.id: set() for f in faculties}
-    faculty_course_semesters = {f.id: {} for f in faculties}
-    faculty_course_semester_education_directions = {f.id: {} for f in faculties}
-    direction_groups = {}
-    
-    all_groups = Group.query.all()
-    for g in all_groups:
-        if g.get_students_count() == 0: continue # Skip empty groups
-        
-        fid = g.faculty_id
-        if fid not in faculty_courses: continue
-        
-        c = g.course_year
-        if not c: continue
-        
-        faculty_courses[fid].add(c)
-        
-        if g.direction:
-            d = g.direction
-            s = g.semester
-            
-            if c not in faculty_course_semesters[fid]:
-                faculty_course_semesters[fid][c] = set()
-            faculty_course_semesters[fid][c].add(s)
-            
-            if s not in faculty_course_semester_education_directions[fid]:
-                faculty_course_semester_education_directions[fid][s] = {}
-            if c not in faculty_course_semester_education_directions[fid][s]:
-                faculty_course_semester_education_directions[fid][s][c] = {}
-            
-            etype = g.education_type or 'kunduzgi'
-            if etype not in faculty_course_semester_education_directions[fid][s][c]:
-                faculty_course_semester_education_directions[fid][s][c][etype] = []
-            
-            if not any(item['id'] == d.id for item in faculty_course_semester_education_directions[fid][s][c][etype]):
-                faculty_course_semester_education_directions[fid][s][c][etype].append({
-                    'id': d.id,
-                    'name': d.name,
-                    'code': d.code,
-                    'enrollment_year': g.enrollment_year,
-                    'education_type': etype
-                })
-            
-            if d.id not in direction_groups:
-                direction_groups[d.id] = []
-            if not any(item['id'] == g.id for item in direction_groups[d.id]):
-                direction_groups[d.id].append({
-                    'id': g.id,
-                    'name': g.name
-                })
-
-    # Convert sets to sorted lists
-    for fid in faculty_courses:
-        faculty_courses[fid] = sorted(list(faculty_courses[fid]))
-        for c in faculty_course_semesters[fid]:
-            faculty_course_semesters[fid][c] = sorted(list(faculty_course_semesters[fid][c]))
+    hierarchy = get_org_hierarchy()
+    faculties = hierarchy.faculties
+    # Bog'langan tanlovlar (faqat talabasi bor guruhlar)
+    tree = hierarchy.schedule_tree()
 
-    
     # Prepare pre-population data
     current_group = schedule.group
     current_faculty_id = current_group.faculty_id
-    current_direction = current_group.direction
+    current_direction_id = current_group.direction_id
     current_course_year = current_group.course_year
     current_semester = current_group.semester if current_group.semester else 1
     
@@ -4409,43 +4046,65 @@ def edit_schedule(id):
             flash("Sana tanlanishi shart.", 'error')
             return redirect(url_for('admin.edit_schedule', id=id))
         
-        schedule.subject_id = request.form.get('subject_id', type=int)
-        schedule.group_id = request.form.get('group_id', type=int)
-        schedule.teacher_id = request.form.get('teacher_id', type=int)
-        schedule.day_of_week = date_code
-        schedule.start_time = request.form.get('start_time')
-        schedule.end_time = None # User request: remove end time
-        schedule.link = request.form.get('link')
-        
-        # O'qituvchiga biriktirilgan barcha dars turlarini topish
-        from app.models import TeacherSubject
-        assignments = TeacherSubject.query.filter_by(
-            group_id=schedule.group_id,
-            subject_id=schedule.subject_id,
-            teacher_id=schedule.teacher_id
-        ).all()
+        clash = describe_conflicts(find_schedule_conflicts(
+            parsed_date.date(), request.form.get('start_time'),
+            teacher_id=request.form.get('teacher_id', type=int),
+            group_id=request.form.get('group_id', type=int),
+            subject_id=request.form.get('subject_id', type=int),
+            exclude_id=schedule.id
+        ))
+        if clash:
+            # Forma kiritilgan qiymatlar bilan qayta ko'rsatiladi
+            flash(f"Bu vaqtda ({request.form.get('start_time')}) dars qo'yib bo'lmaydi - {clash}", 'warning')
+            current_faculty_id = request.form.get('faculty_id', type=int)
+            current_course_year = request.form.get('course_year', type=int)
+            current_semester = request.form.get('semester', type=int)
+            current_direction_id = request.form.get('direction_id', type=int)
+        else:
+            old_group_id, old_teacher_id = schedule.group_id, schedule.teacher_id
+            schedule.subject_id = request.form.get('subject_id', type=int)
+            schedule.group_id = request.form.get('group_id', type=int)
+            schedule.teacher_id = request.form.get('teacher_id', type=int)
+            schedule.day_of_week = date_code
+            schedule.start_time = request.form.get('start_time')
+            schedule.end_time = None # User request: remove end time
+            schedule.link = request.form.get('link')
+        
+            # O'qituvchiga biriktirilgan barcha dars turlarini topish
+            from app.models import TeacherSubject
+            assignments = TeacherSubject.query.filter_by(
+                group_id=schedule.group_id,
+                subject_id=schedule.subject_id,
+                teacher_id=schedule.teacher_id
+            ).all()
         
-        types_map = {
-            'maruza': 'Ma\'ruza',
-            'lecture': 'Ma\'ruza',
-            'amaliyot': 'Amaliyot',
-            'practice': 'Amaliyot',
-            'lab': 'Laboratoriya',
-            'seminar': 'Seminar'
-        }
-        found_types = sorted(list(set([types_map.get(a.lesson_type, str(a.lesson_type).capitalize()) for a in assignments if a.lesson_type])))
-        schedule.lesson_type = "/".join(found_types)[:20] if found_types else 'Ma\'ruza'
+            types_map = {
+                'maruza': 'Ma\'ruza',
+                'lecture': 'Ma\'ruza',
+                'amaliyot': 'Amaliyot',
+                'practice': 'Amaliyot',
+                'lab': 'Laboratoriya',
+                'seminar': 'Seminar'
+            }
+            found_types = sorted(list(set([types_map.get(a.lesson_type, str(a.lesson_type).capitalize()) for a in assignments if a.lesson_type])))
+            schedule.lesson_type = "/".join(found_types)[:20] if found_types else 'Ma\'ruza'
+            # Boshqa guruh yoki o'qituvchiga o'tkazilsa, eski egasining .ics tasmasida dars bekor qilinadi
+            record_schedule_removal(
+                schedule, moved=True,
+                group_id=old_group_id if old_group_id != schedule.group_id else None,
+                teacher_id=old_teacher_id if old_teacher_id != schedule.teacher_id else None
+            )
 
         
-        db.session.commit()
+            db.session.commit()
         
-        flash("Dars jadvali yangilandi", 'success')
-        return redirect(url_for(
-            'admin.schedule',
-            year=parsed_date.year,
-            month=parsed_date.month,
-            group=schedule.group_id
-        ))
+            flash("Dars jadvali yangilandi", 'success')
+            return redirect(url_for(
+                'admin.schedule',
+                year=parsed_date.year,
+                month=parsed_date.month,
+                group=schedule.group_id
+            ))
     
     schedule_date = existing_date.strftime("%Y-%m-%d")
     year = existing_date.year
@@ -4454,18 +4113,19 @@ def edit_schedule(id):
     return render_template(
         'admin/edit_schedule.html',
         faculties=faculties,
-        faculty_courses=faculty_courses,
-        faculty_course_semesters=faculty_course_semesters,
-        faculty_course_semester_education_directions=faculty_course_semester_education_directions,
-        direction_groups=direction_groups,
+        faculty_courses=tree['faculty_courses'],
+        faculty_course_semesters=tree['faculty_course_semesters'],
+        faculty_course_semester_education_directions=tree['faculty_course_semester_education_directions'],
+        direction_groups=tree['direction_groups'],
         schedule=schedule,
         schedule_date=schedule_date,
         current_faculty_id=current_faculty_id,
         current_course_year=current_course_year,
         current_semester=current_semester,
-        current_direction_id=current_direction.id if current_direction else None,
+        current_direction_id=current_direction_id,
         year=year,
-        month=month)
+        month=month,
+        form=request.form)
 
 
 @bp.route('/schedule/<int:id>/delete', methods=['POST'])
@@ -4475,6 +4135,7 @@ def delete_schedule(id):
     """Admin uchun dars jadvalini o'chirish"""
     schedule = Schedule.query.get_or_404(id)
     
+    record_schedule_removal(schedule)
     db.session.delete(schedule)
     db.session.commit()
     flash("Jadval o'chirildi", 'success')
@@ -1,24 +1,21 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, g
 from flask_login import login_required, current_user
-from app.models import User, Subject, Message, Faculty, Group, Direction, ApiKey
-from app import db
-from werkzeug.security import check_password_hash
-from datetime import datetime
+from app.models import User, Subject, Faculty, Group, Direction
+from app.utils.api_key_cache import verify_api_key
+from app.utils.messaging import get_unread_count
 
 bp = Blueprint('api', __name__, url_prefix='/api')
 
 
 def get_api_key_from_request():
-    """X-API-Key header orqali mobil ilova kalitini tekshirish. To'g'ri bo'lsa ApiKey obektini qaytaradi."""
+    """X-API-Key header orqali mobil ilova kalitini tekshirish. To'g'ri bo'lsa VerifiedApiKey obektini qaytaradi."""
+    if 'api_key' in g:
+        return g.api_key
     raw_key = request.headers.get('X-API-Key') or request.args.get('api_key')
     if not raw_key:
         return None
-    for key in ApiKey.query.filter_by(is_active=True).all():
-        if check_password_hash(key.key_hash, raw_key):
-            key.last_used_at = datetime.utcnow()
-            db.session.commit()
-            return key
-    return None
+    g.api_key = verify_api_key(raw_key)
+    return g.api_key
 
 
 def mobile_api_required(permission=None):
@@ -151,11 +148,7 @@ def search_users():
 @bp.route('/messages/unread')
 @login_required
 def unread_messages():
-    count = Message.query.filter_by(
-        receiver_id=current_user.id,
-        is_read=False
-    ).count()
-    return jsonify({'count': count})
+    return jsonify({'count': get_unread_count(current_user.id)})
 
 @bp.route('/dashboard/stats')
 @login_required
@@ -1,12 +1,22 @@
 import os
-import uuid
 import json
 import requests
-from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, send_from_directory, jsonify, Response, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, jsonify, Response, session, abort
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 from app.models import Subject, Lesson, Assignment, Submission, User, TeacherSubject, Group, LessonView, GradeScale, DirectionCurriculum, Direction, UserRole
 from app import db
+from app.utils.grade_matrix import get_grade_matrix, invalidate_grade_matrix
+from app.utils.semester_progress import refresh_student_subject, mark_progress_stale
+from app.utils.course_catalogue import teacher_catalogue, student_catalogue, subject_curriculum_types, invalidate_course_catalogue
+from app.utils.lesson_progress import subject_lock_states, is_lesson_locked
+from app.utils.watch_time import record_watch_time, flush_watch_time
+from app.utils.media import send_media
+from app.utils.video_transcode import video_renditions, renditions_folder, schedule_transcode, purge_renditions
+from app.utils.blob_store import (store_upload, stored_location, sync_lesson_attachments, release_lesson_attachments,
+                                  sync_submission_attachment, purge_blobs, lesson_for_file, submission_for_file)
+from app.utils.chunked_upload import (UploadError, initiate_upload, get_upload, upload_state, save_chunk,
+                                      finalize_upload, claim_upload)
 from datetime import datetime, timedelta
 
 def get_tashkent_time():
@@ -35,6 +45,7 @@ def index():
     
     # Tanlangan rol
     current_role = session.get('current_role', current_user.role)
+    student_cards = []
     
     if current_role == 'student':
         # Talaba faqat o'z guruhiga biriktirilgan va joriy semestrdagi fanlarni ko'radi
@@ -54,22 +65,12 @@ def index():
         else:
             query = Subject.query.filter(False)  # Bo'sh
     elif current_role == 'teacher':
-        # O'qituvchi faqat joriy semestrdagi fanlarni ko'radi
-        teacher_subjects = TeacherSubject.query.filter_by(teacher_id=current_user.id).all()
-        valid_subject_ids = set()
-        
-        for ts in teacher_subjects:
-            group = Group.query.get(ts.group_id)
-            if group and group.direction_id and group.get_students_count() > 0:
-                current_semester = group.semester if group.semester else 1
-                # Tekshirish: bu fan bu guruhda shu semestrda bormi?
-                curr_item = DirectionCurriculum.query.filter_by(
-                    direction_id=group.direction_id,
-                    subject_id=ts.subject_id,
-                    semester=current_semester
-                ).first()
-                if curr_item:
-                    valid_subject_ids.add(ts.subject_id)
+        # O'qituvchi faqat joriy semestrdagi fanlarni ko'radi (katalog keshdan, biriktirish boshiga so'rovsiz)
+        teacher_cards, valid_subject_ids = teacher_catalogue(
+            current_user.id,
+            check_teacher_id=current_user.id if (current_user.role == 'teacher' or current_user.has_role('teacher')) else None,
+            is_admin=current_user.role in ['admin', 'dean']
+        )
         
         query = Subject.query.filter(Subject.id.in_(list(valid_subject_ids))) if valid_subject_ids else Subject.query.filter(False)
     else:
@@ -93,149 +94,20 @@ def index():
             current_semester = group.semester
         
         if group and group.direction_id:
-            # DirectionCurriculum orqali faqat joriy semestrdagi fanlarni olish
-            curriculum_items = DirectionCurriculum.query.filter_by(
-                direction_id=group.direction_id,
-                semester=current_semester
-            ).join(Subject).order_by(Subject.name).all()
-            
-            for item in curriculum_items:
-                semester = item.semester
-                if semester not in subjects_by_semester:
-                    subjects_by_semester[semester] = []
-                # Takrorlanuvchi fanlarni tekshirish
-                existing_subjects = [s['subject'].id for s in subjects_by_semester[semester]]
-                if item.subject.id not in existing_subjects:
-                    # Talaba uchun yo'nalish bo'yicha dars va topshiriqlar sonini hisoblash
-                    lessons_count = Lesson.query.filter_by(
-                        subject_id=item.subject.id,
-                        direction_id=group.direction_id
-                    ).count()
-                    
-                    assignments_count = Assignment.query.filter_by(
-                        subject_id=item.subject.id,
-                        direction_id=group.direction_id
-                    ).count()
-    
-                    
-                    # Kursni hisoblash
-                    course_year = ((semester - 1) // 2) + 1
-                    # Kreditni o'quv rejasidagi soatlar bo'yicha hisoblash (maruza + amaliyot + laboratoriya + seminar + mustaqil) / 30
-                    # Kurs ishi kreditga kiritilmaydi
-                    total_hours = (item.hours_maruza or 0) + (item.hours_amaliyot or 0) + \
-                                 (item.hours_laboratoriya or 0) + (item.hours_seminar or 0) + \
-                                 (item.hours_mustaqil or 0)
-                    credits = total_hours / 30 if total_hours > 0 else (item.subject.credits if item.subject.credits else 0)
-                    
-                    # Bu fanga biriktirilgan o'qituvchilarni olish
-                    teacher_subjects = TeacherSubject.query.filter_by(
-                        subject_id=item.subject.id,
-                        group_id=current_user.group_id
-                    ).all()
-                    
-                    # O'qituvchilarni olish (takrorlanmasligi uchun)
-                    teachers_list = []
-                    seen_teachers = set()
-                    for ts in teacher_subjects:
-                        if ts.teacher_id and ts.teacher_id not in seen_teachers:
-                            teacher = User.query.get(ts.teacher_id)
-                            if teacher:
-                                teachers_list.append(teacher)
-                                seen_teachers.add(ts.teacher_id)
-                    
-                    # Direction ma'lumotini olish
-                    from app.models import Direction
-                    direction = Direction.query.get(group.direction_id) if group.direction_id else None
-                    
-                    subjects_by_semester[semester].append({
-                        'subject': item.subject,
-                        'semester': semester,
-                        'course_year': course_year,
-                        'credits': credits,
-                        'lessons_count': lessons_count,
-                        'assignments_count': assignments_count,
-                        'teachers': teachers_list,
-                        'direction': direction
-                    })
-                    if item.subject not in all_subjects_list:
-                        all_subjects_list.append(item.subject)
+            # Joriy semestr fanlari: dars/topshiriq soni, o'qituvchilar va dars turlari katalogdan
+            student_cards = student_catalogue(current_user.id, group, current_semester)
+            for card in student_cards:
+                subjects_by_semester.setdefault(card['semester'], []).append(card)
+                if card['subject'] not in all_subjects_list:
+                    all_subjects_list.append(card['subject'])
         else:
             # Agar yo'nalish bo'lmasa, oddiy tartibda
             subjects = query.order_by(Subject.name).paginate(page=page, per_page=12)
             all_subjects_list = list(subjects.items)
     elif current_role == 'teacher':
         # O'qituvchi uchun - yo'nalish bo'yicha guruhlash
-        # Har bir yo'nalish uchun alohida fan card ko'rsatiladi
-        from app.models import Direction
-        
-        teacher_subjects = TeacherSubject.query.filter_by(teacher_id=current_user.id).all()
-        
-        # Har bir fan+yo'nalish kombinatsiyasi uchun ma'lumotlar
-        # {semester: [{subject, direction, groups, credits, semester}, ...]}
-        subject_direction_data = {}  # {(subject_id, direction_id): {'subject': ..., 'direction': ..., 'groups': [...], 'semester': ..., 'credits': ...}}
-        
-        for ts in teacher_subjects:
-            group = Group.query.get(ts.group_id)
-            if group and group.direction_id:
-                # Guruh ma'lumotlarini olish
-                
-                direction = Direction.query.get(group.direction_id)
-                if not direction:
-                    continue
-                
-                # Check current semester of the group
-                current_semester = group.semester if group.semester else 1
-                
-                # Bu guruh uchun bu fanga tegishli o'quv reja ma'lumotlarini olish (joriy semestrda)
-                curriculum_item = DirectionCurriculum.query.filter_by(
-                    direction_id=group.direction_id,
-                    subject_id=ts.subject_id,
-                    semester=current_semester
-                ).first()
-                
-                if curriculum_item:
-                    semester = curriculum_item.semester
-                    key = (ts.subject_id, group.direction_id)
-                    
-                    if key not in subject_direction_data:
-                        subject = Subject.query.get(ts.subject_id)
-                        if not subject:
-                            continue
-                        
-                        # Kreditni yo'nalish o'quv rejasidagi soatlar bo'yicha hisoblash
-                        # (maruza + amaliyot + lobaratoriya + seminar + mustaqil) / 30
-                        # Kurs ishi kreditga kiritilmaydi
-                        total_hours = (curriculum_item.hours_maruza or 0) + \
-                                     (curriculum_item.hours_amaliyot or 0) + \
-                                     (curriculum_item.hours_laboratoriya or 0) + \
-                                     (curriculum_item.hours_seminar or 0) + \
-                                     (curriculum_item.hours_mustaqil or 0)
-                        credits = total_hours / 30 if total_hours > 0 else subject.credits
-                        
-                        # Yo'nalish bo'yicha dars va topshiriqlar sonini hisoblash
-                        lessons_count = Lesson.query.filter_by(
-                            subject_id=subject.id,
-                            direction_id=direction.id
-                        ).count()
-                        
-                        assignments_count = Assignment.query.filter_by(
-                            subject_id=subject.id,
-                            direction_id=direction.id
-                        ).count()
-                        
-                        subject_direction_data[key] = {
-                            'subject': subject,
-                            'direction': direction,
-                            'groups': [],
-                            'semester': semester,
-                            'credits': credits,
-                            'lessons_count': lessons_count,
-                            'assignments_count': assignments_count
-                        }
-                    
-                    # Guruhni qo'shish (takrorlanmasligi uchun)
-                    if group not in subject_direction_data[key]['groups']:
-                        subject_direction_data[key]['groups'].append(group)
+        # Har bir yo'nalish uchun alohida fan card ko'rsatiladi (yuqorida katalogdan olingan)
+        subject_direction_data = {(card['subject'].id, card['direction'].id): card for card in teacher_cards}
         
         # Semestr bo'yicha guruhlash va fan nomi bo'yicha tartiblash
         for key, data in subject_direction_data.items():
@@ -413,60 +285,19 @@ def index():
     
     # Har bir fan uchun dars turlarini olish (o'qituvchi va talaba uchun)
     subject_lesson_types = {}
+    student_curriculum_types = {}
     if current_user.role == 'student' and current_user.group_id:
-        # Talaba uchun - guruh va yo'nalish orqali
+        # Talaba uchun - guruh va yo'nalish orqali (o'quv reja ma'lumotlari katalog kartalaridan)
         group = Group.query.get(current_user.group_id)
         if group and group.direction_id:
+            student_curriculum_types = subject_curriculum_types(group.direction_id, subjects_for_processing, student_cards)
             for subject in subjects_for_processing:
-                curriculum_item = DirectionCurriculum.query.filter_by(
-                    direction_id=group.direction_id,
-                    subject_id=subject.id
-                ).first()
-                
-                lessons = []
-                if curriculum_item:
-                    # Maruza
-                    if curriculum_item.hours_maruza and curriculum_item.hours_maruza > 0:
-                        lessons.append({
-                            'type': 'Maruza',
-                            'hours': curriculum_item.hours_maruza
-                        })
-                    
-                    # Amaliyot
-                    if curriculum_item.hours_amaliyot and curriculum_item.hours_amaliyot > 0:
-                        lessons.append({
-                            'type': 'Amaliyot',
-                            'hours': curriculum_item.hours_amaliyot
-                        })
-                    
-                    # Laboratoriya - alohida ko'rsatish
-                    if curriculum_item.hours_laboratoriya and curriculum_item.hours_laboratoriya > 0:
-                        lessons.append({
-                            'type': 'Laboratoriya',
-                            'hours': curriculum_item.hours_laboratoriya
-                        })
-                    
-                    # Seminar
-                    if curriculum_item.hours_seminar and curriculum_item.hours_seminar > 0:
-                        lessons.append({
-                            'type': 'Seminar',
-                            'hours': curriculum_item.hours_seminar
-                        })
-                    
-                    # Kurs ishi
-                    if curriculum_item.hours_kurs_ishi and curriculum_item.hours_kurs_ishi > 0:
-                        lessons.append({
-                            'type': 'Kurs ishi',
-                            'hours': 0  # Kurs ishi uchun soat ko'rsatilmaydi
-                        })
-                
+                lessons = student_curriculum_types[subject.id][0]
                 if lessons:
                     subject_lesson_types[subject.id] = lessons
     elif current_user.role == 'teacher' or current_user.has_role('teacher'):
         # O'qituvchi uchun - har bir yo'nalish uchun alohida dars turlari
         # subject_lesson_types endi {(subject_id, direction_id): [lessons]} formatida
-        teacher_subjects = TeacherSubject.query.filter_by(teacher_id=current_user.id).all()
-        
         for subject_data_item in subjects_for_processing:
             if isinstance(subject_data_item, dict) and 'direction' in subject_data_item:
                 # O'qituvchi uchun - yo'nalish bo'yicha
@@ -530,11 +361,12 @@ def index():
     subject_grades = {}
     if current_user.role == 'student' and current_user.group_id:
         group = Group.query.get(current_user.group_id)
-        for subject in subjects_for_processing:
-            # Fan bo'yicha barcha topshiriqlar
-            assignments_query = Assignment.query.filter_by(
-                subject_id=subject.id
-            )
+        page_subject_ids = [subject.id for subject in subjects_for_processing]
+        
+        # Sahifadagi fanlarning barcha topshiriqlari bitta so'rovda
+        assignments_by_subject = {}
+        if page_subject_ids:
+            assignments_query = Assignment.query.filter(Assignment.subject_id.in_(page_subject_ids))
             if group and group.direction_id:
                 assignments_query = assignments_query.filter(
                     (Assignment.group_id == current_user.group_id) | (Assignment.group_id.is_(None)),
@@ -542,27 +374,42 @@ def index():
                 )
             else:
                 assignments_query = assignments_query.filter_by(group_id=current_user.group_id)
-            
-            assignments = assignments_query.all()
+            for assignment in assignments_query.order_by(Assignment.id):
+                assignments_by_subject.setdefault(assignment.subject_id, []).append(assignment)
+        
+        # Talabaning faol javoblari (topshiriq bo'yicha birinchisi)
+        all_assignment_ids = [a.id for items in assignments_by_subject.values() for a in items]
+        active_submissions = {}
+        if all_assignment_ids:
+            for submission in Submission.query.filter(
+                Submission.student_id == current_user.id,
+                Submission.assignment_id.in_(all_assignment_ids),
+                Submission.is_active == True
+            ).order_by(Submission.id):
+                active_submissions.setdefault(submission.assignment_id, submission)
+        
+        # Guruhdagi o'qituvchi biriktirishlari: (fan, o'qituvchi) -> dars turi va amaliyot o'qituvchilari
+        creator_lesson_types = {}
+        amaliyot_teachers = set()
+        if page_subject_ids:
+            for subject_id, teacher_id, ts_lesson_type in db.session.query(
+                TeacherSubject.subject_id, TeacherSubject.teacher_id, TeacherSubject.lesson_type
+            ).filter(
+                TeacherSubject.subject_id.in_(page_subject_ids),
+                TeacherSubject.group_id == current_user.group_id
+            ).order_by(TeacherSubject.id):
+                creator_lesson_types.setdefault((subject_id, teacher_id), ts_lesson_type)
+                if ts_lesson_type == 'amaliyot':
+                    amaliyot_teachers.add((subject_id, teacher_id))
+        
+        for subject in subjects_for_processing:
+            # Fan bo'yicha barcha topshiriqlar
+            assignments = assignments_by_subject.get(subject.id, [])
             
             # Fanda mavjud bo'lgan dars turlarini aniqlash
             available_lesson_types = set()
             if group and group.direction_id:
-                curriculum_item = DirectionCurriculum.query.filter_by(
-                    direction_id=group.direction_id,
-                    subject_id=subject.id
-            ).first()
-                if curriculum_item:
-                    if curriculum_item.hours_maruza and curriculum_item.hours_maruza > 0:
-                        available_lesson_types.add('maruza')
-                    if curriculum_item.hours_amaliyot and curriculum_item.hours_amaliyot > 0:
-                        available_lesson_types.add('amaliyot')
-                    if curriculum_item.hours_laboratoriya and curriculum_item.hours_laboratoriya > 0:
-                        available_lesson_types.add('laboratoriya')
-                    if curriculum_item.hours_seminar and curriculum_item.hours_seminar > 0:
-                        available_lesson_types.add('seminar')
-                    if curriculum_item.hours_kurs_ishi and curriculum_item.hours_kurs_ishi > 0:
-                        available_lesson_types.add('kurs_ishi')
+                available_lesson_types = set(student_curriculum_types[subject.id][1])
             
             # Faqat mavjud bo'lgan dars turlari uchun ballarni hisoblash
             grades_by_type = {}
@@ -571,27 +418,15 @@ def index():
                     grades_by_type[lesson_type] = {'score': 0, 'max': 0}
             
             for assignment in assignments:
-                submission = Submission.query.filter_by(
-                    student_id=current_user.id,
-                    assignment_id=assignment.id,
-                    is_active=True
-                ).first()
+                submission = active_submissions.get(assignment.id)
                 
                 if submission and submission.score is not None:
                     # Topshiriqning dars turini aniqlash
                     lesson_type = assignment.lesson_type
                     
                     # Agar lesson_type bo'sh bo'lsa, o'qituvchi biriktirishiga qarab aniqlash
-                    if not lesson_type:
-                        assignment_creator = User.query.get(assignment.created_by) if assignment.created_by else None
-                        if assignment_creator:
-                            teacher_subject = TeacherSubject.query.filter_by(
-                                subject_id=subject.id,
-                                group_id=current_user.group_id,
-                                teacher_id=assignment_creator.id
-                            ).first()
-                            if teacher_subject:
-                                lesson_type = teacher_subject.lesson_type
+                    if not lesson_type and assignment.created_by:
+                        lesson_type = creator_lesson_types.get((subject.id, assignment.created_by))
                     
                     # Agar hali ham aniqlanmagan bo'lsa, topshiriq nomiga qarab
                     if not lesson_type:
@@ -616,15 +451,8 @@ def index():
                         # Agar assignment.lesson_type bo'sh bo'lsa va amaliyot o'qituvchisi baholagan bo'lsa
                         elif not assignment.lesson_type:
                             # Amaliyot o'qituvchisi bilan tekshirish
-                            assignment_creator = User.query.get(assignment.created_by) if assignment.created_by else None
-                            if assignment_creator:
-                                amaliyot_teacher = TeacherSubject.query.filter_by(
-                                    subject_id=subject.id,
-                                    group_id=current_user.group_id,
-                                    teacher_id=assignment_creator.id,
-                                    lesson_type='amaliyot'
-                                ).first()
-                                if amaliyot_teacher:
+                            if assignment.created_by:
+                                if (subject.id, assignment.created_by) in amaliyot_teachers:
                                     grades_by_type['amaliyot']['score'] += submission.score
                                     grades_by_type['amaliyot']['max'] += assignment.max_score
                                 else:
@@ -1024,32 +852,8 @@ def detail(id):
     # Talaba uchun: qaysi darslar qulflanganligini aniqlash
     lesson_locked_status = {}
     if current_role == 'student' and current_user.group_id:
-        for lesson in all_lessons:
-            # Faqat videoga ega darslar uchun qulf tekshiruvi
-            if lesson.video_file or lesson.video_url:
-                # Bir xil fan, dars turi va guruhdagi oldingi darslarni olish
-                previous_lessons = Lesson.query.filter(
-                    Lesson.subject_id == subject.id,
-                    Lesson.lesson_type == lesson.lesson_type,
-                    Lesson.order < lesson.order,
-                    ((Lesson.group_id == current_user.group_id) | (Lesson.group_id.is_(None)))
-                ).order_by(Lesson.order).all()
-                
-                is_locked = False
-                for prev_lesson in previous_lessons:
-                    if prev_lesson.video_file or prev_lesson.video_url:
-                        prev_lesson_view = LessonView.query.filter_by(
-                            lesson_id=prev_lesson.id,
-                            student_id=current_user.id
-                        ).first()
-                        
-                        if not prev_lesson_view or not prev_lesson_view.is_completed:
-                            is_locked = True
-                            break
-                
-                lesson_locked_status[lesson.id] = is_locked
-            else:
-                lesson_locked_status[lesson.id] = False
+        # Bir xil fan, dars turi va guruhdagi oldingi videoli darslar bo'yicha (bitta o'tishda)
+        lesson_locked_status = subject_lock_states(current_user.id, subject.id, current_user.group_id, all_lessons)
 
 
 
@@ -2172,17 +1976,23 @@ def create_lesson(id):
         if 'video_file' in request.files:
             video = request.files['video_file']
             if video and video.filename and allowed_video(video.filename):
-                # Unique fayl nomi
-                ext = video.filename.rsplit('.', 1)[1].lower()
-                video_filename = f"{uuid.uuid4().hex}.{ext}"
-                video_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'videos', video_filename)
-                video.save(video_path)
+                # Unique fayl nomi (bir xil mazmun omborda bir marta saqlanadi)
+                video_filename = store_upload(video, 'video', current_user.id)
+        
+        # Qismlab yuklangan video (forma faqat yuklash ID sini yuboradi)
+        video_upload_id = request.form.get('video_upload_id', '').strip()
+        if video_upload_id and not video_filename:
+            video_upload = claim_upload(video_upload_id, current_user.id, 'video')
+            if video_upload is None:
+                flash("Yuklangan video topilmadi. Iltimos, videoni qayta yuklang.", 'error')
+                return render_template('courses/create_lesson.html', subject=subject, groups=groups, direction_id=direction_id, allowed_lesson_types=allowed_lesson_types)
+            video_filename = video_upload.stored_name
         
         # Maruza uchun video majburiy tekshiruvi
         selected_lesson_type = request.form.get('lesson_type', 'maruza')
         if selected_lesson_type == 'maruza':
             video_url_input = request.form.get('video_url', '').strip()
-            has_video_file = 'video_file' in request.files and request.files['video_file'].filename
+            has_video_file = bool(video_filename) or ('video_file' in request.files and request.files['video_file'].filename)
             has_video_url = bool(video_url_input)
             
             if not has_video_file and not has_video_url:
@@ -2205,8 +2015,6 @@ def create_lesson(id):
         if 'lesson_files' in request.files:
             lesson_files = request.files.getlist('lesson_files')
             allowed_extensions = {'pdf', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx', 'txt', 'zip', 'rar'}
-            files_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'lesson_files')
-            os.makedirs(files_folder, exist_ok=True)
             
             for lesson_file in lesson_files:
                 if lesson_file and lesson_file.filename:
@@ -2217,18 +2025,27 @@ def create_lesson(id):
                         return render_template('courses/create_lesson.html', subject=subject, groups=groups, direction_id=direction_id, allowed_lesson_types=allowed_lesson_types)
                     
                     # Faylni saqlash
-                    filename = f"{uuid.uuid4().hex}.{ext}"
-                    file_path = os.path.join(files_folder, filename)
-                    lesson_file.save(file_path)
+                    filename = store_upload(lesson_file, 'lesson_file', current_user.id)
                     uploaded_files.append({
                         'filename': filename,
                         'original_name': lesson_file.filename
                     })
         
+        # Qismlab yuklangan fayllar (forma faqat yuklash ID larini yuboradi)
+        for upload_id in request.form.getlist('lesson_file_upload_ids'):
+            file_upload = claim_upload(upload_id, current_user.id, 'lesson_file')
+            if file_upload is None:
+                flash("Yuklangan fayl topilmadi. Iltimos, faylni qayta yuklang.", 'error')
+                return render_template('courses/create_lesson.html', subject=subject, groups=groups, direction_id=direction_id, allowed_lesson_types=allowed_lesson_types)
+            uploaded_files.append({
+                'filename': file_upload.stored_name,
+                'original_name': file_upload.original_name
+            })
+        
         # Fayl URL
-                    file_url_input = request.form.get('file_url', '').strip()
-            
-            # O'qituvchi uchun fayl majburiy
+        file_url_input = request.form.get('file_url', '').strip()
+        
+        # O'qituvchi uchun fayl majburiy
         if current_role == 'teacher' or current_user.role == 'admin':
             # Agar hech qanday fayl yuklanmagan va URL ham bo'lmasa
             if not uploaded_files and not file_url_input:
@@ -2245,6 +2062,7 @@ def create_lesson(id):
         
         # Har bir tanlangan guruh uchun alohida dars yaratish
         created_count = 0
+        created_lessons = []
         
         # Yo'nalish bo'yicha birlashtirish (One Lesson per Direction)
         if direction_id:
@@ -2272,6 +2090,7 @@ def create_lesson(id):
                 created_by=current_user.id
             )
             db.session.add(lesson)
+            created_lessons.append(lesson)
             created_count = 1
         else:
             # direction_id bo'lmasa (masalan, admin tomonidan guruh tanlanganda), eski uslubda guruhlar uchun alohida yaratish
@@ -2309,9 +2128,16 @@ def create_lesson(id):
                     created_by=current_user.id
                 )
                 db.session.add(lesson)
+                created_lessons.append(lesson)
                 created_count += 1
         
+        # Yuklangan fayllarni darslarga biriktirish (bir nechta guruh - bitta fayl, bir nechta ishora)
+        db.session.flush()
+        for lesson in created_lessons:
+            sync_lesson_attachments(lesson)
         db.session.commit()
+        invalidate_course_catalogue()
+        schedule_transcode(video_filename, current_user.id)
         
         if created_count > 0:
             flash(f"Dars {created_count} ta guruh uchun muvaffaqiyatli qo'shildi", 'success')
@@ -2557,10 +2383,24 @@ def edit_lesson(id):
                             pass
                 
                 # Yangi video faylni saqlash
-                ext = video.filename.rsplit('.', 1)[1].lower()
-                video_filename = f"{uuid.uuid4().hex}.{ext}"
-                video_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'videos', video_filename)
-                video.save(video_path)
+                video_filename = store_upload(video, 'video', current_user.id)
+        
+        # Qismlab yuklangan yangi video (forma faqat yuklash ID sini yuboradi)
+        video_upload_id = request.form.get('video_upload_id', '').strip()
+        if video_upload_id and video_filename == lesson.video_file:
+            video_upload = claim_upload(video_upload_id, current_user.id, 'video')
+            if video_upload is None:
+                flash("Yuklangan video topilmadi. Iltimos, videoni qayta yuklang.", 'error')
+                return render_template('courses/edit_lesson.html', lesson=lesson, subject=subject, direction_id=direction_id)
+            # Eski video faylni o'chirish
+            if lesson.video_file:
+                old_video_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'videos', lesson.video_file)
+                if os.path.exists(old_video_path):
+                    try:
+                        os.remove(old_video_path)
+                    except:
+                        pass
+            video_filename = video_upload.stored_name
         
         # Video URL faqat YouTube link bo'lishi kerak
         video_url = request.form.get('video_url', '').strip()
@@ -2609,17 +2449,25 @@ def edit_lesson(id):
                         return render_template('courses/edit_lesson.html', lesson=lesson, subject=subject, direction_id=direction_id)
                     
                     # Faylni saqlash
-                    filename = f"{uuid.uuid4().hex}.{ext}"
-                    files_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'lesson_files')
-                    os.makedirs(files_folder, exist_ok=True)
-                    file_path = os.path.join(files_folder, filename)
-                    lesson_file.save(file_path)
+                    filename = store_upload(lesson_file, 'lesson_file', current_user.id)
                     uploaded_files.append({
                         'filename': filename,
                         'original_name': lesson_file.filename
                     })
                     has_new_files = True
             
+            # Qismlab yuklangan fayllar
+            for upload_id in request.form.getlist('lesson_file_upload_ids'):
+                file_upload = claim_upload(upload_id, current_user.id, 'lesson_file')
+                if file_upload is None:
+                    flash("Yuklangan fayl topilmadi. Iltimos, faylni qayta yuklang.", 'error')
+                    return render_template('courses/edit_lesson.html', lesson=lesson, subject=subject, direction_id=direction_id)
+                uploaded_files.append({
+                    'filename': file_upload.stored_name,
+                    'original_name': file_upload.original_name
+                })
+                has_new_files = True
+            
             # URL orqali fayl
             file_url_input = request.form.get('file_url', '').strip()
             
@@ -2641,17 +2489,18 @@ def edit_lesson(id):
             # Boshqa rollar uchun ixtiyoriy
             file_url_input = request.form.get('file_url', '').strip()
             lesson_files = request.files.getlist('lesson_files')
+            file_upload_ids = request.form.getlist('lesson_file_upload_ids')
             
-            if any(f.filename for f in lesson_files):
+            if any(f.filename for f in lesson_files) or file_upload_ids:
                 # Fayl yuklash boshqa rollar uchun ham bir xil bo'lishi kerak
                 uploaded_files = []
+                for upload_id in file_upload_ids:
+                    file_upload = claim_upload(upload_id, current_user.id, 'lesson_file')
+                    if file_upload:
+                        uploaded_files.append({'filename': file_upload.stored_name, 'original_name': file_upload.original_name})
                 for lesson_file in lesson_files:
                     if lesson_file and lesson_file.filename:
-                        ext = lesson_file.filename.rsplit('.', 1)[1].lower() if '.' in lesson_file.filename else ''
-                        filename = f"{uuid.uuid4().hex}.{ext}"
-                        files_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'lesson_files')
-                        os.makedirs(files_folder, exist_ok=True)
-                        lesson_file.save(os.path.join(files_folder, filename))
+                        filename = store_upload(lesson_file, 'lesson_file', current_user.id)
                         uploaded_files.append({'filename': filename, 'original_name': lesson_file.filename})
                 lesson_file_url = json.dumps(uploaded_files)
             elif file_url_input:
@@ -2708,12 +2557,20 @@ def edit_lesson(id):
         lesson.title = request.form.get('title')
         lesson.content = request.form.get('content')
         lesson.video_url = video_url if video_url else None
+        old_video_file = lesson.video_file
         lesson.video_file = video_filename
         lesson.file_url = lesson_file_url
         lesson.duration = int(request.form.get('duration', 0) or 0)
         lesson.lesson_type = new_lesson_type
+        released_blobs = sync_lesson_attachments(lesson)
         
         db.session.commit()
+        invalidate_course_catalogue()
+        purge_blobs(released_blobs)
+        if video_filename != old_video_file:
+            purge_renditions([old_video_file])
+            if video_filename:
+                schedule_transcode(video_filename, current_user.id)
         
         flash("Dars muvaffaqiyatli yangilandi", 'success')
         return redirect(url_for('courses.detail', id=subject.id, direction_id=direction_id))
@@ -2837,9 +2694,14 @@ def delete_lesson(id):
     direction_id_val = lesson.direction_id
     group_id_val = lesson.group_id
     lesson_type_val = lesson.lesson_type
+    video_file = lesson.video_file
     
+    released_blobs = release_lesson_attachments(lesson)
     db.session.delete(lesson)
     db.session.commit()
+    purge_blobs(released_blobs)
+    purge_renditions([video_file])
+    invalidate_course_catalogue()
     
     # Qolgan darslarni tartiblash (global tartiblash)
     remaining_lessons_query = Lesson.query.filter_by(
@@ -2863,15 +2725,23 @@ def delete_lesson(id):
 @login_required
 def serve_video(filename):
     """Video faylni uzatish"""
-    videos_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'videos')
-    return send_from_directory(videos_folder, filename)
+    folder, stored_name = stored_location(filename, 'video')
+    return send_media(folder, stored_name, download_name=filename)
+
+@bp.route('/uploads/videos/renditions/<name>/<path:filename>')
+@login_required
+def serve_video_rendition(name, filename):
+    """Qayta kodlangan video: HLS playlist va segmentlari, web.mp4, poster"""
+    if secure_filename(name) != name:
+        abort(404)
+    return send_media(renditions_folder(name), filename)
 
 @bp.route('/uploads/lesson_files/<filename>')
 @login_required
 def serve_lesson_file(filename):
     """Dars faylini uzatish"""
-    files_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'lesson_files')
-    file_path = os.path.join(files_folder, filename)
+    files_folder, stored_name = stored_location(filename, 'lesson_file')
+    file_path = os.path.join(files_folder, stored_name)
     
     # Fayl mavjudligini tekshirish
     if not os.path.exists(file_path):
@@ -2879,51 +2749,89 @@ def serve_lesson_file(filename):
         return redirect(url_for('courses.index'))
     
     # Ruxsatni tekshirish
-    # Lessonni qidirish (JSON formatini ham hisobga olgan holda)
-    lesson = Lesson.query.filter(
-        (Lesson.file_url == filename) | 
-        (Lesson.file_url.like(f'%"{filename}"%'))
-    ).first()
+    # Lessonni qidirish (Attachment indeksi, eski fayllar uchun JSON formatini ham hisobga olgan holda)
+    lesson = lesson_for_file(filename)
     
     if not lesson:
         # URL bo'lsa, to'g'ridan-to'g'ri qaytarish (masalan, e'lonlardagi fayllar yoki boshqa yerda)
-        return send_from_directory(files_folder, filename, as_attachment=True)
+        return send_media(files_folder, stored_name, as_attachment=True, download_name=filename)
     
     subject = lesson.subject
     
     # Ruxsatni tekshirish
     if current_user.role == 'student':
         # Qulflanganligini tekshirish
-        is_locked = False
-        if lesson.video_file or lesson.video_url:
-            previous_lessons = Lesson.query.filter(
-                Lesson.subject_id == lesson.subject_id,
-                Lesson.direction_id == lesson.direction_id,
-                Lesson.order < lesson.order
-            ).order_by(Lesson.order).all()
-            
-            for prev_lesson in previous_lessons:
-                if prev_lesson.video_file or prev_lesson.video_url:
-                    view = LessonView.query.filter_by(
-                        lesson_id=prev_lesson.id,
-                        student_id=current_user.id
-                    ).first()
-                    if not view or not view.is_completed:
-                        is_locked = True
-                        break
+        is_locked = is_lesson_locked(current_user.id, lesson)
         
         if is_locked:
             flash("Siz ushbu dars faylini yuklab ololmaysiz. Avval oldingi darslarni ko'rib chiqing.", "error")
             return redirect(url_for('courses.lesson_detail', id=lesson.id))
 
-    return send_from_directory(files_folder, filename, as_attachment=True)
+    return send_media(files_folder, stored_name, as_attachment=True, download_name=filename)
+
+# ==================== QISMLAB YUKLASH (VIDEO VA DARS FAYLLARI) ====================
+def _can_upload_lesson_media():
+    return current_user.role in ('admin', 'dean') or current_user.has_role('teacher')
+
+
+@bp.route('/uploads/chunked', methods=['POST'])
+@login_required
+def chunked_upload_initiate():
+    """Qismlab yuklashni boshlash: {kind, filename, size, sha256?}"""
+    if not _can_upload_lesson_media():
+        return jsonify({'success': False, 'error': "Ruxsat yo'q"}), 403
+    data = request.get_json(silent=True) or {}
+    try:
+        upload = initiate_upload(current_user.id, data.get('kind'), data.get('filename'), data.get('size'), data.get('sha256'))
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, **upload_state(upload)})
+
+
+@bp.route('/uploads/chunked/<upload_id>')
+@login_required
+def chunked_upload_status(upload_id):
+    """Yuklash holati (davom ettirish uchun qabul qilingan qismlar)"""
+    upload = get_upload(upload_id, current_user.id)
+    if upload is None:
+        return jsonify({'success': False, 'error': 'Yuklash topilmadi'}), 404
+    return jsonify({'success': True, **upload_state(upload)})
+
+
+@bp.route('/uploads/chunked/<upload_id>/chunks/<int:index>', methods=['PUT'])
+@login_required
+def chunked_upload_chunk(upload_id, index):
+    """Bitta qism: tanasi - baytlar, X-Chunk-Sha256 sarlavhasi - qism xeshi"""
+    upload = get_upload(upload_id, current_user.id)
+    if upload is None:
+        return jsonify({'success': False, 'error': 'Yuklash topilmadi'}), 404
+    try:
+        received = save_chunk(upload, index, request.stream, request.headers.get('X-Chunk-Sha256'))
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'index': index, 'received': len(received), 'total_chunks': upload.total_chunks})
+
+
+@bp.route('/uploads/chunked/<upload_id>/finalize', methods=['POST'])
+@login_required
+def chunked_upload_finalize(upload_id):
+    """Qismlarni yig'ish. Natijadagi upload_id dars formasiga yuboriladi."""
+    upload = get_upload(upload_id, current_user.id)
+    if upload is None:
+        return jsonify({'success': False, 'error': 'Yuklash topilmadi'}), 404
+    try:
+        upload = finalize_upload(upload)
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e), **upload_state(upload)}), 400
+    return jsonify({'success': True, 'upload_id': upload.id, 'original_name': upload.original_name})
+
 
 @bp.route('/uploads/submissions/<filename>')
 @login_required
 def serve_submission_file(filename):
     """Topshiriq faylini ko'rsatish"""
-    submissions_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'submissions')
-    file_path = os.path.join(submissions_folder, filename)
+    submissions_folder, stored_name = stored_location(filename, 'submission')
+    file_path = os.path.join(submissions_folder, stored_name)
     
     # Fayl mavjudligini tekshirish
     if not os.path.exists(file_path):
@@ -2931,7 +2839,7 @@ def serve_submission_file(filename):
         return redirect(url_for('courses.index'))
     
     # Ruxsatni tekshirish - faqat fayl egasi yoki o'qituvchi ko'ra oladi
-    submission = Submission.query.filter_by(file_url=filename).first()
+    submission = submission_for_file(filename)
     if not submission:
         flash("Fayl topilmadi", 'error')
         return redirect(url_for('courses.index'))
@@ -2953,7 +2861,7 @@ def serve_submission_file(filename):
             flash("Sizda bu faylni ko'rish huquqi yo'q", 'error')
             return redirect(url_for('courses.index'))
     
-    return send_from_directory(submissions_folder, filename, as_attachment=True)
+    return send_media(submissions_folder, stored_name, as_attachment=True, download_name=filename)
 
 
 
@@ -3022,6 +2930,8 @@ def lesson_detail(id):
     lesson_view = None
     is_locked = False
     if current_user.role == 'student':
+        # Buferdagi ko'rish vaqti sahifada ko'rinishi uchun avval yoziladi
+        flush_watch_time(lesson.id, current_user.id)
         lesson_view = LessonView.query.filter_by(
             lesson_id=lesson.id,
             student_id=current_user.id
@@ -3037,23 +2947,7 @@ def lesson_detail(id):
             db.session.commit()
         
         # Oldingi darslar to'liq ko'rilganligini tekshirish (faqat videoga ega darslar uchun)
-        if lesson.video_file or lesson.video_url:
-            previous_lessons = Lesson.query.filter(
-                Lesson.subject_id == subject.id,
-                Lesson.direction_id == lesson.direction_id,
-                Lesson.order < lesson.order
-            ).order_by(Lesson.order).all()
-            
-            for prev_lesson in previous_lessons:
-                if prev_lesson.video_file or prev_lesson.video_url:
-                    prev_lesson_view = LessonView.query.filter_by(
-                        lesson_id=prev_lesson.id,
-                        student_id=current_user.id
-                    ).first()
-                    
-                    if not prev_lesson_view or not prev_lesson_view.is_completed:
-                        is_locked = True
-                        break
+        is_locked = is_lesson_locked(current_user.id, lesson)
     
     # Tahrirlash huquqini tekshirish
     can_edit_lesson = False
@@ -3117,6 +3011,7 @@ def lesson_detail(id):
                          lesson=lesson, 
                          subject=subject, 
                          lesson_view=lesson_view, 
+                         video_renditions=video_renditions(lesson.video_file),
                          is_locked=is_locked,
                          can_edit_lesson=can_edit_lesson,
                          lesson_files_list=lesson_files_list,
@@ -3187,20 +3082,20 @@ def update_watch_time(id):
     if current_user.role != 'student':
         return jsonify({'success': False}), 403
     
-    lesson_view = LessonView.query.filter_by(
+    # Faqat o'qish: yozish buferda yig'iladi va guruhlab bajariladi (app.utils.watch_time)
+    lesson_view = db.session.query(LessonView.watch_duration, LessonView.is_completed).filter_by(
         lesson_id=id,
         student_id=current_user.id
     ).first()
     
     if lesson_view:
         watch_duration = request.json.get('watch_duration', 0)
-        lesson_view.watch_duration = max(lesson_view.watch_duration, watch_duration)
-        db.session.commit()
+        pending = record_watch_time(id, current_user.id, watch_duration)
         
         # Maksimal ko'rilgan vaqtni qaytarish
         return jsonify({
             'success': True,
-            'watch_duration': lesson_view.watch_duration,
+            'watch_duration': max(lesson_view.watch_duration or 0, pending),
             'is_completed': lesson_view.is_completed
         })
     
@@ -3462,6 +3357,8 @@ def create_assignment(id):
                 created_count += 1
         
         db.session.commit()
+        mark_progress_stale(id)
+        invalidate_course_catalogue()
         
         if created_count > 0:
             flash(f"Topshiriq {created_count} ta guruh uchun muvaffaqiyatli yaratildi", 'success')
@@ -3717,12 +3614,7 @@ def submit_assignment(id):
                 return redirect(url_for('courses.assignment_detail', id=id))
             
             # Faylni saqlash
-            ext = file.filename.rsplit('.', 1)[1].lower()
-            filename = f"{uuid.uuid4().hex}.{ext}"
-            submissions_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'submissions')
-            file_path = os.path.join(submissions_folder, filename)
-            file.save(file_path)
-            file_url = filename
+            file_url = store_upload(file, 'submission', current_user.id)
     
     # Fayl majburiy bo'lsa tekshirish
     if assignment.file_required and not file_url:
@@ -3772,6 +3664,7 @@ def submit_assignment(id):
             is_active=True
         )
         db.session.add(new_submission)
+        submission = new_submission
         flash(f"Javobingiz qayta yuborildi ({new_submission.resubmission_count}/3)", 'success')
     else:
         # Birinchi marta topshirish
@@ -3786,7 +3679,11 @@ def submit_assignment(id):
         db.session.add(submission)
         flash("Javobingiz qabul qilindi", 'success')
     
+    db.session.flush()
+    sync_submission_attachment(submission)
     db.session.commit()
+    invalidate_grade_matrix(assignment.subject_id)
+    refresh_student_subject(current_user.id, assignment.subject_id)
     return redirect(url_for('courses.assignment_detail', id=id))
 
 
@@ -3821,11 +3718,7 @@ def edit_submission(id):
             #         os.remove(os.path.join(current_app.config['UPLOAD_FOLDER'], 'submissions', submission.file_url))
             #     except: pass
 
-            ext = file.filename.rsplit('.', 1)[1].lower()
-            filename = f"{uuid.uuid4().hex}.{ext}"
-            submissions_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'submissions')
-            file.save(os.path.join(submissions_folder, filename))
-            file_url = filename
+            file_url = store_upload(file, 'submission', current_user.id)
     
     # Agar na content, na file bo'lmasa
     if not content and not file_url:
@@ -3834,7 +3727,10 @@ def edit_submission(id):
     
     submission.content = content
     submission.file_url = file_url
+    released_blobs = sync_submission_attachment(submission)
     db.session.commit()
+    purge_blobs(released_blobs)
+    invalidate_grade_matrix(submission.assignment.subject_id)
     
     flash("Javobingiz muvaffaqiyatli yangilandi", 'success')
     return redirect(url_for('courses.assignment_detail', id=submission.assignment_id))
@@ -3887,6 +3783,8 @@ def grade_submission(id):
         submission.graded_at = datetime.utcnow()
         submission.graded_by = current_user.id
         db.session.commit()
+        invalidate_grade_matrix(subject.id)
+        refresh_student_subject(submission.student_id, subject.id)
         flash("Baho muvaffaqiyatli qo'yildi", 'success')
         return redirect(url_for('courses.assignment_detail', id=assignment.id))
     
@@ -3944,6 +3842,8 @@ def grade_submission(id):
     submission.graded_at = datetime.utcnow()
     submission.graded_by = current_user.id
     db.session.commit()
+    invalidate_grade_matrix(subject.id)
+    refresh_student_subject(submission.student_id, subject.id)
     
     flash("Baho muvaffaqiyatli qo'yildi", 'success')
     return redirect(url_for('courses.assignment_detail', id=assignment.id))
@@ -4061,7 +3961,9 @@ def grades():
         # Baholarni foiz va harfga o'girish (admindagi baholash tizimi asosida)
         for data in grades_by_subject.values():
             data['percent'] = (data['total_score'] / data['max_score']) * 100 if data['max_score'] > 0 else 0
-            data['grade'] = GradeScale.get_grade(data['percent'])
+        subject_grades = GradeScale.get_grades([data['percent'] for data in grades_by_subject.values()])
+        for data, grade in zip(grades_by_subject.values(), subject_grades):
+            data['grade'] = grade
         
         def grade_classes(color: str):
             return {
@@ -4152,37 +4054,9 @@ def group_grades(subject_id, group_id):
     # Fan topshiriqlari
     assignments = Assignment.query.filter_by(subject_id=subject_id, group_id=group_id).all()
     
-    # Har bir talabaning baholari
-    student_grades = {}
-    for student in students:
-        student_grades[student.id] = {
-            'student': student,
-            'submissions': {},
-            'total': 0,
-            'max_total': 0
-        }
-        for assignment in assignments:
-            student_submissions = Submission.query.filter_by(
-                student_id=student.id,
-                assignment_id=assignment.id
-            ).all()
-            
-            best_sub = None
-            if student_submissions:
-                # Eng yuqori baholi submissionni topish
-                for s in student_submissions:
-                    if best_sub is None:
-                        best_sub = s
-                    elif s.score is not None:
-                        if best_sub.score is None or s.score > best_sub.score:
-                            best_sub = s
-                    elif best_sub.score is None and s.is_active:
-                        best_sub = s
-            
-            student_grades[student.id]['submissions'][assignment.id] = best_sub
-            if best_sub and best_sub.score:
-                student_grades[student.id]['total'] += best_sub.score
-            student_grades[student.id]['max_total'] += assignment.max_score
+    # Har bir talabaning baholari (bitta so'rovli matritsadan)
+    matrix = get_grade_matrix(subject_id, group_id)
+    student_grades = {row['student'].id: row for row in matrix.build_rows(students, assignments)}
     
     return render_template('courses/group_grades.html',
                          subject=subject,
@@ -4213,32 +4087,10 @@ def export_group_grades(subject_id, group_id):
     students = User.query.filter_by(role='student', group_id=group_id).order_by(User.full_name).all()
     assignments = Assignment.query.filter_by(subject_id=subject_id, group_id=group_id).all()
     
-    student_rows = []
-    for student in students:
-        total = 0
-        max_total = 0
-        for assignment in assignments:
-            student_submissions = Submission.query.filter_by(
-                student_id=student.id,
-                assignment_id=assignment.id
-            ).all()
-            
-            best_score = 0
-            if student_submissions:
-                scores = [s.score for s in student_submissions if s.score is not None]
-                best_score = max(scores) if scores else 0
-                
-            total += best_score
-            max_total += assignment.max_score
-        percent = (total / max_total) * 100 if max_total > 0 else 0
-        grade = GradeScale.get_grade(percent)
-        student_rows.append({
-            'student': student,
-            'total': total,
-            'max_total': max_total,
-            'percent': percent,
-            'grade': grade
-        })
+    student_rows = get_grade_matrix(subject_id, group_id).build_rows(students, assignments)
+    grades = GradeScale.get_grades([row['percent'] for row in student_rows])
+    for row, grade in zip(student_rows, grades):
+        row['grade'] = grade
     
     try:
         from app.utils.excel_export import create_group_grades_excel
@@ -4283,40 +4135,7 @@ def export_detailed_group_grades(subject_id, group_id):
     if not assignments:
         assignments = Assignment.query.filter_by(subject_id=subject_id, group_id=None).order_by(Assignment.due_date).all()
     
-    matrix = []
-    for student in students:
-        row = {
-            'student_id': student.student_id or '-',
-            'student_name': student.full_name.upper() if student.full_name else '-',
-            'scores': [],
-            'total_score': 0,
-            'max_total': 0
-        }
-        for assignment in assignments:
-            # Har bir topshiriq uchun eng yuqori bahoni topish
-            student_submissions = Submission.query.filter_by(
-                student_id=student.id,
-                assignment_id=assignment.id
-            ).all()
-            
-            submission = None
-            if student_submissions:
-                # Eng yuqori baholi submissionni topish
-                for s in student_submissions:
-                    if submission is None:
-                        submission = s
-                    elif s.score is not None:
-                        if submission.score is None or s.score > submission.score:
-                            submission = s
-                    elif submission.score is None and s.is_active:
-                        submission = s
-            score = submission.score if submission and submission.score is not None else 0
-            row['scores'].append(score)
-            row['total_score'] += score
-            row['max_total'] += (assignment.max_score or 0)
-        
-        row['percent'] = (row['total_score'] / row['max_total']) * 100 if row['max_total'] > 0 else 0
-        matrix.append(row)
+    matrix = get_grade_matrix(subject_id, group_id).build_rows(students, assignments)
     
     try:
         from app.utils.excel_export import create_detailed_assignment_export_excel
@@ -4504,6 +4323,8 @@ def edit_assignment(id):
         assignment.file_required = bool(request.form.get('file_required'))
         
         db.session.commit()
+        invalidate_course_catalogue()
+        mark_progress_stale(subject.id)
         flash("Topshiriq muvaffaqiyatli yangilandi", 'success')
         return redirect(url_for('courses.detail', id=subject.id, direction_id=direction_id))
     
@@ -4580,5 +4401,8 @@ def delete_assignment(id):
     
     db.session.delete(assignment)
     db.session.commit()
+    invalidate_grade_matrix(subject.id)
+    mark_progress_stale(subject.id)
+    invalidate_course_catalogue()
     flash("Topshiriq muvaffaqiyatli o'chirildi", 'success')
     return redirect(url_for('courses.detail', id=subject.id, direction_id=assignment.direction_id))
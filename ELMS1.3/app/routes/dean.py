@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, Response, send_file, session, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, session, jsonify
 from flask_login import login_required, current_user
 from app.models import User, Faculty, Group, Subject, TeacherSubject, Schedule, Announcement, Direction, StudentPayment, DirectionCurriculum
 from app import db
@@ -7,8 +7,16 @@ from sqlalchemy import func
 from datetime import datetime
 import calendar
 from werkzeug.security import generate_password_hash
-from app.utils.excel_export import create_schedule_excel
-from app.utils.excel_import import generate_schedule_sample_file, import_schedule_from_excel
+from app.utils.excel_import import generate_schedule_sample_file
+from app.utils.course_catalogue import invalidate_course_catalogue
+from app.utils.org_hierarchy import get_org_hierarchy, invalidate_org_hierarchy, group_semester_subjects
+from app.utils.schedule_calendar import month_schedule
+from app.utils.schedule_feed import record_schedule_removal
+from app.utils.schedule_conflicts import (
+    DEFAULT_LESSON_MINUTES, describe_conflicts, find_free_slots, find_schedule_conflicts
+)
+from app.utils.jobs import enqueue_job
+from app.utils.job_handlers import schedule_date_codes
 
 bp = Blueprint('dean', __name__, url_prefix='/dean')
 
@@ -149,6 +157,7 @@ def create_group():
         )
         db.session.add(group)
         db.session.commit()
+        invalidate_org_hierarchy()
         
         flash("Guruh muvaffaqiyatli yaratildi", 'success')
         return redirect(url_for('dean.courses'))
@@ -214,6 +223,7 @@ def edit_group(id):
         group.description = description if description else None
         
         db.session.commit()
+        invalidate_org_hierarchy()
         flash("Guruh yangilandi", 'success')
         
         # Redireksiya
@@ -253,6 +263,7 @@ def delete_group(id):
     else:
         db.session.delete(group)
         db.session.commit()
+        invalidate_org_hierarchy()
         flash("Guruh o'chirildi", 'success')
     
     if request.args.get('from_courses'):
@@ -471,6 +482,8 @@ def courses():
     # Fakultetdagi barcha guruhlarni olish
     query = faculty.groups
     all_groups = query.all()
+    # Guruhlar bo'yicha talabalar soni bitta so'rovda (guruh boshiga alohida count o'rniga)
+    students_counts = Group.students_count_map([g.id for g in all_groups], role='student')
     
     # Qabul yili va ta'lim shakli bo'yicha guruhlash
     courses_dict = {}
@@ -494,7 +507,7 @@ def courses():
             continue
             
         # Guruhga tegishli talabalar sonini hisoblash
-        students_count = User.query.filter(User.group_id == group.id, User.role == 'student').count()
+        students_count = students_counts.get(group.id, 0)
         
         # Talabasi yo'q guruhlarni ko'rsatish yoki ko'rsatmaslik? 
         # Admin loģikasida 0 talabali guruhlar ham ko'rinishi kerak (agar students_count > 0 check bo'lmasa)
@@ -1049,12 +1062,8 @@ def import_students():
         return redirect(url_for('main.dashboard'))
     
     if request.method == 'POST':
-        if 'excel_file' not in request.files:
-            flash("Fayl tanlanmagan", 'error')
-            return redirect(url_for('dean.students'))
-        
-        file = request.files['excel_file']
-        if file.filename == '':
+        file = request.files.get('excel_file')
+        if not file or file.filename == '':
             flash("Fayl tanlanmagan", 'error')
             return redirect(url_for('dean.students'))
         
@@ -1062,31 +1071,9 @@ def import_students():
             flash("Faqat Excel fayllar (.xlsx, .xls) qo'llab-quvvatlanadi", 'error')
             return redirect(url_for('dean.students'))
         
-        try:
-            from app.utils.excel_import import import_students_from_excel
-            
-            result = import_students_from_excel(file, faculty_id=faculty.id)
-            
-            if result['success']:
-                if result['imported'] > 0:
-                    flash(f"{result['imported']} ta talaba muvaffaqiyatli import qilindi", 'success')
-                else:
-                    flash("Hech qanday talaba import qilinmadi", 'warning')
-                
-                if result['errors']:
-                    error_msg = f"Xatolar ({len(result['errors'])}): " + "; ".join(result['errors'][:5])
-                    if len(result['errors']) > 5:
-                        error_msg += f" va yana {len(result['errors']) - 5} ta xato"
-                    flash(error_msg, 'warning')
-            else:
-                flash(f"Import xatosi: {result['errors'][0] if result['errors'] else 'Noma`lum xatolik'}", 'error')
-                
-        except ImportError as e:
-            flash(f"Excel import funksiyasi ishlamayapti: {str(e)}", 'error')
-        except Exception as e:
-            flash(f"Import xatosi: {str(e)}", 'error')
-        
-        return redirect(url_for('dean.students'))
+        job = enqueue_job('import_students', "Talabalarni import qilish", params={'faculty_id': faculty.id},
+                          upload=file, return_url=url_for('dean.students'), user_id=current_user.id)
+        return redirect(url_for('main.job_detail', job_id=job.id))
     
     return render_template('dean/import_students.html', faculty=faculty)
 
@@ -1120,29 +1107,9 @@ def export_students():
         flash("Sizga fakultet biriktirilmagan", 'error')
         return redirect(url_for('main.dashboard'))
     
-    try:
-        from app.utils.excel_export import create_students_excel
-    except ImportError:
-        flash("Excel export funksiyasi ishlamayapti. Iltimos, 'pip install openpyxl' buyrug'ini bajaring.", 'error')
-        return redirect(url_for('dean.students'))
-    
-    # Faqat o'z fakultetidagi talabalar
-    group_ids = [g.id for g in faculty.groups.all()]
-    students = User.query.filter(
-        User.role == 'student',
-        User.group_id.in_(group_ids)
-    ).order_by(User.full_name).all()
-    
-    excel_file = create_students_excel(students, faculty.name)
-    
-    filename = f"talabalar_{faculty.name.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    
-    return Response(
-        excel_file,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        headers={'Content-Disposition': f'attachment; filename={filename}'}
-    )
-
+    job = enqueue_job('export_students', "Talabalar ro'yxatini eksport qilish", params={'faculty_id': faculty.id},
+                      return_url=url_for('dean.students'), user_id=current_user.id)
+    return redirect(url_for('main.job_detail', job_id=job.id))
 
 @bp.route('/students/create', methods=['GET', 'POST'])
 @login_required
@@ -1269,6 +1236,7 @@ def create_student():
         
         try:
             db.session.commit()
+            invalidate_org_hierarchy()
         except Exception as e:
             error_str = str(e).lower()
             if 'email' in error_str and ('not null' in error_str or 'constraint' in error_str):
@@ -1276,6 +1244,7 @@ def create_student():
                 student.email = ''
                 db.session.add(student)
                 db.session.commit()
+                invalidate_org_hierarchy()
             else:
                 raise
         
@@ -1413,6 +1382,7 @@ def edit_student(id):
             student.group_id = None
             
         db.session.commit()
+        invalidate_org_hierarchy()
         flash(f"{student.full_name} ma'lumotlari yangilandi", 'success')
         return redirect(url_for('dean.students'))
     
@@ -1650,6 +1620,7 @@ def create_direction():
         )
         db.session.add(direction)
         db.session.commit()
+        invalidate_org_hierarchy()
         
         flash("Yo'nalish muvaffaqiyatli yaratildi", 'success')
         return redirect(url_for('dean.directions'))
@@ -1687,6 +1658,7 @@ def assign_groups_to_direction(id):
             group.direction_id = direction.id
     
     db.session.commit()
+    invalidate_org_hierarchy()
     flash("Guruhlar yo'nalishga biriktirildi", 'success')
     return redirect(url_for('dean.direction_detail', id=id))
 
@@ -1726,6 +1698,7 @@ def edit_direction(id):
         direction.description = description
         
         db.session.commit()
+        invalidate_org_hierarchy()
         
         flash("Yo'nalish yangilandi", 'success')
         return redirect(url_for('dean.directions'))
@@ -1759,6 +1732,7 @@ def delete_direction(id):
     else:
         db.session.delete(direction)
         db.session.commit()
+        invalidate_org_hierarchy()
         flash("Yo'nalish o'chirildi", 'success')
     
     return redirect(url_for('dean.courses'))
@@ -1957,8 +1931,6 @@ def export_curriculum(id, year=None, education_type=None):
 @dean_required
 def import_curriculum(id, year=None, education_type=None):
     """O'quv rejani Excel fayldan import qilish"""
-    from app.utils.excel_import import import_curriculum_from_excel
-    
     direction = Direction.query.get_or_404(id)
     
     # Fakultet tekshiruvi
@@ -1986,29 +1958,15 @@ def import_curriculum(id, year=None, education_type=None):
                 return redirect(url_for('dean.direction_curriculum', id=id, year=year, education_type=education_type))
             return redirect(url_for('dean.direction_curriculum', id=id))
         
-        # Import funksiyasiga yil va ta'lim shaklini ham uzatish
-        result = import_curriculum_from_excel(file, direction.id, enrollment_year=year, education_type=education_type)
-        
-        if result['success']:
-            if result['imported'] > 0 or result['updated'] > 0:
-                message = f"Muvaffaqiyatli! {result['imported']} ta yangi qo'shildi, {result['updated']} ta yangilandi."
-                if result.get('subjects_created', 0) > 0:
-                    message += f" {result['subjects_created']} ta yangi fan yaratildi."
-                if result['errors']:
-                    message += f" {len(result['errors'])} ta xatolik yuz berdi."
-                flash(message, 'success' if not result['errors'] else 'warning')
-            else:
-                flash("Hech qanday o'zgarish kiritilmadi", 'info')
-            
-            if result['errors']:
-                for error in result['errors'][:10]:  # Faqat birinchi 10 ta xatolikni ko'rsatish
-                    flash(error, 'error')
-        else:
-            flash(f"Import qilishda xatolik: {', '.join(result['errors'])}", 'error')
-        
         if year and education_type:
-            return redirect(url_for('dean.direction_curriculum', id=id, year=year, education_type=education_type))
-        return redirect(url_for('dean.direction_curriculum', id=id))
+            return_url = url_for('dean.direction_curriculum', id=id, year=year, education_type=education_type)
+        else:
+            return_url = url_for('dean.direction_curriculum', id=id)
+        # Import funksiyasiga yil va ta'lim shaklini ham uzatish
+        job = enqueue_job('import_curriculum', f"O'quv rejani import qilish: {direction.name}",
+                          params={'direction_id': direction.id, 'enrollment_year': year, 'education_type': education_type},
+                          upload=file, return_url=return_url, user_id=current_user.id)
+        return redirect(url_for('main.job_detail', job_id=job.id))
     
     return render_template('dean/import_curriculum.html', 
                          direction=direction,
@@ -2186,6 +2144,7 @@ def direction_subjects(id, year=None, education_type=None):
                             db.session.delete(teacher_subject)
         
         db.session.commit()
+        invalidate_course_catalogue()
         flash(f"{semester}-semestr o'qituvchilari muvaffaqiyatli saqlandi", 'success')
         if year and education_type:
             return redirect(url_for('dean.direction_subjects', id=id, year=year, education_type=education_type))
@@ -2308,6 +2267,7 @@ def add_subject_to_curriculum(id, year=None, education_type=None):
             added += 1
     
     db.session.commit()
+    invalidate_course_catalogue()
     flash(f"{added} ta fan o'quv rejaga qo'shildi", 'success')
     if year and education_type:
         return redirect(url_for('dean.direction_curriculum', id=id, year=year, education_type=education_type))
@@ -2335,6 +2295,7 @@ def update_curriculum_item(id, item_id):
     item.hours_mustaqil = request.form.get('hours_mustaqil', type=int) or 0
     
     db.session.commit()
+    invalidate_course_catalogue()
     flash("O'quv reja yangilandi", 'success')
     return redirect(url_for('dean.direction_curriculum', id=id))
 
@@ -2378,6 +2339,7 @@ def update_semester_curriculum(id, semester, year=None, education_type=None):
         updated += 1
     
     db.session.commit()
+    invalidate_course_catalogue()
     flash(f"{semester}-semestr o'quv rejasi yangilandi", 'success')
     if year and education_type:
         return redirect(url_for('dean.direction_curriculum', id=id, year=year, education_type=education_type))
@@ -2422,6 +2384,7 @@ def replace_curriculum_subject(id, item_id, year=None, education_type=None):
     
     item.subject_id = new_subject_id
     db.session.commit()
+    invalidate_course_catalogue()
     flash("Fan almashtirildi", 'success')
     if year and education_type:
         return redirect(url_for('dean.direction_curriculum', id=id, year=year, education_type=education_type))
@@ -2444,6 +2407,7 @@ def delete_curriculum_item(id, item_id, year=None, education_type=None):
     
     db.session.delete(item)
     db.session.commit()
+    invalidate_course_catalogue()
     flash("Fan o'quv rejadan o'chirildi", 'success')
     if year and education_type:
         return redirect(url_for('dean.direction_curriculum', id=id, year=year, education_type=education_type))
@@ -2485,6 +2449,7 @@ def replace_curriculum_item(id, item_id, year=None, education_type=None):
             else:
                 item.subject_id = new_subject_id
                 db.session.commit()
+                invalidate_course_catalogue()
                 flash(f"Fan {new_subject.name} ga almashtirildi", 'success')
         else:
             flash("Tanlangan fan topilmadi", 'error')
@@ -2535,10 +2500,6 @@ def schedule():
     today_month = today.month
     today_day = today.day
     
-    # Joriy oy uchun sanalar diapazoni
-    start_code = int(f"{year}{month:02d}01")
-    end_code = int(f"{year}{month:02d}{days_in_month:02d}")
-    
     # Filter parametrlari
     course_year = request.args.get('course_year', type=int)
     semester = request.args.get('semester', type=int)
@@ -2548,30 +2509,18 @@ def schedule():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
 
-    # Sana diapazoni bo'yicha filter (Admin kabi logic)
-    if start_date or end_date:
-        try:
-            if start_date and end_date:
-                start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-                end_dt = datetime.strptime(end_date, "%Y-%m-%d")
-                start_code = int(start_dt.strftime("%Y%m%d"))
-                end_code = int(end_dt.strftime("%Y%m%d"))
-            elif start_date:
-                start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-                start_code = int(start_dt.strftime("%Y%m%d"))
-                end_code = 99991231
-            elif end_date:
-                end_dt = datetime.strptime(end_date, "%Y-%m-%d")
-                start_code = 19000101
-                end_code = int(end_dt.strftime("%Y%m%d"))
-        except ValueError:
-            pass # Standard oy filteriga qaytish
+    # Sana diapazoni bo'yicha filter (oy ichida)
+    date_from = date_to = None
+    try:
+        if start_date:
+            date_from = datetime.strptime(start_date, "%Y-%m-%d").date()
+        if end_date:
+            date_to = datetime.strptime(end_date, "%Y-%m-%d").date()
+    except ValueError:
+        date_from = date_to = None  # Standard oy filteriga qaytish
 
     # Query qurish
-    query = Schedule.query.join(Group).filter(
-        Group.faculty_id == faculty.id,
-        Schedule.day_of_week.between(start_code, end_code)
-    )
+    query = Schedule.query.join(Group).filter(Group.faculty_id == faculty.id)
     
     if course_year:
         query = query.filter(Group.course_year == course_year)
@@ -2584,33 +2533,11 @@ def schedule():
     if semester:
         query = query.filter(Group.semester == semester)
         
-    schedules = query.order_by(Schedule.day_of_week, Schedule.start_time).all()
-    
     # Oy kunlari bo'yicha guruhlash
-    schedule_by_day = {i: [] for i in range(1, days_in_month + 1)}
-    for s in schedules:
-        try:
-            code_str = str(s.day_of_week)
-            # Agar yil va oy mos kelsa kunni olamiz
-            s_year = int(code_str[:4])
-            s_month = int(code_str[4:6])
-            
-            if s_year == year and s_month == month:
-                day = int(code_str[6:8])
-                if 1 <= day <= days_in_month:
-                    schedule_by_day[day].append(s)
-        except (TypeError, ValueError):
-            continue
-            
-    for day in schedule_by_day:
-        schedule_by_day[day].sort(key=lambda x: x.start_time or '')
+    schedule_by_day = month_schedule(query, year, month, date_from, date_to)
         
-    # Filter groups that have students
-    active_groups = [g for g in Group.query.filter_by(faculty_id=faculty.id).all() if g.get_students_count() > 0]
-    all_courses = sorted(list(set(g.course_year for g in active_groups if g.course_year)))
-    all_semesters = sorted(list(set(g.semester for g in active_groups if g.semester)))
-    all_directions = sorted(list(set(g.direction for g in active_groups if g.direction)), key=lambda x: x.name)
-    all_groups = sorted(active_groups, key=lambda x: x.name)
+    # Filtrlar - fakultetning talabasi bor guruhlaridan
+    filters = get_org_hierarchy().filter_options(faculty.id)
     
     # O'qituvchilar (shu fakultetga dars beradigan)
     # Oddiylashtirish uchun barcha o'qituvchilarni olib kelamiz yoki fakultetga bog'langanlarini
@@ -2632,10 +2559,10 @@ def schedule():
                          next_year=next_year,
                          next_month=next_month,
                          # Filters context
-                         all_courses=all_courses,
-                         all_semesters=all_semesters,
-                         all_directions=all_directions,
-                         all_groups=all_groups,
+                         all_courses=filters['courses'],
+                         all_semesters=filters['semesters'],
+                         all_directions=filters['directions'],
+                         all_groups=filters['groups'],
                          all_teachers=all_teachers,
                          current_course_year=course_year,
                          current_semester=semester,
@@ -2663,25 +2590,12 @@ def import_schedule():
             flash("Faqat Excel (.xlsx, .xls) fayllar qabul qilinadi", 'error')
             return redirect(url_for('dean.schedule'))
             
-        try:
-            # Import logic
-            result = import_schedule_from_excel(file)
-            
-            if result['success']:
-                msg = f"{result['imported']} ta dars jadvali import qilindi."
-                if result['errors']:
-                    msg += f" {len(result['errors'])} ta xatolik."
-                flash(msg, 'success' if not result['errors'] else 'warning')
-                
-                for err in result['errors'][:5]:
-                    flash(err, 'error')
-            else:
-                flash(f"Import xatosi: {'; '.join(result['errors'])}", 'error')
-                
-        except Exception as e:
-            flash(f"Xatolik yuz berdi: {str(e)}", 'error')
-            
-        return redirect(url_for('dean.schedule'))
+        # Tekshiruv rejimi: to'qnashuv va xatolar hisoboti, bazaga hech narsa yozilmaydi
+        dry_run = bool(request.form.get('dry_run'))
+        title = "Dars jadvalini tekshirish" if dry_run else "Dars jadvalini import qilish"
+        job = enqueue_job('import_schedule', title, params={'dry_run': dry_run}, upload=file,
+                          return_url=url_for('dean.schedule'), user_id=current_user.id)
+        return redirect(url_for('main.job_detail', job_id=job.id))
         
     return render_template('dean/import_schedule.html')
 
@@ -2723,75 +2637,24 @@ def export_schedule():
     end_date = request.args.get('end_date')
 
     # Sana filteri (Admin kabi logic)
-    if start_date or end_date:
-        try:
-            if start_date and end_date:
-                start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-                end_dt = datetime.strptime(end_date, "%Y-%m-%d")
-                start_code = int(start_dt.strftime("%Y%m%d"))
-                end_code = int(end_dt.strftime("%Y%m%d"))
-            elif start_date:
-                start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-                start_code = int(start_dt.strftime("%Y%m%d"))
-                end_code = 99991231
-            elif end_date:
-                end_dt = datetime.strptime(end_date, "%Y-%m-%d")
-                start_code = 19000101
-                end_code = int(end_dt.strftime("%Y%m%d"))
-        except ValueError:
-            flash("Sana formati noto'g'ri", 'error')
-            return redirect(url_for('dean.schedule'))
-    else:
-        # Standart holatda barcha
-        start_code = 19000101
-        end_code = 99991231
-
-    query = Schedule.query.join(Group).filter(
-        Group.faculty_id == faculty.id,
-        Schedule.day_of_week.between(start_code, end_code)
-    )
-
-    if course_year:
-        query = query.filter(Group.course_year == course_year)
-    if direction_id:
-        query = query.filter(Group.direction_id == direction_id)
-    if group_id:
-        query = query.filter(Schedule.group_id == group_id)
-    if teacher_id:
-        query = query.filter(Schedule.teacher_id == teacher_id)
-    if semester:
-        query = query.filter(Group.semester == semester)
-
-    schedules = query.order_by(Schedule.day_of_week, Schedule.start_time).all()
-
-    # Generate descriptive filename
-    filename_parts = ["dars_jadvali"]
-    if group_id and schedules:
-        filename_parts.append(schedules[0].group.name if schedules[0].group else "")
-    else:
-        filename_parts.append(faculty.name.replace(' ', '_'))
-    
-    if teacher_id:
-        teacher = User.query.get(teacher_id)
-        if teacher:
-            filename_parts.append(teacher.full_name.replace(' ', '_'))
-
-    if start_date and end_date:
-        filename_parts.append(f"{start_date}_{end_date}")
-    
-    filename = "_".join(filter(None, filename_parts)) + ".xlsx"
-
-    # Create Excel file
-    group_name = schedules[0].group.name if schedules and schedules[0].group else None
-    
-    excel_file = create_schedule_excel(schedules, group_name, faculty.name)
-    
-    return Response(
-        excel_file,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        headers={'Content-Disposition': f'attachment; filename={filename}'}
-    )
+    try:
+        schedule_date_codes(start_date, end_date)
+    except ValueError:
+        flash("Sana formati noto'g'ri", 'error')
+        return redirect(url_for('dean.schedule'))
 
+    job = enqueue_job('export_schedule', "Dars jadvalini eksport qilish", params={
+        'faculty_id': faculty.id,
+        'scope_faculty': True,
+        'course_year': course_year,
+        'semester': semester,
+        'direction_id': direction_id,
+        'group_id': group_id,
+        'teacher_id': teacher_id,
+        'start_date': start_date,
+        'end_date': end_date,
+    }, return_url=url_for('dean.schedule'), user_id=current_user.id)
+    return redirect(url_for('main.job_detail', job_id=job.id))
 
 @bp.route('/api/schedule/filters')
 @login_required
@@ -2804,32 +2667,13 @@ def api_schedule_filters():
     subject_id = request.args.get('subject_id', type=int)
     teacher_id = request.args.get('teacher_id', type=int)
     
+    # Faqat o'z fakultetidagi guruhlar
+    group = get_org_hierarchy().group(group_id) if group_id else None
+    if group_id and (group is None or group.faculty_id != current_user.faculty_id):
+        return jsonify([])
+    
     if group_id and not subject_id:
-        from app.models import Group, DirectionCurriculum, TeacherSubject
-        group = Group.query.get(group_id)
-        if not group:
-            return jsonify([])
-            
-        current_semester = group.semester if group.semester else 1
-        
-        # Guruhga biriktirilgan fanlar, lekin faqat joriy semestrdagilar
-        assignments = TeacherSubject.query.filter_by(group_id=group_id).all()
-        subjects_data = {}
-        for a in assignments:
-            # Tekshirish: bu fan bu guruhda shu semestrda bormi?
-            curr_item = DirectionCurriculum.query.filter_by(
-                direction_id=group.direction_id,
-                subject_id=a.subject_id,
-                semester=current_semester
-            ).first()
-            
-            if curr_item and a.subject_id not in subjects_data:
-                subjects_data[a.subject_id] = {
-                    'id': a.subject.id,
-                    'name': a.subject.name,
-                    'code': a.subject.code
-                }
-        return jsonify(sorted(list(subjects_data.values()), key=lambda x: x['name']))
+        return jsonify(group_semester_subjects(group))
     
     if group_id and subject_id and not teacher_id:
         # Guruh va fan uchun biriktirilgan o'qituvchilar
@@ -2845,6 +2689,29 @@ def api_schedule_filters():
         
     return jsonify([])
 
+
+@bp.route('/api/schedule/free-slots')
+@login_required
+@dean_required
+def api_schedule_free_slots():
+    """Haftaning o'quv kunlarida guruh va o'qituvchi bir vaqtda bo'sh bo'lgan oraliqlar.
+    week - haftadagi istalgan sana (YYYY-MM-DD), duration - dars davomiyligi (daqiqa)"""
+    group_id = request.args.get('group_id', type=int)
+    teacher_id = request.args.get('teacher_id', type=int)
+    duration = request.args.get('duration', type=int) or DEFAULT_LESSON_MINUTES
+    try:
+        week = datetime.strptime(request.args.get('week', ''), "%Y-%m-%d").date()
+    except ValueError:
+        return jsonify({'error': "week parametri YYYY-MM-DD formatida bo'lishi kerak"}), 400
+    if not group_id and not teacher_id:
+        return jsonify({'error': "group_id yoki teacher_id kerak"}), 400
+    # Faqat o'z fakultetidagi guruhlar
+    group = get_org_hierarchy().group(group_id) if group_id else None
+    if group_id and (group is None or group.faculty_id != current_user.faculty_id):
+        return jsonify({'error': "Guruh topilmadi"}), 404
+    return jsonify(find_free_slots(week, teacher_id=teacher_id, group_id=group_id, duration=max(duration, 1)))
+
+
 @bp.route('/schedule/create', methods=['GET', 'POST'])
 @login_required
 @dean_required
@@ -2856,58 +2723,8 @@ def create_schedule():
     
     faculty_id = faculty.id
     
-    # Robust mapping logic (Group-driven)
-    faculty_course_semesters = {}
-    faculty_course_semester_education_directions = {}
-    direction_groups = {}
-    active_courses = set()
-    
-    all_groups = Group.query.filter_by(faculty_id=faculty_id).all()
-    for g in all_groups:
-        if g.get_students_count() == 0: continue # Skip empty groups
-        
-        c = g.course_year
-        if not c: continue
-        active_courses.add(c)
-        
-        if g.direction:
-            d = g.direction
-            s = g.semester
-            
-            if c not in faculty_course_semesters:
-                faculty_course_semesters[c] = set()
-            faculty_course_semesters[c].add(s)
-            
-            if s not in faculty_course_semester_education_directions:
-                faculty_course_semester_education_directions[s] = {}
-            if c not in faculty_course_semester_education_directions[s]:
-                faculty_course_semester_education_directions[s][c] = {}
-            
-            etype = g.education_type or 'kunduzgi'
-            if etype not in faculty_course_semester_education_directions[s][c]:
-                faculty_course_semester_education_directions[s][c][etype] = []
-            
-            if not any(item['id'] == d.id for item in faculty_course_semester_education_directions[s][c][etype]):
-                faculty_course_semester_education_directions[s][c][etype].append({
-                    'id': d.id,
-                    'name': d.name,
-                    'code': d.code,
-                    'enrollment_year': g.enrollment_year,
-                    'education_type': etype
-                })
-            
-            if d.id not in direction_groups:
-                direction_groups[d.id] = []
-            if not any(item['id'] == g.id for item in direction_groups[d.id]):
-                direction_groups[d.id].append({
-                    'id': g.id,
-                    'name': g.name
-                })
-
-    # Convert sets to sorted lists
-    faculty_courses = sorted(list(active_courses))
-    for c in faculty_course_semesters:
-        faculty_course_semesters[c] = sorted(list(faculty_course_semesters[c]))
+    # Bog'langan tanlovlar (fakultetning talabasi bor guruhlari)
+    tree = get_org_hierarchy().schedule_tree(faculty_id)
 
     teachers = User.query.filter_by(role='teacher').order_by(User.full_name).all()
     
@@ -2933,69 +2750,72 @@ def create_schedule():
             flash("Sana tanlanishi shart.", 'error')
             return redirect(url_for('dean.create_schedule'))
         
-        # Takrorlanishni tekshirish
         start_time = request.form.get('start_time')
+        end_time = request.form.get('end_time') or None
         group_id = request.form.get('group_id', type=int)
         
-        existing = Schedule.query.filter_by(
-            group_id=group_id,
-            day_of_week=date_code,
-            start_time=start_time
-        ).first()
-        
         from app.models import TeacherSubject
         subject_id = request.form.get('subject_id', type=int)
         teacher_id = request.form.get('teacher_id', type=int)
         
-        # O'qituvchiga biriktirilgan barcha dars turlarini topish
-        assignments = TeacherSubject.query.filter_by(
-            group_id=group_id,
-            subject_id=subject_id,
-            teacher_id=teacher_id
-        ).all()
-        
-        # Dars turlarini yig'ish
-        types_map = {
-            'maruza': 'Ma\'ruza',
-            'lecture': 'Ma\'ruza',
-            'amaliyot': 'Amaliyot',
-            'practice': 'Amaliyot',
-            'lab': 'Laboratoriya',
-            'seminar': 'Seminar'
-        }
-        found_types = sorted(list(set([types_map.get(a.lesson_type, a.lesson_type.capitalize()) for a in assignments if a.lesson_type])))
-        lesson_type_display = "/".join(found_types) if found_types else 'Ma\'ruza'
+        # O'qituvchi yoki guruh shu vaqtda band emasligini tekshirish (birlashgan ma'ruza bundan mustasno)
+        clash = describe_conflicts(find_schedule_conflicts(
+            parsed_date.date(), start_time, end_time, teacher_id=teacher_id, group_id=group_id, subject_id=subject_id
+        ))
+        if clash:
+            # Forma kiritilgan qiymatlar bilan qayta ko'rsatiladi
+            flash(f"Bu vaqtda ({start_time}) dars qo'yib bo'lmaydi - {clash}", 'warning')
+        else:
+            # O'qituvchiga biriktirilgan barcha dars turlarini topish
+            assignments = TeacherSubject.query.filter_by(
+                group_id=group_id,
+                subject_id=subject_id,
+                teacher_id=teacher_id
+            ).all()
+        
+            # Dars turlarini yig'ish
+            types_map = {
+                'maruza': 'Ma\'ruza',
+                'lecture': 'Ma\'ruza',
+                'amaliyot': 'Amaliyot',
+                'practice': 'Amaliyot',
+                'lab': 'Laboratoriya',
+                'seminar': 'Seminar'
+            }
+            found_types = sorted(list(set([types_map.get(a.lesson_type, a.lesson_type.capitalize()) for a in assignments if a.lesson_type])))
+            lesson_type_display = "/".join(found_types) if found_types else 'Ma\'ruza'
 
-        schedule = Schedule(
-            subject_id=subject_id,
-            group_id=group_id,
-            teacher_id=teacher_id,
-            day_of_week=date_code,
-            start_time=start_time,
-            end_time=request.form.get('end_time') or None,
-            link=request.form.get('link'),
-            lesson_type=lesson_type_display[:20]
-        )
-        db.session.add(schedule)
-        db.session.commit()
+            schedule = Schedule(
+                subject_id=subject_id,
+                group_id=group_id,
+                teacher_id=teacher_id,
+                day_of_week=date_code,
+                start_time=start_time,
+                end_time=end_time,
+                link=request.form.get('link'),
+                lesson_type=lesson_type_display[:20]
+            )
+            db.session.add(schedule)
+            db.session.commit()
         
-        flash("Dars jadvalga qo'shildi", 'success')
-        return redirect(url_for(
-            'dean.schedule',
-            year=parsed_date.year,
-            month=parsed_date.month,
-            group=group_id
-        ))
+            flash("Dars jadvalga qo'shildi", 'success')
+            return redirect(url_for(
+                'dean.schedule',
+                year=parsed_date.year,
+                month=parsed_date.month,
+                group=group_id
+            ))
     
     return render_template('dean/create_schedule.html',
                          faculty=faculty,
-                         faculty_courses=faculty_courses,
-                         faculty_course_semesters=faculty_course_semesters,
-                         faculty_course_semester_education_directions=faculty_course_semester_education_directions,
-                         direction_groups=direction_groups,
+                         faculty_courses=tree['faculty_courses'],
+                         faculty_course_semesters=tree['faculty_course_semesters'],
+                         faculty_course_semester_education_directions=tree['faculty_course_semester_education_directions'],
+                         direction_groups=tree['direction_groups'],
                          teachers=teachers,
                          default_date=default_date,
-                         default_group_id=default_group_id)
+                         default_group_id=default_group_id,
+                         form=request.form)
 
 
 @bp.route('/schedule/<int:id>/delete', methods=['POST'])
@@ -3009,6 +2829,7 @@ def delete_schedule(id):
         flash("Sizda bu amaliyot uchun huquq yo'q", 'error')
         return redirect(url_for('dean.schedule'))
     
+    record_schedule_removal(schedule)
     db.session.delete(schedule)
     db.session.commit()
     flash("Jadval o'chirildi", 'success')
@@ -3030,58 +2851,8 @@ def edit_schedule(id):
     faculty = current_user.managed_faculty
     faculty_id = faculty.id
     
-    # Robust mapping logic (Group-driven)
-    faculty_course_semesters = {}
-    faculty_course_semester_education_directions = {}
-    direction_groups = {}
-    active_courses = set()
-    
-    all_groups = Group.query.filter_by(faculty_id=faculty_id).all()
-    for g in all_groups:
-        if g.get_students_count() == 0: continue # Skip empty groups
-        
-        c = g.course_year
-        if not c: continue
-        active_courses.add(c)
-        
-        if g.direction:
-            d = g.direction
-            s = g.semester
-            
-            if c not in faculty_course_semesters:
-                faculty_course_semesters[c] = set()
-            faculty_course_semesters[c].add(s)
-            
-            if s not in faculty_course_semester_education_directions:
-                faculty_course_semester_education_directions[s] = {}
-            if c not in faculty_course_semester_education_directions[s]:
-                faculty_course_semester_education_directions[s][c] = {}
-            
-            etype = g.education_type or 'kunduzgi'
-            if etype not in faculty_course_semester_education_directions[s][c]:
-                faculty_course_semester_education_directions[s][c][etype] = []
-            
-            if not any(item['id'] == d.id for item in faculty_course_semester_education_directions[s][c][etype]):
-                faculty_course_semester_education_directions[s][c][etype].append({
-                    'id': d.id,
-                    'name': d.name,
-                    'code': d.code,
-                    'enrollment_year': g.enrollment_year,
-                    'education_type': etype
-                })
-            
-            if d.id not in direction_groups:
-                direction_groups[d.id] = []
-            if not any(item['id'] == g.id for item in direction_groups[d.id]):
-                direction_groups[d.id].append({
-                    'id': g.id,
-                    'name': g.name
-                })
-
-    # Convert sets to sorted lists
-    faculty_courses = sorted(list(active_courses))
-    for c in faculty_course_semesters:
-        faculty_course_semesters[c] = sorted(list(faculty_course_semesters[c]))
+    # Bog'langan tanlovlar (fakultetning talabasi bor guruhlari)
+    tree = get_org_hierarchy().schedule_tree(faculty_id)
 
     teachers = User.query.filter_by(role='teacher').order_by(User.full_name).all()
     
@@ -3107,42 +2878,60 @@ def edit_schedule(id):
             flash("Sana tanlanishi shart.", 'error')
             return redirect(url_for('dean.edit_schedule', id=id))
         
-        schedule.subject_id = request.form.get('subject_id', type=int)
-        schedule.group_id = request.form.get('group_id', type=int)
-        schedule.teacher_id = request.form.get('teacher_id', type=int)
-        schedule.day_of_week = date_code
-        schedule.start_time = request.form.get('start_time')
-        schedule.end_time = request.form.get('end_time') or None
-        schedule.link = request.form.get('link')
-        
-        # O'qituvchiga biriktirilgan barcha dars turlarini topish
-        assignments = TeacherSubject.query.filter_by(
-            group_id=schedule.group_id,
-            subject_id=schedule.subject_id,
-            teacher_id=schedule.teacher_id
-        ).all()
-        
-        # Dars turlarini yig'ish
-        types_map = {
-            'maruza': 'Ma\'ruza',
-            'lecture': 'Ma\'ruza',
-            'amaliyot': 'Amaliyot',
-            'practice': 'Amaliyot',
-            'lab': 'Laboratoriya',
-            'seminar': 'Seminar'
-        }
-        found_types = sorted(list(set([types_map.get(a.lesson_type, a.lesson_type.capitalize()) for a in assignments if a.lesson_type])))
-        schedule.lesson_type = "/".join(found_types) if found_types else 'Ma\'ruza'
+        clash = describe_conflicts(find_schedule_conflicts(
+            parsed_date.date(), request.form.get('start_time'), request.form.get('end_time') or None,
+            teacher_id=request.form.get('teacher_id', type=int),
+            group_id=request.form.get('group_id', type=int),
+            subject_id=request.form.get('subject_id', type=int),
+            exclude_id=schedule.id
+        ))
+        if clash:
+            # Forma kiritilgan qiymatlar bilan qayta ko'rsatiladi
+            flash(f"Bu vaqtda ({request.form.get('start_time')}) dars qo'yib bo'lmaydi - {clash}", 'warning')
+        else:
+            old_group_id, old_teacher_id = schedule.group_id, schedule.teacher_id
+            schedule.subject_id = request.form.get('subject_id', type=int)
+            schedule.group_id = request.form.get('group_id', type=int)
+            schedule.teacher_id = request.form.get('teacher_id', type=int)
+            schedule.day_of_week = date_code
+            schedule.start_time = request.form.get('start_time')
+            schedule.end_time = request.form.get('end_time') or None
+            schedule.link = request.form.get('link')
+        
+            # O'qituvchiga biriktirilgan barcha dars turlarini topish
+            assignments = TeacherSubject.query.filter_by(
+                group_id=schedule.group_id,
+                subject_id=schedule.subject_id,
+                teacher_id=schedule.teacher_id
+            ).all()
+        
+            # Dars turlarini yig'ish
+            types_map = {
+                'maruza': 'Ma\'ruza',
+                'lecture': 'Ma\'ruza',
+                'amaliyot': 'Amaliyot',
+                'practice': 'Amaliyot',
+                'lab': 'Laboratoriya',
+                'seminar': 'Seminar'
+            }
+            found_types = sorted(list(set([types_map.get(a.lesson_type, a.lesson_type.capitalize()) for a in assignments if a.lesson_type])))
+            schedule.lesson_type = "/".join(found_types) if found_types else 'Ma\'ruza'
+            # Boshqa guruh yoki o'qituvchiga o'tkazilsa, eski egasining .ics tasmasida dars bekor qilinadi
+            record_schedule_removal(
+                schedule, moved=True,
+                group_id=old_group_id if old_group_id != schedule.group_id else None,
+                teacher_id=old_teacher_id if old_teacher_id != schedule.teacher_id else None
+            )
         
-        db.session.commit()
+            db.session.commit()
         
-        flash("Dars jadvali yangilandi", 'success')
-        return redirect(url_for(
-            'dean.schedule',
-            year=parsed_date.year,
-            month=parsed_date.month,
-            group=schedule.group_id
-        ))
+            flash("Dars jadvali yangilandi", 'success')
+            return redirect(url_for(
+                'dean.schedule',
+                year=parsed_date.year,
+                month=parsed_date.month,
+                group=schedule.group_id
+            ))
     
     schedule_date = existing_date.strftime("%Y-%m-%d")
     year = existing_date.year
@@ -3151,19 +2940,20 @@ def edit_schedule(id):
     return render_template(
         'dean/edit_schedule.html',
         faculty=faculty,
-        faculty_courses=faculty_courses,
-        faculty_course_semesters=faculty_course_semesters,
-        faculty_course_semester_education_directions=faculty_course_semester_education_directions,
-        direction_groups=direction_groups,
+        faculty_courses=tree['faculty_courses'],
+        faculty_course_semesters=tree['faculty_course_semesters'],
+        faculty_course_semester_education_directions=tree['faculty_course_semester_education_directions'],
+        direction_groups=tree['direction_groups'],
         teachers=teachers,
         schedule=schedule,
         schedule_date=schedule_date,
         year=year,
         month=month,
         current_faculty_id=faculty_id,
-        current_course_year=schedule.group.course_year,
-        current_semester=schedule.group.semester if schedule.group else None,
-        current_direction_id=schedule.group.direction_id
+        current_course_year=request.form.get('course_year', schedule.group.course_year, type=int),
+        current_semester=request.form.get('semester', schedule.group.semester if schedule.group else None, type=int),
+        current_direction_id=request.form.get('direction_id', schedule.group.direction_id, type=int),
+        form=request.form
     )
 
 
@@ -3178,10 +2968,11 @@ def reports():
         return redirect(url_for('main.dashboard'))
     
     # Fakultet statistikasi
-    faculty_group_ids = [g.id for g in faculty.groups.all()]
+    faculty_groups = faculty.groups.all()
+    faculty_group_ids = [g.id for g in faculty_groups]
     
     stats = {
-        'total_groups': faculty.groups.count(),
+        'total_groups': len(faculty_groups),
         'total_subjects': Subject.query.join(TeacherSubject).join(Group).filter(
             Group.faculty_id == faculty.id
         ).distinct().count(),
@@ -3194,13 +2985,17 @@ def reports():
         ).distinct().count(),
     }
     
-    # Guruhlar bo'yicha talabalar
+    # Guruhlar bo'yicha talabalar va fanlar soni (guruh boshiga so'rovsiz)
+    students_counts = Group.students_count_map(faculty_group_ids)
+    subjects_counts = dict(db.session.query(TeacherSubject.group_id, db.func.count(TeacherSubject.id)).filter(
+        TeacherSubject.group_id.in_(faculty_group_ids)
+    ).group_by(TeacherSubject.group_id).all()) if faculty_group_ids else {}
     group_stats = []
-    for group in faculty.groups.all():
+    for group in faculty_groups:
         group_stats.append({
             'group': group,
-            'students': group.students.count(),
-            'subjects': TeacherSubject.query.filter_by(group_id=group.id).count()
+            'students': students_counts.get(group.id, 0),
+            'subjects': subjects_counts.get(group.id, 0)
         })
     
     return render_template('dean/reports.html', faculty=faculty, stats=stats, group_stats=group_stats)
@@ -1,6 +1,6 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, send_file, abort, current_app
 from flask_login import login_required, current_user
-from app.models import User, Subject, Assignment, Announcement, Schedule, Submission, Message, Group, Faculty, TeacherSubject, StudentPayment
+from app.models import User, Subject, Assignment, Announcement, Schedule, Submission, Message, Group, Faculty, TeacherSubject, StudentPayment, BackgroundJob
 from app import db
 from datetime import datetime, timedelta, date
 
@@ -8,8 +8,18 @@ def get_tashkent_time():
     """Toshkent vaqtini qaytaradi (UTC+5)"""
     return datetime.utcnow() + timedelta(hours=5)
 from sqlalchemy import func
+from werkzeug.http import is_resource_modified
 from app.utils.translations import get_translation, get_current_language
+from app.utils.messaging import (record_message, mark_conversation_read, get_inbox_page,
+                                 get_conversation_partner_ids, get_chat_history)
+from app.utils.jobs import job_status as get_job_status
+from app.utils.schedule_calendar import month_schedule
+from app.utils.schedule_feed import (
+    ScheduleFeed, issue_feed_token, is_feed_user, parse_sync_token, personal_schedule_scope, revoke_feed_token,
+    user_for_feed_token
+)
 import calendar
+import os
 
 bp = Blueprint('main', __name__)
 
@@ -98,206 +108,73 @@ def dashboard():
         greeting = "Xayrli tun"
     
     if active_role == 'student':
-        from app.models import DirectionCurriculum
-        current_semester = user.semester
+        from app.utils.semester_progress import (get_student_context, get_curriculum_list, get_semester_progress,
+                                                 curriculum_credits)
         my_subjects_info = {}
         current_semester_subjects_count = 0
         total_semester_credits = 0.0
-        direction_id = None
+        curriculum_list = []
+        group, direction_id, current_semester = get_student_context(user)
         
         if user.group_id:
-            group = Group.query.get(user.group_id)
-            if group:
-                direction_id = group.direction_id
-                if group.direction:
-                    current_semester = group.semester
+            # Joriy semestr o'quv rejasi (fanlari bilan birga)
+            curriculum_list = get_curriculum_list(direction_id, current_semester)
+            my_subjects = list({item.subject_id: item.subject for item in curriculum_list}.values())
             
-            # Fetch curriculum items for all subjects in the current semester
-            curriculum_list = []
-            if direction_id:
-                curriculum_list = DirectionCurriculum.query.join(Subject).filter(
-                    DirectionCurriculum.direction_id == direction_id,
-                    DirectionCurriculum.semester == current_semester
-                ).order_by(Subject.name).all()
+            # Oldindan hisoblangan natijalar (StudentSemesterProgress)
+            progress_rows = get_semester_progress(user, direction_id, current_semester, curriculum_list) if curriculum_list else []
             
-            # Populate basic info and collect subject IDs
-            subject_ids = []
-            total_semester_credits = 0.0
-            for item in curriculum_list:
-                subject_ids.append(item.subject_id)
-                course_year = ((item.semester - 1) // 2) + 1
-                
-                # Formula: (maruza + amaliyot + laboratoriya + seminar + mustaqil) / 30
-                total_hours = (item.hours_maruza or 0) + (item.hours_amaliyot or 0) + \
-                             (item.hours_laboratoriya or 0) + (item.hours_seminar or 0) + \
-                             (item.hours_mustaqil or 0)
-                
-                subject = Subject.query.get(item.subject_id)
-                if total_hours > 0:
-                    credits = total_hours / 30.0
-                else:
-                    credits = float(subject.credits) if subject and subject.credits else 0.0
-                
-                total_semester_credits += credits
-                my_subjects_info[item.subject_id] = {
-                    'semester': item.semester,
-                    'course_year': course_year,
-                    'credits': credits,
-                    'progress': 0,
-                    'graded_count': 0,
-                    'total_assignments': 0,
-                    'progress_score': 0,
-                    'progress_max': 100
+            total_semester_score = 0.0
+            total_semester_max_score = 0.0
+            for row in progress_rows:
+                my_subjects_info[row.subject_id] = {
+                    'semester': row.semester,
+                    'course_year': ((row.semester - 1) // 2) + 1,
+                    'credits': row.credits,
+                    'progress': row.percent,
+                    'graded_count': row.graded_count,
+                    'total_assignments': row.total_assignments,
+                    'progress_score': row.score,
+                    'progress_max': row.max_score if row.max_score > 0 else 100
                 }
-
-            # If my_subjects is still empty, try to populate from curriculum
-            if not my_subjects and subject_ids:
-                my_subjects = Subject.query.filter(Subject.id.in_(subject_ids)).order_by(Subject.name).all()
-            
-            # Now calculate scores for ALL subjects we found
-            all_subj_ids = list(set(subject_ids + [s.id for s in my_subjects]))
+                total_semester_score += row.score
+                total_semester_max_score += row.max_score
             
-            if all_subj_ids:
-                # Fetch assignments
-                assignment_query = Assignment.query.filter(Assignment.subject_id.in_(all_subj_ids))
-                if direction_id:
-                    assignment_query = assignment_query.filter(
-                        (Assignment.direction_id == direction_id) | (Assignment.direction_id.is_(None)),
-                        (Assignment.group_id == user.group_id) | (Assignment.group_id.is_(None))
-                    )
-                else:
-                    assignment_query = assignment_query.filter(
-                        (Assignment.group_id == user.group_id) | (Assignment.group_id.is_(None))
-                    )
-                all_assignments_list = assignment_query.all()
-                
-                # Fetch submissions
-                assign_ids = [a.id for a in all_assignments_list]
-                user_submissions = Submission.query.filter(
-                    Submission.student_id == user.id,
-                    Submission.assignment_id.in_(assign_ids)
-                ).all() if assign_ids else []
-                
-                # Highest score map
-                submissions_map = {}
-                for s in user_submissions:
-                    if s.assignment_id not in submissions_map:
-                        submissions_map[s.assignment_id] = s
-                    elif s.score is not None:
-                        current = submissions_map[s.assignment_id]
-                        if current.score is None or s.score > current.score:
-                            submissions_map[s.assignment_id] = s
-
-                total_semester_score = 0.0
-                total_semester_max_score = 0.0
-                
-                # Group assignments by subject for efficient lookup
-                assignments_by_subject = {}
-                for a in all_assignments_list:
-                    if a.subject_id not in assignments_by_subject:
-                        assignments_by_subject[a.subject_id] = []
-                    assignments_by_subject[a.subject_id].append(a)
-
-                for sid in all_subj_ids:
-                    s_assignments = assignments_by_subject.get(sid, [])
-                    sub_score = 0.0
-                    sub_max = 0.0
-                    sub_graded = 0
-                    
-                    for a in s_assignments:
-                        sub_max += (a.max_score or 0)
-                        subm = submissions_map.get(a.id)
-                        if subm and subm.score is not None:
-                            sub_score += subm.score
-                            sub_graded += 1
-                    
-                    prog = (sub_score / sub_max) * 100 if sub_max > 0 else 0.0
-                    
-                    if sid not in my_subjects_info:
-                        # Ensure we have info for subjects that were found via get_subjects but not curriculum
-                        subject = Subject.query.get(sid)
-                        c_semester = current_semester or 1
-                        my_subjects_info[sid] = {
-                            'semester': current_semester,
-                            'course_year': ((c_semester - 1) // 2) + 1,
-                            'credits': float(subject.credits) if subject and subject.credits else 0.0,
-                            'progress': 0,
-                            'graded_count': 0,
-                            'total_assignments': 0,
-                            'progress_score': 0,
-                            'progress_max': 100
-                        }
-                    
-                    my_subjects_info[sid].update({
-                        'progress': prog,
-                        'graded_count': sub_graded,
-                        'total_assignments': len(s_assignments),
-                        'progress_score': sub_score,
-                        'progress_max': sub_max if sub_max > 0 else 100
-                    })
-                    
-                    # Only add to semester totals if the subject is in the current semester curriculum
-                    if sid in subject_ids:
-                        total_semester_score += sub_score
-                        total_semester_max_score += sub_max
-
-                current_semester_subjects_count = len(subject_ids)
-                if total_semester_max_score > 0:
-                    semester_progress = (total_semester_score / total_semester_max_score) * 100
-                    from app.models import GradeScale
-                    semester_grade = GradeScale.get_grade(semester_progress)
-                else:
-                    semester_progress = 0
-                    semester_grade = None
+            # O'quv rejada takrorlangan fanlar ham hisobga olinadi
+            current_semester_subjects_count = len(curriculum_list)
+            total_semester_credits = sum(curriculum_credits(item) for item in curriculum_list)
+            if total_semester_max_score > 0:
+                semester_progress = (total_semester_score / total_semester_max_score) * 100
+                from app.models import GradeScale
+                semester_grade = GradeScale.get_grade(semester_progress)
+            else:
+                semester_progress = 0
+                semester_grade = None
         
         # Barcha topshiriqlar (talabaning guruhiga tegishli va joriy semestrdagi fanlar uchun)
         all_assignments = []
-        if user.group_id:
-            group = Group.query.get(user.group_id)
-            if group and group.direction_id:
-                # Joriy semestrdagi fanlar
-                curriculum_items = DirectionCurriculum.query.filter_by(
-                    direction_id=group.direction_id,
-                    semester=current_semester
-                ).all()
-                current_semester_subject_ids = [item.subject_id for item in curriculum_items]
-                
-                if current_semester_subject_ids:
-                    # Faqat joriy semestrdagi fanlarga tegishli topshiriqlar
-                    # Filterlash mantiqi courses.grades dagi kabi bo'lishi kerak
-                    all_assignments = Assignment.query.filter(
-                        Assignment.subject_id.in_(current_semester_subject_ids),
-                        (Assignment.group_id == user.group_id) | (Assignment.group_id.is_(None)),
-                        (Assignment.direction_id == group.direction_id) | (Assignment.direction_id.is_(None))
-                    ).order_by(Assignment.due_date.desc()).all()
-                else:
-                    all_assignments = []
-        
-        # Topshirilgan topshiriqlar (baholangan) - faqat joriy semestrdagi topshiriqlar uchun
-        graded_submissions = []
-        graded_assignment_ids = []
-        if all_assignments:
-            assignment_ids = [a.id for a in all_assignments]
-            graded_submissions = Submission.query.join(Assignment).filter(
-                Submission.student_id == user.id,
-                Submission.is_active == True,
-                Submission.score != None,
-                Assignment.id.in_(assignment_ids)
-            ).all()
-            graded_assignment_ids = [s.assignment_id for s in graded_submissions]
+        current_semester_subject_ids = [item.subject_id for item in curriculum_list]
+        if group and group.direction_id and current_semester_subject_ids:
+            # Faqat joriy semestrdagi fanlarga tegishli topshiriqlar
+            # Filterlash mantiqi courses.grades dagi kabi bo'lishi kerak
+            all_assignments = Assignment.query.filter(
+                Assignment.subject_id.in_(current_semester_subject_ids),
+                (Assignment.group_id == user.group_id) | (Assignment.group_id.is_(None)),
+                (Assignment.direction_id == group.direction_id) | (Assignment.direction_id.is_(None))
+            ).order_by(Assignment.due_date.desc()).all()
         
-        # Topshirilgan lekin baholanmagan - faqat joriy semestrdagi topshiriqlar uchun
-        submitted_ungraded = []
-        submitted_ungraded_ids = []
+        # Faol javoblar (baholangan va baholanmagan) - bitta so'rov bilan
+        active_submissions_map = {}
         if all_assignments:
             assignment_ids = [a.id for a in all_assignments]
-            submitted_ungraded = Submission.query.join(Assignment).filter(
+            for s in Submission.query.filter(
                 Submission.student_id == user.id,
                 Submission.is_active == True,
-                Submission.score == None,
-                Assignment.id.in_(assignment_ids)
-            ).all()
-            submitted_ungraded_ids = [s.assignment_id for s in submitted_ungraded]
+                Submission.assignment_id.in_(assignment_ids)
+            ).all():
+                active_submissions_map.setdefault(s.assignment_id, s)
+        graded_assignment_ids = [aid for aid, s in active_submissions_map.items() if s.score is not None]
+        submitted_ungraded_ids = [aid for aid, s in active_submissions_map.items() if s.score is None]
         
         # Topshirilmagan topshiriqlar
         all_assignment_ids = [a.id for a in all_assignments]
@@ -402,12 +279,11 @@ def dashboard():
             
             # Bugungi dars jadvali (Toshkent vaqti bo'yicha)
             today_date = get_tashkent_time().date()
-            date_code = int(today_date.strftime("%Y%m%d"))
             today_schedule = Schedule.query.filter(
                 Schedule.group_id == user.group_id,
                 Schedule.subject_id.in_(subject_ids),
-                Schedule.day_of_week == date_code
-            ).order_by(Schedule.start_time).all()
+                Schedule.lesson_date == today_date
+            ).order_by(Schedule.lesson_start).all()
         else:
             today_schedule = []
         
@@ -415,11 +291,7 @@ def dashboard():
         assignments_with_status = []
         now_dt_check = get_tashkent_time()
         for assignment in all_assignments:
-            submission = Submission.query.filter_by(
-                student_id=user.id,
-                assignment_id=assignment.id,
-                is_active=True
-            ).first()
+            submission = active_submissions_map.get(assignment.id)
 
             status = 'not_submitted'
             if submission:
@@ -1032,37 +904,10 @@ def delete_all_announcements():
 def messages():
     """Xabarlar sahifasi"""
     user = current_user
+    page = request.args.get('page', 1, type=int)
     
-    # Barcha xabarlarni olish (yuborilgan va qabul qilingan)
-    all_messages = Message.query.filter(
-        (Message.sender_id == user.id) | (Message.receiver_id == user.id)
-    ).order_by(Message.created_at.desc()).all()
-    
-    # Suhbatlar ro'yxatini yaratish (har bir foydalanuvchi bilan alohida suhbat)
-    chats_dict = {}
-    for msg in all_messages:
-        # Qaysi foydalanuvchi bilan suhbat
-        other_user_id = msg.receiver_id if msg.sender_id == user.id else msg.sender_id
-        other_user = User.query.get(other_user_id)
-        
-        if other_user and other_user_id not in chats_dict:
-            chats_dict[other_user_id] = {
-                'user': other_user,
-                'last_message': msg,
-                'unread_count': 0
-            }
-        elif other_user and other_user_id in chats_dict:
-            # Agar bu xabar keyinroq bo'lsa, last_message ni yangilash
-            if msg.created_at > chats_dict[other_user_id]['last_message'].created_at:
-                chats_dict[other_user_id]['last_message'] = msg
-        
-        # O'qilmagan xabarlarni hisoblash
-        if msg.receiver_id == user.id and not msg.is_read:
-            chats_dict[other_user_id]['unread_count'] += 1
-    
-    # Chats ro'yxatini yaratish
-    chats = list(chats_dict.values())
-    chats.sort(key=lambda x: x['last_message'].created_at, reverse=True)
+    # Suhbatlar indeksidan (Conversation) bitta sahifa, foydalanuvchilar bilan birga
+    conversations, chats = get_inbox_page(user.id, page=page)
     
     # Mavjud foydalanuvchilar (suhbat boshlash uchun)
     if user.role == 'student':
@@ -1104,9 +949,10 @@ def messages():
         # Admin va dekan hammani ko'ra oladi
         all_users = User.query.filter(User.id != user.id, User.is_active == True).all()
         
-    available_users = [u for u in all_users if u.id not in chats_dict.keys()]
+    partner_ids = get_conversation_partner_ids(user.id)
+    available_users = [u for u in all_users if u.id not in partner_ids]
     
-    return render_template('messages.html', chats=chats, available_users=available_users)
+    return render_template('messages.html', chats=chats, conversations=conversations, available_users=available_users)
 
 @bp.route('/settings', methods=['GET', 'POST'])
 @login_required
@@ -1199,23 +1045,22 @@ def chat(user_id):
                 content=content
             )
             db.session.add(message)
+            record_message(message)
             db.session.commit()
             flash("Xabar yuborildi", 'success')
             return redirect(url_for('main.chat', user_id=user_id))
         else:
             flash("Xabar bo'sh bo'lishi mumkin emas", 'error')
     
-    # Ikki foydalanuvchi o'rtasidagi barcha xabarlar
-    messages = Message.query.filter(
-        ((Message.sender_id == current_user.id) & (Message.receiver_id == user_id)) |
-        ((Message.sender_id == user_id) & (Message.receiver_id == current_user.id))
-    ).order_by(Message.created_at.asc()).all()
+    # Ikki foydalanuvchi o'rtasidagi xabarlar (oxirgi sahifa yoki ?before=<id> dan oldingilari)
+    before_id = request.args.get('before', type=int)
+    messages, before_cursor = get_chat_history(current_user.id, user_id, before_id=before_id)
     
     # Xabarlarni o'qilgan deb belgilash
-    Message.query.filter_by(sender_id=user_id, receiver_id=current_user.id, is_read=False).update({'is_read': True})
+    mark_conversation_read(current_user.id, user_id)
     db.session.commit()
     
-    return render_template('chat.html', other_user=other_user, messages=messages)
+    return render_template('chat.html', other_user=other_user, messages=messages, before_cursor=before_cursor)
 
 @bp.route('/schedule')
 @login_required
@@ -1223,7 +1068,6 @@ def schedule():
     """Dars jadvali sahifasi (talaba va o'qituvchilar uchun)"""
     from datetime import datetime
     import calendar
-    from app.models import Group, Subject, TeacherSubject, Schedule, DirectionCurriculum
     
     user = current_user
     today = datetime.now()
@@ -1249,87 +1093,20 @@ def schedule():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     
-    start_code = int(f"{year}{month:02d}01")
-    end_code = int(f"{year}{month:02d}{days_in_month:02d}")
-    
     # Date Range filtering
+    date_from = date_to = None
     if start_date:
         try:
-            dt = datetime.strptime(start_date, "%d.%m.%Y")
-            start_code = int(dt.strftime("%Y%m%d"))
-        except: pass
+            date_from = datetime.strptime(start_date, "%d.%m.%Y").date()
+        except ValueError: pass
     if end_date:
         try:
-            dt = datetime.strptime(end_date, "%d.%m.%Y")
-            end_code = int(dt.strftime("%Y%m%d"))
-        except: pass
+            date_to = datetime.strptime(end_date, "%d.%m.%Y").date()
+        except ValueError: pass
 
-    query = Schedule.query.filter(Schedule.day_of_week.between(start_code, end_code))
-    
-    all_groups = []
-    all_subjects = []
-
-    if user.role == 'student':
-        if user.group_id:
-            # Talaba faqat o'z guruhidagi va joriy semestridagi fanlarni ko'radi
-            group = Group.query.get(user.group_id)
-            if group and group.direction_id:
-                # Joriy semestrni aniqlash
-                from app.models import DirectionCurriculum
-                current_semester = group.semester if group.semester else 1
-                
-                curr_items = DirectionCurriculum.query.filter_by(
-                    direction_id=group.direction_id,
-                    semester=current_semester
-                ).all()
-                s_ids = [item.subject_id for item in curr_items]
-                all_subjects = Subject.query.filter(Subject.id.in_(s_ids)).order_by(Subject.name).all()
-                
-                # Shcedule query'ni ham filterlash
-                query = query.filter(
-                    Schedule.group_id == user.group_id,
-                    Schedule.subject_id.in_(s_ids)
-                )
-        else:
-            query = query.filter(Schedule.id == None)
-            
-    elif user.role == 'teacher' or user.has_role('teacher'):
-        # O'qituvchi faqat o'zi biriktirilgan darslarni ko'radi
-        # Ammo faqat guruhning joriy semestridagi fanlar bo'yicha
-        from app.models import TeacherSubject, DirectionCurriculum, Group
-        
-        ts_entries = TeacherSubject.query.filter_by(teacher_id=user.id).all()
-        valid_ts_ids = []
-        g_ids = set()
-        s_ids = set()
-        
-        for ts in ts_entries:
-            group = Group.query.get(ts.group_id)
-            if group and group.direction_id:
-                current_semester = group.semester if group.semester else 1
-                # Tekshirish: bu fan bu guruhda shu semestrda bormi?
-                curr_item = DirectionCurriculum.query.filter_by(
-                    direction_id=group.direction_id,
-                    subject_id=ts.subject_id,
-                    semester=current_semester
-                ).first()
-                if curr_item:
-                    valid_ts_ids.append(ts.id)
-                    g_ids.add(ts.group_id)
-                    s_ids.add(ts.subject_id)
-        
-        # Schedule query'ni filterlash
-        if valid_ts_ids:
-            query = query.filter(
-                Schedule.teacher_id == user.id,
-                Schedule.group_id.in_(list(g_ids)),
-                Schedule.subject_id.in_(list(s_ids))
-            )
-        else:
-            query = query.filter(Schedule.id == None)
-            
-        all_groups = Group.query.filter(Group.id.in_(list(g_ids))).order_by(Group.name).all() if g_ids else []
-        all_subjects = Subject.query.filter(Subject.id.in_(list(s_ids))).distinct().order_by(Subject.name).all() if s_ids else []
+    # Talaba - o'z guruhining joriy semestr fanlari; o'qituvchi - o'ziga biriktirilgan darslar
+    # (.ics tasmasi ham shu so'rovdan foydalanadi)
+    query, all_groups, all_subjects = personal_schedule_scope(user)
 
     # Apply additional filters
     if group_id:
@@ -1337,23 +1114,7 @@ def schedule():
     if subject_id:
         query = query.filter_by(subject_id=subject_id)
     
-    schedules = query.order_by(Schedule.day_of_week, Schedule.start_time).all()
-    
-    schedule_by_day = {i: [] for i in range(1, days_in_month + 1)}
-    for s in schedules:
-        try:
-            code_str = str(s.day_of_week)
-            if len(code_str) == 8:
-                s_year = int(code_str[:4])
-                s_month = int(code_str[4:6])
-                if s_year == year and s_month == month:
-                    day = int(code_str[6:8])
-                    if 1 <= day <= days_in_month:
-                        schedule_by_day[day].append(s)
-        except: continue
-        
-    for day in schedule_by_day:
-        schedule_by_day[day].sort(key=lambda x: x.start_time or '')
+    schedule_by_day = month_schedule(query, year, month, date_from, date_to)
     
     return render_template('schedule.html',
                           year=year, month=month,
@@ -1363,4 +1124,100 @@ def schedule():
                           days_in_month=days_in_month, start_weekday=start_weekday,
                           schedule_by_day=schedule_by_day,
                           all_groups=all_groups, all_subjects=all_subjects,
-                          current_group_id=group_id, current_subject_id=subject_id)
+                          current_group_id=group_id, current_subject_id=subject_id,
+                          feed_enabled=is_feed_user(user), feed_token=user.calendar_feed_token)
+
+
+# ==================== KALENDAR TASMASI (.ICS) ====================
+@bp.route('/schedule/feed/<token>.ics')
+def schedule_feed(token):
+    """Shaxsiy dars jadvali (iCalendar). Kalendar ilovalari uchun - login o'rniga havoladagi token.
+    since=<X-Sync-Token> - faqat o'zgarganlar; ETag / If-Modified-Since bo'yicha 304."""
+    user = user_for_feed_token(token)
+    if user is None or not is_feed_user(user):
+        abort(404)
+
+    since = None
+    if request.args.get('since'):
+        try:
+            since = parse_sync_token(request.args['since'])
+        except (ValueError, OverflowError, OSError):
+            return jsonify({'error': "since noto'g'ri"}), 400
+
+    feed = ScheduleFeed(user, since=since)
+    response = current_app.response_class(mimetype='text/calendar')
+    response.set_etag(feed.etag)
+    if feed.last_modified:
+        response.last_modified = feed.last_modified
+    response.headers['X-Sync-Token'] = feed.sync_token
+    response.headers['X-Sync-Mode'] = 'delta' if feed.since else 'full'
+    # Token havolada - faqat shu foydalanuvchining qurilmasi keshlaydi, har safar qayta tekshiradi
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    if not is_resource_modified(request.environ, etag=feed.etag, last_modified=feed.last_modified):
+        response.status_code = 304
+        return response
+
+    response.set_data(feed.render())
+    response.charset = 'utf-8'
+    response.headers['Content-Disposition'] = 'inline; filename="dars_jadvali.ics"'
+    return response
+
+
+@bp.route('/schedule/feed', methods=['POST'])
+@login_required
+def create_schedule_feed():
+    """.ics havolasini yaratish yoki yangilash (eski havola ishlamay qoladi)"""
+    if not is_feed_user(current_user):
+        abort(403)
+    token = issue_feed_token(current_user)
+    db.session.commit()
+    feed_url = url_for('main.schedule_feed', token=token, _external=True)
+    flash(f"Kalendar havolasi (faqat hozir ko'rsatiladi, nusxa oling): {feed_url}", 'success')
+    return redirect(url_for('main.schedule'))
+
+
+@bp.route('/schedule/feed/revoke', methods=['POST'])
+@login_required
+def revoke_schedule_feed():
+    """.ics havolasini bekor qilish"""
+    revoke_feed_token(current_user)
+    db.session.commit()
+    flash("Kalendar havolasi bekor qilindi", 'success')
+    return redirect(url_for('main.schedule'))
+
+
+# ==================== FON VAZIFALARI ====================
+def _get_own_job(job_id):
+    """Vazifani faqat uning egasi yoki admin ko'ra oladi"""
+    job = BackgroundJob.query.get_or_404(job_id)
+    if job.created_by != current_user.id and not current_user.has_role('admin'):
+        abort(404)
+    return job
+
+
+@bp.route('/jobs/<job_id>')
+@login_required
+def job_detail(job_id):
+    """Import/eksport vazifasi holati sahifasi"""
+    job = _get_own_job(job_id)
+    return render_template('job_status.html', job=job, status=get_job_status(job))
+
+
+@bp.route('/jobs/<job_id>/status')
+@login_required
+def job_status(job_id):
+    """Vazifa holati (polling uchun JSON)"""
+    return jsonify(get_job_status(_get_own_job(job_id)))
+
+
+@bp.route('/jobs/<job_id>/download')
+@login_required
+def job_download(job_id):
+    """Eksport vazifasi tayyorlagan faylni yuklab olish"""
+    job = _get_own_job(job_id)
+    if job.status != 'done' or not job.output_path or not os.path.exists(job.output_path):
+        flash("Fayl hali tayyor emas", 'warning')
+        return redirect(url_for('main.job_detail', job_id=job.id))
+    return send_file(job.output_path, as_attachment=True, download_name=job.output_name,
+                     mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
@@ -0,0 +1,124 @@
+"""Mobil API kalitlarini tez tekshirish.
+
+- Kalit key_prefix (indekslangan ustun) bo'yicha topiladi, shuning uchun sekin scrypt tekshiruvi
+  ko'pi bilan bir marta bajariladi.
+- Tasdiqlangan kalitlar qisqa muddat jarayon xotirasida saqlanadi (xom kalit emas, uning HMAC izi).
+- last_used_at har so'rovda emas, to'plab vaqti-vaqti bilan yoziladi.
+"""
+import hashlib
+import hmac
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from werkzeug.security import check_password_hash
+
+from app import db
+from app.models import ApiKey
+
+# Tasdiqlangan kalit keshda qancha turadi (soniya); admin o'zgarishlari boshqa worker'larda shu vaqt ichida ko'rinadi
+VERIFIED_TTL = 60
+# last_used_at yozuvlari orasidagi minimal interval (soniya)
+USAGE_FLUSH_INTERVAL = 60
+# Admin panel yaratadigan kalit prefiksi uzunligi (raw_key[:12])
+KEY_PREFIX_LENGTH = 12
+
+_lock = threading.Lock()
+_verified = {}  # {hmac_digest: (expires_at, VerifiedApiKey)}
+_pending_usage = {}  # {key_id: datetime}
+_last_flush = 0.0
+
+
+class VerifiedApiKey:
+    """Tekshirilgan kalitning bazadan ajratilgan nusxasi"""
+
+    def __init__(self, key):
+        self.id = key.id
+        self.name = key.name
+        self.key_prefix = key.key_prefix
+        self._permissions = tuple(key.get_permissions_list())
+
+    def get_permissions_list(self):
+        return list(self._permissions)
+
+    def has_permission(self, code):
+        return code in self._permissions
+
+    def __repr__(self):
+        return f'<VerifiedApiKey {self.name} ...{self.key_prefix}>'
+
+
+def _digest(raw_key):
+    secret = current_app.config['SECRET_KEY'].encode()
+    return hmac.new(secret, raw_key.encode(), hashlib.sha256).hexdigest()
+
+
+def _lookup(raw_key):
+    """Bazadan prefiks bo'yicha topish va xeshni tekshirish"""
+    candidates = ApiKey.query.filter_by(key_prefix=raw_key[:KEY_PREFIX_LENGTH], is_active=True).all()
+    for key in candidates:
+        if check_password_hash(key.key_hash, raw_key):
+            return VerifiedApiKey(key)
+    return None
+
+
+def verify_api_key(raw_key):
+    """Xom kalitni tekshirish; to'g'ri bo'lsa VerifiedApiKey, aks holda None"""
+    if not raw_key or len(raw_key) < KEY_PREFIX_LENGTH:
+        return None
+    digest = _digest(raw_key)
+    now = time.monotonic()
+    with _lock:
+        entry = _verified.get(digest)
+    if entry and entry[0] > now:
+        key = entry[1]
+    else:
+        key = _lookup(raw_key)
+        if key is None:
+            return None
+        with _lock:
+            _verified[digest] = (now + VERIFIED_TTL, key)
+    record_usage(key.id)
+    return key
+
+
+def record_usage(key_id):
+    """last_used_at ni buferga yozish va interval o'tgan bo'lsa bazaga tushirish"""
+    global _last_flush
+    now = time.monotonic()
+    with _lock:
+        _pending_usage[key_id] = datetime.utcnow()
+        if now - _last_flush < USAGE_FLUSH_INTERVAL:
+            return
+        _last_flush = now
+        pending = list(_pending_usage.items())
+        _pending_usage.clear()
+    flush_usage(pending)
+
+
+def flush_usage(pending=None):
+    """Buferdagi last_used_at qiymatlarini bitta tranzaksiyada yozish"""
+    if pending is None:
+        with _lock:
+            pending = list(_pending_usage.items())
+            _pending_usage.clear()
+    if not pending:
+        return
+    try:
+        db.session.execute(
+            ApiKey.__table__.update().where(ApiKey.__table__.c.id == db.bindparam('key_id')).values(
+                last_used_at=db.bindparam('used_at')
+            ),
+            [{'key_id': key_id, 'used_at': used_at} for key_id, used_at in pending]
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.warning(f"API kalit last_used_at yozilmadi: {e}")
+
+
+def invalidate_api_key_cache():
+    """Kalit o'chirilganda, o'chirib-yoqilganda yoki dostuplari o'zgarganda keshni tozalash"""
+    with _lock:
+        _verified.clear()
@@ -0,0 +1,345 @@
+"""Yuklangan fayllarni mazmuni (SHA-256) bo'yicha saqlash: bir xil fayl diskda bir marta turadi.
+
+Baytlar UPLOAD_FOLDER/blobs/ab/cd/<sha256> da saqlanadi (xeshning boshi bo'yicha papkalarga bo'lingan,
+bitta papkada minglab fayl yig'ilmaydi). Foydalanuvchiga avvalgidek uuid.ext nom beriladi, Attachment
+jadvali esa nom -> egasi (dars yoki javob) -> Blob ni bog'laydi, shuning uchun fayl ruxsatini tekshirish
+indeksli so'rov. Blob.ref_count - unga ishora qiluvchi Attachment lar soni; 0 ga tushgan blob commit dan
+keyin purge_blobs() bilan o'chiriladi. Omborga o'tkazilmagan eski fayllar avvalgi papkalaridan beriladi
+(`flask import-uploads` ularni omborga ko'chiradi).
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app import db
+from app.models import Attachment, Blob, Lesson, Submission
+
+COPY_BUFFER_SIZE = 64 * 1024
+BLOBS_FOLDER = 'blobs'
+
+# Fayl turi -> ombordan oldingi papka (eski fayllar shu yerda qoladi)
+LEGACY_FOLDERS = {'video': 'videos', 'lesson_file': 'lesson_files', 'submission': 'submissions'}
+
+
+def _blobs_root():
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], BLOBS_FOLDER)
+
+
+def blob_path(sha256):
+    return os.path.join(_blobs_root(), sha256[:2], sha256[2:4], sha256)
+
+
+def legacy_folder(kind):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], LEGACY_FOLDERS[kind])
+
+
+def read_blocks(f):
+    """Fayl obyektini bloklab o'qish (butun fayl xotiraga olinmaydi)"""
+    while True:
+        block = f.read(COPY_BUFFER_SIZE)
+        if not block:
+            break
+        yield block
+
+
+def _write_temp(blocks):
+    """Bloklarni vaqtinchalik faylga yozish va shu paytning o'zida xeshlash"""
+    tmp_folder = os.path.join(_blobs_root(), 'tmp')
+    os.makedirs(tmp_folder, exist_ok=True)
+    tmp_path = os.path.join(tmp_folder, f'{uuid.uuid4().hex}.tmp')
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, 'wb') as out:
+            for block in blocks:
+                digest.update(block)
+                size += len(block)
+                out.write(block)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest(), size
+
+
+def _place(source_path, sha256, keep_source=False):
+    """Faylni blob joyiga qo'yish; shu mazmun allaqachon bo'lsa qo'shimcha joy egallamaydi"""
+    target = blob_path(sha256)
+    if os.path.exists(target):
+        if not keep_source:
+            os.remove(source_path)
+        return
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if not keep_source:
+        os.replace(source_path, target)
+        return
+    try:
+        os.link(source_path, target)
+    except OSError:
+        shutil.copy2(source_path, target)
+
+
+def _acquire(sha256, size):
+    updated = Blob.query.filter_by(sha256=sha256).update(
+        {Blob.ref_count: Blob.ref_count + 1}, synchronize_session=False
+    )
+    if not updated:
+        db.session.add(Blob(sha256=sha256, size=size, ref_count=1))
+        db.session.flush()
+
+
+def _release(attachment):
+    Blob.query.filter_by(sha256=attachment.blob_sha256).update(
+        {Blob.ref_count: Blob.ref_count - 1}, synchronize_session=False
+    )
+    db.session.delete(attachment)
+    return attachment.blob_sha256
+
+
+def _attach(sha256, size, kind, filename, original_name, user_id):
+    _acquire(sha256, size)
+    attachment = Attachment(
+        filename=filename,
+        kind=kind,
+        blob_sha256=sha256,
+        original_name=(original_name or '')[:255] or None,
+        created_by=user_id,
+    )
+    db.session.add(attachment)
+    return attachment
+
+
+def new_filename(original_name):
+    """Foydalanuvchiga beriladigan nom: uuid4().hex + asl kengaytma"""
+    ext = original_name.rsplit('.', 1)[1].lower() if '.' in original_name else ''
+    return f"{uuid.uuid4().hex}.{ext}" if ext else uuid.uuid4().hex
+
+
+def store_blocks(blocks, kind, original_name, user_id=None, expected_sha256=None):
+    """Baytlarni omborga yozish va hali egasiz Attachment yaratish. Commit chaqiruvchi tomonidan
+    qilinadi; fayl egasiga sync_*_attachment(s) orqali biriktiriladi."""
+    tmp_path, sha256, size = _write_temp(blocks)
+    if expected_sha256 and sha256 != expected_sha256.lower():
+        os.remove(tmp_path)
+        raise ValueError("Fayl xeshi mos kelmadi")
+    _place(tmp_path, sha256)
+    return _attach(sha256, size, kind, new_filename(original_name), original_name, user_id)
+
+
+def store_upload(file, kind, user_id=None):
+    """Formadan kelgan fayl (FileStorage) -> foydalanuvchiga beriladigan nom"""
+    return store_blocks(read_blocks(file.stream), kind, file.filename, user_id).filename
+
+
+def _store_existing(path, filename, kind):
+    """Eski papkadagi faylni o'z nomi bilan omborga qo'shish (asl fayl commit dan keyin o'chiriladi)"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        for block in read_blocks(f):
+            digest.update(block)
+            size += len(block)
+    sha256 = digest.hexdigest()
+    _place(path, sha256, keep_source=True)
+    return _attach(sha256, size, kind, filename, None, None)
+
+
+# ==================== EGALAR ====================
+def lesson_filenames(lesson):
+    """Darsga yuklangan fayllar: nom -> tur (tashqi URL lar hisobga olinmaydi)"""
+    names = {}
+    if lesson.video_file:
+        names[lesson.video_file] = 'video'
+    file_url = (lesson.file_url or '').strip()
+    if file_url.startswith('['):
+        try:
+            items = json.loads(file_url)
+        except ValueError:
+            items = []
+        for item in items:
+            if isinstance(item, dict) and item.get('filename'):
+                names[item['filename']] = 'lesson_file'
+    elif file_url and '://' not in file_url:
+        names[file_url] = 'lesson_file'
+    return names
+
+
+def _sync(owner_column, owner_id, wanted):
+    """Egasining Attachment larini wanted (nom -> tur) ga moslash; bo'shagan blob xeshlarini qaytaradi"""
+    released = set()
+    kept = set()
+    for attachment in Attachment.query.filter(owner_column == owner_id).all():
+        if attachment.filename in wanted and attachment.filename not in kept:
+            kept.add(attachment.filename)
+        else:
+            released.add(_release(attachment))
+
+    for filename, kind in wanted.items():
+        if filename in kept:
+            continue
+        # Avval shu nom bilan yuklangan, hali egasiz fayl
+        attachment = Attachment.query.filter_by(filename=filename, lesson_id=None, submission_id=None).first()
+        if attachment is not None:
+            setattr(attachment, owner_column.key, owner_id)
+            continue
+        # Nom boshqa egada bor (bir dars bir nechta guruh uchun) - o'sha blob ga yana bir ishora
+        sibling = Attachment.query.filter_by(filename=filename).first()
+        if sibling is not None:
+            attachment = _attach(sibling.blob_sha256, 0, sibling.kind, filename, sibling.original_name, sibling.created_by)
+            setattr(attachment, owner_column.key, owner_id)
+        # Aks holda - omborga o'tkazilmagan eski fayl
+    db.session.flush()
+    return released
+
+
+def sync_lesson_attachments(lesson):
+    """Dars saqlangandan keyin (lesson.id bo'lishi kerak). Commit chaqiruvchi tomonidan qilinadi."""
+    return _sync(Attachment.lesson_id, lesson.id, lesson_filenames(lesson))
+
+
+def release_lesson_attachments(lesson):
+    """Dars o'chirilishidan oldin"""
+    return _sync(Attachment.lesson_id, lesson.id, {})
+
+
+def sync_submission_attachment(submission):
+    wanted = {submission.file_url: 'submission'} if submission.file_url else {}
+    return _sync(Attachment.submission_id, submission.id, wanted)
+
+
+def purge_blobs(sha256s=None):
+    """Commit dan keyin: hech kim ishlatmayotgan blob larni (yozuvi va fayli) o'chirish.
+    sha256s=None - barcha ishlatilmayotganlarini."""
+    query = db.session.query(Blob.sha256).filter(Blob.ref_count <= 0)
+    if sha256s is not None:
+        sha256s = [sha256 for sha256 in sha256s if sha256]
+        if not sha256s:
+            return 0
+        query = query.filter(Blob.sha256.in_(sha256s))
+    orphaned = [sha256 for (sha256,) in query]
+    if not orphaned:
+        return 0
+    Blob.query.filter(Blob.sha256.in_(orphaned), Blob.ref_count <= 0).delete(synchronize_session=False)
+    db.session.commit()
+    # Shu orada qayta yuklangan bo'lsa, yozuv yana paydo bo'ladi - faylni qoldiramiz
+    revived = {sha256 for (sha256,) in db.session.query(Blob.sha256).filter(Blob.sha256.in_(orphaned))}
+    removed = 0
+    for sha256 in orphaned:
+        path = blob_path(sha256)
+        if sha256 not in revived and os.path.exists(path):
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+# ==================== UZATISH VA RUXSAT ====================
+def stored_location(filename, kind):
+    """Fayl baytlari joylashgan (papka, nom): omborda bo'lsa blob, aks holda eski papka"""
+    sha256 = db.session.query(Attachment.blob_sha256).filter_by(filename=filename).limit(1).scalar()
+    if sha256:
+        return os.path.dirname(blob_path(sha256)), sha256
+    return legacy_folder(kind), filename
+
+
+def stored_path(filename, kind):
+    folder, name = stored_location(os.path.basename(filename), kind)
+    return os.path.join(folder, name)
+
+
+def lesson_for_file(filename):
+    """Fayl tegishli dars (indeks orqali); omborga o'tkazilmagan fayllar uchun file_url bo'yicha qidiruv"""
+    lesson = Lesson.query.join(Attachment, Attachment.lesson_id == Lesson.id).filter(
+        Attachment.filename == filename
+    ).first()
+    if lesson is None:
+        lesson = Lesson.query.filter(
+            (Lesson.file_url == filename) |
+            (Lesson.file_url.like(f'%"{filename}"%'))
+        ).first()
+    return lesson
+
+
+def submission_for_file(filename):
+    """Fayl tegishli javob (indeks orqali; eski fayllar uchun file_url bo'yicha)"""
+    submission = Submission.query.join(Attachment, Attachment.submission_id == Submission.id).filter(
+        Attachment.filename == filename
+    ).first()
+    if submission is None:
+        submission = Submission.query.filter_by(file_url=filename).first()
+    return submission
+
+
+# ==================== XIZMAT ====================
+def import_legacy_uploads():
+    """Eski papkalardagi dars va javob fayllarini omborga ko'chirish (qayta ishga tushirish xavfsiz)"""
+    imported = 0
+    owners = [(lesson_id, Lesson) for (lesson_id,) in db.session.query(Lesson.id).filter(
+        (Lesson.video_file.isnot(None)) | (Lesson.file_url.isnot(None))
+    )]
+    owners += [(submission_id, Submission) for (submission_id,) in db.session.query(Submission.id).filter(
+        Submission.file_url.isnot(None)
+    )]
+    for owner_id, model in owners:
+        owner = db.session.get(model, owner_id)
+        if model is Lesson:
+            names = lesson_filenames(owner)
+        else:
+            names = {owner.file_url: 'submission'}
+        moved = []
+        for filename, kind in names.items():
+            if os.path.basename(filename) != filename:
+                continue
+            path = os.path.join(legacy_folder(kind), filename)
+            if os.path.isfile(path) and Attachment.query.filter_by(filename=filename).first() is None:
+                _store_existing(path, filename, kind)
+                moved.append(path)
+        if model is Lesson:
+            sync_lesson_attachments(owner)
+        else:
+            sync_submission_attachment(owner)
+        db.session.commit()
+        for path in moved:
+            os.remove(path)
+        imported += len(moved)
+    return imported
+
+
+def cleanup_blobs():
+    """Egasiz qolgan Attachment lar (formaga biriktirilmagan yuklashlar, o'chirilgan dars/javoblar),
+    ishlatilmayotgan blob lar va yozuvsiz qolgan fayllarni o'chirish"""
+    limit = datetime.utcnow() - timedelta(hours=current_app.config.get('UPLOAD_STALE_HOURS', 48))
+    orphans = Attachment.query.outerjoin(
+        Lesson, Attachment.lesson_id == Lesson.id
+    ).outerjoin(
+        Submission, Attachment.submission_id == Submission.id
+    ).filter(
+        Lesson.id.is_(None), Submission.id.is_(None), Attachment.created_at < limit
+    ).all()
+    for attachment in orphans:
+        _release(attachment)
+    db.session.commit()
+    removed = purge_blobs()
+
+    # Commit bo'lmay qolgan yuklashlardan qolgan fayllar
+    root = _blobs_root()
+    if not os.path.isdir(root):
+        return removed
+    cutoff = time.time() - (datetime.utcnow() - limit).total_seconds()
+    for dirpath, _, filenames in os.walk(root):
+        old = [name for name in filenames if os.path.getmtime(os.path.join(dirpath, name)) < cutoff]
+        if not old:
+            continue
+        if os.path.basename(dirpath) == 'tmp':
+            stray = old
+        else:
+            known = {sha256 for (sha256,) in db.session.query(Blob.sha256).filter(Blob.sha256.in_(old))}
+            stray = [name for name in old if name not in known]
+        for name in stray:
+            os.remove(os.path.join(dirpath, name))
+            removed += 1
+    return removed
@@ -0,0 +1,200 @@
+"""Dars videolari va fayllarini qismlarga bo'lib, uzilishdan keyin davom ettirib yuklash.
+
+Oqim: initiate -> qismlar (PUT, har biri SHA-256 bilan tekshiriladi) -> finalize. Har bir qism
+diskka oqim bilan yoziladi (xotira qism hajmiga bog'liq emas), `<index>.part` nomi bilan faqat
+to'liq va to'g'ri qabul qilingandan keyin saqlanadi. Qabul qilingan qismlar ro'yxati diskdan
+o'qiladi, shuning uchun qismlar uchun bazaga yozilmaydi va uzilgan yuklash qolgan qismlardan
+davom etadi. finalize qismlarni fayllar omboriga (blob_store) yig'adi va uuid nom beradi;
+dars formasi faylning o'zini emas, shu yuklash ID sini yuboradi.
+"""
+import hashlib
+import os
+import shutil
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app import db
+from app.models import ChunkedUpload
+from app.utils.blob_store import read_blocks, store_blocks
+
+# Oqim bilan o'qish/yozish bloki
+COPY_BUFFER_SIZE = 64 * 1024
+
+LESSON_FILE_EXTENSIONS = {'pdf', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx', 'txt', 'zip', 'rar'}
+
+# Yuklash turlari (omborda Attachment.kind)
+UPLOAD_KINDS = ('video', 'lesson_file')
+
+
+class UploadError(ValueError):
+    """Yuklash so'rovi noto'g'ri (foydalanuvchiga ko'rsatiladigan xabar bilan)"""
+
+
+def allowed_extensions(kind):
+    if kind == 'video':
+        return current_app.config['ALLOWED_VIDEO_EXTENSIONS']
+    return LESSON_FILE_EXTENSIONS
+
+
+def _extension(filename):
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
+
+def _chunks_folder(upload_id):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], 'chunks', upload_id)
+
+
+def _chunk_path(upload_id, index):
+    return os.path.join(_chunks_folder(upload_id), f'{index}.part')
+
+
+def initiate_upload(user_id, kind, filename, total_size, sha256=None):
+    """Yangi yuklashni boshlash"""
+    if kind not in UPLOAD_KINDS:
+        raise UploadError("Noma'lum yuklash turi")
+    filename = (filename or '').strip()
+    if _extension(filename) not in allowed_extensions(kind):
+        raise UploadError(f"Ruxsat berilmagan fayl formati: {filename}")
+    try:
+        total_size = int(total_size)
+    except (TypeError, ValueError):
+        raise UploadError("Fayl hajmi noto'g'ri")
+    max_size = current_app.config['MAX_UPLOAD_SIZE']
+    if total_size <= 0 or total_size > max_size:
+        raise UploadError(f"Fayl hajmi {max_size // (1024 * 1024)} MB dan oshmasligi kerak")
+
+    upload = ChunkedUpload(
+        id=uuid.uuid4().hex,
+        kind=kind,
+        original_name=filename[:255],
+        total_size=total_size,
+        chunk_size=current_app.config['UPLOAD_CHUNK_SIZE'],
+        sha256=(sha256 or '').lower() or None,
+        created_by=user_id,
+    )
+    os.makedirs(_chunks_folder(upload.id), exist_ok=True)
+    db.session.add(upload)
+    db.session.commit()
+    return upload
+
+
+def get_upload(upload_id, user_id):
+    """Foydalanuvchining yuklashi (boshqa foydalanuvchiniki bo'lsa None)"""
+    upload = db.session.get(ChunkedUpload, upload_id) if upload_id else None
+    if upload is None or upload.created_by != user_id:
+        return None
+    return upload
+
+
+def received_chunks(upload):
+    """Diskda to'liq saqlangan qismlar raqamlari"""
+    folder = _chunks_folder(upload.id)
+    if not os.path.isdir(folder):
+        return []
+    indexes = []
+    for name in os.listdir(folder):
+        stem, _, ext = name.partition('.')
+        if ext == 'part' and stem.isdigit():
+            indexes.append(int(stem))
+    return sorted(indexes)
+
+
+def upload_state(upload):
+    """Mijoz uchun holat (davom ettirishda qaysi qismlar yetishmasligini bilish uchun)"""
+    return {
+        'upload_id': upload.id,
+        'status': upload.status,
+        'chunk_size': upload.chunk_size,
+        'total_chunks': upload.total_chunks,
+        'received': received_chunks(upload) if upload.status == 'uploading' else list(range(upload.total_chunks)),
+    }
+
+
+def save_chunk(upload, index, stream, checksum):
+    """Qismni oqim bilan diskka yozish va SHA-256 ni tekshirish"""
+    if upload.status != 'uploading':
+        raise UploadError("Yuklash allaqachon yakunlangan")
+    if index < 0 or index >= upload.total_chunks:
+        raise UploadError("Qism raqami noto'g'ri")
+    if not checksum:
+        raise UploadError("Qism xeshi (X-Chunk-Sha256) ko'rsatilmagan")
+
+    expected_size = upload.expected_chunk_size(index)
+    folder = _chunks_folder(upload.id)
+    os.makedirs(folder, exist_ok=True)
+    tmp_path = os.path.join(folder, f'{index}.{uuid.uuid4().hex}.tmp')
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, 'wb') as f:
+            while True:
+                block = stream.read(COPY_BUFFER_SIZE)
+                if not block:
+                    break
+                size += len(block)
+                if size > expected_size:
+                    raise UploadError("Qism hajmi kutilganidan katta")
+                digest.update(block)
+                f.write(block)
+        if size != expected_size:
+            raise UploadError(f"Qism to'liq kelmadi ({size} / {expected_size} bayt)")
+        if digest.hexdigest() != checksum.strip().lower():
+            raise UploadError("Qism xeshi mos kelmadi")
+        # Qism faqat to'liq tekshirilgandan keyin ko'rinadi (takroriy yuborish xavfsiz)
+        os.replace(tmp_path, _chunk_path(upload.id, index))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return received_chunks(upload)
+
+
+def finalize_upload(upload):
+    """Barcha qismlarni bitta faylga yig'ish. Takroriy chaqiruv tayyor natijani qaytaradi."""
+    if upload.status != 'uploading':
+        return upload
+    missing = sorted(set(range(upload.total_chunks)) - set(received_chunks(upload)))
+    if missing:
+        raise UploadError(f"Yetishmayotgan qismlar: {', '.join(map(str, missing[:20]))}")
+
+    def blocks():
+        for index in range(upload.total_chunks):
+            with open(_chunk_path(upload.id, index), 'rb') as part:
+                yield from read_blocks(part)
+
+    try:
+        attachment = store_blocks(blocks(), upload.kind, upload.original_name, upload.created_by, upload.sha256)
+    except ValueError:
+        raise UploadError("Fayl xeshi mos kelmadi, qayta yuklang")
+
+    upload.stored_name = attachment.filename
+    upload.sha256 = attachment.blob_sha256
+    upload.status = 'complete'
+    upload.completed_at = datetime.utcnow()
+    db.session.commit()
+    shutil.rmtree(_chunks_folder(upload.id), ignore_errors=True)
+    return upload
+
+
+def claim_upload(upload_id, user_id, kind):
+    """Dars formasi uchun: yakunlangan yuklashni olish va ishlatilgan deb belgilash.
+    Har bir fayl bitta darsga biriktiriladi (aks holda darsni tahrirlashda eski faylni o'chirish
+    boshqa darsning faylini ham o'chiradi). Topilmasa None. Commit dars bilan birga qilinadi."""
+    upload = get_upload(upload_id, user_id)
+    if upload is None or upload.kind != kind or upload.status != 'complete':
+        return None
+    upload.status = 'used'
+    return upload
+
+
+def cleanup_stale_uploads():
+    """Eski yuklash yozuvlarini va yakunlanmaganlar qismlarini o'chirish.
+    Ishlatilmagan tayyor fayllar egasiz Attachment sifatida blob_store.cleanup_blobs() da o'chiriladi."""
+    limit = datetime.utcnow() - timedelta(hours=current_app.config.get('UPLOAD_STALE_HOURS', 48))
+    stale = ChunkedUpload.query.filter(ChunkedUpload.created_at < limit).all()
+    for upload in stale:
+        shutil.rmtree(_chunks_folder(upload.id), ignore_errors=True)
+        db.session.delete(upload)
+    db.session.commit()
+    return len(stale)
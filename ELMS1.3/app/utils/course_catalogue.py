@@ -0,0 +1,356 @@
+"""Fanlar katalogi (courses.index): o'qituvchi va talaba uchun fan kartalari.
+
+O'qituvchi biriktirishlari TeacherSubject → Group → Direction → Subject → DirectionCurriculum
+bitta so'rovda olinadi, dars va topshiriqlar soni GROUP BY bilan qo'shiladi. Keshda faqat
+id va sonlar saqlanadi (foydalanuvchi va semestr bo'yicha); Subject/Direction/Group/User
+obyektlari har so'rovda id ro'yxati bo'yicha bir nechta IN so'rov bilan yuklanadi.
+"""
+import threading
+import time
+
+from app import db
+from app.models import (
+    Assignment, Direction, DirectionCurriculum, Group, Lesson, Subject, TeacherSubject, User
+)
+
+# Boshqa gunicorn worker'larida qilingan o'zgarishlar shu vaqtdan keyin ko'rinadi (soniya)
+CACHE_TTL = 60
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+# (kalit, kartadagi nomi, o'quv reja ustuni)
+CURRICULUM_LESSON_TYPES = [
+    ('maruza', 'Maruza', 'hours_maruza'),
+    ('amaliyot', 'Amaliyot', 'hours_amaliyot'),
+    ('laboratoriya', 'Laboratoriya', 'hours_laboratoriya'),
+    ('seminar', 'Seminar', 'hours_seminar'),
+    ('kurs_ishi', 'Kurs ishi', 'hours_kurs_ishi'),
+]
+
+
+# Bir fan uchun bir nechta o'quv reja qatori bo'lsa "birinchisi" - unique indeks tartibida
+# (semestr, qabul yili, ta'lim shakli), ya'ni oldingi .first() so'rovlari qaytargan qator
+CURRICULUM_ORDER = (
+    DirectionCurriculum.semester, DirectionCurriculum.enrollment_year,
+    DirectionCurriculum.education_type, DirectionCurriculum.id
+)
+
+
+def curriculum_lesson_types(item):
+    """O'quv reja qatoridagi dars turlari va soatlari (kartadagi ro'yxat)"""
+    lessons = []
+    if item is None:
+        return lessons
+    for code, name, field in CURRICULUM_LESSON_TYPES:
+        hours = getattr(item, field)
+        if hours and hours > 0:
+            # Kurs ishi uchun soat ko'rsatilmaydi
+            lessons.append({'type': name, 'hours': 0 if code == 'kurs_ishi' else hours})
+    return lessons
+
+
+def available_lesson_types(item):
+    """O'quv rejada soati bor dars turlari kalitlari"""
+    if item is None:
+        return set()
+    return {code for code, _, field in CURRICULUM_LESSON_TYPES if (getattr(item, field) or 0) > 0}
+
+
+def curriculum_credits(item, subject_credits):
+    """Kredit = (maruza + amaliyot + laboratoriya + seminar + mustaqil) soatlari / 30.
+    Kurs ishi kreditga kiritilmaydi; soatlar bo'lmasa fanning o'z krediti."""
+    total_hours = (item.hours_maruza or 0) + (item.hours_amaliyot or 0) + \
+                  (item.hours_laboratoriya or 0) + (item.hours_seminar or 0) + \
+                  (item.hours_mustaqil or 0)
+    return total_hours / 30 if total_hours > 0 else subject_credits
+
+
+def _cached(key, build):
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry and now - entry[0] < CACHE_TTL:
+            return entry[1]
+    value = build()
+    with _cache_lock:
+        _cache[key] = (now, value)
+    return value
+
+
+def invalidate_course_catalogue():
+    """Dars, topshiriq, biriktirish yoki o'quv reja o'zgarganda katalog keshini tozalash"""
+    with _cache_lock:
+        _cache.clear()
+
+
+def _lesson_counts(subject_ids, direction_ids):
+    """{(fan, yo'nalish): {dars turi: soni}} - bitta GROUP BY"""
+    counts = {}
+    if not subject_ids or not direction_ids:
+        return counts
+    rows = db.session.query(
+        Lesson.subject_id, Lesson.direction_id, Lesson.lesson_type, db.func.count(Lesson.id)
+    ).filter(
+        Lesson.subject_id.in_(subject_ids), Lesson.direction_id.in_(direction_ids)
+    ).group_by(Lesson.subject_id, Lesson.direction_id, Lesson.lesson_type)
+    for subject_id, direction_id, lesson_type, count in rows:
+        counts.setdefault((subject_id, direction_id), {})[lesson_type] = count
+    return counts
+
+
+def _assignment_counts(subject_ids, direction_ids):
+    """{(fan, yo'nalish): topshiriqlar soni} - bitta GROUP BY"""
+    if not subject_ids or not direction_ids:
+        return {}
+    rows = db.session.query(
+        Assignment.subject_id, Assignment.direction_id, db.func.count(Assignment.id)
+    ).filter(
+        Assignment.subject_id.in_(subject_ids), Assignment.direction_id.in_(direction_ids)
+    ).group_by(Assignment.subject_id, Assignment.direction_id)
+    return {(subject_id, direction_id): count for subject_id, direction_id, count in rows}
+
+
+def _first_curriculum(direction_ids, subject_ids):
+    """{(yo'nalish, fan): birinchi o'quv reja qatori} (semestrdan qat'i nazar, CURRICULUM_ORDER bo'yicha)"""
+    first = {}
+    if not direction_ids or not subject_ids:
+        return first
+    rows = DirectionCurriculum.query.filter(
+        DirectionCurriculum.direction_id.in_(direction_ids),
+        DirectionCurriculum.subject_id.in_(subject_ids)
+    ).order_by(*CURRICULUM_ORDER)
+    for item in rows:
+        first.setdefault((item.direction_id, item.subject_id), item)
+    return first
+
+
+def _direction_headings(direction_ids):
+    """Direction.formatted_direction qiymatlari: yo'nalishning birinchi guruhi bo'yicha, bitta so'rovda"""
+    first_groups = {}
+    if direction_ids:
+        rows = db.session.query(Group.direction_id, Group.enrollment_year, Group.education_type).filter(
+            Group.direction_id.in_(direction_ids)
+        ).order_by(Group.id)
+        for direction_id, year, edu_type in rows:
+            first_groups.setdefault(direction_id, (year, edu_type))
+    headings = {}
+    for direction_id, code, name in db.session.query(Direction.id, Direction.code, Direction.name).filter(
+            Direction.id.in_(direction_ids)):
+        year, edu_type = first_groups.get(direction_id, (None, None))
+        if year and edu_type:
+            headings[direction_id] = f"{year} - {code} - {name} ({edu_type.capitalize()})"
+        else:
+            headings[direction_id] = f"____ - {code} - {name}"
+    return headings
+
+
+def _by_id(model, ids):
+    ids = set(ids)
+    return {obj.id: obj for obj in model.query.filter(model.id.in_(ids))} if ids else {}
+
+
+# ==================== O'QITUVCHI ====================
+def _build_teacher_catalogue(teacher_id, check_teacher_id, is_admin):
+    # Biriktirishlar va o'quv reja qatorlari bitta so'rovda (reja bo'lmasa ham biriktirish qoladi)
+    rows = db.session.query(TeacherSubject, Group, Subject.credits, DirectionCurriculum).join(
+        Group, Group.id == TeacherSubject.group_id
+    ).join(
+        Direction, Direction.id == Group.direction_id
+    ).join(
+        Subject, Subject.id == TeacherSubject.subject_id
+    ).outerjoin(
+        DirectionCurriculum,
+        (DirectionCurriculum.direction_id == Group.direction_id) &
+        (DirectionCurriculum.subject_id == TeacherSubject.subject_id)
+    ).filter(
+        TeacherSubject.teacher_id == teacher_id
+    ).order_by(TeacherSubject.id, *CURRICULUM_ORDER).all()
+
+    group_ids = {group.id for _, group, _, _ in rows}
+    students_counts = Group.students_count_map(group_ids)
+
+    # Har bir (fan, yo'nalish) uchun o'qituvchining barcha dars turlari (o'quv reja tekshiruvi uchun)
+    teacher_types = {}
+    first_curriculum = {}
+    for ts, group, _, item in rows:
+        teacher_types.setdefault((ts.subject_id, group.direction_id), set()).add(ts.lesson_type)
+        if item is not None:
+            first_curriculum.setdefault((group.direction_id, ts.subject_id), item)
+
+    entries = {}
+    valid_subject_ids = set()
+    seen_ts = set()
+    for ts, group, subject_credits, item in rows:
+        # Joriy semestrdagi birinchi o'quv reja qatori (biriktirish bo'yicha bittadan)
+        if ts.id in seen_ts:
+            continue
+        current_semester = group.semester if group.semester else 1
+        if item is None or item.semester != current_semester:
+            continue
+        seen_ts.add(ts.id)
+
+        if students_counts.get(group.id, 0) > 0:
+            valid_subject_ids.add(ts.subject_id)
+        key = (ts.subject_id, group.direction_id)
+        if key not in entries:
+            entries[key] = {
+                'subject_id': ts.subject_id,
+                'direction_id': group.direction_id,
+                'group_ids': [],
+                'semester': item.semester,
+                'credits': curriculum_credits(item, subject_credits),
+            }
+        if group.id not in entries[key]['group_ids']:
+            entries[key]['group_ids'].append(group.id)
+
+    subject_ids = {key[0] for key in entries}
+    direction_ids = {key[1] for key in entries}
+    lesson_counts = _lesson_counts(subject_ids, direction_ids)
+    assignment_counts = _assignment_counts(subject_ids, direction_ids)
+    for key, entry in entries.items():
+        type_counts = lesson_counts.get(key, {})
+        entry['lessons_count'] = sum(type_counts.values())
+        entry['assignments_count'] = assignment_counts.get(key, 0)
+        # Subject.check_curriculum_completion bilan bir xil natija, lekin oldindan yuklangan sonlardan
+        tl_types = None
+        if check_teacher_id and not is_admin:
+            tl_types = Subject.normalize_teacher_lesson_types(teacher_types.get(key, ()))
+        entry['curriculum_check'] = Subject.curriculum_check_result(
+            first_curriculum[(key[1], key[0])], type_counts, entry['lessons_count'],
+            entry['assignments_count'], tl_types, is_admin
+        )
+
+    return {
+        'entries': list(entries.values()),
+        'valid_subject_ids': valid_subject_ids,
+        'headings': _direction_headings(direction_ids),
+    }
+
+
+def teacher_catalogue(teacher_id, check_teacher_id=None, is_admin=False):
+    """O'qituvchi fan kartalari: [{subject, direction, direction_heading, groups, semester, credits,
+    lessons_count, assignments_count, curriculum_check}, ...] va talabasi bor guruhlardagi fanlar id'lari"""
+    data = _cached(('teacher', teacher_id, check_teacher_id, is_admin),
+                   lambda: _build_teacher_catalogue(teacher_id, check_teacher_id, is_admin))
+
+    entries = data['entries']
+    subjects = _by_id(Subject, (e['subject_id'] for e in entries))
+    directions = _by_id(Direction, (e['direction_id'] for e in entries))
+    groups = _by_id(Group, (gid for e in entries for gid in e['group_ids']))
+
+    result = []
+    for entry in entries:
+        subject = subjects.get(entry['subject_id'])
+        direction = directions.get(entry['direction_id'])
+        if not subject or not direction:
+            continue
+        result.append({
+            'subject': subject,
+            'direction': direction,
+            'direction_heading': data['headings'].get(direction.id),
+            'groups': [groups[gid] for gid in entry['group_ids'] if gid in groups],
+            'semester': entry['semester'],
+            'credits': entry['credits'],
+            'lessons_count': entry['lessons_count'],
+            'assignments_count': entry['assignments_count'],
+            'curriculum_check': entry['curriculum_check'],
+        })
+    return result, data['valid_subject_ids']
+
+
+# ==================== TALABA ====================
+def _build_student_catalogue(group_id, direction_id, semester):
+    rows = db.session.query(DirectionCurriculum, Subject.credits).join(
+        Subject, Subject.id == DirectionCurriculum.subject_id
+    ).filter(
+        DirectionCurriculum.direction_id == direction_id,
+        DirectionCurriculum.semester == semester
+    ).order_by(Subject.name).all()
+
+    subject_ids = {item.subject_id for item, _ in rows}
+    lesson_counts = _lesson_counts(subject_ids, [direction_id])
+    assignment_counts = _assignment_counts(subject_ids, [direction_id])
+    first_curriculum = _first_curriculum([direction_id], subject_ids)
+
+    # Fanlarga biriktirilgan o'qituvchilar (takrorlanmasligi uchun)
+    teacher_ids = {}
+    if subject_ids:
+        for subject_id, teacher_id in db.session.query(TeacherSubject.subject_id, TeacherSubject.teacher_id).filter(
+                TeacherSubject.subject_id.in_(subject_ids),
+                TeacherSubject.group_id == group_id
+        ).order_by(TeacherSubject.id):
+            ids = teacher_ids.setdefault(subject_id, [])
+            if teacher_id and teacher_id not in ids:
+                ids.append(teacher_id)
+
+    entries = []
+    seen = set()
+    for item, subject_credits in rows:
+        if (item.semester, item.subject_id) in seen:
+            continue
+        seen.add((item.semester, item.subject_id))
+        key = (item.subject_id, direction_id)
+        first = first_curriculum.get((direction_id, item.subject_id))
+        entries.append({
+            'subject_id': item.subject_id,
+            'semester': item.semester,
+            'course_year': ((item.semester - 1) // 2) + 1,
+            'credits': curriculum_credits(item, subject_credits if subject_credits else 0),
+            'lessons_count': sum(lesson_counts.get(key, {}).values()),
+            'assignments_count': assignment_counts.get(key, 0),
+            'teacher_ids': teacher_ids.get(item.subject_id, []),
+            'lesson_types': curriculum_lesson_types(first),
+            'available_types': sorted(available_lesson_types(first)),
+        })
+    return {'entries': entries}
+
+
+def student_catalogue(student_id, group, semester):
+    """Talaba guruhining semestr fanlari: [{subject, semester, course_year, credits, lessons_count,
+    assignments_count, teachers, direction, lesson_types, available_types}, ...] (fan nomi bo'yicha)"""
+    data = _cached(('student', student_id, group.id, group.direction_id, semester),
+                   lambda: _build_student_catalogue(group.id, group.direction_id, semester))
+
+    entries = data['entries']
+    subjects = _by_id(Subject, (e['subject_id'] for e in entries))
+    teachers = _by_id(User, (tid for e in entries for tid in e['teacher_ids']))
+    direction = db.session.get(Direction, group.direction_id) if group.direction_id else None
+
+    result = []
+    for entry in entries:
+        subject = subjects.get(entry['subject_id'])
+        if not subject:
+            continue
+        result.append({
+            'subject': subject,
+            'semester': entry['semester'],
+            'course_year': entry['course_year'],
+            'credits': entry['credits'],
+            'lessons_count': entry['lessons_count'],
+            'assignments_count': entry['assignments_count'],
+            'teachers': [teachers[tid] for tid in entry['teacher_ids'] if tid in teachers],
+            'direction': direction,
+            'lesson_types': entry['lesson_types'],
+            'available_types': set(entry['available_types']),
+        })
+    return result
+
+
+def subject_curriculum_types(direction_id, subjects, cards=()):
+    """{fan_id: (dars turlari ro'yxati, mavjud dars turlari)} yo'nalish o'quv rejasi bo'yicha.
+    Katalog kartalarida bor fanlar keshdan olinadi, qolganlari uchun bitta so'rov."""
+    from_cards = {card['subject'].id: card for card in cards}
+    result = {}
+    missing = []
+    for subject in subjects:
+        card = from_cards.get(subject.id)
+        if card is not None:
+            result[subject.id] = (card['lesson_types'], card['available_types'])
+        else:
+            missing.append(subject.id)
+    first = _first_curriculum([direction_id], missing)
+    for subject_id in missing:
+        item = first.get((direction_id, subject_id))
+        result[subject_id] = (curriculum_lesson_types(item), available_lesson_types(item))
+    return result
@@ -1,40 +1,111 @@
+from copy import copy
 from datetime import datetime
 from flask import Response
 import io
 
 
-def create_students_excel(students, faculty_name=None):
-    """Talabalar ro'yxatini Excel formatida yaratish (yangi tartib)"""
+# ==================== OQIMLI (WRITE-ONLY) YOZISH ====================
+# Katta ro'yxatlar (talabalar, xodimlar, dars jadvali) openpyxl write_only rejimida yoziladi:
+# qatorlar vaqtinchalik faylga ketma-ket tushadi va xotirada butun varaq saqlanmaydi.
+# Har bir katakka alohida Font/Border yaratish o'rniga umumiy nomlangan stillar ishlatiladi.
+
+def _streaming_workbook(title_size=16):
+    """write_only Workbook va unga qo'shilgan nomlangan stillar"""
     try:
         from openpyxl import Workbook
-        from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-        from openpyxl.utils import get_column_letter
+        from openpyxl.styles import Font, Alignment, PatternFill, Border, Side, NamedStyle
+        from openpyxl.styles.fonts import DEFAULT_FONT
     except ImportError:
         raise ImportError("openpyxl kutubxonasi o'rnatilmagan. Iltimos, 'pip install openpyxl' buyrug'ini bajaring.")
     
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Talabalar"
+    wb = Workbook(write_only=True)
+    thin = Side(style='thin')
+    border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    styles = [
+        NamedStyle(name='export_title', font=Font(size=title_size, bold=True, color="FFFFFF"),
+                   alignment=Alignment(horizontal='center', vertical='center'),
+                   fill=PatternFill(start_color="366092", end_color="366092", fill_type="solid")),
+        NamedStyle(name='export_date', font=Font(size=10, italic=True), alignment=Alignment(horizontal='center')),
+        NamedStyle(name='export_empty', font=Font(size=12, italic=True, color="666666"),
+                   alignment=Alignment(horizontal='center', vertical='center')),
+        NamedStyle(name='export_header', font=Font(bold=True, color="FFFFFF"),
+                   alignment=Alignment(horizontal='center', vertical='center'),
+                   fill=PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid"), border=border),
+        NamedStyle(name='export_cell', font=copy(DEFAULT_FONT),
+                   alignment=Alignment(horizontal='left', vertical='center'), border=border),
+        NamedStyle(name='export_cell_alt', font=copy(DEFAULT_FONT),
+                   alignment=Alignment(horizontal='left', vertical='center'), border=border,
+                   fill=PatternFill(start_color="F2F2F2", end_color="F2F2F2", fill_type="solid")),
+    ]
+    for style in styles:
+        wb.add_named_style(style)
+    return wb
+
+
+def _styled_row(ws, values, style):
+    from openpyxl.cell import WriteOnlyCell
+    cells = []
+    for value in values:
+        cell = WriteOnlyCell(ws, value=value)
+        cell.style = style
+        cells.append(cell)
+    return cells
+
+
+def _start_sheet(wb, sheet_title, title, headers, column_widths, merge_to):
+    """Varaq: sarlavha (1-qator), yaratilgan sana (2-qator), ustun sarlavhalari (3-qator)"""
+    from openpyxl.utils import get_column_letter
+    
+    ws = wb.create_sheet(title=sheet_title)
+    # write_only rejimida ustun kengliklari va birlashtirishlar qatorlardan oldin beriladi
+    for col_num, width in enumerate(column_widths, 1):
+        ws.column_dimensions[get_column_letter(col_num)].width = width
+    ws.merged_cells.add(f'A1:{merge_to}1')
+    ws.merged_cells.add(f'A2:{merge_to}2')
+    ws.append(_styled_row(ws, [title], 'export_title'))
+    ws.append(_styled_row(ws, [f"Yaratilgan: {datetime.now().strftime('%d.%m.%Y %H:%M')}"], 'export_date'))
+    if headers:
+        ws.append(_styled_row(ws, headers, 'export_header'))
+    return ws
+
+
+def _append_data_row(ws, row_num, values):
+    # Juft qatorlar kulrang fonda (avvalgi eksportlar bilan bir xil)
+    ws.append(_styled_row(ws, values, 'export_cell_alt' if row_num % 2 == 0 else 'export_cell'))
+
+
+def _save_workbook(wb, output=None):
+    """output: fayl yo'li yoki fayl obyekti; berilmasa BytesIO qaytariladi"""
+    if output is None:
+        output = io.BytesIO()
+        wb.save(output)
+        output.seek(0)
+        return output
+    wb.save(output)
+    return output
+
+
+def _format_birth_date(birth_date):
+    if not birth_date:
+        return ''
+    if isinstance(birth_date, str):
+        return birth_date
+    return birth_date.strftime('%Y-%m-%d')
+
+
+def create_students_excel(students, faculty_name=None, output=None):
+    """Talabalar ro'yxatini Excel formatida yaratish (yangi tartib).
+    
+    students istalgan iterable bo'lishi mumkin (masalan, yield_per bilan so'rov) - qatorlar
+    oqim bilan yoziladi. output berilsa (fayl yo'li yoki fayl obyekti) fayl shu yerga yoziladi.
+    """
+    wb = _streaming_workbook()
     
     # Sarlavha
     title = f"Talabalar ro'yxati"
     if faculty_name:
         title += f" - {faculty_name}"
     
-    # A–P (16 ustun)
-    ws.merge_cells('A1:P1')
-    title_cell = ws['A1']
-    title_cell.value = title
-    title_cell.font = Font(size=16, bold=True, color="FFFFFF")
-    title_cell.alignment = Alignment(horizontal='center', vertical='center')
-    title_cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    
-    # Sana
-    ws['A2'] = f"Yaratilgan: {datetime.now().strftime('%d.%m.%Y %H:%M')}"
-    ws.merge_cells('A2:P2')
-    ws['A2'].font = Font(size=10, italic=True)
-    ws['A2'].alignment = Alignment(horizontal='center')
-    
     # Jadval sarlavhalari (A ustunidan boshlanadi)
     headers = [
         "Talaba ID",           # A
@@ -54,178 +125,60 @@ def create_students_excel(students, faculty_name=None):
         "Mutaxassislik nomi",  # O
         "Guruh"                # P
     ]
+    column_widths = [15, 30, 20, 18, 18, 16, 25, 40, 20, 12, 12, 15, 12, 20, 30, 15]
+    # A–P (16 ustun)
+    ws = _start_sheet(wb, "Talabalar", title, headers, column_widths, 'P')
     header_row = 3
     
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=header_row, column=col_num)
-        cell.value = header
-        cell.font = Font(bold=True, color="FFFFFF")
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-        cell.fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-        cell.border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
-    
     # Ma'lumotlar
     for row_num, student in enumerate(students, start=header_row + 1):
-        # Talaba ID
-        ws.cell(row=row_num, column=1, value=student.student_id or '')
-        # To'liq ism (katta harflarda)
-        ws.cell(row=row_num, column=2, value=student.full_name.upper() if student.full_name else '')
-        # Pasport seriya raqami
-        passport = getattr(student, 'passport_number', None)
-        ws.cell(row=row_num, column=3, value=passport or '')
-        # JSHSHIR
-        pinfl = getattr(student, 'pinfl', None)
-        ws.cell(row=row_num, column=4, value=pinfl or '')
-        # Tug'ilgan sana (YYYY-MM-DD formatida)
-        birth_date = getattr(student, 'birth_date', None)
-        if birth_date:
-            if isinstance(birth_date, str):
-                ws.cell(row=row_num, column=5, value=birth_date)
-            else:
-                ws.cell(row=row_num, column=5, value=birth_date.strftime('%Y-%m-%d'))
-        else:
-            ws.cell(row=row_num, column=5, value='')
-        # Telefon
-        ws.cell(row=row_num, column=6, value=student.phone or '')
-        # Email
-        ws.cell(row=row_num, column=7, value=student.email or '')
-        # Tavsif
-        ws.cell(row=row_num, column=8, value=getattr(student, 'description', None) or '')
+        values = [
+            student.student_id or '',
+            # To'liq ism (katta harflarda)
+            student.full_name.upper() if student.full_name else '',
+            getattr(student, 'passport_number', None) or '',
+            getattr(student, 'pinfl', None) or '',
+            # Tug'ilgan sana (YYYY-MM-DD formatida)
+            _format_birth_date(getattr(student, 'birth_date', None)),
+            student.phone or '',
+            student.email or '',
+            getattr(student, 'description', None) or '',
+        ]
         
         # Fakultet, Kurs, Semestr, Ta'lim shakli, Guruh - guruhdan olinadi
-        if getattr(student, 'group', None) and student.group:
-            # Fakultet
-            faculty_name_val = student.group.faculty.name if student.group.faculty else ''
-            ws.cell(row=row_num, column=9, value=faculty_name_val)
-            # Kurs (1-kurs formatida)
-            course_year = student.group.course_year
-            ws.cell(row=row_num, column=10, value=f"{course_year}-kurs" if course_year else '')
+        group = getattr(student, 'group', None)
+        if group:
             # Semestr (talabadan yoki guruhdan) - "1-semestr" formatida
-            semester = getattr(student, 'semester', None)
-            if not semester and student.group:
-                semester = student.group.semester
-            semester_display = f"{semester}-semestr" if semester else ''
-            ws.cell(row=row_num, column=11, value=semester_display)
-            # Ta'lim shakli - bosh harf katta bilan
-            education_type = student.group.education_type or ''
-            education_type_display = education_type.capitalize() if education_type else ''
-            ws.cell(row=row_num, column=12, value=education_type_display)
+            semester = getattr(student, 'semester', None) or group.semester
             # Qabul yili (yo'nalishdan yoki talabadan)
-            enrollment_year = ''
-            if student.group and student.group.enrollment_year:
-                enrollment_year = student.group.enrollment_year
-            elif getattr(student, 'enrollment_year', None):
-                enrollment_year = student.enrollment_year
-            ws.cell(row=row_num, column=13, value=enrollment_year)
-            # Mutaxassislik kodi (yo'nalish kodi)
-            specialty_code = ''
-            if student.group.direction:
-                specialty_code = student.group.direction.code or ''
-            ws.cell(row=row_num, column=14, value=specialty_code)
-            # Mutaxassislik nomi (yo'nalish nomi)
-            specialty_name = ''
-            if student.group.direction:
-                specialty_name = student.group.direction.name or ''
-            ws.cell(row=row_num, column=15, value=specialty_name)
-            # Guruh
-            ws.cell(row=row_num, column=16, value=student.group.name)
+            enrollment_year = group.enrollment_year or getattr(student, 'enrollment_year', None) or ''
+            values += [
+                group.faculty.name if group.faculty else '',
+                f"{group.course_year}-kurs" if group.course_year else '',
+                f"{semester}-semestr" if semester else '',
+                # Ta'lim shakli - bosh harf katta bilan
+                group.education_type.capitalize() if group.education_type else '',
+                enrollment_year,
+                (group.direction.code or '') if group.direction else '',
+                (group.direction.name or '') if group.direction else '',
+                group.name,
+            ]
         else:
             # Guruh bo'lmagan talabalar uchun bo'sh qatorlar
-            ws.cell(row=row_num, column=9, value='')
-            ws.cell(row=row_num, column=10, value='')
-            ws.cell(row=row_num, column=11, value='')
-            ws.cell(row=row_num, column=12, value='')
-            ws.cell(row=row_num, column=13, value='')
-            ws.cell(row=row_num, column=14, value='')
-            ws.cell(row=row_num, column=15, value='')
-            ws.cell(row=row_num, column=16, value='')
+            values += [''] * 8
         
-        # Stil
-        for col_num in range(1, len(headers) + 1):
-            cell = ws.cell(row=row_num, column=col_num)
-            cell.alignment = Alignment(horizontal='left', vertical='center')
-            cell.border = Border(
-                left=Side(style='thin'),
-                right=Side(style='thin'),
-                top=Side(style='thin'),
-                bottom=Side(style='thin')
-            )
-            if row_num % 2 == 0:
-                cell.fill = PatternFill(start_color="F2F2F2", end_color="F2F2F2", fill_type="solid")
-    
-    # Ustun kengliklarini sozlash
-    column_widths = [15, 30, 20, 18, 18, 16, 25, 40, 20, 12, 12, 15, 12, 20, 30, 15]
-    for col_num, width in enumerate(column_widths, 1):
-        ws.column_dimensions[get_column_letter(col_num)].width = width
+        _append_data_row(ws, row_num, values)
     
-    # Excel faylni qaytarish
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
-    return output
+    return _save_workbook(wb, output)
 
 
-def create_schedule_excel(schedules, group_name=None, faculty_name=None):
-    """Dars jadvalini Excel formatida yaratish"""
-    try:
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-        from openpyxl.utils import get_column_letter
-    except ImportError:
-        raise ImportError("openpyxl kutubxonasi o'rnatilmagan. Iltimos, 'pip install openpyxl' buyrug'ini bajaring.")
-    
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Dars jadvali"
-    
-    # Sarlavha
-    title = "Dars jadvali"
-    # 10 ta ustun uchun sarlavha birlashtirish (A-J)
-    ws.merge_cells('A1:J1')
-    title_cell = ws['A1']
-    title_cell.value = title
-    title_cell.font = Font(size=14, bold=True, color="FFFFFF")
-    title_cell.alignment = Alignment(horizontal='center', vertical='center')
-    title_cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    
-    # Sana
-    ws['A2'] = f"Yaratilgan: {datetime.now().strftime('%d.%m.%Y %H:%M')}"
-    ws.merge_cells('A2:J2')
-    ws['A2'].font = Font(size=10, italic=True)
-    ws['A2'].alignment = Alignment(horizontal='center')
-    
-    # Agar darslar bo'lmasa
-    if not schedules:
-        ws['A3'] = "Darslar yo'q"
-        ws.merge_cells('A3:J3')
-        ws['A3'].font = Font(size=12, italic=True, color="666666")
-        ws['A3'].alignment = Alignment(horizontal='center', vertical='center')
-        # Ustun kengliklarini sozlash
-        column_widths = [20, 10, 10, 20, 15, 20, 20, 15, 10, 25]
-        for col_num, width in enumerate(column_widths, 1):
-            ws.column_dimensions[get_column_letter(col_num)].width = width
-        # Excel faylni qaytarish
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
-        return output
-    
-    # Jadval sarlavhalari
-    # 1. Fakultet, 2. Kurs, 3. Semestr, 4. Yo'nalish, 5. Guruh, 6. Fan, 7. O'qituvchi, 8. Sana, 9. Vaqt, 10. Link
-    # Jadval sarlavhalari - "Yangi dars qo'shish" formasi bilan bir xil
-    # Asosiy: Guruh, Fan, O'qituvchi, Sana, Boshlanish vaqti, Tugash vaqti, Turi, Link
-    # Info: Fakultet, Kurs, Semestr, Yo'nalish
+def create_schedule_excel(schedules, group_name=None, faculty_name=None, output=None):
+    """Dars jadvalini Excel formatida yaratish (schedules - istalgan iterable, qatorlar oqim bilan yoziladi)"""
+    wb = _streaming_workbook(title_size=14)
     
     # Jadval sarlavhalari - "Yangi dars qo'shish" formasi tartibida
     # 1. Fakultet, 2. Kurs, 3. Semestr, 4. Yo'nalish, 5. Guruh, 6. Fan, 7. O'qituvchi, 8. Sana, 9. Boshlanish vaqti, 10. Link
     # (Tugash vaqti va Turi olib tashlandi)
-    
     headers = [
         'Fakultet',                 # A
         'Kurs',                     # B
@@ -240,51 +193,34 @@ def create_schedule_excel(schedules, group_name=None, faculty_name=None):
     ]
     header_row = 3
     
-    # Sarlavhalar
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=header_row, column=col_num)
-        cell.value = header
-        cell.font = Font(bold=True, color="FFFFFF")
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-        cell.fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-        cell.border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
+    # Darslar bor-yo'qligi birinchi elementdan aniqlanadi (iterable oxirigacha o'qilmaydi)
+    rows = iter(schedules)
+    first = next(rows, None)
+    
+    # 10 ta ustun uchun sarlavha birlashtirish (A-J)
+    if first is None:
+        # Agar darslar bo'lmasa
+        ws = _start_sheet(wb, "Dars jadvali", "Dars jadvali", None,
+                          [20, 10, 10, 20, 15, 20, 20, 15, 10, 25], 'J')
+        ws.merged_cells.add('A3:J3')
+        ws.append(_styled_row(ws, ["Darslar yo'q"], 'export_empty'))
+        return _save_workbook(wb, output)
+    
+    ws = _start_sheet(wb, "Dars jadvali", "Dars jadvali", headers,
+                      [20, 10, 10, 20, 15, 25, 20, 15, 15, 20], 'J')
+    
+    def all_rows():
+        yield first
+        yield from rows
     
     # Ma'lumotlar
-    for row_num, schedule in enumerate(schedules, start=header_row + 1):
-        # 1. Fakultet
-        faculty_val = ''
-        if schedule.group and schedule.group.faculty:
-            faculty_val = schedule.group.faculty.name
-        ws.cell(row=row_num, column=1, value=faculty_val)
-        
-        # 2. Kurs
-        course_val = schedule.group.course_year if schedule.group else ''
-        ws.cell(row=row_num, column=2, value=f"{course_val}-kurs" if course_val else '')
-        
-        # 3. Semestr
-        semester_val = ''
-        if schedule.group:
-            semester_val = schedule.group.semester
-        ws.cell(row=row_num, column=3, value=f"{semester_val}-semestr" if semester_val else '')
+    for row_num, schedule in enumerate(all_rows(), start=header_row + 1):
+        group = schedule.group
         
-        # 4. Yo'nalish
-        direction_val = ''
-        if schedule.group and schedule.group.direction:
-            direction_val = schedule.group.direction.name
-        ws.cell(row=row_num, column=4, value=direction_val)
-        
-        # 5. Guruh
-        ws.cell(row=row_num, column=5, value=schedule.group.name if schedule.group else '')
-        
-        # 6. Fan
-        ws.cell(row=row_num, column=6, value=schedule.subject.name if schedule.subject else '')
-        
-        # 7. O'qituvchi
+        # 7. O'qituvchi (user talabiga ko'ra o'qituvchi ismi chiqariladi)
         teacher_val = ''
         if schedule.teacher:
-            # User talabiga ko'ra o'qituvchi ismi chiqariladi
             teacher_val = schedule.teacher.full_name or schedule.teacher.username
-        ws.cell(row=row_num, column=7, value=teacher_val or '')
         
         # 8. Sana
         date_val = ''
@@ -294,33 +230,22 @@ def create_schedule_excel(schedules, group_name=None, faculty_name=None):
                 date_val = f"{s_date[6:8]}.{s_date[4:6]}.{s_date[0:4]}"
             else:
                 date_val = s_date # Fallback
-        ws.cell(row=row_num, column=8, value=date_val)
-        
-        # 9. Vaqt
-        ws.cell(row=row_num, column=9, value=schedule.start_time or '')
         
-        # 10. Link
-        ws.cell(row=row_num, column=10, value=schedule.link or '')
-
-        # Stil (barcha ustunlar uchun)
-        for col_num in range(1, len(headers) + 1):
-            cell = ws.cell(row=row_num, column=col_num)
-            cell.alignment = Alignment(horizontal='left', vertical='center')
-            cell.border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-            if row_num % 2 == 0:
-                cell.fill = PatternFill(start_color="F2F2F2", end_color="F2F2F2", fill_type="solid")
-    
-    # Ustun kengliklari
-    column_widths = [20, 10, 10, 20, 15, 25, 20, 15, 15, 20]
-    for col_num, width in enumerate(column_widths, 1):
-        ws.column_dimensions[get_column_letter(col_num)].width = width
-    
-    # Excel faylni qaytarish
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
-    return output
+        values = [
+            group.faculty.name if group and group.faculty else '',
+            f"{group.course_year}-kurs" if group and group.course_year else '',
+            f"{group.semester}-semestr" if group and group.semester else '',
+            group.direction.name if group and group.direction else '',
+            group.name if group else '',
+            schedule.subject.name if schedule.subject else '',
+            teacher_val or '',
+            date_val,
+            schedule.start_time or '',
+            schedule.link or '',
+        ]
+        _append_data_row(ws, row_num, values)
+    
+    return _save_workbook(wb, output)
 
 
 def create_contracts_excel(payments, course_year=None):
@@ -560,26 +485,13 @@ def create_group_grades_excel(subject, group, student_rows):
     return output
 
 
-def create_all_users_excel(users):
-    """Barcha foydalanuvchilarni Excel formatida yaratish (rol bo'yicha guruhlash)"""
-    try:
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-        from openpyxl.utils import get_column_letter
-    except ImportError:
-        raise ImportError("openpyxl kutubxonasi o'rnatilmagan. Iltimos, 'pip install openpyxl' buyrug'ini bajaring.")
+def create_all_users_excel(users, output=None):
+    """Barcha foydalanuvchilarni Excel formatida yaratish (rol bo'yicha guruhlash).
     
-    wb = Workbook()
-    
-    # Rol bo'yicha guruhlash
-    from collections import defaultdict
-    users_by_role = defaultdict(list)
-    
-    for user in users:
-        # Bir nechta rol bo'lsa, har bir rol uchun alohida qo'shish
-        roles = user.get_roles() if hasattr(user, 'get_roles') else [user.role]
-        for role in roles:
-            users_by_role[role].append(user)
+    users bir marta oqim bilan o'qiladi: har bir rol varag'i birinchi foydalanuvchisi
+    uchraganda ochiladi, saqlashdan oldin varaqlar rol tartibida joylashtiriladi.
+    """
+    wb = _streaming_workbook()
     
     # Har bir rol uchun alohida worksheet
     role_names = {
@@ -589,225 +501,121 @@ def create_all_users_excel(users):
         'student': 'Talabalar',
         'accounting': 'Buxgalteriya'
     }
+    role_order = ['admin', 'dean', 'teacher', 'student', 'accounting']
+    header_row = 3
+    sheets = {}
+    counters = {}
     
-    for role in ['admin', 'dean', 'teacher', 'student', 'accounting']:
-        if role not in users_by_role:
-            continue
-        
-        ws = wb.create_sheet(title=role_names.get(role, role))
-        
-        # Sarlavha
-        title = f"{role_names.get(role, role)} ro'yxati"
-        ws.merge_cells('A1:K1')
-        title_cell = ws['A1']
-        title_cell.value = title
-        title_cell.font = Font(size=16, bold=True, color="FFFFFF")
-        title_cell.alignment = Alignment(horizontal='center', vertical='center')
-        title_cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        
-        # Sana
-        ws['A2'] = f"Yaratilgan: {datetime.now().strftime('%d.%m.%Y %H:%M')}"
-        ws.merge_cells('A2:K2')
-        ws['A2'].font = Font(size=10, italic=True)
-        ws['A2'].alignment = Alignment(horizontal='center')
-        
-        # Jadval sarlavhalari
-        if role == 'student':
-            headers = ['№', "To'liq ism", 'Email', 'Telefon', 'Talaba ID', 'Pasport raqami', 'JSHSHIR', 'Tug\'ilgan sana', 'Guruh', 'Kurs', 'Fakultet']
-        else:
-            headers = ['№', "To'liq ism", 'Email', 'Telefon', 'Pasport raqami', 'JSHSHIR', 'Tug\'ilgan sana', 'Kafedra', 'Lavozim', 'Fakultet', 'Holat']
-        
-        header_row = 3
-        
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=header_row, column=col_num)
-            cell.value = header
-            cell.font = Font(bold=True, color="FFFFFF")
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-            cell.fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-            cell.border = Border(
-                left=Side(style='thin'),
-                right=Side(style='thin'),
-                top=Side(style='thin'),
-                bottom=Side(style='thin')
-            )
-        
-        # Ma'lumotlar
-        role_users = users_by_role[role]
-        for row_num, user in enumerate(role_users, start=header_row + 1):
-            ws.cell(row=row_num, column=1, value=row_num - header_row)
-            ws.cell(row=row_num, column=2, value=user.full_name.upper() if user.full_name else '')
-            ws.cell(row=row_num, column=3, value=user.email)
-            ws.cell(row=row_num, column=4, value=user.phone or '')
+    for user in users:
+        # Bir nechta rol bo'lsa, har bir rol uchun alohida qo'shish
+        roles = user.get_roles() if hasattr(user, 'get_roles') else [user.role]
+        for role in roles:
+            if role not in role_order:
+                continue
+            
+            ws = sheets.get(role)
+            if ws is None:
+                # Jadval sarlavhalari
+                if role == 'student':
+                    headers = ['№', "To'liq ism", 'Email', 'Telefon', 'Talaba ID', 'Pasport raqami', 'JSHSHIR', 'Tug\'ilgan sana', 'Guruh', 'Kurs', 'Fakultet']
+                    column_widths = [5, 30, 25, 16, 15, 18, 16, 14, 14, 8, 20]
+                else:
+                    headers = ['№', "To'liq ism", 'Email', 'Telefon', 'Pasport raqami', 'JSHSHIR', 'Tug\'ilgan sana', 'Kafedra', 'Lavozim', 'Fakultet', 'Holat']
+                    column_widths = [5, 30, 25, 16, 18, 16, 14, 20, 15, 20, 12]
+                ws = sheets[role] = _start_sheet(wb, role_names[role], f"{role_names[role]} ro'yxati",
+                                                 headers, column_widths, 'K')
+                counters[role] = 0
             
+            counters[role] += 1
+            number = counters[role]
+            birth_date = getattr(user, 'birth_date', None)
+            values = [number, user.full_name.upper() if user.full_name else '', user.email, user.phone or '']
             if role == 'student':
-                ws.cell(row=row_num, column=5, value=user.student_id or '')
-                ws.cell(row=row_num, column=6, value=getattr(user, 'passport_number', None) or '')
-                ws.cell(row=row_num, column=7, value=getattr(user, 'pinfl', None) or '')
-                birth_date = getattr(user, 'birth_date', None)
-                ws.cell(row=row_num, column=8, value=birth_date.strftime('%Y-%m-%d') if birth_date else '')
-                ws.cell(row=row_num, column=9, value=user.group.name if user.group else '')
-                ws.cell(row=row_num, column=10, value=user.group.course_year if user.group else '')
-                ws.cell(row=row_num, column=11, value=user.group.faculty.name if user.group and user.group.faculty else '')
+                values += [
+                    user.student_id or '',
+                    getattr(user, 'passport_number', None) or '',
+                    getattr(user, 'pinfl', None) or '',
+                    birth_date.strftime('%Y-%m-%d') if birth_date else '',
+                    user.group.name if user.group else '',
+                    user.group.course_year if user.group else '',
+                    user.group.faculty.name if user.group and user.group.faculty else '',
+                ]
             else:
-                ws.cell(row=row_num, column=5, value=getattr(user, 'passport_number', None) or '')
-                ws.cell(row=row_num, column=6, value=getattr(user, 'pinfl', None) or '')
-                birth_date = getattr(user, 'birth_date', None)
-                ws.cell(row=row_num, column=7, value=birth_date.strftime('%Y-%m-%d') if birth_date else '')
-                ws.cell(row=row_num, column=8, value=user.department or '')
-                ws.cell(row=row_num, column=9, value=user.position or '')
-                ws.cell(row=row_num, column=10, value=user.managed_faculty.name if user.managed_faculty else '')
-                ws.cell(row=row_num, column=11, value='Faol' if user.is_active else 'Bloklangan')
-            
-            # Stil
-            for col_num in range(1, len(headers) + 1):
-                cell = ws.cell(row=row_num, column=col_num)
-                cell.alignment = Alignment(horizontal='left', vertical='center')
-                cell.border = Border(
-                    left=Side(style='thin'),
-                    right=Side(style='thin'),
-                    top=Side(style='thin'),
-                    bottom=Side(style='thin')
-                )
-                if row_num % 2 == 0:
-                    cell.fill = PatternFill(start_color="F2F2F2", end_color="F2F2F2", fill_type="solid")
-        
-        # Ustun kengliklarini sozlash
-        if role == 'student':
-            column_widths = [5, 30, 25, 16, 15, 18, 16, 14, 14, 8, 20]
-        else:
-            column_widths = [5, 30, 25, 16, 18, 16, 14, 20, 15, 20, 12]
-        for col_num, width in enumerate(column_widths, 1):
-            ws.column_dimensions[get_column_letter(col_num)].width = width
-    
-    # Bosh worksheet'ni o'chirish
-    if 'Sheet' in wb.sheetnames:
-        wb.remove(wb['Sheet'])
-    
-    # Excel faylni qaytarish
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
-    return output
+                values += [
+                    getattr(user, 'passport_number', None) or '',
+                    getattr(user, 'pinfl', None) or '',
+                    birth_date.strftime('%Y-%m-%d') if birth_date else '',
+                    user.department or '',
+                    user.position or '',
+                    user.managed_faculty.name if user.managed_faculty else '',
+                    'Faol' if user.is_active else 'Bloklangan',
+                ]
+            _append_data_row(ws, header_row + number, values)
+    
+    # Varaqlarni rol tartibiga keltirish
+    ordered = [sheets[role] for role in role_order if role in sheets]
+    for index, ws in enumerate(ordered):
+        wb.move_sheet(ws.title, offset=index - wb.worksheets.index(ws))
+    
+    return _save_workbook(wb, output)
 
 
-def create_staff_excel(users):
-    """Xodimlarni Excel formatida yaratish (bitta sheet'da) - bir nechta rollarni qo'llab-quvvatlash"""
-    try:
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-        from openpyxl.utils import get_column_letter
-    except ImportError:
-        raise ImportError("openpyxl kutubxonasi o'rnatilmagan. Iltimos, 'pip install openpyxl' buyrug'ini bajaring.")
+def create_staff_excel(users, roles_by_user=None, output=None):
+    """Xodimlarni Excel formatida yaratish (bitta sheet'da) - bir nechta rollarni qo'llab-quvvatlash.
     
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Xodimlar"
+    roles_by_user: {user_id: [rol, ...]} - oldindan yuklangan rollar (berilmasa har bir xodim
+    uchun UserRole so'raladi). output berilmasa fayl bytes ko'rinishida qaytariladi.
+    """
+    from app.models import UserRole
     
-    # Sarlavha
-    title = "Xodimlar ro'yxati"
-    ws.merge_cells('A1:I1')
-    title_cell = ws['A1']
-    title_cell.value = title
-    title_cell.font = Font(size=16, bold=True, color="FFFFFF")
-    title_cell.alignment = Alignment(horizontal='center', vertical='center')
-    title_cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    
-    # Sana
-    ws['A2'] = f"Yaratilgan: {datetime.now().strftime('%d.%m.%Y %H:%M')}"
-    ws.merge_cells('A2:I2')
-    ws['A2'].font = Font(size=10, italic=True)
-    ws['A2'].alignment = Alignment(horizontal='center')
+    wb = _streaming_workbook()
     
     # Jadval sarlavhalari (A ustunidan boshlanadi)
     headers = ["To'liq ism", 'Login', 'Pasport seriya raqami', 'JSHSHIR', "Tug'ilgan sana", 'Telefon', 'Email', 'Tavsif', 'Rollar']
-    
+    column_widths = [30, 20, 20, 18, 18, 16, 25, 20, 40]
+    ws = _start_sheet(wb, "Xodimlar", "Xodimlar ro'yxati", headers, column_widths, 'I')
     header_row = 3
     
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=header_row, column=col_num)
-        cell.value = header
-        cell.font = Font(bold=True, color="FFFFFF")
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-        cell.fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-        cell.border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
+    # Rollarni o'zbek tilida ko'rsatish (belgilangan tartibda)
+    role_names = {
+        'admin': 'Administrator',
+        'dean': 'Dekan',
+        'teacher': "O'qituvchi",
+        'accounting': 'Buxgalter',
+        'student': 'Talaba'
+    }
+    # Belgilangan tartib: Administrator, Dekan, O'qituvchi, Buxgalter
+    role_order = ['admin', 'dean', 'teacher', 'accounting', 'student']
     
     # Ma'lumotlar
     for row_num, user in enumerate(users, start=header_row + 1):
-        ws.cell(row=row_num, column=1, value=user.full_name.upper() if user.full_name else '')
-        ws.cell(row=row_num, column=2, value=user.login or '')
-        ws.cell(row=row_num, column=3, value=getattr(user, 'passport_number', None) or '')
-        ws.cell(row=row_num, column=4, value=getattr(user, 'pinfl', None) or '')
-        
-        # Tug'ilgan sana (YYYY-MM-DD formatida)
-        birth_date = getattr(user, 'birth_date', None)
-        if birth_date:
-            if isinstance(birth_date, str):
-                ws.cell(row=row_num, column=5, value=birth_date)
-            else:
-                ws.cell(row=row_num, column=5, value=birth_date.strftime('%Y-%m-%d'))
-        else:
-            ws.cell(row=row_num, column=5, value='')
-        
-        ws.cell(row=row_num, column=6, value=user.phone or '')
-        ws.cell(row=row_num, column=7, value=user.email or '')
-        ws.cell(row=row_num, column=8, value=getattr(user, 'description', None) or '')
-        
-        # Rollarni olish va o'zbek tilida ko'rsatish (belgilangan tartibda)
-        from app.models import UserRole
-        role_names = {
-            'admin': 'Administrator',
-            'dean': 'Dekan',
-            'teacher': "O'qituvchi",
-            'accounting': 'Buxgalter',
-            'student': 'Talaba'
-        }
-        # Belgilangan tartib: Administrator, Dekan, O'qituvchi, Buxgalter
-        role_order = ['admin', 'dean', 'teacher', 'accounting', 'student']
-        role_display_order = ['Administrator', 'Dekan', "O'qituvchi", 'Buxgalter', 'Talaba']
-        
         # Foydalanuvchining rollarini olish
-        user_roles = UserRole.query.filter_by(user_id=user.id).all()
-        user_role_codes = [ur.role for ur in user_roles] if user_roles else ([user.role] if user.role else [])
-        
-        # Belgilangan tartibda ko'rsatish
-        roles_display = []
-        for role_code in role_order:
-            if role_code in user_role_codes:
-                roles_display.append(role_names.get(role_code, role_code))
+        if roles_by_user is not None:
+            user_role_codes = roles_by_user.get(user.id)
+        else:
+            user_role_codes = [ur.role for ur in UserRole.query.filter_by(user_id=user.id).all()]
+        if not user_role_codes:
+            user_role_codes = [user.role] if user.role else []
         
-        roles_str = ', '.join(roles_display) if roles_display else ''
-        ws.cell(row=row_num, column=9, value=roles_str)
+        roles_display = [role_names.get(code, code) for code in role_order if code in user_role_codes]
         
-        # Stil
-        for col_num in range(1, len(headers) + 1):
-            cell = ws.cell(row=row_num, column=col_num)
-            cell.alignment = Alignment(horizontal='left', vertical='center')
-            cell.border = Border(
-                left=Side(style='thin'),
-                right=Side(style='thin'),
-                top=Side(style='thin'),
-                bottom=Side(style='thin')
-            )
-            if row_num % 2 == 0:
-                cell.fill = PatternFill(start_color="F2F2F2", end_color="F2F2F2", fill_type="solid")
-    
-    # Ustun kengliklarini sozlash
-    column_widths = [30, 20, 20, 18, 18, 16, 25, 20, 40]
-    for col_num, width in enumerate(column_widths, 1):
-        ws.column_dimensions[get_column_letter(col_num)].width = width
-    
-    excel_file = io.BytesIO()
-    wb.save(excel_file)
-    excel_file.seek(0)
-    
-    return excel_file.getvalue()
+        values = [
+            user.full_name.upper() if user.full_name else '',
+            user.login or '',
+            getattr(user, 'passport_number', None) or '',
+            getattr(user, 'pinfl', None) or '',
+            # Tug'ilgan sana (YYYY-MM-DD formatida)
+            _format_birth_date(getattr(user, 'birth_date', None)),
+            user.phone or '',
+            user.email or '',
+            getattr(user, 'description', None) or '',
+            ', '.join(roles_display),
+        ]
+        _append_data_row(ws, row_num, values)
+    
+    if output is not None:
+        return _save_workbook(wb, output)
+    return _save_workbook(wb).getvalue()
 
 
 def create_sample_contracts_excel():
@@ -1208,12 +1016,13 @@ def create_detailed_assignment_export_excel(subject, group, assignments, matrix)
         cell.alignment = Alignment(horizontal='center', vertical='center')
         cell.border = border_thin
 
-    # Ma'lumotlar
+    # Ma'lumotlar (GradeMatrix.build_rows qatorlari)
     for row_num, row_data in enumerate(matrix, start=5):
+        student = row_data['student']
         # A: ID
-        ws.cell(row=row_num, column=1, value=row_data['student_id']).border = border_thin
+        ws.cell(row=row_num, column=1, value=student.student_id or '-').border = border_thin
         # B: Name
-        ws.cell(row=row_num, column=2, value=row_data['student_name']).border = border_thin
+        ws.cell(row=row_num, column=2, value=student.full_name.upper() if student.full_name else '-').border = border_thin
         
         # C onwards: Scores
         for col_idx, score in enumerate(row_data['scores'], start=3):
@@ -1230,7 +1039,7 @@ def create_detailed_assignment_export_excel(subject, group, assignments, matrix)
         
         # Next: Total
         total_col = len(assignments) + 3
-        cell_total = ws.cell(row=row_num, column=total_col, value=row_data['total_score'])
+        cell_total = ws.cell(row=row_num, column=total_col, value=row_data['total'])
         cell_total.font = font_bold
         cell_total.alignment = Alignment(horizontal='center')
         cell_total.border = border_thin
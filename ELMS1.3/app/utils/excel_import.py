@@ -1,8 +1,11 @@
 from flask import flash
 from app.models import Subject, Faculty
 from app import db
-from datetime import datetime
+from app.utils.org_hierarchy import invalidate_org_hierarchy
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 import io
+import os
 import re
 
 
@@ -278,305 +281,340 @@ def generate_staff_sample_file():
     return output
 
 
-def import_students_from_excel(file, faculty_id=None):
-    """Excel fayldan talabalarni import qilish (yangi tartib)
-    
-    Args:
-        file: Excel fayl
-        faculty_id: Fakultet ID (ixtiyoriy, agar berilsa, guruhlar shu fakultet doirasida qidiriladi)
+# Talabalar importida bir martada bazaga yoziladigan qatorlar soni (progress shu qadamda yangilanadi)
+STUDENT_IMPORT_CHUNK_SIZE = 500
+# Sarlavha qatori qidiriladigan dastlabki qatorlar soni
+STUDENT_IMPORT_HEADER_SCAN_ROWS = 50
+# Parol xeshlarini hisoblaydigan oqimlar soni
+STUDENT_IMPORT_HASH_WORKERS = min(4, os.cpu_count() or 1)
+
+
+def _cell_text(value):
+    """Katak qiymatini satrga o'tkazish (bo'sh bo'lsa '')"""
+    return str(value).strip() if value else ''
+
+
+def _parse_int_prefix(value, suffix):
+    """"1-kurs" / "1-semestr" -> 1"""
+    if not value:
+        return None
+    try:
+        return int(value.replace(suffix, '').strip())
+    except ValueError:
+        return None
+
+
+def _parse_birth_date(value):
+    """Tug'ilgan sana: Excel sanasi yoki DD.MM.YYYY / YYYY-MM-DD matni. (sana, xato bormi) qaytaradi."""
+    from datetime import date
+    if isinstance(value, datetime):
+        return value.date(), False
+    if isinstance(value, date):
+        return value, False
+    text = _cell_text(value)
+    if not text:
+        return None, False
+    try:
+        if '.' in text:
+            return datetime.strptime(text, '%d.%m.%Y').date(), False
+        if '-' in text:
+            return datetime.strptime(text, '%Y-%m-%d').date(), False
+    except ValueError:
+        pass
+    return None, True
+
+
+class _StudentImportIndex:
+    """Import uchun oldindan yuklangan lug'atlar (har qator uchun so'rov yubormaslik uchun)"""
+
+    def __init__(self):
+        from app.models import User, Group, Direction
+
+        # Mavjud foydalanuvchilar: faqat kerakli ustunlar, bitta so'rov
+        self.users = {}
+        self.by_student_id = {}
+        self.by_email = {}
+        self.by_passport = {}
+        rows = db.session.query(User.id, User.student_id, User.email, User.passport_number).all()
+        for user_id, student_id, email, passport in rows:
+            record = {'id': user_id, 'student_id': student_id, 'email': email, 'passport_number': passport}
+            self._index(record)
+
+        self.faculties = {f.name: f for f in Faculty.query.all()}
+        self.directions = {}
+        for direction in Direction.query.order_by(Direction.id).all():
+            self.directions.setdefault((direction.faculty_id, direction.code), direction)
+        self.groups = {}
+        for group in Group.query.order_by(Group.id).all():
+            self.groups.setdefault((group.faculty_id, group.name), group)
+
+    def _index(self, record):
+        if record.get('student_id'):
+            self.by_student_id.setdefault(record['student_id'], record)
+        if record.get('email'):
+            self.by_email.setdefault(record['email'], record)
+        if record.get('passport_number'):
+            self.by_passport.setdefault(record['passport_number'], record)
+
+    def find_user(self, student_id, email, passport_number):
+        """student_id, email yoki pasport bo'yicha (shu tartibda) foydalanuvchini topish"""
+        return (self.by_student_id.get(student_id) or
+                (self.by_email.get(email) if email else None) or
+                self.by_passport.get(passport_number))
+
+    def reindex(self, record, old_student_id, old_email, old_passport):
+        """Yozuv kalitlari o'zgarganda lug'atlarni yangilash"""
+        for index, old, new in ((self.by_student_id, old_student_id, record.get('student_id')),
+                                (self.by_email, old_email, record.get('email')),
+                                (self.by_passport, old_passport, record.get('passport_number'))):
+            if old != new and old and index.get(old) is record:
+                del index[old]
+        self._index(record)
+
+
+def iter_student_import(file, faculty_id=None, chunk_size=STUDENT_IMPORT_CHUNK_SIZE):
+    """Talabalar importi: har bir bo'lak (chunk) yozilgandan keyin holatni yield qiladi.
+
+    Oraliq holat: {'processed', 'total', 'imported', 'updated'}; oxirgisi qo'shimcha
+    'done': True, 'success' va 'errors' kalitlariga ega. Barcha o'zgarishlar bitta tranzaksiyada.
     """
     try:
         from openpyxl import load_workbook
-        from app.models import User, Group, Faculty, Direction
-        from app import db
-        from datetime import datetime, date
+        from werkzeug.security import generate_password_hash
+        from app.models import User, Group, Direction
     except ImportError:
-        return {
-            'success': False,
-            'imported': 0,
-            'errors': ["openpyxl kutubxonasi o'rnatilmagan"]
-        }
-    
+        yield {'done': True, 'success': False, 'imported': 0, 'updated': 0,
+               'errors': ["openpyxl kutubxonasi o'rnatilmagan"]}
+        return
+
+    try:
+        wb = load_workbook(file, read_only=True, data_only=True)
+    except Exception as e:
+        yield {'done': True, 'success': False, 'imported': 0, 'updated': 0,
+               'errors': [f"Fayl o'qishda xatolik: {str(e)}"]}
+        return
+
+    state = {'processed': 0, 'total': 0, 'imported': 0, 'updated': 0}
+    errors = []
     try:
-        wb = load_workbook(file)
         ws = wb.active
-        
-        imported = 0
-        updated = 0
-        errors = []
-        
-        # Sarlavha qatorini topish (dinamik ravishda)
-        header_row = None
-        for row_num in range(1, min(20, ws.max_row + 1)):
-            first_cell = ws.cell(row=row_num, column=1).value
-            if first_cell and ("Talaba ID" in str(first_cell) or "To'liq ism" in str(first_cell)):
-                header_row = row_num
-                break
-        
-        if not header_row:
-            return {
-                'success': False,
-                'imported': 0,
-                'updated': 0,
-                'errors': ["Sarlavha qatori topilmadi. Iltimos, fayl formati to'g'ri ekanligini tekshiring."]
-            }
-        
-        headers = []
-        for col in range(1, ws.max_column + 1):
-            cell_value = ws.cell(row=header_row, column=col).value
-            if cell_value:
-                headers.append(str(cell_value).strip())
-        
-        # Ma'lumotlarni o'qish
-        for row_num in range(header_row + 1, ws.max_row + 1):
-            try:
-                row_data = {}
-                for col_num, header in enumerate(headers, 1):
-                    cell_value = ws.cell(row=row_num, column=col_num).value
-                    row_data[header] = str(cell_value).strip() if cell_value else ''
-                
-                # Bo'sh qatorlarni o'tkazib yuborish
-                if not row_data.get("To'liq ism") and not row_data.get('Email'):
-                    continue
-                
-                full_name = row_data.get("To'liq ism", '').strip()
-                student_id = row_data.get('Talaba ID', '').strip()
-                email = row_data.get('Email', '').strip()
-                passport_number = row_data.get('Pasport seriya raqami', '').strip()
-                
-                # Majburiy maydonlarni tekshirish
-                if not full_name:
-                    errors.append(f"Qator {row_num}: To'liq ism kiritilmagan")
-                    continue
-                if not student_id:
-                    errors.append(f"Qator {row_num}: Talaba ID kiritilmagan")
+        index = _StudentImportIndex()
+        new_users = []
+        changed_users = {}  # {user_id: mapping}
+
+        def flush_chunk():
+            # Parol xeshlari (scrypt) importning eng qimmat qismi; hashlib GIL ni bo'shatadi,
+            # shuning uchun bo'lakdagi xeshlar bir nechta oqimda hisoblanadi
+            pending = new_users + list(changed_users.values())
+            if pending:
+                with ThreadPoolExecutor(max_workers=STUDENT_IMPORT_HASH_WORKERS) as pool:
+                    hashes = pool.map(generate_password_hash, [m['passport_number'] for m in pending])
+                    for mapping, password_hash in zip(pending, hashes):
+                        mapping['password_hash'] = password_hash
+            if new_users:
+                # return_defaults: yangi id lar lug'atlarga yoziladi (keyingi qatorlar ularni yangilashi mumkin)
+                db.session.bulk_insert_mappings(User, new_users, return_defaults=True)
+                new_users.clear()
+            if changed_users:
+                db.session.bulk_update_mappings(User, list(changed_users.values()))
+                changed_users.clear()
+            db.session.flush()
+
+        def get_faculty(row_num, faculty_name):
+            faculty = index.faculties.get(faculty_name)
+            if not faculty:
+                errors.append(f"Qator {row_num}: Fakultet '{faculty_name}' topilmadi")
+            return faculty
+
+        headers = None
+        for row_num, values in enumerate(ws.iter_rows(values_only=True), 1):
+            # Sarlavha qatorini topish. Namuna faylda sarlavhadan oldin yo'riqnoma qatorlari bor
+            # ("1. Talaba ID - majburiy..."), shuning uchun katak qiymati to'liq mos kelishi kerak.
+            if headers is None:
+                first_cell = _cell_text(values[0]) if values else ''
+                if first_cell in ("Talaba ID", "To'liq ism"):
+                    headers = [_cell_text(v) for v in values]
+                    state['total'] = max((ws.max_row or row_num) - row_num, 0)
+                elif row_num >= STUDENT_IMPORT_HEADER_SCAN_ROWS:
+                    break
+                continue
+
+            row_data = {}
+            raw_data = {}
+            for header, value in zip(headers, values):
+                if header:
+                    row_data[header] = _cell_text(value)
+                    raw_data[header] = value
+
+            # Bo'sh qatorlarni o'tkazib yuborish
+            if not row_data.get("To'liq ism") and not row_data.get('Email'):
+                continue
+
+            if state['processed'] and state['processed'] % chunk_size == 0:
+                flush_chunk()
+                yield dict(state)
+            state['processed'] += 1
+
+            full_name = row_data.get("To'liq ism", '')
+            student_id = row_data.get('Talaba ID', '')
+            email = row_data.get('Email', '')
+            passport_number = row_data.get('Pasport seriya raqami', '')
+
+            # Majburiy maydonlarni tekshirish
+            if not full_name:
+                errors.append(f"Qator {row_num}: To'liq ism kiritilmagan")
+                continue
+            if not student_id:
+                errors.append(f"Qator {row_num}: Talaba ID kiritilmagan")
+                continue
+            if not passport_number:
+                errors.append(f"Qator {row_num}: Pasport seriya raqami kiritilmagan")
+                continue
+
+            full_name = full_name.upper()
+            pinfl = row_data.get('JSHSHIR', '') or None
+            birth_date, bad_date = _parse_birth_date(raw_data.get("Tug'ilgan sana"))
+            if bad_date:
+                errors.append(f"Qator {row_num}: Tug'ilgan sana noto'g'ri format (DD.MM.YYYY yoki YYYY-MM-DD)")
+
+            faculty_name = row_data.get('Fakultet', '')
+            course_year = _parse_int_prefix(row_data.get('Kurs', ''), '-kurs')
+            semester = _parse_int_prefix(row_data.get('Semestr', ''), '-semestr')
+            education_type = row_data.get("Ta'lim shakli", '').lower() or None
+            enrollment_year = _parse_int_prefix(row_data.get('Qabul yili', ''), '')
+            specialty_code = row_data.get('Mutaxassislik kodi', '')
+            specialty_name = row_data.get('Mutaxassislik nomi', '')
+            group_name = row_data.get('Guruh', '')
+
+            record = index.find_user(student_id, email, passport_number)
+
+            # Boshqa foydalanuvchiga tegishli Talaba ID / email (unique cheklovlar)
+            owner = index.by_student_id.get(student_id)
+            if record is not None and owner is not None and owner is not record:
+                errors.append(f"Qator {row_num}: Talaba ID '{student_id}' boshqa foydalanuvchiga tegishli")
+                continue
+            owner = index.by_email.get(email) if email else None
+            if owner is not None and owner is not record:
+                errors.append(f"Qator {row_num}: Email '{email}' boshqa foydalanuvchiga tegishli")
+                continue
+
+            # Yo'nalishni topish yoki yaratish
+            direction = None
+            if specialty_code and faculty_name:
+                faculty = get_faculty(row_num, faculty_name)
+                if not faculty:
                     continue
-                if not passport_number:
-                    errors.append(f"Qator {row_num}: Pasport seriya raqami kiritilmagan")
+                direction = index.directions.get((faculty.id, specialty_code))
+                if not direction and specialty_name:
+                    direction = Direction(name=specialty_name, code=specialty_code, faculty_id=faculty.id)
+                    db.session.add(direction)
+                    db.session.flush()
+                    index.directions[(faculty.id, specialty_code)] = direction
+
+            # Guruhni topish yoki yaratish
+            group = None
+            if group_name and faculty_name:
+                faculty = direction.faculty if direction else get_faculty(row_num, faculty_name)
+                if not faculty:
                     continue
-                
-                # Ismni katta harflarda yozish
-                full_name = full_name.upper()
-                
-                # Foydalanuvchini topish (student_id, email yoki passport_number orqali)
-                user = None
-                if student_id:
-                    user = User.query.filter_by(student_id=student_id).first()
-                if not user and email:
-                    user = User.query.filter_by(email=email).first()
-                if not user and passport_number:
-                    user = User.query.filter_by(passport_number=passport_number).first()
-                
-                # JSHSHIR
-                pinfl = row_data.get('JSHSHIR', '').strip() or None
-                
-                # Tug'ilgan sana
-                birth_date_str = row_data.get("Tug'ilgan sana", '').strip()
-                birth_date = None
-                if birth_date_str:
-                    try:
-                        # DD.MM.YYYY yoki YYYY-MM-DD formatini qo'llab-quvvatlash
-                        if '.' in birth_date_str:
-                            birth_date = datetime.strptime(birth_date_str, '%d.%m.%Y').date()
-                        elif '-' in birth_date_str:
-                            birth_date = datetime.strptime(birth_date_str, '%Y-%m-%d').date()
-                    except ValueError:
-                        errors.append(f"Qator {row_num}: Tug'ilgan sana noto'g'ri format (DD.MM.YYYY yoki YYYY-MM-DD)")
-                
-                # Fakultet, Kurs, Semestr, Ta'lim shakli, Qabul yili, Mutaxassislik, Guruh
-                faculty_name = row_data.get('Fakultet', '').strip()
-                course_str = row_data.get('Kurs', '').strip()  # "1-kurs" formatida
-                semester_str = row_data.get('Semestr', '').strip()
-                education_type = row_data.get("Ta'lim shakli", '').strip()
-                enrollment_year_str = row_data.get('Qabul yili', '').strip()
-                specialty_code = row_data.get('Mutaxassislik kodi', '').strip()
-                specialty_name = row_data.get('Mutaxassislik nomi', '').strip()
-                group_name = row_data.get('Guruh', '').strip()
-                
-                # Kurs raqamini ajratish ("1-kurs" -> 1)
-                course_year = None
-                if course_str:
-                    try:
-                        course_year = int(course_str.replace('-kurs', '').strip())
-                    except:
-                        pass
-                
-                # Semestr raqamini ajratish ("1-semestr" -> 1)
-                semester = None
-                if semester_str:
-                    try:
-                        # "1-semestr" formatidan raqamni ajratish
-                        semester_str_clean = semester_str.replace('-semestr', '').strip()
-                        semester = int(semester_str_clean)
-                    except:
-                        pass
-                
-                # Ta'lim shaklini kichik harfga o'tkazish (database'da kichik harfda saqlanadi)
-                if education_type:
-                    education_type = education_type.lower()
-                
-                # Qabul yilini o'qish
-                enrollment_year = None
-                if enrollment_year_str:
-                    try:
-                        enrollment_year = int(enrollment_year_str)
-                    except:
-                        pass
-                
-                # Yo'nalishni topish yoki yaratish
-                direction = None
-                if specialty_code and faculty_name:
-                    # Fakultetni topish
-                    faculty = Faculty.query.filter_by(name=faculty_name).first()
-                    if not faculty:
-                        errors.append(f"Qator {row_num}: Fakultet '{faculty_name}' topilmadi")
-                        continue
-                    
-                    # Yo'nalishni topish (kodi bo'yicha va qabul yili bo'yicha)
-                    query = Direction.query.filter_by(code=specialty_code, faculty_id=faculty.id)
-                    if enrollment_year:
-                        # Qabul yili bilan bir nechta yo'nalish bo'lishi mumkin
-                        query = query.filter_by(enrollment_year=enrollment_year)
-                    direction = query.first()
-                    
-                    # Agar qabul yili bilan topilmasa, qabul yilisiz qidirish
-                    if not direction and enrollment_year:
-                        direction = Direction.query.filter_by(
-                            code=specialty_code, 
+                group = index.groups.get((faculty.id, group_name))
+                if not group:
+                    if course_year and education_type:
+                        group = Group(
+                            name=group_name,
                             faculty_id=faculty.id,
-                            enrollment_year=None
-                        ).first()
-                    
-                    # Agar yo'nalish topilmasa, yangi yaratish
-                    if not direction:
-                        if specialty_name:
-                            direction = Direction(
-                                name=specialty_name,
-                                code=specialty_code,
-                                faculty_id=faculty.id
-                            )
-                            db.session.add(direction)
-                            db.session.flush()
-                    pass
-                
-                # Guruhni topish yoki yaratish
-                group = None
-                if group_name and faculty_name:
-                    # Fakultetni topish (agar yo'nalishda topilmagan bo'lsa)
-                    if not direction:
-                        faculty = Faculty.query.filter_by(name=faculty_name).first()
-                        if not faculty:
-                            errors.append(f"Qator {row_num}: Fakultet '{faculty_name}' topilmadi")
-                            continue
+                            direction_id=direction.id if direction else None,
+                            course_year=course_year,
+                            semester=semester or 1,
+                            education_type=education_type,
+                            enrollment_year=enrollment_year
+                        )
+                        db.session.add(group)
+                        db.session.flush()
+                        index.groups[(faculty.id, group_name)] = group
                     else:
-                        faculty = direction.faculty
-                    
-                    # Guruhni topish
-                    group = Group.query.filter_by(name=group_name, faculty_id=faculty.id).first()
-                    
-                    # Agar guruh topilmasa, yangi yaratish
-                    if not group:
-                        if course_year and education_type:
-                            group = Group(
-                                name=group_name,
-                                faculty_id=faculty.id,
-                                direction_id=direction.id if direction else None,
-                                course_year=course_year,
-                                semester=semester or 1,
-                                education_type=education_type,
-                                enrollment_year=enrollment_year
-                            )
-                            db.session.add(group)
-                            db.session.flush()
-                        else:
-                            errors.append(f"Qator {row_num}: Guruh yaratish uchun kurs va ta'lim shakli kerak")
-                    elif direction and not group.direction_id:
-                        # Agar guruh topilgan bo'lsa va yo'nalish biriktirilmagan bo'lsa, biriktirish
-                        group.direction_id = direction.id
-                
-                if user:
-                    # Yangilash
-                    user.full_name = full_name
-                    if student_id:
-                        user.student_id = student_id
-                    user.phone = row_data.get('Telefon', '').strip() or None
-                    user.passport_number = passport_number
-                    user.pinfl = pinfl
-                    user.birth_date = birth_date
-                    user.email = email if email else None
-                    user.description = row_data.get('Tavsif', '').strip() or None
-                    
-                    # Guruhni biriktirish
-                    if group:
-                        user.group_id = group.id
-                        if semester:
-                            user.semester = semester
-                        if education_type:
-                            user.education_type = education_type
-                        if enrollment_year:
-                            user.enrollment_year = enrollment_year
-                    
-                    user.set_password(passport_number)
-                    updated += 1
+                        errors.append(f"Qator {row_num}: Guruh yaratish uchun kurs va ta'lim shakli kerak")
+                elif direction and not group.direction_id:
+                    group.direction_id = direction.id
+
+            values_map = {
+                'full_name': full_name,
+                'student_id': student_id,
+                'phone': row_data.get('Telefon', '') or None,
+                'passport_number': passport_number,
+                'pinfl': pinfl,
+                'birth_date': birth_date,
+                'email': email or None,
+                'description': row_data.get('Tavsif', '') or None,
+            }
+
+            if record is not None:
+                # Yangilash (bazadagi yoki shu faylda oldinroq qo'shilgan talaba)
+                if group:
+                    values_map['group_id'] = group.id
+                    if semester:
+                        values_map['semester'] = semester
+                    if education_type:
+                        values_map['education_type'] = education_type
+                    if enrollment_year:
+                        values_map['enrollment_year'] = enrollment_year
+                old_keys = (record.get('student_id'), record.get('email'), record.get('passport_number'))
+                if record.get('id') is not None:
+                    changed_users.setdefault(record['id'], {'id': record['id']}).update(values_map)
+                    record.update(student_id=student_id, email=values_map['email'], passport_number=passport_number)
                 else:
-                    # Yaratish
-                    user = User(
-                        full_name=full_name,
-                        role='student',
-                        student_id=student_id or None,
-                        phone=row_data.get('Telefon', '').strip() or None,
-                        passport_number=passport_number,
-                        pinfl=pinfl,
-                        birth_date=birth_date,
-                        email=email if email else None,
-                        description=row_data.get('Tavsif', '').strip() or None,
-                        semester=semester,
-                        education_type=education_type if education_type else None,
-                        enrollment_year=enrollment_year
-                    )
-                    
-                    # Guruhni biriktirish
-                    if group:
-                        user.group_id = group.id
-                    
-                    user.set_password(passport_number)
-                    db.session.add(user)
-                    
-                    # Commit qilish va agar email NOT NULL xatolik bo'lsa, email maydonini bo'sh qatorga o'zgartirish
-                    try:
-                        db.session.flush()  # ID olish uchun
-                    except Exception as e:
-                        error_str = str(e).lower()
-                        if 'email' in error_str and ('not null' in error_str or 'constraint' in error_str):
-                            # Database'da email NOT NULL bo'lsa, bo'sh qator qo'yamiz
-                            db.session.rollback()
-                            user.email = ''  # Bo'sh qator (database NOT NULL constraint uchun)
-                            db.session.add(user)
-                            db.session.flush()
-                        else:
-                            raise
-                    
-                    imported += 1
-                
-            except Exception as e:
-                errors.append(f"Qator {row_num}: Xatolik - {str(e)}")
-        
+                    record.update(values_map)
+                index.reindex(record, *old_keys)
+                state['updated'] += 1
+            else:
+                # Yaratish
+                values_map.update(
+                    role='student',
+                    semester=semester,
+                    education_type=education_type,
+                    enrollment_year=enrollment_year,
+                    group_id=group.id if group else None,
+                )
+                new_users.append(values_map)
+                index._index(values_map)
+                state['imported'] += 1
+
+        wb.close()
+
+        if headers is None:
+            yield {'done': True, 'success': False, 'imported': 0, 'updated': 0,
+                   'errors': ["Sarlavha qatori topilmadi. Iltimos, fayl formati to'g'ri ekanligini tekshiring."]}
+            return
+
+        flush_chunk()
         db.session.commit()
-        
-        return {
-            'success': True,
-            'imported': imported,
-            'updated': updated,
-            'errors': errors
-        }
-        
+        invalidate_org_hierarchy()
+        state['total'] = state['processed']
+        yield dict(state, done=True, success=True, errors=errors)
+
     except Exception as e:
-        return {
-            'success': False,
-            'imported': 0,
-            'updated': 0,
-            'errors': [f"Fayl o'qishda xatolik: {str(e)}"]
-        }
+        db.session.rollback()
+        wb.close()
+        yield {'done': True, 'success': False, 'imported': 0, 'updated': 0,
+               'errors': [f"Fayl o'qishda xatolik: {str(e)}"]}
+
+
+def import_students_from_excel(file, faculty_id=None):
+    """Excel fayldan talabalarni import qilish (yangi tartib)
+    
+    Args:
+        file: Excel fayl
+        faculty_id: Fakultet ID (ixtiyoriy, agar berilsa, guruhlar shu fakultet doirasida qidiriladi)
+    """
+    result = {}
+    for result in iter_student_import(file, faculty_id=faculty_id):
+        pass
+    return {
+        'success': result.get('success', False),
+        'imported': result.get('imported', 0),
+        'updated': result.get('updated', 0),
+        'errors': result.get('errors', [])
+    }
 
 
 def import_directions_from_excel(file):
@@ -674,6 +712,7 @@ def import_directions_from_excel(file):
                 errors.append(f"Qator {row_num}: Xatolik - {str(e)}")
         
         db.session.commit()
+        invalidate_org_hierarchy()
         
         return {
             'success': True,
@@ -898,6 +937,7 @@ def import_staff_from_excel(file):
                     user.role = primary_role
                     # Eski rollarni o'chirish
                     UserRole.query.filter_by(user_id=user.id).delete()
+                    user.invalidate_roles_cache()
                     # Yangi rollarni qo'shish (belgilangan tartibda: admin, dean, teacher, accounting, student)
                     role_order = ['admin', 'dean', 'teacher', 'accounting', 'student']
                     if roles_list:
@@ -1604,189 +1644,285 @@ def generate_schedule_sample_file():
     return output
 
 # Excel fayldan jadvalni import qilish
-def import_schedule_from_excel(file):
+SCHEDULE_IMPORT_CHUNK_SIZE = 500
+
+SCHEDULE_LESSON_TYPE_NAMES = {
+    'maruza': 'Ma\'ruza',
+    'lecture': 'Ma\'ruza',
+    'amaliyot': 'Amaliyot',
+    'practice': 'Amaliyot',
+    'lab': 'Laboratoriya',
+    'seminar': 'Seminar'
+}
+
+
+def _chunked(values, size=SCHEDULE_IMPORT_CHUNK_SIZE):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _parse_schedule_date(value):
+    """Sana katagi -> YYYYMMDD butun son (noto'g'ri bo'lsa None)"""
+    if isinstance(value, datetime):
+        return int(value.strftime('%Y%m%d'))
+    if isinstance(value, str):
+        for fmt in ['%d.%m.%Y', '%Y-%m-%d', '%d/%m/%Y']:
+            try:
+                return int(datetime.strptime(value, fmt).strftime('%Y%m%d'))
+            except ValueError:
+                continue
+    return None
+
+
+def _format_schedule_time(value):
+    from datetime import time
+    if isinstance(value, (datetime, time)):
+        return value.strftime('%H:%M')
+    return str(value)
+
+
+def _resolve_teachers(identifiers):
+    """O'qituvchi identifikatorlari -> user id: avval login, keyin pasport, keyin to'liq ism (katta-kichik harfsiz)"""
+    from app.models import User
+    from sqlalchemy import func
+
+    by_login, by_passport, by_name = {}, {}, {}
+    for chunk in _chunked(identifiers):
+        for user_id, login in User.query.with_entities(User.id, User.login) \
+                .filter(User.login.in_(chunk)).order_by(User.id):
+            by_login.setdefault(login, user_id)
+        for user_id, passport in User.query.with_entities(User.id, User.passport_number) \
+                .filter(User.passport_number.in_(chunk)).order_by(User.id):
+            by_passport.setdefault(passport, user_id)
+        lowered = list({value.lower() for value in chunk})
+        for user_id, name in User.query.with_entities(User.id, func.lower(User.full_name)) \
+                .filter(func.lower(User.full_name).in_(lowered)).order_by(User.id):
+            by_name.setdefault(name, user_id)
+
+    resolved = {}
+    for value in identifiers:
+        user_id = by_login.get(value) or by_passport.get(value) or by_name.get(value.lower())
+        if user_id:
+            resolved[value] = user_id
+    return resolved
+
+
+def import_schedule_from_excel(file, dry_run=False):
+    """Dars jadvalini Excel fayldan import qilish.
+
+    Guruh, fan, o'qituvchi va biriktirishlar bir necha so'rovda lug'atlarga yuklanadi, o'qituvchi
+    va guruh vaqt to'qnashuvlari (bazadagi va fayl ichidagi) xotirada aniqlanadi, to'qnashmagan
+    qatorlar bo'laklab bulk insert qilinadi. dry_run=True bo'lsa hech narsa saqlanmaydi -
+    faqat hisobot (qancha qator import qilinadi, xatolar, to'qnashuvlar) qaytariladi.
+    """
     try:
         from openpyxl import load_workbook
-        wb = load_workbook(file)
+        wb = load_workbook(file, read_only=True, data_only=True)
         ws = wb.active
-        
-        success_count = 0
-        errors = []
-        
+    except Exception as e:
+        return {
+            'success': False,
+            'imported': 0,
+            'errors': [f"Fayl formati noto'g'ri yoki o'qishda xatolik: {str(e)}"]
+        }
+
+    from app.models import Group, Subject, Schedule, TeacherSubject
+    from app.utils.schedule_conflicts import IntervalIndex, lesson_interval
+
+    errors = []
+    conflicts = []
+    try:
+        rows = ws.iter_rows(values_only=True)
+
         # Sarlavha qatorini topish (Header Row)
         header_row_index = None
-        for row in ws.iter_rows(min_row=1, max_row=50, values_only=False):
-            # Qatordagi barcha qiymatlarni stringga o'tkazib tekshiramiz
-            row_values = [str(cell.value).strip() if cell.value else "" for cell in row]
+        header_map = {}
+        for row_index, values in enumerate(rows, start=1):
+            row_values = [str(value).strip() if value else "" for value in values]
             if "Guruh" in row_values and "Fan" in row_values:
-                header_row_index = row[0].row # 1-based index
+                header_row_index = row_index
+                header_map = {name: col for col, name in enumerate(row_values) if name}
                 break
-        
+            if row_index >= 50:
+                break
+
         if not header_row_index:
-            return 0, ["Sarlavha qatori topilmadi (Guruh va Fan ustunlari bo'lishi shart)"]
+            return {
+                'success': False,
+                'imported': 0,
+                'errors': ["Sarlavha qatori topilmadi (Guruh va Fan ustunlari bo'lishi shart)"]
+            }
 
-        # Ma'lumotlarni o'qish
-        # Headerdan keyingi qatordan boshlaymiz
-        
-        from app.models import Group, Subject, User, Schedule
-        from sqlalchemy import func
-        from datetime import datetime, time, timedelta
-        
-        # Ustun indekslarini aniqlash (Header row boyicha)
-        header_map = {}
-        for cell in ws[header_row_index]:
-            if cell.value:
-                header_map[str(cell.value).strip()] = cell.column - 1 # 0-based index
-        
         # Kerakli ustunlar indeksi
-        # Agar aniq topilmasa, default indekslarni ishlatamiz (A=0, E=4, F=5...)
-        # Lekin bizning namunada: A=Fakultet, B=Kurs, C=Semestr, D=Yonalish, E=Guruh(4), F=Fan(5), G=Oqituvchi(6), H=Sana(7), I=Vaqt(8), J=Link(9)
-        
+        # Namunada: A=Fakultet, B=Kurs, C=Semestr, D=Yonalish, E=Guruh(4), F=Fan(5), G=Oqituvchi(6), H=Sana(7), I=Vaqt(8), J=Link(9)
         idx_group = header_map.get('Guruh', 4)
         idx_subject = header_map.get('Fan', 5)
         # O'qituvchi har xil yozilishi mumkin
         idx_teacher = header_map.get("O'qituvchi", 6)
         if "O'qituvchi" not in header_map:
-             for k in header_map:
-                 if "qituvchi" in k:
-                     idx_teacher = header_map[k]
-                     break
-        
-        idx_date = header_map.get('Sana (dd.mm.yyyy)', 7)
-        if 'Sana (dd.mm.yyyy)' not in header_map:
-             idx_date = header_map.get('Sana', 7)
-
+            for k in header_map:
+                if "qituvchi" in k:
+                    idx_teacher = header_map[k]
+                    break
+        idx_date = header_map.get('Sana (dd.mm.yyyy)', header_map.get('Sana', 7))
         idx_time = header_map.get('Vaqt', 8)
         idx_link = header_map.get('Link', 9)
 
-        # Iteratsiya
-        for row in ws.iter_rows(min_row=header_row_index + 1, values_only=False):
+        def get_val(values, idx):
+            return values[idx] if idx < len(values) else None
+
+        # 1. Qatorlarni o'qish (faqat qiymatlar)
+        records = []
+        for row_index, values in enumerate(rows, start=header_row_index + 1):
+            group_name = get_val(values, idx_group)
+            subject_name = get_val(values, idx_subject)
+            teacher_identifier = get_val(values, idx_teacher)
+            date_val = get_val(values, idx_date)
+            start_time_val = get_val(values, idx_time)
+
+            # Bo'sh qatorlarni o'tkazib yuborish
+            if not all([group_name, subject_name, teacher_identifier, date_val, start_time_val]):
+                continue
+            records.append((row_index, str(group_name), str(subject_name), str(teacher_identifier).strip(),
+                            date_val, start_time_val, get_val(values, idx_link)))
+
+        # 2. Ma'lumotnomalarni oldindan yuklash
+        groups, subjects = {}, {}
+        for chunk in _chunked({r[1] for r in records}):
+            for group_id, name in Group.query.with_entities(Group.id, Group.name) \
+                    .filter(Group.name.in_(chunk)).order_by(Group.id):
+                groups.setdefault(name, group_id)
+        for chunk in _chunked({r[2] for r in records}):
+            for subject_id, name in Subject.query.with_entities(Subject.id, Subject.name) \
+                    .filter(Subject.name.in_(chunk)).order_by(Subject.id):
+                subjects.setdefault(name, subject_id)
+        teachers = _resolve_teachers({r[3] for r in records})
+
+        assigned_types = {}
+        for chunk in _chunked(set(teachers.values())):
+            for group_id, subject_id, teacher_id, lesson_type in TeacherSubject.query.with_entities(
+                    TeacherSubject.group_id, TeacherSubject.subject_id, TeacherSubject.teacher_id,
+                    TeacherSubject.lesson_type).filter(TeacherSubject.teacher_id.in_(chunk)):
+                if lesson_type:
+                    assigned_types.setdefault((group_id, subject_id, teacher_id), set()).add(
+                        SCHEDULE_LESSON_TYPE_NAMES.get(lesson_type, str(lesson_type).capitalize()))
+
+        # 3. Qatorlarni tekshirish
+        new_rows = []
+        for row_index, group_name, subject_name, teacher_val, date_val, start_time_val, link_val in records:
+            group_id = groups.get(group_name)
+            if not group_id:
+                errors.append(f"Qator {row_index}: Guruh topilmadi - {group_name}")
+                continue
+            subject_id = subjects.get(subject_name)
+            if not subject_id:
+                errors.append(f"Qator {row_index}: Fan topilmadi - {subject_name}")
+                continue
+            teacher_id = teachers.get(teacher_val)
+            if not teacher_id:
+                errors.append(f"Qator {row_index}: O'qituvchi topilmadi - {teacher_val}")
+                continue
+            day = _parse_schedule_date(date_val)
+            if not day:
+                errors.append(f"Qator {row_index}: Sana noto'g'ri formatda - {date_val}")
+                continue
+
+            start_time = _format_schedule_time(start_time_val)
+            # Tugash vaqtini hisoblash (+80 min)
+            end_time = ''
             try:
-                # Helper to safe get value
-                def get_val(idx):
-                    if idx < len(row):
-                        return row[idx].value
-                    return None
-
-                group_name = get_val(idx_group)
-                subject_name = get_val(idx_subject)
-                teacher_identifier = get_val(idx_teacher)
-                date_val = get_val(idx_date)
-                start_time_val = get_val(idx_time)
-                link_val = get_val(idx_link)
-                
-                # Bo'sh qatorlarni o'tkazib yuborish
-                if not all([group_name, subject_name, teacher_identifier, date_val, start_time_val]):
-                    continue
-                    
-                # Guruhni topish
-                group = Group.query.filter_by(name=str(group_name)).first()
-                if not group:
-                    errors.append(f"Qator {row[0].row}: Guruh topilmadi - {group_name}")
-                    continue
-                    
-                # Fanni topish
-                subject = Subject.query.filter_by(name=str(subject_name)).first()
-                if not subject:
-                    errors.append(f"Qator {row[0].row}: Fan topilmadi - {subject_name}")
+                end_time = (datetime.strptime(start_time, '%H:%M') + timedelta(minutes=80)).strftime('%H:%M')
+            except ValueError:
+                pass
+
+            found_types = sorted(assigned_types.get((group_id, subject_id, teacher_id), ()))
+            lesson_type_code = "/".join(found_types) if found_types else 'Ma\'ruza'
+
+            new_rows.append({
+                'row': row_index,
+                'interval': lesson_interval(start_time, end_time),
+                'values': {
+                    'group_id': group_id,
+                    'subject_id': subject_id,
+                    'teacher_id': teacher_id,
+                    'day_of_week': day,  # YYYYMMDD
+                    'start_time': start_time,
+                    'end_time': end_time,
+                    'lesson_type': lesson_type_code[:20],
+                    'link': link_val,
+                    # bulk insert ORM validatorlarini chaqirmaydi
+                    **Schedule.calendar_columns(day, start_time, end_time),
+                },
+            })
+
+        # 4. Vaqt to'qnashuvlari: bazadagi darslar va fayldagi oldingi qatorlar bilan
+        index = IntervalIndex()
+        if new_rows:
+            days = [r['values']['day_of_week'] for r in new_rows]
+            teacher_ids = {r['values']['teacher_id'] for r in new_rows}
+            group_ids = {r['values']['group_id'] for r in new_rows}
+            existing = Schedule.query.with_entities(
+                Schedule.id, Schedule.day_of_week, Schedule.start_time, Schedule.end_time,
+                Schedule.teacher_id, Schedule.group_id, Schedule.subject_id
+            ).filter(
+                Schedule.day_of_week.between(min(days), max(days)),
+                Schedule.teacher_id.in_(teacher_ids) | Schedule.group_id.in_(group_ids)
+            )
+            for schedule_id, day, start, end, teacher_id, group_id, subject_id in existing:
+                interval = lesson_interval(start, end)
+                if not interval:
                     continue
-                    
-                # O'qituvchini topish: Login, Passport yoki To'liq ism bo'yicha
-                teacher_val = str(teacher_identifier).strip()
-                teacher = None
-                
-                # 1. Login bo'yicha
-                teacher = User.query.filter_by(login=teacher_val).first()
-                # 2. Passport bo'yicha
-                if not teacher:
-                     teacher = User.query.filter_by(passport_number=teacher_val).first()
-                # 3. To'liq ism bo'yicha (Case insensitive)
-                if not teacher:
-                     teacher = User.query.filter(func.lower(User.full_name) == func.lower(teacher_val)).first()
-                
-                if not teacher:
-                    errors.append(f"Qator {row[0].row}: O'qituvchi topilmadi - {teacher_val}")
+                label = f"mavjud dars #{schedule_id} ({start})"
+                if teacher_id in teacher_ids:
+                    index.add(('teacher', day, teacher_id), *interval, label, tag=subject_id)
+                if group_id in group_ids:
+                    index.add(('group', day, group_id), *interval, label)
+
+        to_insert = []
+        for record in new_rows:
+            values = record['values']
+            interval = record['interval']
+            if interval:
+                day = values['day_of_week']
+                # Birlashgan ma'ruza (shu fan, aynan shu vaqt, boshqa guruh) jadval formasidagi kabi ruxsat etiladi
+                teacher_clash = index.overlapping(('teacher', day, values['teacher_id']), *interval,
+                                                  tag=values['subject_id'])
+                group_clash = index.overlapping(('group', day, values['group_id']), *interval)
+                if teacher_clash or group_clash:
+                    date_text = f"{day % 100:02d}.{day // 100 % 100:02d}.{day // 10000}"
+                    parts = []
+                    if teacher_clash:
+                        parts.append(f"o'qituvchi band: {', '.join(teacher_clash)}")
+                    if group_clash:
+                        parts.append(f"guruh band: {', '.join(group_clash)}")
+                    conflicts.append(f"Qator {record['row']}: {date_text} {values['start_time']} - " + "; ".join(parts))
                     continue
-                
-                # Sana formatlash
-                day_of_week_int = None
-                if isinstance(date_val, datetime):
-                    day_of_week_int = int(date_val.strftime('%Y%m%d'))
-                elif isinstance(date_val, str):
-                    for fmt in ['%d.%m.%Y', '%Y-%m-%d', '%d/%m/%Y']:
-                        try:
-                            dt = datetime.strptime(date_val, fmt)
-                            day_of_week_int = int(dt.strftime('%Y%m%d'))
-                            break
-                        except ValueError:
-                            continue
-                
-                if not day_of_week_int:
-                     errors.append(f"Qator {row[0].row}: Sana noto'g'ri formatda - {date_val}")
-                     continue
-
-                # Vaqt formatlash
-                def format_time(t):
-                    if isinstance(t, (datetime, time)):
-                        return t.strftime('%H:%M')
-                    return str(t)
-
-                start_time = format_time(start_time_val)
-                # Tugash vaqtini hisoblash (+80 min)
-                end_time = ''
-                try:
-                    st = datetime.strptime(start_time, '%H:%M')
-                    et = st + timedelta(minutes=80)
-                    end_time = et.strftime('%H:%M')
-                except:
-                    pass
-                
-                # O'qituvchiga biriktirilgan barcha dars turlarini topish
-                from app.models import TeacherSubject
-                assigned_types = TeacherSubject.query.filter_by(
-                    group_id=group.id,
-                    subject_id=subject.id,
-                    teacher_id=teacher.id
-                ).all()
-                
-                types_map = {
-                    'maruza': 'Ma\'ruza',
-                    'lecture': 'Ma\'ruza',
-                    'amaliyot': 'Amaliyot',
-                    'practice': 'Amaliyot',
-                    'lab': 'Laboratoriya',
-                    'seminar': 'Seminar'
-                }
-                found_types = sorted(list(set([types_map.get(a.lesson_type, str(a.lesson_type).capitalize()) for a in assigned_types if a.lesson_type])))
-                lesson_type_code = "/".join(found_types) if found_types else 'Ma\'ruza'
-
-                # Jadval yaratish
-                schedule = Schedule(
-                    group_id=group.id,
-                    subject_id=subject.id,
-                    teacher_id=teacher.id,
-                    day_of_week=day_of_week_int, # YYYYMMDD
-                    start_time=start_time,
-                    end_time=end_time,
-                    lesson_type=lesson_type_code[:20],
-                    link=link_val
-                )
-                db.session.add(schedule)
-                success_count += 1
-                
-            except Exception as e:
-                errors.append(f"Qator {row[0].row}: Xatolik - {str(e)}")
-                
-        db.session.commit()
+                label = f"qator {record['row']} ({values['start_time']})"
+                index.add(('teacher', day, values['teacher_id']), *interval, label, tag=values['subject_id'])
+                index.add(('group', day, values['group_id']), *interval, label)
+            to_insert.append(values)
+
+        # 5. Yozish (bo'laklab bulk insert, bitta tranzaksiya)
+        if not dry_run:
+            for chunk in _chunked(to_insert):
+                db.session.bulk_insert_mappings(Schedule, chunk)
+            db.session.commit()
+
         return {
             'success': True,
-            'imported': success_count,
-            'errors': errors
+            'imported': len(to_insert),
+            'dry_run': dry_run,
+            'errors': errors,
+            'conflicts': conflicts
         }
-        
+
     except Exception as e:
+        db.session.rollback()
         return {
             'success': False,
             'imported': 0,
             'errors': [f"Fayl formati noto'g'ri yoki o'qishda xatolik: {str(e)}"]
         }
+    finally:
+        wb.close()
@@ -0,0 +1,70 @@
+"""Shablon bo'laklarini keshlash: {% cache 'nom', kalit1, kalit2 %}...{% endcache %}.
+
+Bo'lak ichidagi HTML faqat berilgan kalitlarga bog'liq bo'lishi kerak (masalan, base.html dagi
+menyu: til, rol va joriy sahifa). Foydalanuvchiga bog'liq qismlar (o'qilmagan xabarlar soni,
+talabaning to'lov sahifasi havolasi) blokdan tashqarida qoldiriladi. Kalitga shablon nomi, qator raqami va url_for natijasi
+o'zgarmasligi uchun request.script_root avtomatik qo'shiladi. Shablonlar faqat qayta ishga
+tushirishda o'zgargani uchun muddat yo'q; TEMPLATES_AUTO_RELOAD (debug) rejimida kesh o'chiq.
+"""
+import threading
+from collections import OrderedDict
+
+from flask import has_request_context, request
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+# Shundan ko'p bo'lak yig'ilsa eng eskisi o'chiriladi
+DEFAULT_MAX_ENTRIES = 2048
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class FragmentCacheExtension(Extension):
+    """Jinja kengaytmasi: {% cache %} bloki natijasini jarayon xotirasida saqlaydi"""
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(
+            fragment_cache_enabled=True,
+            fragment_cache_max_entries=DEFAULT_MAX_ENTRIES,
+        )
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        keys = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            keys.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        args = [nodes.Const(f'{parser.name}:{lineno}'), nodes.Tuple(keys, 'load')]
+        return nodes.CallBlock(self.call_method('_render', args), [], [], body).set_lineno(lineno)
+
+    def _render(self, location, keys, caller):
+        if not self.environment.fragment_cache_enabled:
+            return caller()
+        script_root = request.script_root if has_request_context() else ''
+        key = (location, script_root) + keys
+        with _cache_lock:
+            html = _cache.get(key)
+            if html is not None:
+                _cache.move_to_end(key)
+                return html
+        html = caller()
+        with _cache_lock:
+            _cache[key] = html
+            while len(_cache) > self.environment.fragment_cache_max_entries:
+                _cache.popitem(last=False)
+        return html
+
+
+def init_fragment_cache(app):
+    """Kengaytmani ilovaga ulash (shablonlar yuklanishidan oldin chaqiriladi)"""
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.fragment_cache_enabled = (
+        app.config.get('TEMPLATE_FRAGMENT_CACHE', True) and not app.jinja_env.auto_reload
+    )
+    app.jinja_env.fragment_cache_max_entries = app.config.get(
+        'TEMPLATE_FRAGMENT_CACHE_SIZE', DEFAULT_MAX_ENTRIES
+    )
+
@@ -0,0 +1,122 @@
+"""Guruh baholari matritsasi (talaba × topshiriq).
+
+Fan va guruh uchun barcha javoblar bitta so'rov bilan yuklanadi, har bir katak uchun
+"eng yaxshi" javob tanlanadi va natija jarayon ichida keshlanadi.
+"""
+import threading
+import time
+from collections import namedtuple
+
+from app import db
+from app.models import Assignment, Submission, User
+
+
+# Matritsa katagi: shablonlar faqat .score dan foydalanadi
+GradeCell = namedtuple('GradeCell', ['submission_id', 'score', 'is_active'])
+
+# Boshqa gunicorn worker'larida qilingan o'zgarishlar shu vaqtdan keyin ko'rinadi (soniya)
+CACHE_TTL = 60
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def pick_best_submission(best, candidate):
+    """Ikki javobdan yaxshirog'ini tanlash: eng yuqori ball, aks holda faol javob"""
+    if best is None:
+        return candidate
+    if candidate.score is not None:
+        if best.score is None or candidate.score > best.score:
+            return candidate
+    elif best.score is None and candidate.is_active:
+        return candidate
+    return best
+
+
+class GradeMatrix:
+    """Fan va guruh bo'yicha talaba × topshiriq baholar matritsasi"""
+
+    def __init__(self, subject_id, group_id, cells):
+        self.subject_id = subject_id
+        self.group_id = group_id
+        self.cells = cells  # {student_id: {assignment_id: GradeCell}}
+
+    def get(self, student_id, assignment_id):
+        return self.cells.get(student_id, {}).get(assignment_id)
+
+    def build_rows(self, students, assignments):
+        """Har bir talaba uchun qator: kataklar, ballar ro'yxati, jami va foiz"""
+        rows = []
+        for student in students:
+            student_cells = self.cells.get(student.id, {})
+            row = {
+                'student': student,
+                'submissions': {},
+                'scores': [],
+                'total': 0,
+                'max_total': 0,
+            }
+            for assignment in assignments:
+                cell = student_cells.get(assignment.id)
+                score = cell.score if cell and cell.score is not None else 0
+                row['submissions'][assignment.id] = cell
+                row['scores'].append(score)
+                row['total'] += score
+                row['max_total'] += (assignment.max_score or 0)
+            row['percent'] = (row['total'] / row['max_total']) * 100 if row['max_total'] > 0 else 0
+            rows.append(row)
+        return rows
+
+
+def _load_cells(subject_id, group_id):
+    """Fan va guruh talabalarining barcha javoblarini bitta so'rov bilan yuklash"""
+    rows = db.session.query(
+        Submission.id,
+        Submission.student_id,
+        Submission.assignment_id,
+        Submission.score,
+        Submission.is_active
+    ).join(
+        Assignment, Assignment.id == Submission.assignment_id
+    ).join(
+        User, User.id == Submission.student_id
+    ).filter(
+        Assignment.subject_id == subject_id,
+        User.group_id == group_id
+    ).order_by(Submission.id).all()
+
+    cells = {}
+    for sub_id, student_id, assignment_id, score, is_active in rows:
+        student_cells = cells.setdefault(student_id, {})
+        candidate = GradeCell(sub_id, score, is_active)
+        student_cells[assignment_id] = pick_best_submission(student_cells.get(assignment_id), candidate)
+    return cells
+
+
+def get_grade_matrix(subject_id, group_id):
+    """Keshdan yoki bazadan baholar matritsasini olish"""
+    key = (subject_id, group_id)
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry and now - entry[0] < CACHE_TTL:
+            return entry[1]
+
+    matrix = GradeMatrix(subject_id, group_id, _load_cells(subject_id, group_id))
+    with _cache_lock:
+        _cache[key] = (now, matrix)
+    return matrix
+
+
+def invalidate_grade_matrix(subject_id, group_id=None):
+    """Fan (yoki fan+guruh) bo'yicha keshni tozalash.
+
+    Guruhsiz (umumiy) topshiriqlar bir nechta guruhga tegishli bo'lishi mumkin,
+    shuning uchun group_id berilmasa fanning barcha guruhlari tozalanadi.
+    """
+    with _cache_lock:
+        if group_id is not None:
+            _cache.pop((subject_id, group_id), None)
+            return
+        for key in [k for k in _cache if k[0] == subject_id]:
+            del _cache[key]
@@ -0,0 +1,146 @@
+"""Asosiy sahifalar SQL so'rovlarining indeks auditi (flask db-index-audit).
+
+Har bir rol uchun asosiy sahifalar test client orqali ochiladi, yuborilgan SELECT so'rovlari
+yig'iladi va har biri uchun bazaning reja (plan) chiqishi tekshiriladi:
+- SQLite: EXPLAIN QUERY PLAN -> "SCAN <jadval>" (indeksiz to'liq o'qish)
+- PostgreSQL: EXPLAIN -> "Seq Scan on <jadval>"
+
+Eslatma: PostgreSQL kichik jadvallarda indeks bo'lsa ham Seq Scan tanlashi mumkin, shuning uchun
+auditni haqiqiy hajmdagi ma'lumotlar bilan ishlatish kerak.
+"""
+import re
+from collections import OrderedDict, namedtuple
+
+from flask import g
+from sqlalchemy import event
+
+from app import db
+from app.models import Subject, TeacherSubject, User
+
+# Rol bo'yicha tekshiriladigan sahifalar
+AUDIT_ROUTES = OrderedDict([
+    ('student', ['/dashboard', '/subjects/', '/schedule', '/messages', '/announcements', '/api/messages/unread']),
+    ('teacher', ['/dashboard', '/subjects/', '/schedule', '/messages', '/announcements']),
+    ('dean', ['/dashboard', '/dean/', '/dean/students', '/dean/schedule', '/messages']),
+    ('admin', ['/dashboard', '/admin/users', '/admin/students', '/admin/schedule', '/messages']),
+])
+
+SQLITE_SCAN_RE = re.compile(r'^SCAN (?!CONSTANT ROW)(?:TABLE )?"?(\w+)"?(?!.*\bUSING\b)')
+POSTGRES_SCAN_RE = re.compile(r'Seq Scan on "?(\w+)"?')
+
+ScanFinding = namedtuple('ScanFinding', ['role', 'path', 'tables', 'statement', 'count'])
+
+
+def _teacher_paths(user):
+    """O'qituvchining birinchi fani uchun fan va baholar sahifalari"""
+    ts = TeacherSubject.query.filter_by(teacher_id=user.id).first()
+    if not ts:
+        return []
+    return [f'/subjects/{ts.subject_id}', f'/subjects/grades/{ts.subject_id}/{ts.group_id}']
+
+
+def _student_paths(user):
+    subject = Subject.query.join(TeacherSubject).filter(TeacherSubject.group_id == user.group_id).first() \
+        if user.group_id else None
+    return [f'/subjects/{subject.id}'] if subject else []
+
+
+EXTRA_PATHS = {
+    'teacher': _teacher_paths,
+    'student': _student_paths,
+}
+
+
+def _explain(conn, statement, parameters):
+    """So'rov rejasidan indeksiz o'qiladigan jadvallar ro'yxati"""
+    dialect = conn.dialect.name
+    if dialect == 'sqlite':
+        rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+        details = [row[-1] for row in rows]
+        pattern = SQLITE_SCAN_RE
+    elif dialect == 'postgresql':
+        rows = conn.exec_driver_sql(f'EXPLAIN {statement}', parameters).fetchall()
+        details = [row[0] for row in rows]
+        pattern = POSTGRES_SCAN_RE
+    else:
+        raise RuntimeError(f"{dialect} uchun audit qo'llab-quvvatlanmaydi")
+
+    tables = []
+    for detail in details:
+        match = pattern.search(detail.strip())
+        if match and match.group(1) not in tables:
+            tables.append(match.group(1))
+    return tables
+
+
+def _capture(client, path):
+    """Sahifani ochish va yuborilgan SELECT so'rovlarini yig'ish"""
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith('SELECT'):
+            captured.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(path)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return response.status_code, captured
+
+
+def _login(client, user, role):
+    # CLI buyrug'i ilova kontekstida ishlaydi va test so'rovlari shu g ni ishlatadi
+    g.pop('_login_user', None)
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user.id)
+        sess['_fresh'] = True
+        sess['current_role'] = role
+
+
+def run_index_audit(app, roles=None, extra_paths=None):
+    """Auditni bajarish. (topilmalar ro'yxati, tekshirilgan so'rovlar soni, ogohlantirishlar) qaytaradi.
+
+    Bir xil SQL (faqat parametrlari farq qiladigan) bir marta tekshiriladi; ScanFinding.count
+    uning sahifada necha marta bajarilganini ko'rsatadi (N+1 belgisi).
+    """
+    findings = OrderedDict()
+    warnings = []
+    checked = set()
+    known_tables = set(db.metadata.tables)
+
+    for role, paths in AUDIT_ROUTES.items():
+        if roles and role not in roles:
+            continue
+        user = User.query.filter_by(role=role, is_active=True).first()
+        if not user:
+            warnings.append(f"{role}: faol foydalanuvchi topilmadi")
+            continue
+
+        client = app.test_client()
+        _login(client, user, role)
+        role_paths = list(paths) + EXTRA_PATHS.get(role, lambda u: [])(user) + list(extra_paths or [])
+
+        for path in role_paths:
+            status, statements = _capture(client, path)
+            if status >= 400:
+                warnings.append(f"{role} {path}: HTTP {status}")
+            for statement, parameters in statements:
+                key = (role, path, statement)
+                if key in findings:
+                    findings[key] = findings[key]._replace(count=findings[key].count + 1)
+                    continue
+                if statement in checked:
+                    continue
+                checked.add(statement)
+                with db.engine.connect() as conn:
+                    try:
+                        tables = _explain(conn, statement, parameters)
+                    except Exception as e:
+                        warnings.append(f"{role} {path}: EXPLAIN bajarilmadi: {e}")
+                        continue
+                tables = [t for t in tables if t in known_tables]
+                if tables:
+                    findings[key] = ScanFinding(role, path, tables, ' '.join(statement.split()), 1)
+
+    return list(findings.values()), len(checked), warnings
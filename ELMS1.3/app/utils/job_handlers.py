@@ -0,0 +1,177 @@
+"""Import va eksport fon vazifalari (app.utils.jobs uchun handlerlar)"""
+from datetime import datetime
+
+from sqlalchemy.orm import joinedload
+
+from app.models import Faculty, Group, Schedule, User, UserRole
+from app.utils.jobs import job_handler
+
+
+# ==================== IMPORT ====================
+@job_handler('import_students')
+def import_students(ctx):
+    from app.utils.excel_import import iter_student_import
+
+    state = {}
+    for state in iter_student_import(ctx.input_path, faculty_id=ctx.params.get('faculty_id')):
+        ctx.progress(state.get('processed', 0), state.get('total'), force=state.get('done', False))
+    state.pop('done', None)
+    return state
+
+
+@job_handler('import_staff')
+def import_staff(ctx):
+    from app.utils.excel_import import import_staff_from_excel
+    return import_staff_from_excel(ctx.input_path)
+
+
+@job_handler('import_schedule')
+def import_schedule(ctx):
+    from app.utils.excel_import import import_schedule_from_excel
+    return import_schedule_from_excel(ctx.input_path, dry_run=bool(ctx.params.get('dry_run')))
+
+
+@job_handler('import_curriculum')
+def import_curriculum(ctx):
+    from app.utils.excel_import import import_curriculum_from_excel
+    from app.utils.course_catalogue import invalidate_course_catalogue
+    result = import_curriculum_from_excel(
+        ctx.input_path,
+        ctx.params['direction_id'],
+        enrollment_year=ctx.params.get('enrollment_year'),
+        education_type=ctx.params.get('education_type')
+    )
+    invalidate_course_catalogue()
+    return result
+
+
+@job_handler('import_payments')
+def import_payments(ctx):
+    try:
+        from app.utils.excel_import import import_payments_from_excel
+    except ImportError as e:
+        return {'success': False, 'errors': [f"Excel import funksiyasi ishlamayapti: {str(e)}"]}
+    return import_payments_from_excel(ctx.input_path)
+
+
+# ==================== VIDEO ====================
+@job_handler('transcode_video')
+def transcode_video(ctx):
+    from app.utils.video_transcode import transcode_video as run_transcode
+    return run_transcode(ctx.params['video_file'], progress=lambda done, total: ctx.progress(done, total, force=True))
+
+
+# ==================== EKSPORT ====================
+# Eksportlar qatorlarni server tomonidagi kursor (yield_per) orqali oladi va write_only Excel
+# faylini to'g'ridan-to'g'ri vazifa papkasiga yozadi, shuning uchun xotira qator soniga bog'liq emas.
+EXPORT_BATCH_SIZE = 500
+
+
+@job_handler('export_students')
+def export_students(ctx):
+    from app.utils.excel_export import create_students_excel
+
+    faculty_id = ctx.params.get('faculty_id')
+    faculty = Faculty.query.get(faculty_id) if faculty_id else None
+    if faculty:
+        filename = f"talabalar_{faculty.name.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+    else:
+        filename = f"talabalar_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+    path = ctx.output_path(filename)
+
+    query = User.query.filter(User.role == 'student')
+    if faculty:
+        query = query.join(Group, User.group_id == Group.id).filter(Group.faculty_id == faculty.id)
+    total = query.count()
+    students = query.options(
+        joinedload(User.group).joinedload(Group.faculty),
+        joinedload(User.group).joinedload(Group.direction)
+    ).order_by(User.full_name).yield_per(EXPORT_BATCH_SIZE)
+
+    create_students_excel(ctx.track(students, total), faculty.name if faculty else None, output=path)
+    return {'success': True, 'exported': total}
+
+
+STAFF_ROLES = ['admin', 'dean', 'teacher', 'accounting']
+
+
+@job_handler('export_staff')
+def export_staff(ctx):
+    from app.utils.excel_export import create_staff_excel
+
+    path = ctx.output_path(f"xodimlar_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx")
+
+    # Asosiy roli yoki UserRole orqali qo'shimcha roli xodim bo'lganlar (talabalar emas)
+    multi_role_ids = UserRole.query.with_entities(UserRole.user_id).filter(UserRole.role.in_(STAFF_ROLES))
+    query = User.query.filter(
+        (User.role.in_(STAFF_ROLES)) | (User.id.in_(multi_role_ids)),
+        User.role != 'student'
+    )
+    total = query.count()
+
+    # Xodimlar rollari bitta so'rovda (har bir xodim uchun alohida so'rov o'rniga)
+    roles_by_user = {}
+    for user_id, role in UserRole.query.with_entities(UserRole.user_id, UserRole.role) \
+            .filter(UserRole.user_id.in_(query.with_entities(User.id))):
+        roles_by_user.setdefault(user_id, []).append(role)
+
+    staff_users = query.order_by(User.id).yield_per(EXPORT_BATCH_SIZE)
+    create_staff_excel(ctx.track(staff_users, total), roles_by_user=roles_by_user, output=path)
+    return {'success': True, 'exported': total}
+
+
+def schedule_date_codes(start_date, end_date):
+    """Sana filtri (YYYY-MM-DD) -> day_of_week (YYYYMMDD) oralig'i. Noto'g'ri formatda ValueError."""
+    start_code = int(datetime.strptime(start_date, "%Y-%m-%d").strftime("%Y%m%d")) if start_date else 19000101
+    end_code = int(datetime.strptime(end_date, "%Y-%m-%d").strftime("%Y%m%d")) if end_date else 99991231
+    return start_code, end_code
+
+
+@job_handler('export_schedule')
+def export_schedule(ctx):
+    """params: faculty_id, course_year, semester, direction_id, group_id, teacher_id, start_date, end_date.
+    scope_faculty=True (dekan eksporti): fayl nomiga o'qituvchi ismi har doim qo'shiladi."""
+    from app.utils.excel_export import create_schedule_excel
+
+    p = ctx.params
+    start_code, end_code = schedule_date_codes(p.get('start_date'), p.get('end_date'))
+    query = Schedule.query.join(Group).filter(Schedule.day_of_week.between(start_code, end_code))
+    if p.get('faculty_id'):
+        query = query.filter(Group.faculty_id == p['faculty_id'])
+    if p.get('course_year'):
+        query = query.filter(Group.course_year == p['course_year'])
+    if p.get('direction_id'):
+        query = query.filter(Group.direction_id == p['direction_id'])
+    if p.get('group_id'):
+        query = query.filter(Schedule.group_id == p['group_id'])
+    if p.get('teacher_id'):
+        query = query.filter(Schedule.teacher_id == p['teacher_id'])
+    if p.get('semester'):
+        query = query.filter(Group.semester == p['semester'])
+    total = query.count()
+
+    faculty = Faculty.query.get(p['faculty_id']) if p.get('faculty_id') else None
+    teacher = User.query.get(p['teacher_id']) if p.get('teacher_id') else None
+    first = query.order_by(Schedule.day_of_week, Schedule.start_time).first()
+    group_name = first.group.name if first and first.group else None
+
+    filename_parts = ["dars_jadvali"]
+    by_group = p.get('group_id') and first
+    if by_group:
+        filename_parts.append(group_name or "")
+    elif faculty:
+        filename_parts.append(faculty.name.replace(' ', '_'))
+    if teacher and (p.get('scope_faculty') or not (by_group or faculty)):
+        filename_parts.append(teacher.full_name.replace(' ', '_'))
+    if p.get('start_date') and p.get('end_date'):
+        filename_parts.append(f"{p['start_date']}_{p['end_date']}")
+    path = ctx.output_path("_".join(filter(None, filename_parts)) + ".xlsx")
+
+    schedules = query.options(
+        joinedload(Schedule.group).joinedload(Group.faculty),
+        joinedload(Schedule.group).joinedload(Group.direction),
+        joinedload(Schedule.subject),
+        joinedload(Schedule.teacher)
+    ).order_by(Schedule.day_of_week, Schedule.start_time).yield_per(EXPORT_BATCH_SIZE)
+    create_schedule_excel(ctx.track(schedules, total), group_name, faculty.name if faculty else None, output=path)
+    return {'success': True, 'exported': total}
@@ -0,0 +1,327 @@
+"""Fon vazifalari: uzoq davom etadigan import va eksportlarni so'rovdan tashqarida bajarish.
+
+Vazifa holati BackgroundJob jadvalida saqlanadi (holat, progress, xatolar, tayyor fayl), shuning
+uchun istalgan gunicorn worker uni ko'rsata oladi. Bajarish usuli konfiguratsiyaga bog'liq:
+- JOBS_RUN_IN_PROCESS=True: vazifa shu jarayonning oqimlar pulida (ThreadPoolExecutor) bajariladi;
+- JOBS_RUN_IN_PROCESS=False: vazifa navbatda qoladi va alohida `flask run-jobs` worker uni oladi.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from werkzeug.utils import secure_filename
+
+from app import db
+from app.models import BackgroundJob
+
+# Progress bazaga shu oraliqdan tez-tez yozilmaydi (soniya)
+PROGRESS_WRITE_INTERVAL = 1.0
+
+_handlers = {}
+# Shu jarayonda bajarilayotgan vazifalar progressi: job_id -> (done, total).
+# Boshqa worker'lar progressni bazadagi progress_done/progress_total dan ko'radi (SQLite'da - tugaganda).
+_live_progress = {}
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def job_handler(kind):
+    """Vazifa turini bajaruvchi funksiyani ro'yxatdan o'tkazish"""
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def _load_handlers():
+    # job_handlers shu moduldan job_handler ni import qiladi, shuning uchun kech yuklanadi
+    from app.utils import job_handlers  # noqa: F401
+
+
+def _job_folder(job_id):
+    return os.path.join(current_app.config['JOBS_FOLDER'], job_id)
+
+
+def _heartbeat_path(job_id):
+    return os.path.join(_job_folder(job_id), 'heartbeat')
+
+
+def _touch_heartbeat(job_id):
+    """SQLite: heartbeat vazifa papkasidagi fayl vaqtiga yoziladi (bazani bloklamaydi)"""
+    path = _heartbeat_path(job_id)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a'):
+            os.utime(path)
+    except OSError:
+        pass
+
+
+def _file_heartbeat(job_id):
+    """Fayldagi oxirgi heartbeat (UTC) yoki None"""
+    try:
+        mtime = os.path.getmtime(_heartbeat_path(job_id))
+    except OSError:
+        return None
+    return datetime.fromtimestamp(mtime, timezone.utc).replace(tzinfo=None)
+
+
+class JobContext:
+    """Handler uchun vazifa muhiti: parametrlar, kirish fayli, progress va natija fayli"""
+
+    def __init__(self, job):
+        self.job_id = job.id
+        self.params = job.get_params()
+        self.input_path = job.input_path
+        self.user_id = job.created_by
+        self._last_write = 0.0
+
+    def progress(self, done, total=None, force=False):
+        """Progressni yozish (bazaga bir soniyada ko'pi bilan bir marta)"""
+        if total is None:
+            total = _live_progress.get(self.job_id, (0, None))[1]
+        _live_progress[self.job_id] = (done, total)
+        now = time.monotonic()
+        if not force and now - self._last_write < PROGRESS_WRITE_INTERVAL:
+            return
+        self._last_write = now
+        # SQLite'da handlerning ochiq tranzaksiyasi yoki yield_per kursori boshqa ulanishdan yozishni
+        # bloklaydi, shuning uchun progress jarayon xotirasida qoladi (bazaga vazifa tugaganda yoziladi),
+        # heartbeat esa faylga yoziladi
+        if db.engine.dialect.name == 'sqlite':
+            _touch_heartbeat(self.job_id)
+            return
+        values = {'progress_done': done, 'heartbeat_at': datetime.utcnow()}
+        if total is not None:
+            values['progress_total'] = total
+        # Handlerning ochiq tranzaksiyasiga aralashmaslik uchun alohida ulanish
+        with db.engine.begin() as conn:
+            conn.execute(
+                BackgroundJob.__table__.update().where(BackgroundJob.__table__.c.id == self.job_id).values(**values)
+            )
+
+    def track(self, rows, total, step=500):
+        """Iterable'ni o'tkazib, har `step` qatorda progress yozish (eksportlar uchun)"""
+        self.progress(0, total, force=True)
+        done = 0
+        for row in rows:
+            yield row
+            done += 1
+            if done % step == 0:
+                self.progress(done)
+        self.progress(done, force=True)
+
+    def output_path(self, filename):
+        """Natija fayli yo'li: eksport faylni to'g'ridan-to'g'ri shu yerga yozadi"""
+        folder = _job_folder(self.job_id)
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, secure_filename(filename) or 'natija.xlsx')
+        BackgroundJob.query.filter_by(id=self.job_id).update(
+            {'output_path': path, 'output_name': filename}, synchronize_session=False
+        )
+        db.session.commit()
+        return path
+
+    def save_output(self, data, filename):
+        """Tayyor faylni saqlash (BytesIO yoki bytes)"""
+        path = self.output_path(filename)
+        with open(path, 'wb') as f:
+            if hasattr(data, 'read'):
+                data.seek(0)
+                shutil.copyfileobj(data, f)
+            else:
+                f.write(data)
+        return path
+
+
+def enqueue_job(kind, title, params=None, upload=None, return_url=None, user_id=None):
+    """Vazifani navbatga qo'yish. upload - yuklangan fayl (FileStorage), u diskka saqlanadi."""
+    job_id = uuid.uuid4().hex
+    job = BackgroundJob(
+        id=job_id,
+        kind=kind,
+        title=title,
+        params=json.dumps(params or {}, ensure_ascii=False),
+        return_url=return_url,
+        created_by=user_id,
+    )
+    if upload is not None:
+        folder = _job_folder(job_id)
+        os.makedirs(folder, exist_ok=True)
+        job.input_path = os.path.join(folder, 'input_' + (secure_filename(upload.filename) or 'file.xlsx'))
+        upload.save(job.input_path)
+    db.session.add(job)
+    db.session.commit()
+
+    if current_app.config.get('JOBS_RUN_IN_PROCESS', True):
+        _get_executor().submit(_run_with_app, current_app._get_current_object(), job_id)
+    return job
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=current_app.config.get('JOBS_MAX_WORKERS', 2),
+                thread_name_prefix='job'
+            )
+        return _executor
+
+
+def _run_with_app(app, job_id):
+    with app.app_context():
+        try:
+            run_job(job_id)
+        finally:
+            db.session.remove()
+
+
+def _claim(job_id):
+    """queued -> running (faqat bitta worker oladi)"""
+    now = datetime.utcnow()
+    claimed = BackgroundJob.query.filter_by(id=job_id, status='queued').update(
+        {'status': 'running', 'started_at': now, 'heartbeat_at': now}, synchronize_session=False
+    )
+    db.session.commit()
+    return bool(claimed)
+
+
+def _finish(job_id, status, result=None, errors=None):
+    db.session.rollback()
+    values = {
+        'status': status,
+        'result': json.dumps(result or {}, ensure_ascii=False, default=str),
+        'errors': json.dumps(errors or [], ensure_ascii=False),
+        'finished_at': datetime.utcnow(),
+    }
+    live = _live_progress.pop(job_id, None)
+    if live:
+        values['progress_done'] = live[0]
+        if live[1] is not None:
+            values['progress_total'] = live[1]
+    BackgroundJob.query.filter_by(id=job_id).update(values, synchronize_session=False)
+    db.session.commit()
+
+
+def run_job(job_id):
+    """Vazifani bajarish. Handler natija lug'atini qaytaradi ('success', 'errors' va boshqalar)."""
+    if not _claim(job_id):
+        return
+    _live_progress[job_id] = (0, None)
+    job = db.session.get(BackgroundJob, job_id)
+    _load_handlers()
+    handler = _handlers.get(job.kind)
+    if handler is None:
+        _finish(job_id, 'failed', errors=[f"Noma'lum vazifa turi: {job.kind}"])
+        return
+
+    try:
+        result = handler(JobContext(job)) or {}
+    except Exception as e:
+        current_app.logger.exception(f"Fon vazifasi xatosi ({job.kind} {job_id})")
+        _finish(job_id, 'failed', errors=[str(e)])
+        return
+
+    errors = result.pop('errors', [])
+    status = 'done' if result.pop('success', True) else 'failed'
+    _finish(job_id, status, result=result, errors=errors)
+
+
+def run_pending_jobs(poll_interval=2.0, once=False):
+    """`flask run-jobs` worker sikli: navbatdagi vazifalarni eskisidan boshlab bajarish"""
+    fail_stale_jobs()
+    while True:
+        job_ids = [row[0] for row in db.session.query(BackgroundJob.id).filter_by(status='queued')
+                   .order_by(BackgroundJob.created_at).limit(10).all()]
+        db.session.commit()
+        for job_id in job_ids:
+            run_job(job_id)
+        if once:
+            return
+        if not job_ids:
+            time.sleep(poll_interval)
+
+
+def _stale_limit():
+    return datetime.utcnow() - timedelta(seconds=current_app.config.get('JOBS_STALE_AFTER', 1800))
+
+
+def fail_stale_jobs(job_id=None):
+    """Uzoq vaqt progress yozmagan (jarayon qayta ishga tushgan) vazifalarni xato deb belgilash.
+    Ilova ishga tushganda, `flask run-jobs` boshlanganda va holat so'ralganda chaqiriladi."""
+    limit = _stale_limit()
+    query = BackgroundJob.query.filter(
+        BackgroundJob.status == 'running',
+        BackgroundJob.heartbeat_at < limit
+    )
+    if job_id is not None:
+        query = query.filter(BackgroundJob.id == job_id)
+    # Shu jarayonda bajarilayotganlari tirik (heartbeat uzoq tranzaksiya tufayli kechikkan bo'lishi mumkin)
+    running_here = list(_live_progress)
+    if running_here:
+        query = query.filter(BackgroundJob.id.notin_(running_here))
+    # SQLite: boshqa jarayon heartbeat'ni faylga yozadi
+    stale_ids = []
+    for (stale_id,) in query.with_entities(BackgroundJob.id).all():
+        file_heartbeat = _file_heartbeat(stale_id)
+        if file_heartbeat is None or file_heartbeat < limit:
+            stale_ids.append(stale_id)
+    stale = 0
+    if stale_ids:
+        stale = BackgroundJob.query.filter(
+            BackgroundJob.id.in_(stale_ids),
+            BackgroundJob.status == 'running'
+        ).update({
+            'status': 'failed',
+            'errors': json.dumps(["Vazifa to'xtab qoldi (server qayta ishga tushgan bo'lishi mumkin)"], ensure_ascii=False),
+            'finished_at': datetime.utcnow(),
+        }, synchronize_session=False)
+    db.session.commit()
+    return stale
+
+
+def cleanup_old_jobs():
+    """Eski tugagan vazifalar va ularning fayllarini o'chirish"""
+    limit = datetime.utcnow() - timedelta(days=current_app.config.get('JOBS_KEEP_DAYS', 7))
+    old_jobs = BackgroundJob.query.filter(
+        BackgroundJob.status.in_(['done', 'failed']),
+        BackgroundJob.finished_at < limit
+    ).all()
+    for job in old_jobs:
+        shutil.rmtree(_job_folder(job.id), ignore_errors=True)
+        db.session.delete(job)
+    db.session.commit()
+    return len(old_jobs)
+
+
+def job_status(job):
+    """Polling uchun vazifa holati (JSON)"""
+    if job.status == 'running' and job.heartbeat_at and job.heartbeat_at < _stale_limit():
+        if fail_stale_jobs(job.id):
+            db.session.refresh(job)
+    done, total = job.progress_done or 0, job.progress_total or 0
+    live = _live_progress.get(job.id) if job.status == 'running' else None
+    if live:
+        done, total = live[0], live[1] or total
+    percent = job.percent if job.status != 'running' else (min(100, int(done * 100 / total)) if total else 0)
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'title': job.title,
+        'status': job.status,
+        'progress_done': done,
+        'progress_total': total,
+        'percent': percent,
+        'result': job.get_result(),
+        'errors': job.get_errors(),
+        'has_output': job.status == 'done' and bool(job.output_path),
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
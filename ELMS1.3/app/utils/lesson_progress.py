@@ -0,0 +1,78 @@
+"""Talabaning video darslar bo'yicha progressi: qaysi darslar qulflangan.
+
+Videoli dars oldingi (tartib raqami kichikroq) barcha videoli darslar to'liq ko'rilgandan keyin
+ochiladi. Ketma-ketlikdagi darslar va talabaning tugatgan darslari ikki so'rovda olinadi, qulf
+holati esa birinchi tugatilmagan dars tartib raqami orqali bitta o'tishda hisoblanadi (har bir
+oldingi dars uchun alohida so'rov o'rniga).
+"""
+from app import db
+from app.models import Lesson, LessonView
+
+
+def has_video(lesson):
+    """Darsda video bormi (fayl yoki tashqi havola)"""
+    return bool(lesson.video_file or lesson.video_url)
+
+
+def completed_lesson_ids(student_id, lesson_ids):
+    """Talaba to'liq ko'rgan darslar ID lari (bitta so'rov)"""
+    lesson_ids = list(lesson_ids)
+    if not lesson_ids:
+        return set()
+    rows = db.session.query(LessonView.lesson_id).filter(
+        LessonView.student_id == student_id,
+        LessonView.lesson_id.in_(lesson_ids),
+        LessonView.is_completed.is_(True)
+    ).distinct()
+    return {row[0] for row in rows}
+
+
+def first_incomplete_order(lessons, completed_ids):
+    """Ketma-ketlikdagi birinchi tugatilmagan videoli dars tartib raqami (hammasi tugatilgan bo'lsa None).
+
+    Undan katta tartib raqamli videoli darslar qulflangan; bu raqamgacha bo'lganlari ochiq.
+    """
+    orders = [l.order for l in lessons
+              if l.order is not None and has_video(l) and l.id not in completed_ids]
+    return min(orders) if orders else None
+
+
+def is_locked_by(lesson, incomplete_order):
+    """Dars birinchi tugatilmagan darsdan keyin keladimi (tartib raqami teng darslar bir-birini qulflamaydi)"""
+    return (has_video(lesson) and lesson.order is not None
+            and incomplete_order is not None and incomplete_order < lesson.order)
+
+
+def _sequence_rows(*criteria):
+    return db.session.query(
+        Lesson.id, Lesson.order, Lesson.lesson_type, Lesson.video_file, Lesson.video_url
+    ).filter(*criteria).all()
+
+
+def subject_lock_states(student_id, subject_id, group_id, lessons):
+    """Fan sahifasi uchun {lesson_id: qulflanganmi}: har bir dars turi guruh (yoki umumiy)
+    darslari bo'yicha alohida ketma-ketlik"""
+    rows = _sequence_rows(
+        Lesson.subject_id == subject_id,
+        (Lesson.group_id == group_id) | (Lesson.group_id.is_(None))
+    )
+    completed = completed_lesson_ids(student_id, [r.id for r in rows if has_video(r)])
+    by_type = {}
+    for row in rows:
+        by_type.setdefault(row.lesson_type, []).append(row)
+    incomplete = {lesson_type: first_incomplete_order(sequence, completed)
+                  for lesson_type, sequence in by_type.items()}
+    return {lesson.id: is_locked_by(lesson, incomplete.get(lesson.lesson_type)) for lesson in lessons}
+
+
+def is_lesson_locked(student_id, lesson):
+    """Dars sahifasi va fayllari uchun: fan va yo'nalish bo'yicha oldingi videoli darslar tugatilganmi"""
+    if not has_video(lesson) or lesson.order is None:
+        return False
+    rows = _sequence_rows(
+        Lesson.subject_id == lesson.subject_id,
+        Lesson.direction_id == lesson.direction_id,
+        Lesson.order < lesson.order
+    )
+    completed = completed_lesson_ids(student_id, [r.id for r in rows if has_video(r)])
+    return is_locked_by(lesson, first_incomplete_order(rows, completed))
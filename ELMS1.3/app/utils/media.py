@@ -0,0 +1,74 @@
+"""Yuklangan media (dars videolari va fayllari) ni uzatish.
+
+Ruxsat Flask'da tekshiriladi, baytlarni uzatish esa MEDIA_OFFLOAD ga bog'liq:
+- '' (standart): werkzeug send_file - Range (206), ETag/Last-Modified (304) bilan;
+- 'x-accel': javob faqat X-Accel-Redirect sarlavhasi, faylni nginx uzatadi. nginx'da
+  MEDIA_ACCEL_PREFIX uchun `internal` location UPLOAD_FOLDER ga `alias` qilinadi;
+- 'x-sendfile': X-Sendfile sarlavhasi (Apache mod_xsendfile, lighttpd).
+
+uuid bilan nomlangan fayllar va ombordagi blob lar (nomi - mazmun xeshi) o'zgarmaydi, shuning uchun ular
+brauzerda uzoq muddat keshlanadi; boshqa fayllar har safar ETag orqali qayta tekshiriladi.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from flask import abort, current_app, request
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+
+# HLS fayllari (video_transcode) uchun turlar barcha tizimlarda ham ro'yxatda bo'lmaydi
+mimetypes.add_type('application/vnd.apple.mpegurl', '.m3u8')
+mimetypes.add_type('video/mp2t', '.ts')
+
+# uuid4().hex + kengaytma - yuklashda beriladigan o'zgarmas nom; 64 belgili - blob (SHA-256)
+IMMUTABLE_NAME = re.compile(r'^([0-9a-f]{32}\.[A-Za-z0-9]+|[0-9a-f]{64})$')
+
+
+def send_media(folder, filename, as_attachment=False, download_name=None):
+    """UPLOAD_FOLDER ichidagi faylni offload rejimiga mos ravishda uzatish"""
+    path = safe_join(folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    mode = current_app.config.get('MEDIA_OFFLOAD') or ''
+    if mode == 'x-accel':
+        response = _accel_response(path, as_attachment, download_name or filename)
+    else:
+        response = send_file(
+            path,
+            request.environ,
+            as_attachment=as_attachment,
+            download_name=download_name or filename,
+            conditional=True,
+            etag=True,
+            use_x_sendfile=(mode == 'x-sendfile'),
+            response_class=current_app.response_class,
+        )
+        if mode != 'x-sendfile':
+            # Pleyerlar oldinga-orqaga o'tkazish uchun Range qo'llab-quvvatlanishini shu sarlavhadan biladi
+            response.accept_ranges = 'bytes'
+
+    # Fayllar login orqali beriladi - faqat brauzer keshi (private), umumiy proksilar emas
+    response.cache_control.private = True
+    response.cache_control.public = False
+    if IMMUTABLE_NAME.match(filename):
+        response.cache_control.max_age = current_app.config.get('MEDIA_MAX_AGE', 365 * 24 * 3600)
+        response.cache_control.immutable = True
+        response.cache_control.no_cache = None
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+def _accel_response(path, as_attachment, download_name):
+    relative = os.path.relpath(path, current_app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+    prefix = current_app.config.get('MEDIA_ACCEL_PREFIX', '/protected-uploads/').rstrip('/')
+    response = current_app.response_class()
+    response.headers['X-Accel-Redirect'] = f"{prefix}/{quote(relative)}"
+    # Content-Type, uzunlik, Range va ETag'ni nginx o'zi qo'yadi; turini aniq bo'lsa ko'rsatamiz
+    response.mimetype = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+    if as_attachment:
+        response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    return response
@@ -0,0 +1,237 @@
+"""Xabarlar hisoblagichlari va suhbatlar indeksi.
+
+O'qilmagan xabarlar soni UnreadMessageCounter jadvalida saqlanadi va xabar yuborilganda /
+o'qilganda atomar UPDATE bilan o'zgartiriladi. Hisoblagich birinchi xabar kelganda yaratiladi;
+o'qish (sahifa chizilayotganda) hech narsa yozmaydi - qator yo'q bo'lsa 0. Eski ma'lumotlar uchun
+yetishmayotgan hisoblagichlar ilova ishga tushganda to'ldiriladi (ensure_unread_counters).
+
+Conversation jadvali har bir juftlik uchun oxirgi xabar va har ikki tomonning o'qilmagan
+xabarlari sonini saqlaydi - xabarlar sahifasi barcha xabarlarni o'qimaydi.
+"""
+from datetime import datetime
+
+from sqlalchemy import case, func, or_
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import Conversation, Message, UnreadMessageCounter, User
+
+# Xabarlar sahifasida suhbatlar soni va chat tarixidagi bir sahifa xabarlar soni
+CONVERSATIONS_PER_PAGE = 30
+CHAT_PAGE_SIZE = 50
+
+
+def _count_unread(user_id):
+    return Message.query.filter_by(receiver_id=user_id, is_read=False).count()
+
+
+def _ensure_counter(user_id):
+    """Hisoblagich qatorini yaratish (Message jadvalidan hisoblab)"""
+    counter = UnreadMessageCounter(user_id=user_id, unread_count=_count_unread(user_id))
+    db.session.add(counter)
+    db.session.flush()
+    return counter
+
+
+def get_unread_count(user_id):
+    """O'qilmagan xabarlar soni (bitta indekslangan qator; yozmaydi)"""
+    counter = db.session.get(UnreadMessageCounter, user_id)
+    return counter.unread_count if counter is not None else 0
+
+
+def _add_unread(user_id, amount):
+    return UnreadMessageCounter.query.filter_by(user_id=user_id).update(
+        {UnreadMessageCounter.unread_count: UnreadMessageCounter.unread_count + amount},
+        synchronize_session=False
+    )
+
+
+def increment_unread(user_id, amount=1):
+    """Yangi xabar qabul qilinganda (commit chaqiruvchi tomonidan qilinadi)"""
+    if _add_unread(user_id, amount):
+        return
+    # Yangi xabar allaqachon flush qilingan bo'lsa, hisobga kiradi
+    db.session.flush()
+    try:
+        with db.session.begin_nested():
+            _ensure_counter(user_id)
+    except IntegrityError:
+        # Parallel so'rov qatorni shu orada yaratdi
+        _add_unread(user_id, amount)
+
+
+def ensure_unread_counters():
+    """O'qilmagan xabari bor, lekin hisoblagichi yo'q foydalanuvchilar uchun qator yaratish"""
+    missing = [row[0] for row in db.session.query(Message.receiver_id).outerjoin(
+        UnreadMessageCounter, UnreadMessageCounter.user_id == Message.receiver_id
+    ).filter(
+        Message.is_read == False,
+        UnreadMessageCounter.user_id.is_(None)
+    ).distinct()]
+    for user_id in missing:
+        _ensure_counter(user_id)
+    db.session.commit()
+    return len(missing)
+
+
+def decrement_unread(user_id, amount):
+    """Xabarlar o'qilgan deb belgilanganda (commit chaqiruvchi tomonidan qilinadi)"""
+    if amount <= 0:
+        return
+    new_value = UnreadMessageCounter.unread_count - amount
+    UnreadMessageCounter.query.filter_by(user_id=user_id).update(
+        {UnreadMessageCounter.unread_count: case((new_value < 0, 0), else_=new_value)},
+        synchronize_session=False
+    )
+
+
+def rebuild_unread_counters(user_id=None):
+    """Hisoblagichlarni Message jadvalidan qayta tiklash. Tiklangan qatorlar sonini qaytaradi."""
+    query = db.session.query(Message.receiver_id, func.count(Message.id)).filter(Message.is_read == False)
+    if user_id is not None:
+        query = query.filter(Message.receiver_id == user_id)
+    counts = dict(query.group_by(Message.receiver_id).all())
+
+    counters = UnreadMessageCounter.query
+    if user_id is not None:
+        counters = counters.filter_by(user_id=user_id)
+    existing = {c.user_id: c for c in counters.all()}
+
+    for uid, counter in existing.items():
+        counter.unread_count = counts.pop(uid, 0)
+    for uid, count in counts.items():
+        db.session.add(UnreadMessageCounter(user_id=uid, unread_count=count))
+    db.session.commit()
+    return len(existing) + len(counts)
+
+
+def record_message(message):
+    """Yangi xabarni suhbat indeksiga va qabul qiluvchi hisoblagichiga yozish (commit chaqiruvchida)"""
+    db.session.flush()
+    low_id, high_id = Conversation.pair(message.sender_id, message.receiver_id)
+    unread_col = Conversation.unread_low if message.receiver_id == low_id else Conversation.unread_high
+    updated = Conversation.query.filter_by(user_low_id=low_id, user_high_id=high_id).update({
+        Conversation.last_message_id: message.id,
+        Conversation.last_message_at: message.created_at,
+        unread_col: unread_col + 1,
+    }, synchronize_session=False)
+    if not updated:
+        conversation = Conversation(user_low_id=low_id, user_high_id=high_id,
+                                    last_message_id=message.id, last_message_at=message.created_at)
+        if message.receiver_id == low_id:
+            conversation.unread_low = 1
+        else:
+            conversation.unread_high = 1
+        db.session.add(conversation)
+    increment_unread(message.receiver_id)
+
+
+def mark_conversation_read(user_id, other_user_id):
+    """other_user_id dan kelgan xabarlarni o'qilgan deb belgilash (commit chaqiruvchida)"""
+    read_count = Message.query.filter_by(
+        sender_id=other_user_id, receiver_id=user_id, is_read=False
+    ).update({'is_read': True}, synchronize_session=False)
+    if not read_count:
+        return 0
+    low_id, high_id = Conversation.pair(user_id, other_user_id)
+    unread_col = Conversation.unread_low if user_id == low_id else Conversation.unread_high
+    Conversation.query.filter_by(user_low_id=low_id, user_high_id=high_id).update(
+        {unread_col: 0}, synchronize_session=False
+    )
+    decrement_unread(user_id, read_count)
+    return read_count
+
+
+def _user_conversations(user_id):
+    return Conversation.query.filter(
+        or_(Conversation.user_low_id == user_id, Conversation.user_high_id == user_id)
+    )
+
+
+def get_inbox_page(user_id, page=1, per_page=CONVERSATIONS_PER_PAGE):
+    """Xabarlar sahifasi: suhbatlar sahifasi va har bir suhbat uchun ma'lumot.
+
+    Foydalanuvchilar va oxirgi xabarlar bitta-bitta emas, IN (...) so'rovlari bilan yuklanadi.
+    """
+    conversations = _user_conversations(user_id).order_by(
+        Conversation.last_message_at.desc(), Conversation.id.desc()
+    ).paginate(page=page, per_page=per_page, error_out=False)
+
+    items = conversations.items
+    other_ids = {c.other_user_id(user_id) for c in items}
+    message_ids = {c.last_message_id for c in items if c.last_message_id}
+    users = {u.id: u for u in User.query.filter(User.id.in_(other_ids)).all()} if other_ids else {}
+    last_messages = {m.id: m for m in Message.query.filter(Message.id.in_(message_ids)).all()} if message_ids else {}
+
+    chats = []
+    for c in items:
+        other_user = users.get(c.other_user_id(user_id))
+        if not other_user:
+            continue
+        chats.append({
+            'user': other_user,
+            'last_message': last_messages.get(c.last_message_id),
+            'unread_count': c.unread_for(user_id),
+        })
+    return conversations, chats
+
+
+def get_conversation_partner_ids(user_id):
+    """Foydalanuvchi suhbatlashgan barcha foydalanuvchilar id lari"""
+    other_id = case(
+        (Conversation.user_low_id == user_id, Conversation.user_high_id),
+        else_=Conversation.user_low_id
+    )
+    return {row[0] for row in db.session.query(other_id).filter(
+        or_(Conversation.user_low_id == user_id, Conversation.user_high_id == user_id)
+    ).all()}
+
+
+def get_chat_history(user_id, other_user_id, before_id=None, limit=CHAT_PAGE_SIZE):
+    """Chat tarixining bir sahifasi (keyset: id < before_id).
+
+    (xabarlar eskidan yangiga, oldingi sahifa uchun cursor yoki None) qaytaradi.
+    """
+    query = Message.query.filter(or_(
+        (Message.sender_id == user_id) & (Message.receiver_id == other_user_id),
+        (Message.sender_id == other_user_id) & (Message.receiver_id == user_id)
+    ))
+    if before_id:
+        query = query.filter(Message.id < before_id)
+    rows = query.order_by(Message.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    rows.reverse()
+    before_cursor = rows[0].id if has_more and rows else None
+    return rows, before_cursor
+
+
+def rebuild_conversations():
+    """Conversation jadvalini Message jadvalidan qayta qurish. Suhbatlar sonini qaytaradi."""
+    low = case((Message.sender_id <= Message.receiver_id, Message.sender_id), else_=Message.receiver_id)
+    high = case((Message.sender_id <= Message.receiver_id, Message.receiver_id), else_=Message.sender_id)
+    unread = Message.is_read == False
+    rows = db.session.query(
+        low.label('low'),
+        high.label('high'),
+        func.max(Message.id),
+        func.sum(case((unread & (Message.receiver_id == low), 1), else_=0)),
+        func.sum(case((unread & (Message.receiver_id != low), 1), else_=0)),
+    ).group_by(low, high).all()
+
+    last_ids = [row[2] for row in rows]
+    created = dict(
+        db.session.query(Message.id, Message.created_at).filter(Message.id.in_(last_ids)).all()
+    ) if last_ids else {}
+
+    Conversation.query.delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(Conversation, [{
+        'user_low_id': low_id,
+        'user_high_id': high_id,
+        'last_message_id': last_id,
+        'last_message_at': created.get(last_id) or datetime.utcnow(),
+        'unread_low': unread_low or 0,
+        'unread_high': unread_high or 0,
+    } for low_id, high_id, last_id, unread_low, unread_high in rows])
+    db.session.commit()
+    return len(rows)
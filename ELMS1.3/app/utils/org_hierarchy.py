@@ -0,0 +1,208 @@
+"""Tashkiliy tuzilma: fakultet -> kurs -> semestr -> ta'lim shakli -> yo'nalish -> guruh.
+
+Dars jadvali sahifalari (admin va dekan: ko'rish, qo'shish, tahrirlash) va filtr API lari shu
+daraxtni o'qiydi. Guruhlar yo'nalishi va talabalar soni bilan bitta JOIN so'rovda olinadi va
+o'zgarmas, versiyalangan snapshot sifatida jarayon xotirasida saqlanadi; sahifalar uchun
+ko'rinishlar (fakultet bo'yicha) snapshot ichida bir marta hisoblanadi. Guruh, yo'nalish yoki
+fakultet yaratilganda, o'zgartirilganda yoki o'chirilganda invalidate_org_hierarchy() chaqiriladi;
+boshqa worker'lardagi o'zgarishlar va talabalar tarkibi CACHE_TTL dan keyin ko'rinadi.
+"""
+import threading
+import time
+from collections import namedtuple
+
+from app import db
+from app.models import Direction, DirectionCurriculum, Faculty, Group, Subject, TeacherSubject, User
+
+# Boshqa gunicorn worker'larida qilingan o'zgarishlar shu vaqtdan keyin ko'rinadi (soniya)
+CACHE_TTL = 60
+
+FacultyNode = namedtuple('FacultyNode', 'id name code')
+DirectionNode = namedtuple('DirectionNode', 'id name code')
+GroupNode = namedtuple(
+    'GroupNode',
+    'id name faculty_id course_year semester education_type enrollment_year direction students_count'
+)
+
+_cache = {}
+_cache_lock = threading.Lock()
+_generation = 0  # invalidate_org_hierarchy() chaqiruvlari soni
+_version = 0  # qurilgan snapshot'lar soni
+
+
+class FrozenDict(dict):
+    """O'zgartirib bo'lmaydigan dict (tojson uchun oddiy dict kabi seriyalanadi)"""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Tuzilma snapshot'ini o'zgartirib bo'lmaydi")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return FrozenDict((key, _freeze(item)) for key, item in value.items())
+    if type(value) in (list, tuple):  # namedtuple tugunlari o'zgarishsiz qoladi
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class OrgHierarchy:
+    """Bir lahzadagi tuzilma. Guruhlar id tartibida (avvalgi Group.query.all() kabi)."""
+
+    def __init__(self, version, faculties, groups):
+        self.version = version
+        self.faculties = tuple(faculties)
+        self.groups = tuple(groups)
+        self.groups_by_id = FrozenDict((group.id, group) for group in self.groups)
+        self._views = {}
+        self._views_lock = threading.Lock()
+
+    def group(self, group_id):
+        return self.groups_by_id.get(group_id)
+
+    def _view(self, key, build):
+        with self._views_lock:
+            if key in self._views:
+                return self._views[key]
+        value = _freeze(build())
+        with self._views_lock:
+            return self._views.setdefault(key, value)
+
+    def _groups(self, faculty_id, active_only):
+        return [
+            group for group in self.groups
+            if (faculty_id is None or group.faculty_id == faculty_id)
+            and (not active_only or group.students_count)
+        ]
+
+    def filter_options(self, faculty_id=None):
+        """Jadval sahifasidagi filtrlar - talabasi bor guruhlardan kurslar, semestrlar, yo'nalishlar va guruhlar"""
+        def build():
+            groups = self._groups(faculty_id, True)
+            directions = {group.direction.id: group.direction for group in groups if group.direction}
+            return {
+                'courses': sorted({group.course_year for group in groups if group.course_year}),
+                'semesters': sorted({group.semester for group in groups if group.semester}),
+                'directions': sorted(directions.values(), key=lambda d: d.name),
+                'groups': sorted(groups, key=lambda g: g.name),
+            }
+        return self._view(('filters', faculty_id), build)
+
+    def schedule_tree(self, faculty_id=None, active_only=True):
+        """Bog'langan tanlovlar (kurs -> semestr -> ta'lim shakli -> yo'nalish -> guruh) uchun daraxt.
+        faculty_id=None - barcha fakultetlar, kalitlari fakultet id (admin sahifalari);
+        faculty_id berilsa - shu fakultet darajasi ochilgan holda (dekan sahifalari)."""
+        def build():
+            faculty_ids = [faculty_id] if faculty_id is not None else [f.id for f in self.faculties]
+            faculty_courses = {fid: set() for fid in faculty_ids}
+            faculty_course_semesters = {fid: {} for fid in faculty_ids}
+            education_directions = {fid: {} for fid in faculty_ids}
+            direction_groups = {}
+
+            for group in self._groups(faculty_id, active_only):
+                fid = group.faculty_id
+                course = group.course_year
+                if fid not in faculty_courses or not course:
+                    continue
+                faculty_courses[fid].add(course)
+                direction = group.direction
+                if direction is None:
+                    continue
+                semester = group.semester
+                faculty_course_semesters[fid].setdefault(course, set()).add(semester)
+
+                etype = group.education_type or 'kunduzgi'
+                items = education_directions[fid].setdefault(semester, {}).setdefault(course, {}).setdefault(etype, [])
+                if not any(item['id'] == direction.id for item in items):
+                    items.append({
+                        'id': direction.id,
+                        'name': direction.name,
+                        'code': direction.code,
+                        'enrollment_year': group.enrollment_year,
+                        'education_type': etype
+                    })
+                direction_groups.setdefault(direction.id, []).append({'id': group.id, 'name': group.name})
+
+            tree = {
+                'faculty_courses': {fid: sorted(courses) for fid, courses in faculty_courses.items()},
+                'faculty_course_semesters': {
+                    fid: {course: sorted(semesters) for course, semesters in by_course.items()}
+                    for fid, by_course in faculty_course_semesters.items()
+                },
+                'faculty_course_semester_education_directions': education_directions,
+                'direction_groups': direction_groups,
+            }
+            if faculty_id is not None:
+                for key in ('faculty_courses', 'faculty_course_semesters', 'faculty_course_semester_education_directions'):
+                    tree[key] = tree[key][faculty_id]
+            return tree
+        return self._view(('tree', faculty_id, active_only), build)
+
+
+def _build(version):
+    counts = db.session.query(
+        User.group_id.label('group_id'), db.func.count(User.id).label('students_count')
+    ).filter(User.group_id.isnot(None)).group_by(User.group_id).subquery()
+    rows = db.session.query(
+        Group.id, Group.name, Group.faculty_id, Group.course_year, Group.semester,
+        Group.education_type, Group.enrollment_year,
+        Direction.id, Direction.name, Direction.code, counts.c.students_count
+    ).outerjoin(
+        Direction, Group.direction_id == Direction.id
+    ).outerjoin(
+        counts, counts.c.group_id == Group.id
+    ).order_by(Group.id)
+
+    groups = []
+    for (group_id, name, faculty_id, course_year, semester, education_type, enrollment_year,
+         direction_id, direction_name, direction_code, students_count) in rows:
+        direction = DirectionNode(direction_id, direction_name, direction_code) if direction_id else None
+        groups.append(GroupNode(group_id, name, faculty_id, course_year, semester, education_type,
+                                enrollment_year, direction, students_count or 0))
+    faculties = [FacultyNode(*row) for row in db.session.query(Faculty.id, Faculty.name, Faculty.code).order_by(Faculty.name)]
+    return OrgHierarchy(version, faculties, groups)
+
+
+def group_semester_subjects(group):
+    """Guruhga biriktirilgan, o'quv reja bo'yicha joriy semestrida bor fanlar (jadval filtrlari uchun)"""
+    if group.direction is None:
+        return []
+    rows = db.session.query(Subject.id, Subject.name, Subject.code).join(
+        TeacherSubject, TeacherSubject.subject_id == Subject.id
+    ).join(
+        DirectionCurriculum, DirectionCurriculum.subject_id == Subject.id
+    ).filter(
+        TeacherSubject.group_id == group.id,
+        DirectionCurriculum.direction_id == group.direction.id,
+        DirectionCurriculum.semester == (group.semester or 1)
+    ).distinct()
+    return sorted(({'id': id, 'name': name, 'code': code} for id, name, code in rows), key=lambda x: x['name'])
+
+
+def get_org_hierarchy():
+    """Joriy snapshot (eskirgan yoki bekor qilingan bo'lsa qayta quriladi)"""
+    global _version
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get('snapshot')
+        if entry and now - entry[0] < CACHE_TTL:
+            return entry[1]
+        generation = _generation
+        _version += 1
+        version = _version
+    snapshot = _build(version)
+    with _cache_lock:
+        # Qurish davomida bekor qilingan bo'lsa eski ma'lumotni keshga qo'ymaymiz
+        if generation == _generation:
+            _cache['snapshot'] = (now, snapshot)
+    return snapshot
+
+
+def invalidate_org_hierarchy():
+    """Guruh, yo'nalish yoki fakultet o'zgarganda (commit dan keyin)"""
+    global _generation
+    with _cache_lock:
+        _generation += 1
+        _cache.clear()
@@ -0,0 +1,63 @@
+"""Dars jadvalining oylik kalendari.
+
+Schedule.lesson_date (DATE) va lesson_start (TIME) ustunlari day_of_week (YYYYMMDD) va start_time
+matnidan to'ldiriladi. Oy ko'rinishi shu ustunlar bo'yicha bitta oraliq so'rovi bilan olinadi
+(ix_schedule_group_date, ix_schedule_teacher_date, ix_schedule_date_group) va kunlarga ajratiladi.
+"""
+import calendar
+from datetime import date
+
+from sqlalchemy import or_, update
+
+from app import db
+from app.models import Schedule
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def month_bounds(year, month):
+    """Oyning birinchi va oxirgi kuni"""
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def month_schedule(query, year, month, date_from=None, date_to=None):
+    """Schedule so'rovini oy (va ixtiyoriy sana oralig'i) bo'yicha cheklab {kun: [darslar]} qaytarish.
+    Darslar kun ichida boshlanish vaqti bo'yicha tartiblangan."""
+    first, last = month_bounds(year, month)
+    by_day = {day: [] for day in range(1, last.day + 1)}
+    start = max(first, date_from) if date_from else first
+    end = min(last, date_to) if date_to else last
+    if start > end:
+        return by_day
+
+    rows = query.filter(Schedule.lesson_date.between(start, end)).order_by(
+        Schedule.lesson_date, Schedule.lesson_start, Schedule.id
+    )
+    for schedule in rows:
+        by_day[schedule.lesson_date.day].append(schedule)
+    return by_day
+
+
+def backfill_schedule_calendar(batch_size=BACKFILL_BATCH_SIZE):
+    """lesson_date/lesson_start/lesson_end bo'sh qolgan yozuvlarni day_of_week va vaqt matnidan to'ldirish.
+    Yangilangan yozuvlar sonini qaytaradi."""
+    pending = db.session.query(
+        Schedule.id, Schedule.day_of_week, Schedule.start_time, Schedule.end_time
+    ).filter(or_(
+        Schedule.lesson_date.is_(None) & (Schedule.day_of_week > 10000000),
+        Schedule.lesson_start.is_(None) & Schedule.start_time.isnot(None),
+        Schedule.lesson_end.is_(None) & Schedule.end_time.isnot(None),
+    )).order_by(Schedule.id).all()
+
+    updated = 0
+    for offset in range(0, len(pending), batch_size):
+        rows = []
+        for schedule_id, day_of_week, start_time, end_time in pending[offset:offset + batch_size]:
+            values = Schedule.calendar_columns(day_of_week, start_time, end_time)
+            if any(value is not None for value in values.values()):
+                rows.append(dict(values, id=schedule_id))
+        if rows:
+            db.session.execute(update(Schedule), rows)
+            db.session.commit()
+            updated += len(rows)
+    return updated
@@ -0,0 +1,189 @@
+"""Dars jadvalidagi vaqt to'qnashuvlarini xotirada aniqlash.
+
+Darslar (kun, o'qituvchi) va (kun, guruh) kalitlari bo'yicha boshlanish vaqti tartibida saqlanadi;
+yangi dars uchun faqat shu kalitdagi qo'shni oraliqlar tekshiriladi (bisect).
+
+Birlashgan ma'ruza (bir o'qituvchi bir fanni aynan bir vaqtda bir nechta guruhga o'tadi) o'qituvchi
+to'qnashuvi hisoblanmaydi: o'qituvchi oraliqlari fan bilan belgilanadi (tag) va vaqti ham, fani ham
+bir xil bo'lgan dars o'tkazib yuboriladi. Bir guruhga takroriy dars guruh kaliti orqali aniqlanadi.
+
+Jadval qo'shish/tahrirlashda va bo'sh vaqtlarni qidirishda indeks bazadan faqat kerakli o'qituvchi
+va guruhning shu kun/hafta darslari bilan quriladi (ix_schedule_teacher_date, ix_schedule_group_date),
+shuning uchun boshqa worker'lardagi o'zgarishlar ham darhol hisobga olinadi.
+"""
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app.models import Schedule
+
+# Tugash vaqti ko'rsatilmagan darslar uchun standart davomiylik (daqiqa) - bir juftlik
+DEFAULT_LESSON_MINUTES = 80
+
+
+def parse_minutes(value):
+    """'HH:MM' -> kun boshidan daqiqalar (noto'g'ri bo'lsa None)"""
+    if not value:
+        return None
+    try:
+        t = datetime.strptime(str(value).strip()[:5], '%H:%M')
+    except ValueError:
+        return None
+    return t.hour * 60 + t.minute
+
+
+def lesson_interval(start_time, end_time=None):
+    """Dars oralig'i (boshlanish, tugash) daqiqalarda yoki None"""
+    start = parse_minutes(start_time)
+    if start is None:
+        return None
+    end = parse_minutes(end_time)
+    if end is None or end <= start:
+        end = start + DEFAULT_LESSON_MINUTES
+    return start, end
+
+
+class IntervalIndex:
+    """Kalit bo'yicha yarim ochiq [start, end) oraliqlar indeksi"""
+
+    def __init__(self):
+        self._items = {}  # key -> [(start, end, seq, label, tag), ...] start bo'yicha tartiblangan
+        self._max_length = {}  # key -> eng uzun oraliq (orqaga qidirish chegarasi)
+        self._seq = 0
+
+    def add(self, key, start, end, label=None, tag=None):
+        self._seq += 1
+        insort(self._items.setdefault(key, []), (start, end, self._seq, label, tag))
+        self._max_length[key] = max(self._max_length.get(key, 0), end - start)
+
+    def overlapping(self, key, start, end, tag=None):
+        """[start, end) bilan kesishadigan oraliqlar belgilarini qaytarish.
+        tag berilsa, aynan shu oraliqdagi shu tag'li elementlar (birlashgan dars) hisobga olinmaydi"""
+        items = self._items.get(key)
+        if not items:
+            return []
+        # start < end bo'lgan elementlar pos dan chapda; ulardan end > start bo'lganlari kerak
+        pos = bisect_left(items, (end,))
+        lower = start - self._max_length[key]
+        found = []
+        for i in range(pos - 1, -1, -1):
+            item_start, item_end, _, label, item_tag = items[i]
+            if item_start <= lower:
+                break
+            if item_end <= start:
+                continue
+            if tag is not None and item_tag == tag and (item_start, item_end) == (start, end):
+                continue
+            found.append(label)
+        found.reverse()
+        return found
+
+    def gaps(self, keys, start, end, min_length=1):
+        """[start, end) ichida barcha kalitlar bo'sh bo'lgan, min_length dan qisqa bo'lmagan oraliqlar"""
+        busy = sorted(
+            (item_start, item_end)
+            for key in keys
+            for item_start, item_end, _, _, _ in self._items.get(key, ())
+        )
+        found = []
+        cursor = start
+        for item_start, item_end in busy:
+            if item_start >= end:
+                break
+            if item_start - cursor >= min_length:
+                found.append((cursor, item_start))
+            cursor = max(cursor, item_end)
+        if end - cursor >= min_length:
+            found.append((cursor, end))
+        return found
+
+    def __len__(self):
+        return sum(len(items) for items in self._items.values())
+
+
+def format_minutes(minutes):
+    """Kun boshidan daqiqalar -> 'HH:MM'"""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def _schedule_index(date_from, date_to, teacher_id=None, group_id=None, exclude_id=None):
+    """O'qituvchi va guruhning [date_from, date_to] dagi darslaridan (kun, o'qituvchi/guruh) indeksi"""
+    index = IntervalIndex()
+    owners = []
+    if teacher_id:
+        owners.append(Schedule.teacher_id == teacher_id)
+    if group_id:
+        owners.append(Schedule.group_id == group_id)
+    if not owners:
+        return index
+
+    query = Schedule.query.filter(
+        Schedule.lesson_date.between(date_from, date_to),
+        owners[0] if len(owners) == 1 else owners[0] | owners[1]
+    )
+    if exclude_id:
+        query = query.filter(Schedule.id != exclude_id)
+    for schedule in query:
+        interval = lesson_interval(schedule.start_time, schedule.end_time)
+        if not interval:
+            continue
+        if teacher_id and schedule.teacher_id == teacher_id:
+            index.add(('teacher', schedule.lesson_date, teacher_id), *interval, schedule, tag=schedule.subject_id)
+        if group_id and schedule.group_id == group_id:
+            index.add(('group', schedule.lesson_date, group_id), *interval, schedule)
+    return index
+
+
+def find_schedule_conflicts(lesson_date, start_time, end_time=None, teacher_id=None, group_id=None,
+                            subject_id=None, exclude_id=None):
+    """Yangi yoki tahrirlanayotgan dars bilan kesishadigan darslar: {'teacher': [...], 'group': [...]}.
+    subject_id berilsa, shu fandan aynan shu vaqtdagi boshqa guruh darsi (birlashgan ma'ruza) to'qnashuv emas"""
+    interval = lesson_interval(start_time, end_time)
+    if not lesson_date or not interval:
+        return {'teacher': [], 'group': []}
+    index = _schedule_index(lesson_date, lesson_date, teacher_id, group_id, exclude_id)
+    return {
+        'teacher': index.overlapping(('teacher', lesson_date, teacher_id), *interval, tag=subject_id) if teacher_id else [],
+        'group': index.overlapping(('group', lesson_date, group_id), *interval) if group_id else [],
+    }
+
+
+def describe_conflicts(conflicts):
+    """Flash xabari uchun: "o'qituvchi band: Fan (Guruh, 09:00); guruh band: ..." (to'qnashuv bo'lmasa None)"""
+    parts = []
+    for key, title in (('teacher', "o'qituvchi band"), ('group', "guruh band")):
+        if conflicts[key]:
+            lessons = ', '.join(
+                f"{s.subject.name if s.subject else '-'} ({s.group.name if s.group else '-'}, {s.start_time})"
+                for s in conflicts[key]
+            )
+            parts.append(f"{title}: {lessons}")
+    return '; '.join(parts) or None
+
+
+def find_free_slots(week_date, teacher_id=None, group_id=None, duration=DEFAULT_LESSON_MINUTES):
+    """week_date haftasining ish kunlarida o'qituvchi ham, guruh ham bo'sh bo'lgan oraliqlar"""
+    config = current_app.config
+    day_start = parse_minutes(config.get('SCHEDULE_DAY_START', '08:30'))
+    day_end = parse_minutes(config.get('SCHEDULE_DAY_END', '18:00'))
+    monday = week_date - timedelta(days=week_date.weekday())
+    days = [monday + timedelta(days=i) for i in range(config.get('SCHEDULE_WORK_DAYS', 6))]
+
+    index = _schedule_index(days[0], days[-1], teacher_id, group_id)
+    result = []
+    for day in days:
+        keys = []
+        if teacher_id:
+            keys.append(('teacher', day, teacher_id))
+        if group_id:
+            keys.append(('group', day, group_id))
+        result.append({
+            'date': day.isoformat(),
+            'weekday': day.weekday(),
+            'slots': [
+                {'start': format_minutes(start), 'end': format_minutes(end)}
+                for start, end in index.gaps(keys, day_start, day_end, duration)
+            ],
+        })
+    return result
@@ -0,0 +1,313 @@
+"""Shaxsiy dars jadvalining iCalendar (.ics) tasmasi.
+
+- Havola foydalanuvchining bekor qilinadigan tokeni bilan ochiladi (CalendarFeedToken); bazada
+  tokenning faqat SHA-256 izi saqlanadi, qidirish indekslangan prefiks bo'yicha.
+- Darslar main.schedule sahifasi bilan bir xil so'rovdan olinadi (personal_schedule_scope).
+- ETag va Last-Modified bitta yig'indi so'rovdan hisoblanadi, shuning uchun o'zgarmagan tasma
+  tanasi qurilmasdan 304 bilan qaytadi.
+- since=<sync token> (oldingi javobning X-Sync-Token sarlavhasi) - faqat shu vaqtdan keyin
+  o'zgargan darslar va o'chirilganlari (STATUS:CANCELLED). Eski token bo'lsa to'liq tasma beriladi.
+"""
+import calendar
+import hashlib
+import hmac
+import secrets
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+
+from app import db
+from app.models import (
+    CalendarFeedToken, DirectionCurriculum, Group, Schedule, ScheduleTombstone, Subject, TeacherSubject
+)
+from app.utils.schedule_conflicts import lesson_interval
+
+TOKEN_PREFIX_LENGTH = 12
+# last_used_at yozuvlari orasidagi minimal interval
+USAGE_WRITE_INTERVAL = timedelta(hours=1)
+# Delta rejimida token vaqtidan shuncha oldingi o'zgarishlar ham qayta yuboriladi (commit kechikishi uchun)
+SYNC_OVERLAP = timedelta(minutes=1)
+TIMEZONE = 'Asia/Tashkent'
+
+PersonalScope = namedtuple('PersonalScope', 'query groups subjects')
+
+
+def _hash_token(raw_token):
+    return hashlib.sha256(raw_token.encode()).hexdigest()
+
+
+def issue_feed_token(user):
+    """Yangi token berish (eskisi bekor bo'ladi). Xom token faqat shu yerda qaytariladi."""
+    raw_token = secrets.token_urlsafe(32)
+    CalendarFeedToken.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+    db.session.add(CalendarFeedToken(
+        user_id=user.id,
+        token_prefix=raw_token[:TOKEN_PREFIX_LENGTH],
+        token_hash=_hash_token(raw_token),
+    ))
+    return raw_token
+
+
+def revoke_feed_token(user):
+    return CalendarFeedToken.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+
+
+def user_for_feed_token(raw_token):
+    """Token egasi (faol foydalanuvchi) yoki None"""
+    if not raw_token or len(raw_token) < TOKEN_PREFIX_LENGTH:
+        return None
+    digest = _hash_token(raw_token)
+    for feed_token in CalendarFeedToken.query.filter_by(token_prefix=raw_token[:TOKEN_PREFIX_LENGTH]):
+        if hmac.compare_digest(feed_token.token_hash, digest):
+            user = feed_token.user
+            if not user or not user.is_active:
+                return None
+            now = datetime.utcnow()
+            if not feed_token.last_used_at or now - feed_token.last_used_at > USAGE_WRITE_INTERVAL:
+                feed_token.last_used_at = now
+                db.session.commit()
+            return user
+    return None
+
+
+def is_feed_user(user):
+    """Tasma faqat talaba va o'qituvchilar uchun (main.schedule dagi kabi)"""
+    return user.role == 'student' or user.role == 'teacher' or user.has_role('teacher')
+
+
+def personal_schedule_scope(user):
+    """Foydalanuvchi jadval sahifasida ko'radigan darslar so'rovi va filtrlar uchun guruh/fanlar.
+    Talaba - o'z guruhining joriy semestr fanlari; o'qituvchi - guruhning joriy semestr o'quv rejasida
+    bor, o'ziga biriktirilgan fanlar. Boshqa rollar uchun so'rov cheklanmaydi."""
+    query = Schedule.query
+    groups = []
+    subjects = []
+
+    if user.role == 'student':
+        group = Group.query.get(user.group_id) if user.group_id else None
+        if group is None:
+            return PersonalScope(query.filter(Schedule.id == None), groups, subjects)
+        query = query.filter(Schedule.group_id == group.id)
+        if group.direction_id:
+            subject_ids = [item.subject_id for item in DirectionCurriculum.query.filter_by(
+                direction_id=group.direction_id,
+                semester=group.semester if group.semester else 1
+            )]
+            subjects = Subject.query.filter(Subject.id.in_(subject_ids)).order_by(Subject.name).all()
+            query = query.filter(Schedule.subject_id.in_(subject_ids))
+
+    elif user.role == 'teacher' or user.has_role('teacher'):
+        # Biriktirilgan (guruh, fan) lardan guruhning joriy semestr o'quv rejasida borlari
+        current_semester = func.coalesce(func.nullif(Group.semester, 0), 1)
+        pairs = db.session.query(TeacherSubject.group_id, TeacherSubject.subject_id).join(
+            Group, Group.id == TeacherSubject.group_id
+        ).join(
+            DirectionCurriculum,
+            (DirectionCurriculum.direction_id == Group.direction_id)
+            & (DirectionCurriculum.subject_id == TeacherSubject.subject_id)
+            & (DirectionCurriculum.semester == current_semester)
+        ).filter(TeacherSubject.teacher_id == user.id).distinct().all()
+        group_ids = {group_id for group_id, _ in pairs}
+        subject_ids = {subject_id for _, subject_id in pairs}
+
+        if pairs:
+            query = query.filter(
+                Schedule.teacher_id == user.id,
+                Schedule.group_id.in_(group_ids),
+                Schedule.subject_id.in_(subject_ids)
+            )
+            groups = Group.query.filter(Group.id.in_(group_ids)).order_by(Group.name).all()
+            subjects = Subject.query.filter(Subject.id.in_(subject_ids)).order_by(Subject.name).all()
+        else:
+            query = query.filter(Schedule.id == None)
+
+    return PersonalScope(query, groups, subjects)
+
+
+def record_schedule_removal(schedule, group_id=None, teacher_id=None, moved=False):
+    """Dars o'chirilganda iz qoldirish (commit chaqiruvchida). moved=True - dars boshqa guruh yoki
+    o'qituvchiga o'tkazilgan: iz faqat berilgan eski egalar (group_id / teacher_id) uchun."""
+    if moved and group_id is None and teacher_id is None:
+        return
+    db.session.add(ScheduleTombstone(
+        schedule_id=schedule.id,
+        group_id=group_id if moved else schedule.group_id,
+        teacher_id=teacher_id if moved else schedule.teacher_id,
+        lesson_date=schedule.lesson_date,
+        lesson_start=schedule.lesson_start,
+    ))
+
+
+def cleanup_schedule_tombstones():
+    """ICAL_TOMBSTONE_DAYS dan eski izlarni o'chirish (bunday eski sync token to'liq tasma oladi)"""
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config.get('ICAL_TOMBSTONE_DAYS', 30))
+    removed = ScheduleTombstone.query.filter(ScheduleTombstone.removed_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return removed
+
+
+def _tombstones_for(user):
+    if user.role == 'student':
+        return ScheduleTombstone.query.filter(ScheduleTombstone.group_id == user.group_id)
+    return ScheduleTombstone.query.filter(ScheduleTombstone.teacher_id == user.id)
+
+
+def make_sync_token(moment):
+    return str(calendar.timegm(moment.utctimetuple()))
+
+
+def parse_sync_token(value):
+    """X-Sync-Token -> UTC datetime (noto'g'ri bo'lsa ValueError)"""
+    return datetime.utcfromtimestamp(int(value))
+
+
+class ScheduleFeed:
+    """Bitta so'rov uchun tasma: holat (ETag/Last-Modified) arzon, tanasi faqat kerak bo'lsa quriladi"""
+
+    def __init__(self, user, since=None):
+        config = current_app.config
+        self.user = user
+        self.generated_at = datetime.utcnow()
+        self.window_start = self.generated_at.date() - timedelta(days=config.get('ICAL_FEED_PAST_DAYS', 30))
+        oldest_tombstone = self.generated_at - timedelta(days=config.get('ICAL_TOMBSTONE_DAYS', 30))
+        # Izlari tozalanib ketgan eski token bilan delta to'g'ri bo'lmaydi - to'liq tasma
+        self.since = since if since and since > oldest_tombstone else None
+
+        self.query = personal_schedule_scope(user).query.filter(Schedule.lesson_date >= self.window_start)
+        self.tombstones = _tombstones_for(user)
+        if self.since:
+            changed_after = self.since - SYNC_OVERLAP
+            self.query = self.query.filter(Schedule.updated_at > changed_after)
+            self.tombstones = self.tombstones.filter(ScheduleTombstone.removed_at > changed_after)
+        else:
+            self.tombstones = None
+
+        count, last_updated = self.query.with_entities(func.count(Schedule.id), func.max(Schedule.updated_at)).one()
+        last_removed = _tombstones_for(user).with_entities(func.max(ScheduleTombstone.removed_at)).scalar()
+        state = f"{user.id}:{count}:{last_updated}:{last_removed}:{self.window_start}:{self.since}"
+        self.etag = hashlib.sha256(state.encode()).hexdigest()[:32]
+        changes = [moment for moment in (last_updated, last_removed) if moment]
+        self.last_modified = max(changes) if changes else None
+
+    @property
+    def sync_token(self):
+        return make_sync_token(self.generated_at)
+
+    def render(self):
+        events = self.query.options(
+            joinedload(Schedule.subject), joinedload(Schedule.group), joinedload(Schedule.teacher)
+        ).order_by(Schedule.lesson_date, Schedule.lesson_start, Schedule.id)
+        lines = [
+            'BEGIN:VCALENDAR',
+            'VERSION:2.0',
+            'PRODID:-//TIIAME//ELMS//UZ',
+            'CALSCALE:GREGORIAN',
+            'METHOD:PUBLISH',
+            f"X-WR-CALNAME:{_escape('Dars jadvali - ' + (self.user.full_name or ''))}",
+            f"X-WR-TIMEZONE:{TIMEZONE}",
+            'REFRESH-INTERVAL;VALUE=DURATION:PT1H',
+            'X-PUBLISHED-TTL:PT1H',
+            # O'zbekistonda yozgi vaqt yo'q - doimiy UTC+5
+            'BEGIN:VTIMEZONE',
+            f"TZID:{TIMEZONE}",
+            'BEGIN:STANDARD',
+            'DTSTART:19700101T000000',
+            'TZOFFSETFROM:+0500',
+            'TZOFFSETTO:+0500',
+            'TZNAME:+05',
+            'END:STANDARD',
+            'END:VTIMEZONE',
+        ]
+        listed = set()
+        for schedule in events:
+            listed.add(schedule.id)
+            lines.extend(self._event(schedule))
+        for tombstone in self.tombstones or ():
+            # Keyin yana shu foydalanuvchiga qaytarilgan dars bekor qilinmaydi
+            if tombstone.schedule_id not in listed:
+                listed.add(tombstone.schedule_id)
+                lines.extend(self._cancelled(tombstone))
+        lines.append('END:VCALENDAR')
+        return '\r\n'.join(_fold(line) for line in lines) + '\r\n'
+
+    def _event(self, schedule):
+        interval = lesson_interval(schedule.start_time, schedule.end_time)
+        if not interval:
+            return []
+        start, end = interval
+        day = schedule.lesson_date
+        subject = schedule.subject.name if schedule.subject else ''
+        summary = f"{subject} ({schedule.lesson_type})" if schedule.lesson_type else subject
+        details = []
+        if schedule.group:
+            details.append(f"Guruh: {schedule.group.name}")
+        if schedule.teacher:
+            details.append(f"O'qituvchi: {schedule.teacher.full_name}")
+        if schedule.link:
+            details.append(f"Havola: {schedule.link}")
+        lines = [
+            'BEGIN:VEVENT',
+            f"UID:schedule-{schedule.id}@elms",
+            f"DTSTAMP:{_utc(schedule.updated_at or self.generated_at)}",
+            f"DTSTART;TZID={TIMEZONE}:{_local(day, start)}",
+            f"DTEND;TZID={TIMEZONE}:{_local(day, end)}",
+            f"SUMMARY:{_escape(summary)}",
+        ]
+        if details:
+            lines.append(f"DESCRIPTION:{_escape(chr(10).join(details))}")
+        if schedule.link and schedule.link.startswith(('http://', 'https://')):
+            lines.append(f"URL:{schedule.link}")
+        if schedule.updated_at:
+            lines.append(f"LAST-MODIFIED:{_utc(schedule.updated_at)}")
+        lines.append('END:VEVENT')
+        return lines
+
+    def _cancelled(self, tombstone):
+        if not tombstone.lesson_date:
+            return []
+        start = tombstone.lesson_start.strftime('%H%M%S') if tombstone.lesson_start else '000000'
+        return [
+            'BEGIN:VEVENT',
+            f"UID:schedule-{tombstone.schedule_id}@elms",
+            f"DTSTAMP:{_utc(tombstone.removed_at)}",
+            f"DTSTART;TZID={TIMEZONE}:{tombstone.lesson_date.strftime('%Y%m%d')}T{start}",
+            'STATUS:CANCELLED',
+            'END:VEVENT',
+        ]
+
+
+def _local(day, minutes):
+    """Sana + kun boshidan daqiqalar -> mahalliy vaqt (yarim tundan o'tsa keyingi kun)"""
+    moment = datetime.combine(day, datetime.min.time()) + timedelta(minutes=minutes)
+    return moment.strftime('%Y%m%dT%H%M%S')
+
+
+def _utc(moment):
+    return moment.strftime('%Y%m%dT%H%M%SZ')
+
+
+def _escape(text):
+    return (text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _fold(line, limit=75):
+    """RFC 5545: 75 baytdan uzun qatorlarni bo'lish (UTF-8 belgilarini buzmasdan)"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= limit:
+        return line
+    parts = []
+    current = ''
+    size = 0
+    for char in line:
+        char_size = len(char.encode('utf-8'))
+        if size + char_size > limit:
+            parts.append(current)
+            current, size = ' ', 1
+        current += char
+        size += char_size
+    parts.append(current)
+    return '\r\n'.join(parts)
@@ -0,0 +1,173 @@
+"""Talabaning joriy semestr natijalari (StudentSemesterProgress).
+
+Dashboard har safar qayta hisoblamasligi uchun natijalar jadvalda saqlanadi:
+- javob baholanganda yoki yuborilganda faqat shu talaba va fan qatori yangilanadi;
+- topshiriq qo'shilganda, o'zgartirilganda yoki o'chirilganda fan qatorlari "eskirgan" deb belgilanadi
+  va talaba dashboardni ochganda qayta hisoblanadi.
+"""
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import contains_eager
+
+from app import db
+from app.models import (Assignment, DirectionCurriculum, Group, StudentSemesterProgress,
+                        Subject, Submission, User)
+
+
+def curriculum_credits(item):
+    """O'quv reja bo'yicha kredit: (maruza + amaliyot + laboratoriya + seminar + mustaqil) / 30"""
+    total_hours = (item.hours_maruza or 0) + (item.hours_amaliyot or 0) + \
+                  (item.hours_laboratoriya or 0) + (item.hours_seminar or 0) + \
+                  (item.hours_mustaqil or 0)
+    if total_hours > 0:
+        return total_hours / 30.0
+    return float(item.subject.credits) if item.subject and item.subject.credits else 0.0
+
+
+def get_student_context(student):
+    """Talabaning guruhi, yo'nalishi va joriy semestri"""
+    group = db.session.get(Group, student.group_id) if student.group_id else None
+    direction_id = group.direction_id if group else None
+    current_semester = student.semester
+    if group and group.direction:
+        current_semester = group.semester
+    return group, direction_id, current_semester
+
+
+def get_curriculum_list(direction_id, semester):
+    """Joriy semestr o'quv rejasi (fanlari bilan birga, bitta so'rov).
+
+    Bir fan turli qabul yili / ta'lim shakli uchun takrorlanishi mumkin; barcha qatorlar qaytariladi
+    (dashboard fanlar soni va kreditlarni shu qatorlar bo'yicha hisoblaydi).
+    """
+    if not direction_id:
+        return []
+    return DirectionCurriculum.query.join(Subject).options(
+        contains_eager(DirectionCurriculum.subject)
+    ).filter(
+        DirectionCurriculum.direction_id == direction_id,
+        DirectionCurriculum.semester == semester
+    ).order_by(Subject.name).all()
+
+
+def _subject_credits(curriculum_list):
+    """Fan -> kredit (fan takrorlansa oxirgi qatori)"""
+    return {item.subject_id: curriculum_credits(item) for item in curriculum_list}
+
+
+def _student_assignments(student, direction_id, subject_ids):
+    """Talabaga tegishli topshiriqlar (guruh yoki yo'nalish darajasida)"""
+    if not subject_ids:
+        return []
+    query = Assignment.query.filter(
+        Assignment.subject_id.in_(subject_ids),
+        (Assignment.group_id == student.group_id) | (Assignment.group_id.is_(None))
+    )
+    if direction_id:
+        query = query.filter(
+            (Assignment.direction_id == direction_id) | (Assignment.direction_id.is_(None))
+        )
+    return query.all()
+
+
+def _best_scores(student_id, assignment_ids):
+    """Har bir topshiriq bo'yicha eng yuqori baho: {assignment_id: score}"""
+    if not assignment_ids:
+        return {}
+    rows = db.session.query(
+        Submission.assignment_id, func.max(Submission.score)
+    ).filter(
+        Submission.student_id == student_id,
+        Submission.assignment_id.in_(assignment_ids),
+        Submission.score.isnot(None)
+    ).group_by(Submission.assignment_id).all()
+    return dict(rows)
+
+
+def _compute(student, direction_id, subject_ids):
+    """Fanlar bo'yicha ball, maksimal ball va baholanganlar soni"""
+    assignments = _student_assignments(student, direction_id, subject_ids)
+    best = _best_scores(student.id, [a.id for a in assignments])
+    result = {sid: {'score': 0.0, 'max_score': 0.0, 'graded_count': 0, 'total_assignments': 0} for sid in subject_ids}
+    for a in assignments:
+        data = result[a.subject_id]
+        data['max_score'] += (a.max_score or 0)
+        data['total_assignments'] += 1
+        if a.id in best:
+            data['score'] += best[a.id]
+            data['graded_count'] += 1
+    return result
+
+
+def rebuild_student_progress(student, direction_id, semester, curriculum_list):
+    """Talabaning joriy semestr qatorlarini to'liq qayta hisoblash (har bir fanga bitta qator)"""
+    credits = _subject_credits(curriculum_list)
+    computed = _compute(student, direction_id, list(credits))
+    existing = {
+        row.subject_id: row
+        for row in StudentSemesterProgress.query.filter_by(student_id=student.id, semester=semester).all()
+    }
+
+    rows = []
+    for subject_id, subject_credits in credits.items():
+        row = existing.pop(subject_id, None)
+        if row is None:
+            row = StudentSemesterProgress(student_id=student.id, subject_id=subject_id, semester=semester)
+            db.session.add(row)
+        for key, value in computed[subject_id].items():
+            setattr(row, key, value)
+        row.credits = subject_credits
+        row.group_id = student.group_id
+        row.is_stale = False
+        rows.append(row)
+
+    # O'quv rejadan chiqarilgan fanlar
+    for row in existing.values():
+        db.session.delete(row)
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Parallel so'rov (dashboard birinchi marta bir vaqtda ochilgan) shu qatorlarni yozib bo'lgan
+        db.session.rollback()
+        rows = StudentSemesterProgress.query.filter_by(student_id=student.id, semester=semester).all()
+    return rows
+
+
+def get_semester_progress(student, direction_id, semester, curriculum_list):
+    """Dashboard uchun semestr qatorlari; kerak bo'lsa qayta hisoblanadi.
+    Fanlar to'plami o'zgarganda, topshiriqlar o'zgarganda yoki talaba boshqa guruhga o'tganda."""
+    rows = StudentSemesterProgress.query.filter_by(student_id=student.id, semester=semester).all()
+    row_subject_ids = {row.subject_id for row in rows}
+    curriculum_subject_ids = {item.subject_id for item in curriculum_list}
+    if row_subject_ids != curriculum_subject_ids or any(
+        row.is_stale or row.group_id != student.group_id for row in rows
+    ):
+        rows = rebuild_student_progress(student, direction_id, semester, curriculum_list)
+    order = {item.subject_id: idx for idx, item in enumerate(curriculum_list)}
+    return sorted(rows, key=lambda row: order.get(row.subject_id, 0))
+
+
+def refresh_student_subject(student_id, subject_id):
+    """Javob yuborilganda yoki baholanganda bitta talaba va fan qatorini yangilash"""
+    rows = StudentSemesterProgress.query.filter_by(student_id=student_id, subject_id=subject_id).all()
+    if not rows:
+        return
+    student = db.session.get(User, student_id)
+    if not student:
+        return
+    _, direction_id, _ = get_student_context(student)
+    data = _compute(student, direction_id, [subject_id])[subject_id]
+    for row in rows:
+        for key, value in data.items():
+            setattr(row, key, value)
+        row.is_stale = False
+    db.session.commit()
+
+
+def mark_progress_stale(subject_id):
+    """Fan topshiriqlari o'zgarganda barcha talabalar qatorlarini eskirgan deb belgilash"""
+    StudentSemesterProgress.query.filter_by(subject_id=subject_id).update(
+        {StudentSemesterProgress.is_stale: True}, synchronize_session=False
+    )
+    db.session.commit()
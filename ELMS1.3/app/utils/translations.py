@@ -1,5 +1,6 @@
-# Translation dictionary for 3 languages: Uzbek, Russian, English
+from types import MappingProxyType
 
+# Translation dictionary for 3 languages: Uzbek, Russian, English
 TRANSLATIONS = {
     'uz': {
         # Site info
@@ -285,12 +286,54 @@ TRANSLATIONS = {
     }
 }
 
+DEFAULT_LANGUAGE = 'uz'
+
+# Til tanlagichdagi tillar (kod, nom, bayroq)
+LANGUAGES = MappingProxyType({
+    'uz': MappingProxyType({'code': 'uz', 'name': 'O\'zbek', 'flag': '🇺🇿'}),
+    'ru': MappingProxyType({'code': 'ru', 'name': 'Русский', 'flag': '🇷🇺'}),
+    'en': MappingProxyType({'code': 'en', 'name': 'English', 'flag': '🇺🇸'}),
+})
+
+
+class Translator:
+    """Bitta til uchun tarjima funksiyasi (shablonlarda t('kalit'))"""
+    __slots__ = ('lang', '_lookup')
+
+    def __init__(self, lang, messages):
+        self.lang = lang
+        self._lookup = messages.get
+
+    def __call__(self, key):
+        return self._lookup(key, key)
+
+    def __repr__(self):
+        return f'<Translator {self.lang}>'
+
+
+def _compile_catalog(source):
+    """TRANSLATIONS lug'atini har bir til uchun o'zgarmas katalogga aylantirish"""
+    return MappingProxyType({
+        lang: MappingProxyType(dict(messages))
+        for lang, messages in source.items()
+    })
+
+
+# Ilova yuklanganda bir marta tuziladi; har bir til uchun tarjimon ham bitta
+CATALOG = _compile_catalog(TRANSLATIONS)
+_TRANSLATORS = MappingProxyType({lang: Translator(lang, messages) for lang, messages in CATALOG.items()})
+_UNKNOWN_LANGUAGE = Translator(None, MappingProxyType({}))
+
+
+def get_translator(lang=DEFAULT_LANGUAGE):
+    """Til uchun tayyor tarjimon (noma'lum tilda kalitning o'zi qaytadi)"""
+    return _TRANSLATORS.get(lang, _UNKNOWN_LANGUAGE)
+
 def get_translation(key, lang='uz'):
     """Get translation for a key"""
-    return TRANSLATIONS.get(lang, {}).get(key, key)
+    return get_translator(lang)(key)
 
 def get_current_language():
     """Get current language from session or default"""
     from flask import session
-    return session.get('language', 'uz')
-
+    return session.get('language', DEFAULT_LANGUAGE)
@@ -0,0 +1,241 @@
+"""Yuklangan dars videolarini fonda qayta kodlash: HLS (bir nechta sifat), brauzerbop MP4 va poster.
+
+Natija UPLOAD_FOLDER/videos/renditions/<video nomi>/ papkasida saqlanadi:
+    master.m3u8, v0/index.m3u8, v0/seg_000.ts, ...  - moslashuvchan oqim (HLS)
+    web.mp4                                          - H.264/AAC, +faststart (mov/avi ham o'ynaydi)
+    poster.jpg                                       - pleyer uchun muqova
+Kodlash vaqtinchalik papkada bajariladi va tugagach bir martada joyiga ko'chiriladi, shuning uchun
+papka mavjud bo'lsa - natija to'liq. ffmpeg topilmasa vazifa qo'yilmaydi va asl video beriladi.
+"""
+import json
+import os
+import shutil
+import subprocess
+import time
+import uuid
+
+from flask import current_app
+
+from app import db
+from app.models import Lesson
+from app.utils.blob_store import stored_path
+
+RENDITIONS_FOLDER = 'renditions'
+MASTER_PLAYLIST = 'master.m3u8'
+WEB_MP4 = 'web.mp4'
+POSTER = 'poster.jpg'
+# Uzoq ffmpeg bosqichlarida vazifa "to'xtab qolgan" deb hisoblanmasligi uchun (soniya)
+HEARTBEAT_INTERVAL = 60
+
+
+def _videos_folder():
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], 'videos')
+
+
+def renditions_name(video_file):
+    """Video fayl nomi -> renditions ichidagi papka nomi (kengaytmasiz)"""
+    return os.path.splitext(os.path.basename(video_file))[0]
+
+
+def renditions_folder(video_file):
+    return os.path.join(_videos_folder(), RENDITIONS_FOLDER, renditions_name(video_file))
+
+
+def video_renditions(video_file):
+    """Tayyor natijalar: {'name', 'hls', 'mp4', 'poster'} (fayl nomlari yoki None); tayyor bo'lmasa None"""
+    if not video_file:
+        return None
+    folder = renditions_folder(video_file)
+    if not os.path.isdir(folder):
+        return None
+
+    def existing(name):
+        return name if os.path.isfile(os.path.join(folder, name)) else None
+
+    return {
+        'name': renditions_name(video_file),
+        'hls': existing(MASTER_PLAYLIST),
+        'mp4': existing(WEB_MP4),
+        'poster': existing(POSTER),
+    }
+
+
+def transcoding_available():
+    config = current_app.config
+    return bool(config.get('VIDEO_TRANSCODE_ENABLED')) and shutil.which(config.get('FFMPEG_BINARY', 'ffmpeg')) is not None
+
+
+def schedule_transcode(video_file, user_id=None):
+    """Yangi saqlangan video uchun fon vazifasini qo'yish (ffmpeg bo'lmasa hech narsa qilinmaydi)"""
+    if not video_file or not transcoding_available():
+        return None
+    from app.utils.jobs import enqueue_job
+    return enqueue_job(
+        'transcode_video',
+        f"Videoni qayta kodlash: {video_file}",
+        params={'video_file': video_file},
+        user_id=user_id,
+    )
+
+
+def remove_renditions(video_file):
+    """Video natijalarini o'chirish (tekshiruvsiz; odatda purge_renditions orqali)"""
+    if video_file:
+        shutil.rmtree(renditions_folder(video_file), ignore_errors=True)
+
+
+def purge_renditions(video_files):
+    """Commit dan keyin: hech bir dars ishlatmayotgan videolarning natijalarini o'chirish.
+    Bir dars bir nechta guruh uchun yaratilganda barcha nusxalar bitta video faylni ishlatadi."""
+    names = {name for name in video_files if name}
+    if not names:
+        return 0
+    used = {name for (name,) in db.session.query(Lesson.video_file).filter(Lesson.video_file.in_(names))}
+    for name in names - used:
+        remove_renditions(name)
+    return len(names - used)
+
+
+def probe_video(source_path, ffprobe='ffprobe'):
+    """ffprobe: {'height', 'duration', 'has_audio'}"""
+    result = subprocess.run(
+        [ffprobe, '-v', 'error', '-show_entries', 'stream=codec_type,height:format=duration', '-of', 'json', source_path],
+        capture_output=True, text=True, timeout=120
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe xatosi: {result.stderr.strip()[-500:]}")
+    info = json.loads(result.stdout or '{}')
+    streams = info.get('streams', [])
+    video = next((s for s in streams if s.get('codec_type') == 'video'), None)
+    if video is None:
+        raise RuntimeError("Faylda video oqimi topilmadi")
+    try:
+        duration = float(info.get('format', {}).get('duration') or 0)
+    except ValueError:
+        duration = 0.0
+    return {
+        'height': int(video.get('height') or 0),
+        'duration': duration,
+        'has_audio': any(s.get('codec_type') == 'audio' for s in streams),
+    }
+
+
+def select_ladder(ladder, source_height):
+    """Asl videodan katta bo'lmagan sifatlar (kamida eng kichigi)"""
+    rungs = sorted(ladder, key=lambda r: r[0])
+    selected = [r for r in rungs if not source_height or r[0] <= source_height]
+    return selected or rungs[:1]
+
+
+def _scale(height):
+    # Asl videodan kattalashtirmaslik; libx264 uchun balandlik juft bo'lishi kerak
+    return f"scale=-2:'trunc(min({height},ih)/2)*2'"
+
+
+def hls_command(ffmpeg, source_path, output_folder, rungs, has_audio, segment_seconds):
+    """Bitta ffmpeg jarayonida barcha sifatlar uchun HLS"""
+    count = len(rungs)
+    splits = ''.join(f'[s{i}]' for i in range(count))
+    filters = [f'[0:v]split={count}{splits}']
+    filters += [f'[s{i}]{_scale(height)}[v{i}]' for i, (height, _, _) in enumerate(rungs)]
+    cmd = [ffmpeg, '-y', '-v', 'error', '-i', source_path, '-filter_complex', ';'.join(filters)]
+    stream_map = []
+    for i, (height, video_bitrate, audio_bitrate) in enumerate(rungs):
+        cmd += ['-map', f'[v{i}]']
+        if has_audio:
+            cmd += ['-map', '0:a:0']
+        cmd += [f'-b:v:{i}', video_bitrate, f'-maxrate:v:{i}', video_bitrate, f'-bufsize:v:{i}', video_bitrate]
+        if has_audio:
+            cmd += [f'-b:a:{i}', audio_bitrate]
+        stream_map.append(f'v:{i},a:{i}' if has_audio else f'v:{i}')
+    gop = str(segment_seconds * 24)
+    cmd += [
+        '-c:v', 'libx264', '-preset', 'veryfast', '-profile:v', 'main', '-pix_fmt', 'yuv420p',
+        '-g', gop, '-keyint_min', gop, '-sc_threshold', '0',
+    ]
+    if has_audio:
+        cmd += ['-c:a', 'aac', '-ac', '2']
+    cmd += [
+        '-f', 'hls', '-hls_time', str(segment_seconds), '-hls_playlist_type', 'vod',
+        '-hls_segment_filename', os.path.join(output_folder, 'v%v', 'seg_%03d.ts'),
+        '-master_pl_name', MASTER_PLAYLIST,
+        '-var_stream_map', ' '.join(stream_map),
+        os.path.join(output_folder, 'v%v', 'index.m3u8'),
+    ]
+    return cmd
+
+
+def mp4_command(ffmpeg, source_path, output_path, height, has_audio):
+    cmd = [
+        ffmpeg, '-y', '-v', 'error', '-i', source_path, '-vf', _scale(height),
+        '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23', '-profile:v', 'main', '-pix_fmt', 'yuv420p',
+    ]
+    cmd += ['-c:a', 'aac', '-b:a', '128k', '-ac', '2'] if has_audio else ['-an']
+    cmd += ['-movflags', '+faststart', output_path]
+    return cmd
+
+
+def poster_command(ffmpeg, source_path, output_path, at_seconds):
+    return [
+        ffmpeg, '-y', '-v', 'error', '-ss', f'{at_seconds:.2f}', '-i', source_path,
+        '-frames:v', '1', '-vf', _scale(720), '-q:v', '3', output_path,
+    ]
+
+
+def _run(cmd, timeout, heartbeat=None):
+    """ffmpeg ni bajarish; kutish davomida har HEARTBEAT_INTERVAL soniyada heartbeat() chaqiriladi"""
+    deadline = time.monotonic() + timeout
+    with subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True) as proc:
+        while True:
+            try:
+                _, stderr = proc.communicate(timeout=max(0.0, min(HEARTBEAT_INTERVAL, deadline - time.monotonic())))
+                break
+            except subprocess.TimeoutExpired:
+                if time.monotonic() >= deadline:
+                    proc.kill()
+                    proc.communicate()
+                    raise
+                if heartbeat is not None:
+                    heartbeat()
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg xatosi: {stderr.strip()[-500:]}")
+
+
+def transcode_video(video_file, progress=None):
+    """Videoni qayta kodlash. progress(done, total) - bosqichlar bo'yicha."""
+    config = current_app.config
+    ffmpeg = config.get('FFMPEG_BINARY', 'ffmpeg')
+    ffprobe = config.get('FFPROBE_BINARY', 'ffprobe')
+    timeout = config.get('VIDEO_TRANSCODE_TIMEOUT', 2 * 3600)
+    source_path = stored_path(video_file, 'video')
+    if not os.path.isfile(source_path):
+        raise RuntimeError(f"Video topilmadi: {video_file}")
+
+    report = progress or (lambda done, total: None)
+    info = probe_video(source_path, ffprobe)
+    rungs = select_ladder(config['VIDEO_HLS_LADDER'], info['height'])
+    report(1, 4)
+
+    target = renditions_folder(video_file)
+    work = os.path.join(_videos_folder(), RENDITIONS_FOLDER, f'.tmp_{uuid.uuid4().hex}')
+    for i in range(len(rungs)):
+        os.makedirs(os.path.join(work, f'v{i}'), exist_ok=True)
+    try:
+        _run(hls_command(ffmpeg, source_path, work, rungs, info['has_audio'], config.get('VIDEO_HLS_SEGMENT_SECONDS', 6)),
+             timeout, heartbeat=lambda: report(1, 4))
+        report(2, 4)
+        _run(mp4_command(ffmpeg, source_path, os.path.join(work, WEB_MP4), rungs[-1][0], info['has_audio']),
+             timeout, heartbeat=lambda: report(2, 4))
+        report(3, 4)
+        _run(poster_command(ffmpeg, source_path, os.path.join(work, POSTER), min(5.0, info['duration'] / 10)), 300,
+             heartbeat=lambda: report(3, 4))
+
+        # Kodlash davomida video almashtirilgan yoki o'chirilgan bo'lsa natija kerak emas
+        if not os.path.isfile(stored_path(video_file, 'video')):
+            raise RuntimeError(f"Kodlash davomida video o'chirildi: {video_file}")
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(work, target)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    report(4, 4)
+    return {'success': True, 'renditions': [f'{height}p' for height, _, _ in rungs], 'source_height': info['height']}
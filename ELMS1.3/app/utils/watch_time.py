@@ -0,0 +1,129 @@
+"""Video ko'rish vaqti (update_watch_time) yozuvlarini xotirada yig'ib, guruhlab bazaga yozish.
+
+Har bir o'ynayotgan video vaqti-vaqti bilan heartbeat yuboradi; har biri uchun alohida commit
+SQLite'da yozish qulfi uchun raqobat yaratadi. Heartbeatlar (dars, talaba) kaliti bo'yicha eng katta
+qiymat sifatida xotirada saqlanadi va WATCH_TIME_MAX_PENDING ta kalit yig'ilganda yoki har
+WATCH_TIME_FLUSH_INTERVAL soniyada (worker yangi so'rov olmasa ham - fon oqimi orqali) bitta
+tranzaksiyada yoziladi. UPDATE faqat qiymat oshganda ishlaydi, shuning uchun watch_duration hech qachon
+kamaymaydi. Jarayon to'xtaganda qolgan yozuvlar ham yoziladi; worker o'ldirilsa (timeout, OOM) oxirgi
+oraliqdagi qiymatlar yo'qoladi, keyingi heartbeat ularni tiklaydi.
+
+Bufer har bir jarayonda alohida. Dars sahifasi (lesson_detail) faqat o'z jarayonidagi kalitni yozadi,
+shuning uchun heartbeat boshqa gunicorn worker'ga tushgan bo'lsa, sahifadagi watch_duration
+WATCH_TIME_FLUSH_INTERVAL gacha eskiroq ko'rinishi mumkin.
+
+Bu faqat ko'rish vaqti uchun: attention_check (darsni tugatish) avvalgidek darhol commit qilinadi.
+"""
+import atexit
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import bindparam, or_
+
+from app import db
+from app.models import LessonView
+
+_pending = {}  # (lesson_id, student_id) -> eng katta watch_duration
+_lock = threading.Lock()
+_last_flush = time.monotonic()
+_flusher = None  # Fon oqimi (har bir jarayonda o'zining; fork'dan keyin qayta ishga tushiriladi)
+
+
+def record_watch_time(lesson_id, student_id, watch_duration):
+    """Heartbeatni buferga qo'shish. Kalit uchun buferdagi eng katta qiymatni qaytaradi."""
+    key = (lesson_id, student_id)
+    config = current_app.config
+    with _lock:
+        _start_flusher(current_app._get_current_object())
+        value = max(_pending.get(key, 0), watch_duration)
+        _pending[key] = value
+        due = (len(_pending) >= config.get('WATCH_TIME_MAX_PENDING', 500)
+               or time.monotonic() - _last_flush >= config.get('WATCH_TIME_FLUSH_INTERVAL', 10))
+        if due:
+            batch = _take()
+    if due:
+        _write(batch)
+    return value
+
+
+def pending_watch_time(lesson_id, student_id):
+    """Hali bazaga yozilmagan qiymat (yo'q bo'lsa 0)"""
+    with _lock:
+        return _pending.get((lesson_id, student_id), 0)
+
+
+def flush_watch_time(lesson_id=None, student_id=None):
+    """Buferni bazaga yozish: hammasini yoki faqat bitta (dars, talaba) kalitini"""
+    with _lock:
+        if lesson_id is None:
+            batch = _take()
+        else:
+            value = _pending.pop((lesson_id, student_id), None)
+            batch = {(lesson_id, student_id): value} if value is not None else {}
+    _write(batch)
+    return len(batch)
+
+
+def _start_flusher(app):
+    """Vaqt bo'yicha yozuvchi fon oqimini ishga tushirish (_lock ostida chaqiriladi)"""
+    global _flusher
+    if _flusher is not None and _flusher.is_alive():
+        return
+    _flusher = threading.Thread(target=_flush_loop, args=(app,), name='watch-time-flush', daemon=True)
+    _flusher.start()
+
+
+def _flush_loop(app):
+    interval = max(app.config.get('WATCH_TIME_FLUSH_INTERVAL', 10), 1)
+    while True:
+        time.sleep(interval)
+        with _lock:
+            due = _pending and time.monotonic() - _last_flush >= interval
+            batch = _take() if due else None
+        if batch:
+            with app.app_context():
+                try:
+                    _write(batch)
+                finally:
+                    db.session.remove()
+
+
+def _take():
+    global _pending, _last_flush
+    batch, _pending = _pending, {}
+    _last_flush = time.monotonic()
+    return batch
+
+
+def _write(batch):
+    if not batch:
+        return
+    table = LessonView.__table__
+    stmt = table.update().where(
+        table.c.lesson_id == bindparam('b_lesson_id'),
+        table.c.student_id == bindparam('b_student_id'),
+        or_(table.c.watch_duration.is_(None), table.c.watch_duration < bindparam('b_watch_duration'))
+    ).values(watch_duration=bindparam('b_watch_duration'))
+    rows = [{'b_lesson_id': lesson_id, 'b_student_id': student_id, 'b_watch_duration': value}
+            for (lesson_id, student_id), value in batch.items()]
+    # Joriy sessiya orqali: SQLite'da alohida ulanish so'rovning o'qish qulfi tufayli bloklanib qoladi
+    try:
+        db.session.execute(stmt, rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        # Yozib bo'lmasa qiymatlar yo'qolmasin - keyingi flush'da qayta urinamiz
+        current_app.logger.exception("Ko'rish vaqtlarini yozib bo'lmadi")
+        with _lock:
+            for key, value in batch.items():
+                _pending[key] = max(_pending.get(key, 0), value)
+
+
+def init_watch_time(app):
+    """Jarayon to'xtaganda buferdagi yozuvlarni yozib qo'yish"""
+    def _flush_on_exit():
+        with app.app_context():
+            flush_watch_time()
+
+    atexit.register(_flush_on_exit)
@@ -15,6 +15,48 @@ class Config:
     ALLOWED_SUBMISSION_EXTENSIONS = {'pdf', 'doc', 'docx', 'xls', 'xlsx', 'jpg', 'jpeg', 'png', 'gif', 'bmp', 'txt', 'rtf'}
     MAX_SUBMISSION_SIZE = 2 * 1024 * 1024  # 2 MB max file size for submissions
     
+    # Dars videolari va fayllarini uzatish: '' - Flask (Range/ETag bilan), 'x-accel' - nginx, 'x-sendfile' - Apache
+    MEDIA_OFFLOAD = os.environ.get('MEDIA_OFFLOAD', '')
+    MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/protected-uploads/')  # nginx internal location
+    MEDIA_MAX_AGE = 365 * 24 * 3600  # uuid nomli fayllar brauzer keshida saqlanadigan muddat
+    
+    # Video va dars fayllarini qismlab yuklash
+    MAX_UPLOAD_SIZE = 200 * 1024 * 1024  # bitta faylning eng katta hajmi
+    UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024  # qism hajmi
+    UPLOAD_STALE_HOURS = 48  # shuncha vaqt yakunlanmagan yoki ishlatilmagan yuklashlar o'chiriladi
+    
+    # Yuklangan videolarni fonda qayta kodlash (HLS, web.mp4, poster). ffmpeg topilmasa o'tkazib yuboriladi
+    VIDEO_TRANSCODE_ENABLED = os.environ.get('VIDEO_TRANSCODE_ENABLED', '1') != '0'
+    FFMPEG_BINARY = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+    FFPROBE_BINARY = os.environ.get('FFPROBE_BINARY', 'ffprobe')
+    VIDEO_HLS_LADDER = [(360, '800k', '96k'), (720, '2500k', '128k'), (1080, '5000k', '160k')]  # (balandlik, video, audio)
+    VIDEO_HLS_SEGMENT_SECONDS = 6
+    VIDEO_TRANSCODE_TIMEOUT = 2 * 3600  # bitta ffmpeg buyrug'i uchun (soniya)
+    
+    # Dars jadvali: bo'sh vaqtlarni qidirishdagi o'quv kuni chegaralari va haftadagi o'quv kunlari (Du-Sh)
+    SCHEDULE_DAY_START = '08:30'
+    SCHEDULE_DAY_END = '18:00'
+    SCHEDULE_WORK_DAYS = 6
+    # Shaxsiy .ics tasmasi: o'tgan darslar shuncha kun ko'rsatiladi; o'chirilgan darslar izi shuncha kun saqlanadi
+    ICAL_FEED_PAST_DAYS = 30
+    ICAL_TOMBSTONE_DAYS = 30
+
+    # Fon vazifalari (import/eksport)
+    JOBS_FOLDER = os.path.join(UPLOAD_FOLDER, 'jobs')
+    # True: vazifalar veb-jarayon ichidagi oqimlarda bajariladi; False: alohida `flask run-jobs` worker
+    JOBS_RUN_IN_PROCESS = os.environ.get('JOBS_RUN_IN_PROCESS', '1') != '0'
+    JOBS_MAX_WORKERS = int(os.environ.get('JOBS_MAX_WORKERS', '2'))
+    JOBS_STALE_AFTER = 30 * 60  # Shuncha soniya progress bo'lmasa vazifa to'xtagan hisoblanadi
+    JOBS_KEEP_DAYS = 7  # Tugagan vazifalar fayllari saqlanadigan kunlar
+    
+    # Video ko'rish vaqti heartbeatlari xotirada yig'iladi va guruhlab yoziladi
+    WATCH_TIME_FLUSH_INTERVAL = 10  # soniya
+    WATCH_TIME_MAX_PENDING = 500  # shuncha (dars, talaba) yozuvi yig'ilsa darhol yoziladi
+    
+    # base.html dagi menyu va til tanlagich (til, rol, sahifa bo'yicha) tayyor HTML sifatida keshlanadi
+    TEMPLATE_FRAGMENT_CACHE = os.environ.get('TEMPLATE_FRAGMENT_CACHE', '1') != '0'
+    TEMPLATE_FRAGMENT_CACHE_SIZE = 2048
+    
     # CSRF Protection settings
     WTF_CSRF_ENABLED = True
     WTF_CSRF_TIME_LIMIT = 3600  # 1 soat (3600 soniya)
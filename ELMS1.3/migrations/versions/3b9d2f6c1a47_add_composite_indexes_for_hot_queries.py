@@ -0,0 +1,51 @@
+"""Add composite indexes for hot query shapes
+
+Revision ID: 3b9d2f6c1a47
+Revises: 7e821dc4bbf5
+Create Date: 2026-10-17 10:12:41.208153
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9d2f6c1a47'
+down_revision = '7e821dc4bbf5'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('submission', 'ix_submission_student_assignment_active', ['student_id', 'assignment_id', 'is_active']),
+    ('assignment', 'ix_assignment_subject_group_direction', ['subject_id', 'group_id', 'direction_id']),
+    ('lesson', 'ix_lesson_subject_direction_order', ['subject_id', 'direction_id', 'order']),
+    ('lesson_view', 'ix_lesson_view_lesson_student', ['lesson_id', 'student_id']),
+    ('teacher_subject', 'ix_teacher_subject_teacher_subject_group_type', ['teacher_id', 'subject_id', 'group_id', 'lesson_type']),
+    ('schedule', 'ix_schedule_day_group', ['day_of_week', 'group_id']),
+    ('message', 'ix_message_receiver_read', ['receiver_id', 'is_read']),
+    ('message', 'ix_message_pair', ['sender_id', 'receiver_id', 'id']),
+    ('api_key', 'ix_api_key_key_prefix', ['key_prefix']),
+]
+
+
+def _existing_indexes(table):
+    inspector = sa.inspect(op.get_bind())
+    return {index['name'] for index in inspector.get_indexes(table)}
+
+
+def upgrade():
+    # Ilova ishga tushganda ham shu indekslar yaratiladi, shuning uchun mavjudlari o'tkazib yuboriladi
+    for table, name, columns in INDEXES:
+        if name in _existing_indexes(table):
+            continue
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.create_index(name, columns, unique=False)
+
+
+def downgrade():
+    for table, name, columns in reversed(INDEXES):
+        if name not in _existing_indexes(table):
+            continue
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(name)
@@ -0,0 +1,41 @@
+"""Add group_id to student_semester_progress to detect group changes
+
+Revision ID: 4a7c3e9b1d62
+Revises: 8d4f2b7e6a15
+Create Date: 2026-10-18 09:14:52.305118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4a7c3e9b1d62'
+down_revision = '8d4f2b7e6a15'
+branch_labels = None
+depends_on = None
+
+
+def _columns():
+    inspector = sa.inspect(op.get_bind())
+    if 'student_semester_progress' not in inspector.get_table_names():
+        return None
+    return {column['name'] for column in inspector.get_columns('student_semester_progress')}
+
+
+def upgrade():
+    # Jadval db.create_all() orqali yaratiladi; ustun ilova ishga tushganda ham qo'shiladi.
+    # Eski qatorlarda group_id bo'sh - ular dashboard ochilganda qayta hisoblanadi.
+    columns = _columns()
+    if columns is None or 'group_id' in columns:
+        return
+    with op.batch_alter_table('student_semester_progress', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('group_id', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    columns = _columns()
+    if not columns or 'group_id' not in columns:
+        return
+    with op.batch_alter_table('student_semester_progress', schema=None) as batch_op:
+        batch_op.drop_column('group_id')
@@ -0,0 +1,116 @@
+"""Add lesson_date/lesson_start/lesson_end to schedule and backfill them
+
+Revision ID: 5c1e8a9d2f30
+Revises: 3b9d2f6c1a47
+Create Date: 2026-10-17 16:05:12.480913
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1e8a9d2f30'
+down_revision = '3b9d2f6c1a47'
+branch_labels = None
+depends_on = None
+
+
+COLUMNS = [
+    ('lesson_date', sa.Date()),
+    ('lesson_start', sa.Time()),
+    ('lesson_end', sa.Time()),
+]
+
+INDEXES = [
+    ('ix_schedule_group_date', ['group_id', 'lesson_date']),
+    ('ix_schedule_teacher_date', ['teacher_id', 'lesson_date']),
+    ('ix_schedule_date_group', ['lesson_date', 'group_id']),
+]
+
+BATCH_SIZE = 1000
+
+schedule = sa.table(
+    'schedule',
+    sa.column('id', sa.Integer),
+    sa.column('day_of_week', sa.Integer),
+    sa.column('start_time', sa.String),
+    sa.column('end_time', sa.String),
+    sa.column('lesson_date', sa.Date),
+    sa.column('lesson_start', sa.Time),
+    sa.column('lesson_end', sa.Time),
+)
+
+
+def _to_date(code):
+    # Eski yozuvlarda day_of_week hafta kuni (1-7) - ular uchun sana bo'sh qoladi
+    try:
+        return datetime.strptime(str(code), '%Y%m%d').date() if code else None
+    except ValueError:
+        return None
+
+
+def _to_time(value):
+    try:
+        return datetime.strptime(str(value).strip()[:5], '%H:%M').time() if value else None
+    except ValueError:
+        return None
+
+
+def _backfill():
+    bind = op.get_bind()
+    rows = bind.execute(
+        sa.select(schedule.c.id, schedule.c.day_of_week, schedule.c.start_time, schedule.c.end_time)
+        .order_by(schedule.c.id)
+    ).all()
+    statement = sa.update(schedule).where(schedule.c.id == sa.bindparam('row_id')).values(
+        lesson_date=sa.bindparam('new_date'),
+        lesson_start=sa.bindparam('new_start'),
+        lesson_end=sa.bindparam('new_end'),
+    )
+    for offset in range(0, len(rows), BATCH_SIZE):
+        params = []
+        for row_id, day_of_week, start_time, end_time in rows[offset:offset + BATCH_SIZE]:
+            params.append({
+                'row_id': row_id,
+                'new_date': _to_date(day_of_week),
+                'new_start': _to_time(start_time),
+                'new_end': _to_time(end_time),
+            })
+        bind.execute(statement, params)
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    existing_columns = {column['name'] for column in inspector.get_columns('schedule')}
+    # Ilova ishga tushganda ham ustunlar qo'shiladi, shuning uchun mavjudlari o'tkazib yuboriladi
+    missing = [(name, type_) for name, type_ in COLUMNS if name not in existing_columns]
+    if missing:
+        with op.batch_alter_table('schedule', schema=None) as batch_op:
+            for name, type_ in missing:
+                batch_op.add_column(sa.Column(name, type_, nullable=True))
+    _backfill()
+
+    existing_indexes = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('schedule')}
+    for name, columns in INDEXES:
+        if name in existing_indexes:
+            continue
+        with op.batch_alter_table('schedule', schema=None) as batch_op:
+            batch_op.create_index(name, columns, unique=False)
+
+
+def downgrade():
+    existing_indexes = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('schedule')}
+    for name, columns in reversed(INDEXES):
+        if name not in existing_indexes:
+            continue
+        with op.batch_alter_table('schedule', schema=None) as batch_op:
+            batch_op.drop_index(name)
+
+    existing_columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('schedule')}
+    with op.batch_alter_table('schedule', schema=None) as batch_op:
+        for name, _ in reversed(COLUMNS):
+            if name in existing_columns:
+                batch_op.drop_column(name)
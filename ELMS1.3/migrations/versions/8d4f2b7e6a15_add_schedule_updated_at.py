@@ -0,0 +1,37 @@
+"""Add updated_at to schedule for the calendar feed delta mode
+
+Revision ID: 8d4f2b7e6a15
+Revises: 5c1e8a9d2f30
+Create Date: 2026-10-17 18:42:07.913526
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4f2b7e6a15'
+down_revision = '5c1e8a9d2f30'
+branch_labels = None
+depends_on = None
+
+
+def _has_column():
+    inspector = sa.inspect(op.get_bind())
+    return 'updated_at' in {column['name'] for column in inspector.get_columns('schedule')}
+
+
+def upgrade():
+    # Ilova ishga tushganda ham ustun qo'shiladi, shuning uchun mavjud bo'lsa o'tkazib yuboriladi.
+    # Eski yozuvlar bo'sh qoladi: ular .ics delta rejimida "o'zgarmagan" hisoblanadi.
+    if _has_column():
+        return
+    with op.batch_alter_table('schedule', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    if not _has_column():
+        return
+    with op.batch_alter_table('schedule', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')